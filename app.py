@@ -2,8 +2,10 @@
 Modern Streamlit application for the RAG system with enhanced UI
 """
 import streamlit as st
+import json
 import time
-from typing import List, Dict, Any
+import uuid
+from typing import List, Dict, Any, Optional
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
@@ -322,46 +324,83 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Import our custom modules
-from document_processor import DocumentProcessor
 from vector_store import VectorStore  
-from reranker import RerankerService, FallbackReranker
-from llm_service import LLMService
+from rag_pipeline import PipelineError
+from query_service import QueryService, QueryServiceClient, ServiceOverloaded
+from ingest_jobs import start_worker_process
+from warmup import SAMPLE_QUESTIONS
+from profiling import profiled, profiles
+from config import TRACE_WINDOW_SIZE, QUERY_SERVICE_URL, INGEST_AUTOSTART_WORKER, WARMUP_ENABLED, PROFILING_ENABLED
+
+# Spans shown in the latency dashboard, in pipeline order
+LATENCY_PANEL_STAGES = [
+    'retrieval.encode', 'retrieval.pinecone_query', 'retrieval',
+    'rerank', 'llm.prompt_build', 'llm.call', 'llm.citation_extraction', 'generation', 'query'
+]
+
+
+@st.cache_resource(show_spinner="Loading models and connecting to services...")
+def get_local_query_service() -> QueryService:
+    """In-process query service shared by all sessions (one embedding model and client set per process)"""
+    service = QueryService.from_config()
+    if WARMUP_ENABLED:
+        service.start_warmup()
+    return service
+
+
+@st.cache_resource
+def start_ingest_worker():
+    """Launch one background ingestion worker tied to this Streamlit process"""
+    import os
+    return start_worker_process(parent_pid=os.getpid())
 
 
 class RAGApp:
     """Main RAG Application Class"""
     
     def __init__(self):
-        self.doc_processor = DocumentProcessor()
-        self.vector_store = None
-        self.reranker = None
-        self.llm_service = None
+        self.service = None
+        self.service_status = {}
+        # One /stats snapshot per rerun (a new RAGApp is built on every rerun), shared by all panels
+        self.stats: Dict[str, Any] = {}
         
         # Initialize services
         self._initialize_services()
     
     def _initialize_services(self):
-        """Initialize all services with error handling"""
+        """Connect to the query service (remote if QUERY_SERVICE_URL is set, otherwise in-process)"""
         try:
-            self.vector_store = VectorStore()
-            st.success("✅ Connected to Pinecone vector database")
+            if QUERY_SERVICE_URL:
+                self.service = QueryServiceClient(QUERY_SERVICE_URL)
+            else:
+                self.service = get_local_query_service()
+                if INGEST_AUTOSTART_WORKER:
+                    start_ingest_worker()
+            self.stats = self.service.stats()
+            self.service_status = self.stats['services']
         except Exception as e:
-            st.error(f"❌ Failed to connect to Pinecone: {str(e)}")
+            st.error(f"❌ Failed to start query service: {str(e)}")
             st.stop()
         
-        try:
-            self.reranker = RerankerService()
+        if QUERY_SERVICE_URL:
+            st.success(f"✅ Connected to query service at {QUERY_SERVICE_URL}")
+        if self.service_status.get('vector_backend') == 'local':
+            st.success("✅ Using local vector index")
+        else:
+            st.success("✅ Connected to Pinecone vector database")
+        if self.service_status.get('reranker') == 'cohere':
             st.success("✅ Connected to Cohere Reranker")
-        except Exception as e:
-            st.warning(f"⚠️ Cohere Reranker not available: {str(e)}. Using fallback reranker.")
-            self.reranker = FallbackReranker()
-        
-        try:
-            self.llm_service = LLMService()
-            st.success("✅ Connected to Groq LLM")
-        except Exception as e:
-            st.error(f"❌ Failed to connect to Groq LLM: {str(e)}")
-            st.stop()
+        else:
+            st.warning("⚠️ Cohere Reranker not available. Using fallback reranker.")
+        st.success("✅ Connected to Groq LLM")
+    
+    def _get_index_stats(self) -> Dict[str, Any]:
+        """Index statistics from this rerun's stats snapshot"""
+        return self.stats.get('index') or {'error': "Index statistics unavailable"}
+    
+    def _get_source_inventory(self) -> List[Dict[str, Any]]:
+        """Per-source chunk counts and sizes from this rerun's stats snapshot"""
+        return self.stats.get('inventory') or []
     
     def run(self):
         """Main application runner with modern UI"""
@@ -396,13 +435,37 @@ class RAGApp:
             docs=results['docs'],
             timing_info=results['timing_info'],
             show_scores=results['show_scores'],
-            show_timing=results['show_timing']
+            show_timing=results['show_timing'],
+            candidate_selection=results.get('candidate_selection')
         )
         
         if st.button("⬅️ Back to Dashboard", use_container_width=True):
             del st.session_state['query_results']
             st.rerun()
     
+    def _get_readiness(self) -> Dict[str, Any]:
+        """Warm-up status from the query service (treated as ready if unavailable)"""
+        try:
+            return self.service.readiness()
+        except Exception:
+            return {'ready': True}
+    
+    def _get_open_circuits(self) -> List[str]:
+        """Remote services whose circuit breaker is open (answers are degraded meanwhile)"""
+        services = (self.stats.get('resilience') or {}).get('services', {})
+        return [name for name, stats in services.items() if stats['state'] != 'closed']
+    
+    def _render_warmup_banner(self) -> None:
+        """Progress note shown until warm-up finishes, then re-enables the query box"""
+        @st.fragment(run_every=1)
+        def warmup_banner():
+            readiness = self._get_readiness()
+            if readiness.get('ready', True):
+                st.rerun()
+            st.info(f"🔥 Warming up models and connections... ({readiness.get('seconds', 0):.0f}s)")
+        
+        warmup_banner()
+    
     def _render_status_card(self):
         """Render modern status card"""
         st.markdown('<div class="custom-card">', unsafe_allow_html=True)
@@ -410,9 +473,9 @@ class RAGApp:
         
         # Service status indicators
         services = [
-            ("Pinecone Vector DB", self.vector_store is not None, "Connected"),
-            ("Cohere Reranker", hasattr(self.reranker, 'co'), "Active"),
-            ("Groq LLM", self.llm_service is not None, "Ready")
+            ("Pinecone Vector DB", bool(self.service_status.get('vector_backend')), "Connected"),
+            ("Cohere Reranker", self.service_status.get('reranker') == 'cohere', "Active"),
+            ("Groq LLM", bool(self.service_status.get('llm')), "Ready")
         ]
         
         for service, status, label in services:
@@ -421,6 +484,22 @@ class RAGApp:
             else:
                 st.markdown(f'<span class="status-warning">⚠️ {service}: Offline</span>', unsafe_allow_html=True)
         
+        readiness = self._get_readiness()
+        if readiness.get('started'):
+            if readiness.get('ready'):
+                st.markdown(f'<span class="status-success">✅ Warm-up: done in {readiness["seconds"]:.1f}s</span>',
+                            unsafe_allow_html=True)
+            else:
+                st.markdown('<span class="status-warning">⏳ Warm-up: in progress</span>', unsafe_allow_html=True)
+        
+        replica_age = (self.stats.get('resilience') or {}).get('index_replica_age')
+        for name in self._get_open_circuits():
+            fallback = "using fallback"
+            if name == 'index' and replica_age is not None:
+                fallback = f"serving local replica last written {replica_age / 3600:.1f}h ago"
+            st.markdown(f'<span class="status-warning">⚠️ {name}: circuit open, {fallback}</span>',
+                        unsafe_allow_html=True)
+        
         st.markdown('</div>', unsafe_allow_html=True)
     
     def _render_stats_card(self):
@@ -428,8 +507,12 @@ class RAGApp:
         st.markdown('<div class="custom-card">', unsafe_allow_html=True)
         st.markdown("### 📊 Knowledge Base Stats")
         
-        stats = self.vector_store.get_index_stats()
+        stats = self._get_index_stats()
         total_vectors = stats.get('total_vectors', 0)
+        dimension = stats.get('dimension') or stats.get('full_dimension') or '—'
+        reduction = stats.get('reduction')
+        dimension_label = (f"Dimensions ({reduction['method']} of {reduction['full_dimension']})"
+                           if reduction else "Dimensions")
         
         col1, col2, col3 = st.columns(3)
         
@@ -444,8 +527,8 @@ class RAGApp:
         with col2:
             st.markdown(f'''
             <div class="metric-card">
-                <span class="metric-value">768</span>
-                <div class="metric-label">Dimensions</div>
+                <span class="metric-value">{dimension}</span>
+                <div class="metric-label">{dimension_label}</div>
             </div>
             ''', unsafe_allow_html=True)
         
@@ -477,7 +560,8 @@ class RAGApp:
             
             if uploaded_files:
                 if st.button("� Process & Upload", type="primary", use_container_width=True):
-                    self._process_and_upload_documents(uploaded_files)
+                    with profiled('upload', ", ".join(f.name for f in uploaded_files), self._profiling_enabled()):
+                        self._process_and_upload_documents(uploaded_files)
             
             st.divider()
             
@@ -497,7 +581,10 @@ class RAGApp:
             )
             
             if text_input and st.button("⚡ Process Text", type="primary", use_container_width=True):
-                self._process_and_upload_text(text_input, source_name)
+                with profiled('upload', source_name, self._profiling_enabled()):
+                    self._process_and_upload_text(text_input, source_name)
+            
+            self._render_ingest_jobs()
             
             st.divider()
             
@@ -505,7 +592,7 @@ class RAGApp:
             st.markdown("### 🗄️ Index Management")
             
             # Enhanced index stats
-            stats = self.vector_store.get_index_stats()
+            stats = self._get_index_stats()
             if 'error' not in stats:
                 total_vectors = stats.get('total_vectors', 0)
                 
@@ -514,8 +601,19 @@ class RAGApp:
                     st.success(f"📊 **{total_vectors}** vectors indexed")
                     
                     # Storage estimation
-                    storage_mb = (total_vectors * 768 * 4) / (1024 * 1024)  # 4 bytes per float
+                    dimension = stats.get('dimension') or 768
+                    storage_mb = (total_vectors * dimension * 4) / (1024 * 1024)  # 4 bytes per float
                     st.caption(f"📦 Estimated storage: {storage_mb:.2f} MB")
+                    if stats.get('stats_pending'):
+                        st.caption(f"🔄 Includes local changes since the last index sync ({stats['stats_age']:.0f}s ago)")
+                    
+                    inventory = self._get_source_inventory()
+                    if inventory:
+                        with st.expander(f"📚 Sources ({len(inventory)})", expanded=False):
+                            for entry in inventory:
+                                ingested = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_ingested']))
+                                st.caption(f"**{entry['source']}** · {entry['chunks']} chunks · "
+                                           f"{(entry['bytes'] + entry['vector_bytes']) / 1024:.0f} KB · {ingested}")
                 else:
                     st.info("📊 Index is empty - upload documents to get started!")
             
@@ -523,16 +621,55 @@ class RAGApp:
             if st.button("🗑️ Clear All Data", type="secondary", use_container_width=True):
                 if st.checkbox("⚠️ I understand this will delete all data", key="confirm_clear"):
                     with st.spinner("🧹 Clearing index..."):
-                        if self.vector_store.clear_index():
+                        if self.service.clear_index():
                             st.success("✅ Index cleared successfully!")
                             st.rerun()
                         else:
                             st.error("❌ Failed to clear index")
+            
+            st.divider()
+            self._render_profiling_panel()
+    
+    def _profiling_enabled(self) -> bool:
+        """Per-session profiling toggle (defaults to PROFILING_ENABLED)"""
+        return st.session_state.get('profiling_enabled', PROFILING_ENABLED)
+    
+    def _render_profiling_panel(self) -> None:
+        """Profiling toggle and downloads of the most recent saved profiles"""
+        st.markdown("### 🔬 Profiling")
+        st.toggle("Profile my requests", value=PROFILING_ENABLED, key="profiling_enabled",
+                  help="Run queries and uploads under cProfile and save pstats plus flamegraph stacks")
+        if QUERY_SERVICE_URL:
+            st.caption("Queries run in the remote service, so profiles only cover this app's side of the call.")
+        
+        recent = profiles.list(limit=10)
+        if not recent:
+            return
+        with st.expander(f"🧾 Recent profiles ({len(recent)})", expanded=False):
+            for entry in recent:
+                started = time.strftime('%H:%M:%S', time.localtime(entry['started_at']))
+                st.markdown(f"**{entry['kind']}** · {started} · {entry['seconds']:.2f}s  \n`{entry['label'][:60]}`")
+                if entry.get('error'):
+                    st.caption(f"❌ {entry['error']}")
+                if entry.get('top'):
+                    st.caption(" → ".join(f"{item['function'][:40]} {item['cumulative']:.2f}s"
+                                          for item in entry['top'][1:4]))
+                try:
+                    flame_col, stats_col = st.columns(2)
+                    flame_col.download_button("🔥 Stacks", profiles.read(entry['request_id'], 'collapsed'),
+                                              file_name=f"{entry['request_id']}.collapsed", mime="text/plain",
+                                              key=f"flame_{entry['request_id']}", use_container_width=True)
+                    stats_col.download_button("📈 pstats", profiles.read(entry['request_id'], 'pstats'),
+                                              file_name=f"{entry['request_id']}.pstats",
+                                              mime="application/octet-stream",
+                                              key=f"pstats_{entry['request_id']}", use_container_width=True)
+                except OSError:
+                    st.caption("Profile files were pruned.")
     
     def _render_modern_main_content(self):
         """Render the modern main content area with Q&A interface"""
         # Check if we have any documents
-        stats = self.vector_store.get_index_stats()
+        stats = self._get_index_stats()
         if stats.get('total_vectors', 0) == 0:
             # Modern empty state
             st.markdown("""
@@ -554,12 +691,18 @@ class RAGApp:
         st.markdown('<div class="custom-card">', unsafe_allow_html=True)
         st.markdown("## 💬 Ask Your Questions")
         
+        # Queries wait until the background warm-up has finished
+        ready = self._get_readiness().get('ready', True)
+        if not ready:
+            self._render_warmup_banner()
+        
         # Enhanced query input
         query = st.text_input(
             "What would you like to know?",
             placeholder="e.g., 'What are the types of AI?' or 'How is machine learning used in healthcare?'",
             help="Ask any question about your uploaded documents",
-            label_visibility="collapsed"
+            label_visibility="collapsed",
+            disabled=not ready
         )
         
         # Modern settings in columns
@@ -577,11 +720,16 @@ class RAGApp:
                 with settings_col2:
                     show_scores = st.checkbox("📊 Show similarity scores", value=False)
                     show_timing = st.checkbox("⏱️ Show performance metrics", value=True)
+            
+            # Document scoping, pushed down to the index as a metadata filter
+            with st.expander("🎯 Scope to Documents", expanded=False):
+                filters = self._render_scope_controls()
         
         with col2:
             if query:
-                if st.button("🔍 Ask AI", type="primary", use_container_width=True):
-                    self._process_query(query, top_k_retrieval, top_k_rerank, show_scores, show_timing)
+                if st.button("🔍 Ask AI", type="primary", use_container_width=True, disabled=not ready):
+                    with profiled('query', query, self._profiling_enabled()):
+                        self._process_query(query, top_k_retrieval, top_k_rerank, show_scores, show_timing, filters)
         
         st.markdown('</div>', unsafe_allow_html=True)
         
@@ -590,133 +738,147 @@ class RAGApp:
             st.markdown('<div class="custom-card">', unsafe_allow_html=True)
             st.markdown("### 💡 Try These Sample Questions")
             
-            sample_questions = [
-                "What is artificial intelligence?",
-                "What are the types of AI?", 
-                "How is AI used in healthcare?",
-                "What is the difference between supervised and unsupervised learning?",
-                "What are the main challenges facing AI implementation?"
-            ]
-            
             col1, col2 = st.columns(2)
-            for i, question in enumerate(sample_questions):
+            for i, question in enumerate(SAMPLE_QUESTIONS):
                 with col1 if i % 2 == 0 else col2:
-                    if st.button(f"💭 {question}", key=f"sample_{i}", use_container_width=True):
+                    if st.button(f"💭 {question}", key=f"sample_{i}", use_container_width=True, disabled=not ready):
                         st.rerun()
             
             st.markdown('</div>', unsafe_allow_html=True)
     
-    def _process_and_upload_documents(self, uploaded_files: List) -> None:
-        """Process and upload multiple documents"""
-        total_chunks = 0
-        successful_files = 0
+    def _render_scope_controls(self) -> Optional[Dict[str, Any]]:
+        """Render source/title/section/date scoping inputs and return the metadata filter"""
+        available_sources = self.service.list_sources()
+        if available_sources:
+            sources = st.multiselect("📄 Sources", available_sources,
+                                     help="Only search within the selected documents")
+        else:
+            sources_text = st.text_input("📄 Sources", placeholder="manual.pdf, notes.txt",
+                                         help="Comma-separated source names to search within")
+            sources = [s.strip() for s in sources_text.split(',') if s.strip()]
+        
+        scope_col1, scope_col2 = st.columns(2)
+        with scope_col1:
+            titles_text = st.text_input("📖 Titles", placeholder="Comma-separated titles")
+            sections_text = st.text_input("📂 Sections", placeholder="Comma-separated sections")
+        with scope_col2:
+            use_date = st.checkbox("📅 Only documents ingested since")
+            ingested_since = st.date_input("Ingested since", label_visibility="collapsed", disabled=not use_date)
         
-        progress_bar = st.sidebar.progress(0)
-        status_text = st.sidebar.empty()
+        ingested_after = None
+        if use_date and ingested_since:
+            ingested_after = time.mktime(ingested_since.timetuple())
         
-        for i, uploaded_file in enumerate(uploaded_files):
+        return VectorStore.build_metadata_filter(
+            sources=sources,
+            titles=[t.strip() for t in titles_text.split(',') if t.strip()],
+            sections=[s.strip() for s in sections_text.split(',') if s.strip()],
+            ingested_after=ingested_after
+        )
+    
+    def _process_and_upload_documents(self, uploaded_files: List) -> None:
+        """Queue uploaded documents for background ingestion"""
+        queued = 0
+        for uploaded_file in uploaded_files:
             try:
-                status_text.text(f"Processing {uploaded_file.name}...")
-                
-                # Process document
-                chunks = self.doc_processor.process_uploaded_file(uploaded_file)
-                
-                # Upload to vector store
-                result = self.vector_store.upsert_documents(chunks)
-                
-                if result['success']:
-                    total_chunks += result['upserted_count']
-                    successful_files += 1
-                    st.sidebar.success(f"✅ {uploaded_file.name}: {result['upserted_count']} chunks")
-                else:
-                    st.sidebar.error(f"❌ {uploaded_file.name}: {result['error']}")
-                
-                progress_bar.progress((i + 1) / len(uploaded_files))
-                
+                self.service.submit_file(uploaded_file)
+                queued += 1
             except Exception as e:
-                st.sidebar.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+                st.sidebar.error(f"❌ Error queuing {uploaded_file.name}: {str(e)}")
         
-        status_text.text(f"✅ Complete! {successful_files}/{len(uploaded_files)} files processed successfully")
-        st.sidebar.info(f"📊 Total chunks uploaded: {total_chunks}")
+        if queued:
+            st.sidebar.success(f"📥 Queued {queued}/{len(uploaded_files)} files - progress is shown below")
     
     def _process_and_upload_text(self, text: str, source_name: str) -> None:
-        """Process and upload pasted text with enhanced metadata"""
+        """Queue pasted text for background ingestion"""
         try:
-            with st.spinner("Processing text..."):
-                # Extract title from the text content
-                title = self.doc_processor.extract_document_title(text, source_name)
-                
-                # Process text with title
-                chunks = self.doc_processor.chunk_text(text, source_name, title)
-                
-                # Upload to vector store
-                result = self.vector_store.upsert_documents(chunks)
-                
-                if result['success']:
-                    st.sidebar.success(f"✅ {result['upserted_count']} chunks uploaded from '{source_name}'")
-                    st.sidebar.info(f"📖 Title: {title}")
-                else:
-                    st.sidebar.error(f"❌ Error: {result['error']}")
-                    
+            self.service.submit_text(text, source_name)
+            st.sidebar.success(f"📥 Queued '{source_name}' - progress is shown below")
         except Exception as e:
-            st.sidebar.error(f"❌ Error processing text: {str(e)}")
+            st.sidebar.error(f"❌ Error queuing text: {str(e)}")
     
-    def _process_query(self, query: str, top_k_retrieval: int, top_k_rerank: int, 
-                      show_scores: bool, show_timing: bool) -> None:
-        """Process user query and generate answer"""
-        
-        # Timing tracking
-        start_time = time.time()
-        timing_info = {}
+    def _render_ingest_jobs(self) -> None:
+        """Live view of background ingestion jobs, refreshed while any are active"""
+        try:
+            jobs = self.service.list_jobs(limit=10)
+        except Exception as e:
+            st.caption(f"Ingestion jobs unavailable: {str(e)}")
+            return
+        if not jobs:
+            return
         
-        with st.spinner("🔍 Searching for relevant documents..."):
-            # Step 1: Retrieve documents
-            retrieval_start = time.time()
-            try:
-                retrieved_docs = self.vector_store.query_similar_documents(query, top_k_retrieval)
-                timing_info['retrieval'] = time.time() - retrieval_start
-                
-                if not retrieved_docs:
-                    st.warning("No relevant documents found for your query.")
-                    return
+        @st.fragment(run_every=2 if any(job['status'] in ('queued', 'running') for job in jobs) else None)
+        def jobs_panel():
+            st.markdown("### ⏳ Ingestion Jobs")
+            for job in self.service.list_jobs(limit=10):
+                label = f"{job['source_name']} · {job['status']}"
+                if job['status'] == 'running' and job['total_batches']:
+                    label += f" ({job['committed_batches']}/{job['total_batches']} batches)"
+                elif job['status'] == 'completed':
+                    label += f" ({job['upserted_count']} chunks)"
+                st.progress(job['progress'], text=label)
                 
-            except Exception as e:
-                st.error(f"Error during retrieval: {str(e)}")
-                return
+                if job['status'] == 'failed':
+                    st.caption(f"❌ {job['error']}")
+                    retry_col, discard_col = st.columns(2)
+                    if retry_col.button("🔁 Retry", key=f"retry_{job['id']}", use_container_width=True):
+                        self.service.retry_job(job['id'])
+                        st.rerun(scope="fragment")
+                    if discard_col.button("🗑️ Discard", key=f"discard_{job['id']}", use_container_width=True):
+                        self.service.discard_job(job['id'])
+                        st.rerun(scope="fragment")
         
-        with st.spinner("🎯 Reranking documents..."):
-            # Step 2: Rerank documents
-            rerank_start = time.time()
-            try:
-                reranked_docs = self.reranker.rerank_documents(query, retrieved_docs, top_k_rerank)
-                timing_info['reranking'] = time.time() - rerank_start
-            except Exception as e:
-                st.error(f"Error during reranking: {str(e)}")
-                return
+        jobs_panel()
+    
+    def _process_query(self, query: str, top_k_retrieval: int, top_k_rerank: int, 
+                      show_scores: bool, show_timing: bool, filters: Optional[Dict[str, Any]] = None) -> None:
+        """Process user query and generate answer"""
+        stage_messages = {
+            'retrieval': "🔍 Searching for relevant documents...",
+            'rerank': "🎯 Reranking documents...",
+            'generation': "🤖 Generating answer..."
+        }
+        progress = st.empty()
         
-        with st.spinner("🤖 Generating answer..."):
-            # Step 3: Generate answer with LLM
-            llm_start = time.time()
-            try:
-                result = self.llm_service.generate_answer_with_citations(query, reranked_docs)
-                timing_info['llm_generation'] = time.time() - llm_start
-                timing_info['total'] = time.time() - start_time
-            except Exception as e:
-                st.error(f"Error generating answer: {str(e)}")
-                return
+        try:
+            with st.spinner("Working..."):
+                response = self.service.query(
+                    query, top_k_retrieval, top_k_rerank, filters,
+                    on_stage=lambda stage: progress.info(stage_messages[stage]),
+                    session_id=st.session_state.setdefault('session_id', uuid.uuid4().hex)
+                )
+        except (PipelineError, ServiceOverloaded) as e:
+            progress.empty()
+            st.error(str(e))
+            return
+        except Exception as e:
+            progress.empty()
+            st.error(f"Error processing query: {str(e)}")
+            return
+        progress.empty()
+        
+        if not response['retrieved']:
+            if filters:
+                st.warning("No relevant documents found within the selected scope.")
+            else:
+                st.warning("No relevant documents found for your query.")
+            return
         
         # Store results in session state instead of displaying directly
         st.session_state['query_results'] = {
-            'result': result,
-            'docs': reranked_docs,
-            'timing_info': timing_info,
+            'result': response['result'],
+            'docs': response['docs'],
+            'timing_info': response['timing_info'],
+            'trace': response['trace'],
+            'candidate_selection': response.get('candidate_selection'),
             'show_scores': show_scores,
             'show_timing': show_timing
         }
         st.rerun()
 
     def _display_results(self, result: Dict[str, Any], docs: List[Dict[str, Any]], 
-                        timing_info: Dict[str, float], show_scores: bool, show_timing: bool):
+                        timing_info: Dict[str, float], show_scores: bool, show_timing: bool,
+                        candidate_selection: Optional[Dict[str, Any]] = None):
         """Display the query results with modern styling and full width"""
         
         # Modern answer section - full width using Streamlit containers properly
@@ -799,6 +961,11 @@ class RAGApp:
                     ("🎯 Reranked", f"{len(result['citations'])} final"),
                     ("🤖 Tokens", f"{result.get('tokens_used', 0)}")
                 ]
+                if candidate_selection:
+                    metrics.insert(2, (
+                        f"🧮 Rerank candidates ({candidate_selection['rule']})",
+                        f"{candidate_selection['selected']} of {candidate_selection['retrieved']}"
+                    ))
                 
                 for label, value in metrics:
                     st.markdown(f'''
@@ -810,42 +977,9 @@ class RAGApp:
                 
                 st.markdown('</div>', unsafe_allow_html=True)
         
-        # Modern performance chart - full width
+        # Rolling latency percentiles across all sessions - full width
         if show_timing:
-            with st.container():
-                st.markdown('<div class="custom-card">', unsafe_allow_html=True)
-                st.markdown("## 📊 Performance Analytics")
-                
-                # Create performance chart
-                fig = go.Figure()
-                
-                stages = ['Retrieval', 'Reranking', 'Generation']
-                times = [
-                    timing_info.get('retrieval', 0),
-                    timing_info.get('reranking', 0), 
-                    timing_info.get('llm_generation', 0)
-                ]
-                colors = ['#00D4AA', '#0066CC', '#FF6B6B']
-                
-                fig.add_trace(go.Bar(
-                    x=stages,
-                    y=times,
-                    marker_color=colors,
-                    text=[f"{t:.2f}s" for t in times],
-                    textposition='auto',
-                ))
-                
-                fig.update_layout(
-                    title="Processing Time Breakdown",
-                    yaxis_title="Time (seconds)",
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(color='white'),
-                    height=300
-                )
-                
-                st.plotly_chart(fig, use_container_width=True)
-                st.markdown('</div>', unsafe_allow_html=True)
+            self._render_latency_panel(timing_info)
         
         # Debug information with modern styling
         if show_scores:
@@ -871,6 +1005,70 @@ class RAGApp:
                 
                 st.markdown('</div>', unsafe_allow_html=True)
 
+    
+    def _render_latency_panel(self, timing_info: Dict[str, float]):
+        """Render rolling p50/p95/p99 latency per pipeline stage with export options"""
+        with st.container():
+            st.markdown('<div class="custom-card">', unsafe_allow_html=True)
+            st.markdown("## 📊 Performance Analytics")
+            
+            snapshot = self.stats.get('latency', {})
+            stages = [name for name in LATENCY_PANEL_STAGES if name in snapshot]
+            if not stages:
+                st.info("No latency samples recorded yet.")
+                st.markdown('</div>', unsafe_allow_html=True)
+                return
+            
+            fig = go.Figure()
+            for percentile, color in (('p50', '#00D4AA'), ('p95', '#0066CC'), ('p99', '#FF6B6B')):
+                values = [snapshot[name][percentile] for name in stages]
+                fig.add_trace(go.Bar(
+                    name=percentile,
+                    x=stages,
+                    y=values,
+                    marker_color=color,
+                    text=[f"{v:.2f}s" for v in values],
+                    textposition='auto',
+                ))
+            
+            # Overlay this query's own stage timings for comparison
+            current = {
+                'retrieval': timing_info.get('retrieval'),
+                'rerank': timing_info.get('reranking'),
+                'generation': timing_info.get('llm_generation'),
+                'query': timing_info.get('total')
+            }
+            fig.add_trace(go.Scatter(
+                name='this query',
+                x=[name for name in stages if current.get(name) is not None],
+                y=[current[name] for name in stages if current.get(name) is not None],
+                mode='markers',
+                marker=dict(color='white', size=10, symbol='diamond')
+            ))
+            
+            fig.update_layout(
+                title=f"Stage Latency Percentiles (last {TRACE_WINDOW_SIZE} samples per stage)",
+                yaxis_title="Time (seconds)",
+                barmode='group',
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)',
+                font=dict(color='white'),
+                height=350
+            )
+            
+            st.plotly_chart(fig, use_container_width=True)
+            st.caption(" | ".join(f"**{name}:** {snapshot[name]['count']} samples" for name in stages))
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("⬇️ Export JSON", json.dumps({'stages': snapshot}, indent=2), file_name="latency.json",
+                                   mime="application/json", use_container_width=True)
+            with col2:
+                st.download_button("⬇️ Export Prometheus", self.service.metrics(), file_name="latency.prom",
+                                   mime="text/plain", use_container_width=True)
+            
+            st.markdown('</div>', unsafe_allow_html=True)
+
 
 def main():
     """Main function to run the Streamlit app"""
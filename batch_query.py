@@ -0,0 +1,226 @@
+"""
+Batch question answering over a JSONL file of queries
+
+Usage:
+    python batch_query.py queries.jsonl -o results.jsonl
+
+Each input line is a JSON object with a "query" field and optional "id",
+"top_k_retrieval", "top_k_rerank" and "filters" fields. Results are appended
+to the output file as they complete, one JSON object per line, so an
+interrupted run can be resumed: queries whose latest output record has
+status "ok" are skipped on the next run. Answers that fell back to an
+extractive quote because the LLM was unavailable get status "degraded" and
+are retried too.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Set
+from config import (
+    BATCH_RETRIEVAL_WORKERS,
+    BATCH_RERANK_CONCURRENCY,
+    BATCH_LLM_CONCURRENCY,
+    GROQ_REQUESTS_PER_MINUTE,
+    GROQ_TOKENS_PER_MINUTE
+)
+from rag_pipeline import RAGPipeline, PipelineError
+from tracing import tracer
+
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    """Read queries from a JSONL file, assigning line-number IDs where missing"""
+    queries = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON on line {line_number} of {path}: {str(e)}")
+            if not item.get('query'):
+                raise ValueError(f"Missing 'query' on line {line_number} of {path}")
+            item['id'] = str(item.get('id', line_number))
+            queries.append(item)
+    return queries
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """IDs whose most recent record in an existing output file succeeded"""
+    status = {}
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partially written line from an interrupted run
+            status[str(record.get('id'))] = record.get('status')
+    return {query_id for query_id, state in status.items() if state == 'ok'}
+
+
+class BatchQueryRunner:
+    """
+    Runs many queries through a RAGPipeline with per-stage concurrency limits
+
+    All pending queries are embedded with one batched encode. Vector queries
+    then run on a thread pool, reranking is bounded by a semaphore, and LLM
+    calls are bounded by a semaphore plus request and token budgets.
+    """
+
+    SESSION_ID = 'batch'  # scheduler session: fair-queued against interactive users and capped separately
+
+    def __init__(self, pipeline: RAGPipeline,
+                 retrieval_workers: int = BATCH_RETRIEVAL_WORKERS,
+                 rerank_concurrency: int = BATCH_RERANK_CONCURRENCY,
+                 llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+                 requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = GROQ_TOKENS_PER_MINUTE):
+        self.pipeline = pipeline
+        self.retrieval_workers = retrieval_workers
+        # Held by pipeline.answer() around the rerank and generation calls
+        self._stage_limits = {
+            'rerank': threading.BoundedSemaphore(rerank_concurrency),
+            'generation': threading.BoundedSemaphore(llm_concurrency)
+        }
+        # Applied as a cap on the batch session only while run() is active; the
+        # scheduler's model budgets (shared with interactive queries) still apply
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._write_lock = threading.Lock()
+
+    def run(self, queries: List[Dict[str, Any]], output_path: str, resume: bool = True) -> Dict[str, Any]:
+        """
+        Answer all queries, streaming one JSON record per query to output_path
+
+        Returns:
+            Summary with counts, wall time and throughput
+        """
+        done = completed_ids(output_path) if resume else set()
+        pending = [item for item in queries if item['id'] not in done]
+        summary = {'total': len(queries), 'skipped': len(queries) - len(pending), 'ok': 0, 'degraded': 0, 'error': 0,
+                   'tokens_used': 0}
+        if not pending:
+            summary.update({'wall_time': 0.0, 'queries_per_second': 0.0})
+            return summary
+
+        scheduler = self.pipeline.llm_service.scheduler
+        scheduler.set_session_budget(self.SESSION_ID, self.requests_per_minute, self.tokens_per_minute)
+        try:
+            return self._run(pending, output_path, resume, summary)
+        finally:
+            scheduler.clear_session_budget(self.SESSION_ID)
+
+    def _run(self, pending: List[Dict[str, Any]], output_path: str, resume: bool,
+             summary: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        with tracer.span("batch.encode", queries=len(pending)) as span:
+            embeddings = self.pipeline.vector_store.encode_queries([item['query'] for item in pending])
+        encode_share = span.duration / len(pending)
+
+        mode = 'a' if resume else 'w'
+        with open(output_path, mode, encoding='utf-8') as out, \
+                ThreadPoolExecutor(max_workers=self.retrieval_workers) as executor:
+            futures = [
+                executor.submit(self._answer_one, item, embedding, encode_share)
+                for item, embedding in zip(pending, embeddings)
+            ]
+            for finished, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                summary[record['status']] += 1
+                summary['tokens_used'] += record.get('tokens_used', 0)
+                with self._write_lock:
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                print(f"[{finished}/{len(pending)}] {record['status']} {record['timings'].get('total', 0):.2f}s id={record['id']}",
+                      file=sys.stderr)
+
+        summary['wall_time'] = time.perf_counter() - start
+        summary['queries_per_second'] = len(pending) / summary['wall_time'] if summary['wall_time'] else 0.0
+        return summary
+
+    def _answer_one(self, item: Dict[str, Any], embedding: List[float], encode_share: float) -> Dict[str, Any]:
+        timings = {'encode': encode_share}
+        record = {'id': item['id'], 'query': item['query'], 'status': 'ok', 'timings': timings}
+        start = time.perf_counter()
+        try:
+            response = self.pipeline.answer(
+                item['query'], item.get('top_k_retrieval'), item.get('top_k_rerank'), item.get('filters'),
+                query_embedding=embedding, session_id=self.SESSION_ID, stage_limits=self._stage_limits
+            )
+        except PipelineError as e:
+            record.update({'status': 'error', 'error': str(e), 'failed_stage': e.stage})
+        except Exception as e:
+            record.update({'status': 'error', 'error': str(e)})
+        else:
+            record.update(self._record_fields(response, timings))
+            result = response['result']
+            if result.get('error'):
+                record.update({'status': 'error', 'error': result['error'], 'failed_stage': 'generation'})
+            elif result.get('degraded'):
+                record.update({'status': 'degraded', 'error': result.get('degraded_reason')})
+        timings['total'] = time.perf_counter() - start + encode_share
+        return record
+
+    @staticmethod
+    def _record_fields(response: Dict[str, Any], timings: Dict[str, float]) -> Dict[str, Any]:
+        """Output fields for one pipeline.answer() response; fills in the stage timings"""
+        result, timing_info = response['result'], response['timing_info']
+        timings['retrieval'] = timing_info['retrieval']
+        if 'reranking' in timing_info:
+            timings['rerank'] = timing_info['reranking']
+        if 'llm_generation' in timing_info:
+            timings['llm_wait'] = result.get('queue_wait', 0.0)
+            timings['generation'] = timing_info['llm_generation'] - timings['llm_wait']
+        fields = {'retrieved_ids': response['retrieved_ids']}
+        for key in ('candidate_selection', 'diversity', 'fast_path'):
+            if response[key] is not None:
+                fields[key] = response[key]
+        fields.update({
+            'answer': result['answer'],
+            'citations': result['citations'],
+            'sources': result['sources'],
+            'reranked_ids': [doc['id'] for doc in response['docs']],
+            'tokens_used': result.get('tokens_used', 0),
+            'model_used': result.get('model_used')
+        })
+        return fields
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the RAG pipeline")
+    parser.add_argument("input", help="JSONL file with one {\"query\": ...} object per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to append results to")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of resuming")
+    parser.add_argument("--workers", type=int, default=BATCH_RETRIEVAL_WORKERS, help="Concurrent vector queries")
+    parser.add_argument("--rerank-concurrency", type=int, default=BATCH_RERANK_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    parser.add_argument("--requests-per-minute", type=int, default=GROQ_REQUESTS_PER_MINUTE)
+    parser.add_argument("--tokens-per-minute", type=int, default=GROQ_TOKENS_PER_MINUTE)
+    args = parser.parse_args(argv)
+
+    from rag_pipeline import create_pipeline
+
+    queries = load_queries(args.input)
+    runner = BatchQueryRunner(
+        create_pipeline(),
+        retrieval_workers=args.workers,
+        rerank_concurrency=args.rerank_concurrency,
+        llm_concurrency=args.llm_concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute
+    )
+    summary = runner.run(queries, args.output, resume=not args.no_resume)
+    print(json.dumps(summary, indent=2))
+    return 0 if summary['error'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
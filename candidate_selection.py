@@ -0,0 +1,235 @@
+"""
+Candidate selection between retrieval and reranking
+
+The adaptive depth selector looks at the dense similarity curve of the
+retrieved candidates and decides how many of them are worth reranking:
+a clear gap after the leaders shrinks the set, a flat curve widens it,
+always within configured bounds. The MMR selector then drops redundant
+near-duplicates (e.g. overlapping neighbour chunks) using the embeddings
+returned by the index.
+"""
+import threading
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from config import (
+    ADAPTIVE_MIN_CANDIDATES,
+    ADAPTIVE_MAX_CANDIDATES,
+    ADAPTIVE_MIN_SCORE,
+    ADAPTIVE_GAP_THRESHOLD,
+    ADAPTIVE_FLAT_SPREAD,
+    MMR_LAMBDA,
+    MMR_CANDIDATES,
+    MMR_DUPLICATE_SIMILARITY
+)
+
+
+class AdaptiveDepthSelector:
+    """Chooses the rerank candidate count from the shape of the retrieval score curve"""
+
+    def __init__(self, min_candidates: int = ADAPTIVE_MIN_CANDIDATES,
+                 max_candidates: int = ADAPTIVE_MAX_CANDIDATES,
+                 min_score: float = ADAPTIVE_MIN_SCORE,
+                 gap_threshold: float = ADAPTIVE_GAP_THRESHOLD,
+                 flat_spread: float = ADAPTIVE_FLAT_SPREAD):
+        """
+        Args:
+            min_candidates: Never rerank fewer candidates than this
+            max_candidates: Never rerank more candidates than this (also the retrieval depth)
+            min_score: Drop candidates below this similarity (subject to min_candidates)
+            gap_threshold: A drop between neighbours larger than this fraction of the
+                score range is treated as the edge of the relevant set
+            flat_spread: If top-to-bottom spread is below this, scores are considered
+                flat and every candidate up to max_candidates is kept
+        """
+        self.min_candidates = min_candidates
+        self.max_candidates = max(max_candidates, min_candidates)
+        self.min_score = min_score
+        self.gap_threshold = gap_threshold
+        self.flat_spread = flat_spread
+        self._lock = threading.Lock()
+        self.totals = {'queries': 0, 'baseline_candidates': 0, 'selected_candidates': 0, 'rerank_seconds_saved': 0.0}
+
+    def cut_point(self, scores: List[float], min_k: int = None) -> Tuple[int, str]:
+        """
+        Number of leading candidates to keep, and the rule that decided it
+
+        Scores must be sorted in descending order.
+        """
+        min_k = self.min_candidates if min_k is None else min_k
+        n = min(len(scores), self.max_candidates)
+        if n <= min_k:
+            return n, 'all'
+
+        s = np.asarray(scores[:n], dtype=np.float64)
+
+        # Minimum-score cutoff
+        above = int(np.count_nonzero(s >= self.min_score))
+        if above < n:
+            n = max(above, min_k)
+            s = s[:n]
+            if n <= min_k:
+                return n, 'min_score'
+
+        spread = s[0] - s[-1]
+        if spread < self.flat_spread:
+            return n, 'flat'
+
+        # Largest neighbour gap at or after min_k, relative to the score range
+        gaps = s[min_k - 1:-1] - s[min_k:]
+        best = int(np.argmax(gaps))
+        if gaps[best] / spread >= self.gap_threshold:
+            return min_k + best, 'gap'
+
+        # Elbow: the point furthest below the chord from first to last score
+        x = np.linspace(0.0, 1.0, n)
+        chord = s[0] + (s[-1] - s[0]) * x
+        distance = (chord - s)[min_k - 1:]
+        elbow = min_k - 1 + int(np.argmax(np.abs(distance)))
+        return max(elbow + 1, min_k), 'elbow'
+
+    def select(self, docs: List[Dict[str, Any]], baseline_k: int,
+               min_k: int = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Keep the leading candidates chosen by cut_point
+
+        Args:
+            docs: Retrieved candidates, best first, with 'score'
+            baseline_k: Candidate count the fixed-k pipeline would have reranked
+            min_k: Lower bound for this query (e.g. the rerank top_k)
+
+        Returns:
+            (selected docs, selection info for tracing and logging)
+        """
+        min_k = max(self.min_candidates, min_k or 0)
+        keep, rule = self.cut_point([doc.get('score', 0.0) for doc in docs], min_k)
+        selection = {
+            'retrieved': len(docs),
+            'baseline': min(baseline_k, len(docs)),
+            'selected': keep,
+            'rule': rule
+        }
+        return docs[:keep], selection
+
+    def record(self, selection: Dict[str, Any], rerank_seconds: float, reranked: int = None) -> float:
+        """
+        Record a selection with the rerank time it saved versus the fixed-k baseline
+
+        Rerank cost is taken as linear in the candidate count, so the saving is
+        the measured per-candidate cost times the candidates skipped (negative
+        when the set was widened). `reranked` is the count actually sent to the
+        reranker if a later stage trimmed the selection further.
+        """
+        reranked = selection['selected'] if reranked is None else reranked
+        per_candidate = rerank_seconds / reranked if reranked else 0.0
+        saved = per_candidate * (selection['baseline'] - reranked)
+        selection['rerank_seconds_saved'] = saved
+        with self._lock:
+            self.totals['queries'] += 1
+            self.totals['baseline_candidates'] += selection['baseline']
+            self.totals['selected_candidates'] += selection['selected']
+            self.totals['rerank_seconds_saved'] += saved
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        """Lifetime totals plus the average candidate count versus baseline"""
+        with self._lock:
+            totals = dict(self.totals)
+        queries = totals['queries']
+        totals['avg_selected'] = totals['selected_candidates'] / queries if queries else 0.0
+        totals['avg_baseline'] = totals['baseline_candidates'] / queries if queries else 0.0
+        return totals
+
+
+class MMRSelector:
+    """Maximal-marginal-relevance selection over candidate embeddings"""
+
+    def __init__(self, lambda_mult: float = MMR_LAMBDA, max_candidates: int = MMR_CANDIDATES,
+                 duplicate_similarity: float = MMR_DUPLICATE_SIMILARITY):
+        """
+        Args:
+            lambda_mult: 1.0 ranks purely by relevance, 0.0 purely by novelty
+            max_candidates: Candidates kept for reranking
+            duplicate_similarity: Dropped candidates at least this similar to a kept
+                one are counted as near-duplicates in the report
+        """
+        self.lambda_mult = lambda_mult
+        self.max_candidates = max_candidates
+        self.duplicate_similarity = duplicate_similarity
+        self._lock = threading.Lock()
+        self.totals = {'queries': 0, 'candidates_in': 0, 'candidates_out': 0,
+                       'rerank_chars_saved': 0, 'redundant_context_chars_avoided': 0}
+
+    def order(self, relevance: np.ndarray, similarity: np.ndarray, k: int) -> List[int]:
+        """Greedy MMR: indices of the k picks, in pick order"""
+        n = len(relevance)
+        chosen = []
+        available = np.ones(n, dtype=bool)
+        max_similarity = np.full(n, -np.inf)
+        for _ in range(min(k, n)):
+            if chosen:
+                marginal = self.lambda_mult * relevance - (1 - self.lambda_mult) * max_similarity
+            else:
+                marginal = relevance.copy()
+            marginal[~available] = -np.inf
+            pick = int(np.argmax(marginal))
+            chosen.append(pick)
+            available[pick] = False
+            np.maximum(max_similarity, similarity[pick], out=max_similarity)
+        return chosen
+
+    def select(self, docs: List[Dict[str, Any]], context_size: int,
+               min_k: int = 0) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Pick a diverse subset of docs (each needs 'score' and 'values')
+
+        Texts are not needed: character counts come from 'text' when it is
+        already loaded and from the index's 'chunk_size' metadata otherwise.
+
+        Args:
+            docs: Candidates, best first
+            context_size: Documents that end up in the LLM prompt (rerank top_k),
+                used to report how much redundant text the prompt avoided
+            min_k: Never keep fewer than this many candidates
+
+        Returns:
+            (selected docs in original rank order, selection report)
+        """
+        k = min(len(docs), max(self.max_candidates, min_k))
+        if k == len(docs) or any(doc.get('values') is None for doc in docs):
+            return docs, None
+
+        embeddings = np.asarray([doc['values'] for doc in docs], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.where(norms > 0, norms, 1.0)
+        similarity = embeddings @ embeddings.T
+        relevance = np.asarray([doc.get('score', 0.0) for doc in docs], dtype=np.float64)
+
+        chosen = sorted(self.order(relevance, similarity, k))
+        kept = np.zeros(len(docs), dtype=bool)
+        kept[chosen] = True
+        dropped = np.flatnonzero(~kept)
+
+        closest = similarity[np.ix_(dropped, chosen)].max(axis=1) if len(dropped) else np.zeros(0)
+        chars = [len(doc['text']) if doc.get('text') is not None else doc.get('chunk_size') or 0 for doc in docs]
+        report = {
+            'lambda': self.lambda_mult,
+            'candidates_in': len(docs),
+            'candidates_out': len(chosen),
+            'near_duplicates_dropped': int(np.count_nonzero(closest >= self.duplicate_similarity)),
+            'rerank_chars_in': sum(chars),
+            'rerank_chars_out': sum(chars[i] for i in chosen),
+            # Redundant chunks the fixed dense top-k would have put in the prompt
+            'redundant_context_chars_avoided': sum(chars[i] for i in dropped if i < context_size)
+        }
+        with self._lock:
+            self.totals['queries'] += 1
+            self.totals['candidates_in'] += report['candidates_in']
+            self.totals['candidates_out'] += report['candidates_out']
+            self.totals['rerank_chars_saved'] += report['rerank_chars_in'] - report['rerank_chars_out']
+            self.totals['redundant_context_chars_avoided'] += report['redundant_context_chars_avoided']
+        return [docs[i] for i in chosen], report
+
+    def stats(self) -> Dict[str, Any]:
+        """Lifetime totals of candidates and characters removed"""
+        with self._lock:
+            return dict(self.totals)
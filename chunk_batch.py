@@ -0,0 +1,172 @@
+"""
+Columnar representation of document chunks for ingestion
+
+A ChunkBatch stores chunk texts as (offset, length) slices of one shared text
+buffer (usually the cleaned document itself, so overlapping chunks share
+memory), per-chunk numeric columns as NumPy arrays, and source/title/section
+as indexes into interned string tables. Embeddings live in one float32
+matrix. The list-of-dicts chunk format is still available as a
+compatibility view through iteration, indexing and to_dicts().
+"""
+import sys
+from typing import List, Dict, Any, Optional, Iterator, Union
+import numpy as np
+
+
+class StringTable:
+    """Interned strings addressed by small integer codes"""
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values = []
+        self._codes = {}
+        for value in values or []:
+            self.code(value)
+
+    def code(self, value: str) -> int:
+        """Code for value, adding it to the table if new"""
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __getitem__(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ChunkBatch:
+    """Parallel arrays of chunk slices and metadata codes over one text buffer"""
+
+    def __init__(self, buffer: str, offsets, lengths, positions, chunk_indexes,
+                 source_ids, title_ids, section_ids,
+                 sources: StringTable, titles: StringTable, sections: StringTable,
+                 embeddings: Optional[np.ndarray] = None):
+        self.buffer = buffer
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int32)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.chunk_indexes = np.asarray(chunk_indexes, dtype=np.int32)
+        self.source_ids = np.asarray(source_ids, dtype=np.int32)
+        self.title_ids = np.asarray(title_ids, dtype=np.int32)
+        self.section_ids = np.asarray(section_ids, dtype=np.int32)
+        self.sources = sources
+        self.titles = titles
+        self.sections = sections
+        self.embeddings = embeddings
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def empty(cls, buffer: str = "") -> 'ChunkBatch':
+        return cls(buffer, [], [], [], [], [], [], [], StringTable(), StringTable(), StringTable())
+
+    @classmethod
+    def from_dicts(cls, chunks: List[Dict[str, Any]]) -> 'ChunkBatch':
+        """Build a batch from legacy {'text', 'metadata'} chunk dicts (texts are copied into one buffer)"""
+        sources, titles, sections = StringTable(), StringTable(), StringTable()
+        parts, offsets, lengths = [], [], []
+        positions, chunk_indexes, source_ids, title_ids, section_ids = [], [], [], [], []
+        cursor = 0
+        for chunk in chunks:
+            text = chunk['text']
+            metadata = chunk.get('metadata', {})
+            parts.append(text)
+            offsets.append(cursor)
+            lengths.append(len(text))
+            cursor += len(text)
+            positions.append(metadata.get('position', metadata.get('chunk_index', 0)))
+            chunk_indexes.append(metadata.get('chunk_index', 0))
+            source_ids.append(sources.code(metadata.get('source', 'unknown')))
+            title_ids.append(titles.code(metadata.get('title', '')))
+            section_ids.append(sections.code(metadata.get('section', '')))
+        return cls("".join(parts), offsets, lengths, positions, chunk_indexes,
+                   source_ids, title_ids, section_ids, sources, titles, sections)
+
+    # ------------------------------------------------------------------
+    # Column access
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def text(self, i: int) -> str:
+        start = int(self.offsets[i])
+        return self.buffer[start:start + int(self.lengths[i])]
+
+    def texts(self) -> List[str]:
+        """All chunk texts (e.g. for one batched encode call)"""
+        return [self.text(i) for i in range(len(self))]
+
+    def source(self, i: int) -> str:
+        return self.sources[self.source_ids[i]]
+
+    def title(self, i: int) -> str:
+        return self.titles[self.title_ids[i]]
+
+    def section(self, i: int) -> str:
+        return self.sections[self.section_ids[i]]
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        return {
+            'source': self.source(i),
+            'title': self.title(i),
+            'section': self.section(i),
+            'position': int(self.positions[i]),
+            'chunk_index': int(self.chunk_indexes[i]),
+            'chunk_size': int(self.lengths[i])
+        }
+
+    def slice(self, start: int, stop: int) -> 'ChunkBatch':
+        """View of chunks [start, stop) sharing the buffer and string tables"""
+        return ChunkBatch(
+            self.buffer, self.offsets[start:stop], self.lengths[start:stop], self.positions[start:stop],
+            self.chunk_indexes[start:stop], self.source_ids[start:stop], self.title_ids[start:stop],
+            self.section_ids[start:stop], self.sources, self.titles, self.sections,
+            self.embeddings[start:stop] if self.embeddings is not None else None
+        )
+
+    def take(self, indices) -> 'ChunkBatch':
+        """Batch of the chunks at `indices` (any order), sharing the buffer and string tables"""
+        indices = np.asarray(indices, dtype=np.int64)
+        return ChunkBatch(
+            self.buffer, self.offsets[indices], self.lengths[indices], self.positions[indices],
+            self.chunk_indexes[indices], self.source_ids[indices], self.title_ids[indices],
+            self.section_ids[indices], self.sources, self.titles, self.sections,
+            self.embeddings[indices] if self.embeddings is not None else None
+        )
+
+    # ------------------------------------------------------------------
+    # Compatibility view
+    # ------------------------------------------------------------------
+
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("ChunkBatch slices must be contiguous")
+            return self.slice(start, stop)
+        if key < 0:
+            key += len(self)
+        return {'text': self.text(key), 'metadata': self.metadata(key)}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Legacy list of {'text', 'metadata'} dicts"""
+        return list(self)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the batch (buffer, columns and embeddings)"""
+        columns = (self.offsets, self.lengths, self.positions, self.chunk_indexes,
+                   self.source_ids, self.title_ids, self.section_ids)
+        size = sys.getsizeof(self.buffer) + sum(column.nbytes for column in columns)
+        if self.embeddings is not None:
+            size += self.embeddings.nbytes
+        return size
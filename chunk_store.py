@@ -0,0 +1,211 @@
+"""
+Local SQLite store for chunk text, keyed by vector ID
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+
+class ChunkStore:
+    """
+    Holds the full text of every indexed chunk outside the vector index
+
+    The vector index only carries small filterable metadata; texts are
+    looked up here in batches for the candidates that actually need them.
+    """
+
+    # SQLite limits the number of host parameters per statement
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                title TEXT,
+                section TEXT,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source)")
+        # Full-width float32 embeddings for rescoring when the index holds reduced vectors
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if 'embedding' not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN embedding BLOB")
+        self._create_inventory()
+        self._conn.commit()
+
+    def _create_inventory(self) -> None:
+        """Per-source chunk counts and text bytes, kept current by triggers on every write"""
+        # REPLACE only fires delete triggers for the replaced row with recursive triggers on
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'source_inventory'"
+        ).fetchone()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS source_inventory (
+                source TEXT PRIMARY KEY,
+                chunks INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                first_ingested REAL,
+                last_ingested REAL
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_inventory_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO source_inventory (source, chunks, bytes, first_ingested, last_ingested)
+                VALUES (NEW.source, 1, LENGTH(CAST(NEW.text AS BLOB)), NEW.created_at, NEW.created_at)
+                ON CONFLICT(source) DO UPDATE SET
+                    chunks = chunks + 1,
+                    bytes = bytes + excluded.bytes,
+                    first_ingested = MIN(first_ingested, excluded.first_ingested),
+                    last_ingested = MAX(last_ingested, excluded.last_ingested);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_inventory_delete AFTER DELETE ON chunks BEGIN
+                UPDATE source_inventory
+                SET chunks = chunks - 1, bytes = bytes - LENGTH(CAST(OLD.text AS BLOB))
+                WHERE source = OLD.source;
+                DELETE FROM source_inventory WHERE source = OLD.source AND chunks <= 0;
+            END;
+        """)
+        if not exists:
+            # Backfill stores created before the inventory existed
+            self._conn.execute("""
+                INSERT INTO source_inventory (source, chunks, bytes, first_ingested, last_ingested)
+                SELECT source, COUNT(*), SUM(LENGTH(CAST(text AS BLOB))), MIN(created_at), MAX(created_at)
+                FROM chunks GROUP BY source
+            """)
+
+    def put_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert or replace chunk texts
+
+        Args:
+            records: Dicts with 'id', 'text' and optional 'source', 'title', 'section'
+                and 'embedding' (float32 bytes)
+
+        Returns:
+            Number of rows written
+        """
+        now = time.time()
+        rows = [
+            (r['id'], r.get('source', 'unknown'), r.get('title', ''), r.get('section', ''), r['text'], now,
+             r.get('embedding'))
+            for r in records
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, source, title, section, text, created_at, embedding) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        """Batch lookup of chunk texts by vector ID (missing IDs are omitted)"""
+        texts = {}
+        with self._lock:
+            for i in range(0, len(ids), self.LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + self.LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for vector_id, text in self._conn.execute(
+                    f"SELECT id, text FROM chunks WHERE id IN ({placeholders})", batch
+                ):
+                    texts[vector_id] = text
+        return texts
+
+    def put_embeddings(self, ids: List[str], embeddings: np.ndarray) -> None:
+        """Attach full-width embeddings to existing chunk rows"""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET embedding = ? WHERE id = ?",
+                [(matrix[i].tobytes(), vector_id) for i, vector_id in enumerate(ids)]
+            )
+            self._conn.commit()
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Batch lookup of full-width embeddings by vector ID (IDs without one are omitted)"""
+        embeddings = {}
+        with self._lock:
+            for i in range(0, len(ids), self.LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + self.LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for vector_id, blob in self._conn.execute(
+                    f"SELECT id, embedding FROM chunks WHERE id IN ({placeholders}) AND embedding IS NOT NULL", batch
+                ):
+                    embeddings[vector_id] = np.frombuffer(blob, dtype=np.float32)
+        return embeddings
+
+    def list_ids(self) -> List[str]:
+        """Every stored vector ID, in insertion order"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM chunks ORDER BY rowid")]
+
+    def iter_texts(self, source: Optional[str] = None, batch_size: int = LOOKUP_BATCH_SIZE) -> Iterator[Tuple[str, str]]:
+        """(source, text) of every stored chunk, optionally for one source, read in batches"""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, source, text FROM chunks WHERE rowid > ? AND (? IS NULL OR source = ?) "
+                    "ORDER BY rowid LIMIT ?", (last_rowid, source, source, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, row_source, text in rows:
+                yield row_source, text
+            last_rowid = rows[-1][0]
+
+    def delete_many(self, ids: List[str]) -> None:
+        """Remove chunk texts by vector ID"""
+        with self._lock:
+            for i in range(0, len(ids), self.LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + self.LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Remove all chunk texts"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def list_sources(self) -> List[str]:
+        """Distinct source names with stored chunks"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT source FROM chunks ORDER BY source")]
+
+    def inventory(self) -> List[Dict[str, Any]]:
+        """Chunk count, text bytes and first/last ingest time per source (no table scan)"""
+        with self._lock:
+            return [
+                {'source': row[0], 'chunks': row[1], 'bytes': row[2], 'first_ingested': row[3], 'last_ingested': row[4]}
+                for row in self._conn.execute(
+                    "SELECT source, chunks, bytes, first_ingested, last_ingested FROM source_inventory ORDER BY source"
+                )
+            ]
+
+    def count(self, source: Optional[str] = None) -> int:
+        """Number of stored chunks, optionally for one source"""
+        with self._lock:
+            if source is None:
+                return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE source = ?", (source,)).fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
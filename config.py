@@ -14,7 +14,8 @@ def get_config_value(key, default=None):
         # Try Streamlit secrets first (for cloud deployment)
         if hasattr(st, 'secrets') and key in st.secrets:
             return st.secrets[key]
-    except ImportError:
+    except (ImportError, FileNotFoundError):
+        # No Streamlit, or running outside Streamlit without a secrets.toml (CLI tools)
         pass
     # Fallback to environment variables
     return os.getenv(key, default)
@@ -37,6 +38,149 @@ TOP_K_RETRIEVAL = 20
 TOP_K_RERANK = 5
 
 # LLM Configuration
-LLM_MODEL = "llama-3.1-8b-instant"  # Groq model
+LLM_MODEL = get_config_value("LLM_MODEL", "llama-3.1-8b-instant")  # Groq model
+LLM_FAST_MODEL = get_config_value("LLM_FAST_MODEL", LLM_MODEL)  # routed to under load or for small contexts
+LLM_MAX_CONCURRENCY = int(get_config_value("LLM_MAX_CONCURRENCY", 4))  # in-flight Groq calls per process
+LLM_QUEUE_TIMEOUT = float(get_config_value("LLM_QUEUE_TIMEOUT", 60))  # seconds a call may wait for budget
+LLM_ROUTE_QUEUE_DEPTH = int(get_config_value("LLM_ROUTE_QUEUE_DEPTH", 4))  # waiting calls before using fast model
+LLM_ROUTE_SMALL_CONTEXT_TOKENS = int(get_config_value("LLM_ROUTE_SMALL_CONTEXT_TOKENS", 500))
+LLM_MAX_RETRIES = int(get_config_value("LLM_MAX_RETRIES", 2))  # retries after a Groq rate-limit response
 MAX_TOKENS = 1000
 TEMPERATURE = 0.1
+
+# Adaptive Retrieval Depth Configuration (off by default: it retrieves past the top_k setting)
+ADAPTIVE_DEPTH_ENABLED = str(get_config_value("ADAPTIVE_DEPTH_ENABLED", "false")).lower() == "true"
+ADAPTIVE_MIN_CANDIDATES = int(get_config_value("ADAPTIVE_MIN_CANDIDATES", 5))
+ADAPTIVE_MAX_CANDIDATES = int(get_config_value("ADAPTIVE_MAX_CANDIDATES", 40))
+ADAPTIVE_MIN_SCORE = float(get_config_value("ADAPTIVE_MIN_SCORE", 0.2))  # cosine similarity floor
+ADAPTIVE_GAP_THRESHOLD = float(get_config_value("ADAPTIVE_GAP_THRESHOLD", 0.35))  # fraction of the score range
+ADAPTIVE_FLAT_SPREAD = float(get_config_value("ADAPTIVE_FLAT_SPREAD", 0.05))  # top-to-bottom spread
+
+# MMR Diversity Configuration (off by default: it changes which candidates reach the reranker)
+MMR_ENABLED = str(get_config_value("MMR_ENABLED", "false")).lower() == "true"
+MMR_LAMBDA = float(get_config_value("MMR_LAMBDA", 0.7))  # 1.0 = relevance only, 0.0 = novelty only
+MMR_CANDIDATES = int(get_config_value("MMR_CANDIDATES", 12))  # candidates kept for reranking
+MMR_DUPLICATE_SIMILARITY = float(get_config_value("MMR_DUPLICATE_SIMILARITY", 0.9))  # reported as near-duplicate
+
+# Fast Path Configuration (calibrate with `python fast_path.py golden.jsonl` before enabling)
+FAST_PATH_ENABLED = str(get_config_value("FAST_PATH_ENABLED", "false")).lower() == "true"
+FAST_PATH_SKIP_RERANK_SCORE = float(get_config_value("FAST_PATH_SKIP_RERANK_SCORE", 0.75))  # top dense score
+FAST_PATH_SKIP_RERANK_MARGIN = float(get_config_value("FAST_PATH_SKIP_RERANK_MARGIN", 0.08))  # over runner-up
+FAST_PATH_EXTRACTIVE = str(get_config_value("FAST_PATH_EXTRACTIVE", "false")).lower() == "true"
+FAST_PATH_EXTRACTIVE_SCORE = float(get_config_value("FAST_PATH_EXTRACTIVE_SCORE", 0.85))
+FAST_PATH_EXTRACTIVE_MARGIN = float(get_config_value("FAST_PATH_EXTRACTIVE_MARGIN", 0.15))
+
+# Local State Configuration
+DATA_DIR = get_config_value("RAG_DATA_DIR", ".rag_data")
+
+# Tracing Configuration
+TRACE_STORE_PATH = get_config_value("TRACE_STORE_PATH", os.path.join(DATA_DIR, "latency_histograms.json"))
+TRACE_WINDOW_SIZE = int(get_config_value("TRACE_WINDOW_SIZE", 1000))  # samples kept per stage
+TRACE_FLUSH_SECONDS = float(get_config_value("TRACE_FLUSH_SECONDS", 10))  # histograms are persisted in the background this often
+
+# Vector Backend Configuration
+VECTOR_BACKEND = get_config_value("VECTOR_BACKEND", "pinecone")  # "pinecone" or "local"
+LOCAL_INDEX_PATH = get_config_value("LOCAL_INDEX_PATH", os.path.join(DATA_DIR, "local_index"))
+CHUNK_STORE_PATH = get_config_value("CHUNK_STORE_PATH", os.path.join(DATA_DIR, "chunks.sqlite3"))
+
+# Batch Query Configuration
+BATCH_RETRIEVAL_WORKERS = int(get_config_value("BATCH_RETRIEVAL_WORKERS", 8))
+BATCH_RERANK_CONCURRENCY = int(get_config_value("BATCH_RERANK_CONCURRENCY", 4))
+BATCH_LLM_CONCURRENCY = int(get_config_value("BATCH_LLM_CONCURRENCY", 4))
+GROQ_REQUESTS_PER_MINUTE = int(get_config_value("GROQ_REQUESTS_PER_MINUTE", 30))
+GROQ_TOKENS_PER_MINUTE = int(get_config_value("GROQ_TOKENS_PER_MINUTE", 6000))
+
+# Query Service Configuration
+QUERY_SERVICE_URL = get_config_value("QUERY_SERVICE_URL")  # set to use a remote query service from the UI
+QUERY_SERVICE_HOST = get_config_value("QUERY_SERVICE_HOST", "127.0.0.1")
+QUERY_SERVICE_PORT = int(get_config_value("QUERY_SERVICE_PORT", 8600))
+QUERY_SERVICE_WORKERS = int(get_config_value("QUERY_SERVICE_WORKERS", 4))
+QUERY_SERVICE_MAX_QUEUE = int(get_config_value("QUERY_SERVICE_MAX_QUEUE", 32))  # waiting requests before 503
+QUERY_SERVICE_TIMEOUT = float(get_config_value("QUERY_SERVICE_TIMEOUT", 120))  # seconds
+QUERY_SERVICE_ADMIN_TOKEN = get_config_value("QUERY_SERVICE_ADMIN_TOKEN")  # bearer token for POST /clear; unset disables it
+
+# Background Ingestion Configuration
+INGEST_QUEUE_PATH = get_config_value("INGEST_QUEUE_PATH", os.path.join(DATA_DIR, "ingest_jobs.sqlite3"))
+INGEST_UPLOAD_DIR = get_config_value("INGEST_UPLOAD_DIR", os.path.join(DATA_DIR, "uploads"))
+INGEST_BATCH_SIZE = int(get_config_value("INGEST_BATCH_SIZE", 100))  # chunks per checkpointed batch
+INGEST_POLL_INTERVAL = float(get_config_value("INGEST_POLL_INTERVAL", 1.0))  # seconds
+INGEST_STALE_SECONDS = float(get_config_value("INGEST_STALE_SECONDS", 120))  # reclaim jobs without heartbeat
+INGEST_AUTOSTART_WORKER = str(get_config_value("INGEST_AUTOSTART_WORKER", "true")).lower() == "true"
+
+# Reduced-Dimension Index Configuration (migrate with `python dim_reduction.py migrate`)
+EMBEDDING_REDUCTION = get_config_value("EMBEDDING_REDUCTION", "none")  # none, pca or truncate
+EMBEDDING_REDUCED_DIM = int(get_config_value("EMBEDDING_REDUCED_DIM", 256))
+EMBEDDING_RESCORE_FACTOR = int(get_config_value("EMBEDDING_RESCORE_FACTOR", 4))  # shortlist = top_k * factor
+PCA_PROJECTION_PATH = get_config_value("PCA_PROJECTION_PATH", os.path.join(DATA_DIR, "pca_projection.npz"))
+PCA_FIT_SAMPLES = int(get_config_value("PCA_FIT_SAMPLES", 20000))
+
+# Ingest Deduplication Configuration
+DEDUP_ENABLED = str(get_config_value("DEDUP_ENABLED", "false")).lower() == "true"  # aliases are invisible to source filters, citations and the inventory
+DEDUP_INDEX_PATH = get_config_value("DEDUP_INDEX_PATH", os.path.join(DATA_DIR, "signatures.sqlite3"))
+DEDUP_MAX_DISTANCE = int(get_config_value("DEDUP_MAX_DISTANCE", 3))  # SimHash bits that may differ for a near-duplicate
+DEDUP_MIN_TOKENS = int(get_config_value("DEDUP_MIN_TOKENS", 8))  # shorter chunks are never deduplicated
+DEDUP_SHINGLE_SIZE = int(get_config_value("DEDUP_SHINGLE_SIZE", 3))  # words per SimHash feature
+
+# Upload Handling Configuration
+UPLOAD_SPOOL_THRESHOLD = int(get_config_value("UPLOAD_SPOOL_THRESHOLD", 8 * 1024 * 1024))  # bytes kept in memory before spooling to disk
+UPLOAD_SPOOL_DIR = get_config_value("UPLOAD_SPOOL_DIR", os.path.join(DATA_DIR, "spool"))
+UPLOAD_READ_CHUNK = int(get_config_value("UPLOAD_READ_CHUNK", 1024 * 1024))  # bytes per read when copying/decoding
+
+# Embedding Worker Pool Configuration (benchmark with `python embedding_pool.py benchmark`)
+EMBEDDING_MODEL_NAME = get_config_value("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2")
+EMBEDDING_POOL_WORKERS = int(get_config_value("EMBEDDING_POOL_WORKERS", 0))  # worker processes; 0 or 1 encodes in-process
+EMBEDDING_POOL_MIN_CHUNKS = int(get_config_value("EMBEDDING_POOL_MIN_CHUNKS", 64))  # smaller batches encode in-process
+EMBEDDING_POOL_SHARD_SIZE = int(get_config_value("EMBEDDING_POOL_SHARD_SIZE", 64))  # chunks per worker task
+
+# Index Snapshot Configuration (python index_snapshot.py export/import)
+SNAPSHOT_DIR = get_config_value("SNAPSHOT_DIR", os.path.join(DATA_DIR, "snapshots"))
+SNAPSHOT_DTYPE = get_config_value("SNAPSHOT_DTYPE", "float32")  # float16 halves the vector file
+SNAPSHOT_IMPORT_WORKERS = int(get_config_value("SNAPSHOT_IMPORT_WORKERS", 8))  # parallel Pinecone upserts/fetches
+SNAPSHOT_BATCH_SIZE = int(get_config_value("SNAPSHOT_BATCH_SIZE", 100))  # vectors per upsert/fetch request
+
+# Warm-up Configuration (runs in the background at service start)
+WARMUP_ENABLED = str(get_config_value("WARMUP_ENABLED", "true")).lower() == "true"
+WARMUP_RERANKER = str(get_config_value("WARMUP_RERANKER", "true")).lower() == "true"  # one tiny rerank call
+WARMUP_LLM = str(get_config_value("WARMUP_LLM", "true")).lower() == "true"  # lists models; no tokens spent
+QUERY_EMBEDDING_CACHE_SIZE = int(get_config_value("QUERY_EMBEDDING_CACHE_SIZE", 1024))  # 0 disables the cache
+
+# Index Statistics Configuration
+INDEX_STATS_TTL = float(get_config_value("INDEX_STATS_TTL", 30))  # seconds before a background describe_index_stats refresh
+
+# Ingest Memory Configuration
+INGEST_MEMORY_PROFILE = str(get_config_value("INGEST_MEMORY_PROFILE", "false")).lower() == "true"  # tracemalloc per stage (slow)
+INGEST_MEMORY_TOP_N = int(get_config_value("INGEST_MEMORY_TOP_N", 10))  # allocating lines reported per stage
+INGEST_MEMORY_BUDGET_MB = float(get_config_value("INGEST_MEMORY_BUDGET_MB", 0))  # RSS ceiling during ingest; 0 = unlimited
+INGEST_MEMORY_MIN_BATCH = int(get_config_value("INGEST_MEMORY_MIN_BATCH", 8))  # smallest batch before rejecting
+
+# Profiling Configuration (python profiling.py list/show)
+PROFILING_ENABLED = str(get_config_value("PROFILING_ENABLED", "false")).lower() == "true"  # profile every query/ingest
+PROFILE_DIR = get_config_value("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_KEEP = int(get_config_value("PROFILE_KEEP", 50))  # most recent profiles kept on disk
+
+# Query Log Configuration (replay with python replay_queries.py)
+QUERY_LOG_ENABLED = str(get_config_value("QUERY_LOG_ENABLED", "false")).lower() == "true"  # stores every question
+QUERY_LOG_DIR = get_config_value("QUERY_LOG_DIR", os.path.join(DATA_DIR, "query_log"))
+QUERY_LOG_KEEP_DAYS = int(get_config_value("QUERY_LOG_KEEP_DAYS", 14))  # daily segments kept on disk (0 keeps all)
+QUERY_LOG_FLUSH_RECORDS = int(get_config_value("QUERY_LOG_FLUSH_RECORDS", 20))  # buffered records per gzip append
+QUERY_LOG_FLUSH_SECONDS = float(get_config_value("QUERY_LOG_FLUSH_SECONDS", 5))  # or flush once the buffer is this old
+
+# Resilience Configuration (deadlines, circuit breakers and hedging for remote calls)
+RESILIENCE_ENABLED = str(get_config_value("RESILIENCE_ENABLED", "true")).lower() == "true"
+INDEX_DEADLINE = float(get_config_value("INDEX_DEADLINE", 3.0))  # seconds per vector index query
+RERANK_DEADLINE = float(get_config_value("RERANK_DEADLINE", 3.0))  # seconds per Cohere rerank call
+LLM_DEADLINE = float(get_config_value("LLM_DEADLINE", 30.0))  # seconds per Groq completion
+BREAKER_FAILURE_THRESHOLD = int(get_config_value("BREAKER_FAILURE_THRESHOLD", 5))  # consecutive failures that open a circuit
+BREAKER_RESET_SECONDS = float(get_config_value("BREAKER_RESET_SECONDS", 30))  # open time before one probe call is let through
+HEDGE_ENABLED = str(get_config_value("HEDGE_ENABLED", "false")).lower() == "true"
+HEDGE_SERVICES = get_config_value("HEDGE_SERVICES", "index,rerank")  # LLM calls are never hedged (token budget)
+HEDGE_PERCENTILE = float(get_config_value("HEDGE_PERCENTILE", 95))  # duplicate a call still running after this latency percentile
+HEDGE_MIN_SAMPLES = int(get_config_value("HEDGE_MIN_SAMPLES", 20))  # samples needed before hedging starts
+RESILIENCE_MAX_THREADS = int(get_config_value("RESILIENCE_MAX_THREADS", 32))  # threads running guarded calls
+RESILIENCE_INDEX_FALLBACK = str(get_config_value("RESILIENCE_INDEX_FALLBACK", "false")).lower() == "true"  # query LOCAL_INDEX_PATH replica while Pinecone is down (it is not kept in sync)
+
+# Token-Aware Chunking Configuration (python tokenization.py stats reports truncation in the current index)
+CHUNK_UNIT = get_config_value("CHUNK_UNIT", "chars")  # "chars" (CHUNK_SIZE/CHUNK_OVERLAP) or "tokens" of the embedding model
+EMBEDDING_MAX_SEQ_LENGTH = int(get_config_value("EMBEDDING_MAX_SEQ_LENGTH", 384))  # tokens the embedding model reads, special tokens included
+CHUNK_TOKENS = int(get_config_value("CHUNK_TOKENS", 0))  # tokens per chunk in token mode; 0 fills the model's sequence length
+CHUNK_OVERLAP_TOKENS = int(get_config_value("CHUNK_OVERLAP_TOKENS", 48))  # tokens repeated from the end of the previous chunk
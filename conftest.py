@@ -0,0 +1,32 @@
+"""
+Shared pytest fixtures
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+# Keep test runs out of the working tree's .rag_data: config (and the module-level
+# tracer, which flushes histograms at exit) read these when first imported
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="rag-test-data-")
+os.environ["RAG_DATA_DIR"] = TEST_DATA_DIR
+os.environ["TRACE_STORE_PATH"] = os.path.join(TEST_DATA_DIR, "latency_histograms.json")
+atexit.register(shutil.rmtree, TEST_DATA_DIR, True)  # registered first, so it runs after the tracer's flush
+
+import random
+import pytest
+from document_processor import DocumentProcessor
+from load_test import synthetic_document
+from stand_ins import create_stand_in_pipeline
+
+
+@pytest.fixture
+def seeded_pipeline():
+    """Stand-in pipeline with a dozen synthetic documents indexed"""
+    pipeline = create_stand_in_pipeline()
+    processor = DocumentProcessor()
+    rng = random.Random(7)
+    for i in range(12):
+        chunks = processor.chunk_text(synthetic_document(i, rng, paragraphs=12), f"doc-{i}.txt", f"Document {i}")
+        pipeline.vector_store.upsert_documents(chunks, [f"doc{i}_{n}" for n in range(len(chunks))])
+    return pipeline
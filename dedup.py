@@ -0,0 +1,264 @@
+"""
+Ingest-time near-duplicate detection with SimHash signatures and banded LSH
+
+Every indexed chunk gets a 64-bit SimHash over word shingles. Signatures are
+split into DEDUP_MAX_DISTANCE + 1 bands, so two signatures within that
+Hamming distance share at least one band exactly; bands are the lookup keys
+of a persisted SQLite index. Chunks of a new batch that are near-duplicates
+of an indexed chunk (or of an earlier chunk in the same batch) are not
+embedded or upserted but recorded as aliases of that canonical chunk.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+import numpy as np
+from config import (
+    DEDUP_INDEX_PATH,
+    DEDUP_MAX_DISTANCE,
+    DEDUP_MIN_TOKENS,
+    DEDUP_SHINGLE_SIZE
+)
+
+_BITS = np.arange(64, dtype=np.uint64)
+
+
+def _signed(value: int) -> int:
+    """Unsigned 64-bit value as SQLite's signed INTEGER"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def simhash(tokens: List[str], shingle_size: int = DEDUP_SHINGLE_SIZE) -> int:
+    """64-bit SimHash of a token list, using word shingles as features"""
+    if len(tokens) < shingle_size:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little') for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    votes = ((hashes[:, None] >> _BITS) & np.uint64(1)).sum(axis=0)
+    bits = (votes * 2 > len(shingles)).astype(np.uint64)
+    return int((bits << _BITS).sum())
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class DedupPlan:
+    """Outcome of checking a batch: which chunks to index and which are aliases"""
+
+    def __init__(self, keep: np.ndarray, signatures: List[Optional[int]], canonical: Dict[int, str],
+                 distances: Dict[int, int]):
+        self.keep = keep              # bool mask over the batch
+        self.signatures = signatures  # None for chunks too short to deduplicate
+        self.canonical = canonical    # batch index -> canonical vector ID
+        self.distances = distances    # batch index -> Hamming distance to its canonical
+
+    @property
+    def duplicates(self) -> int:
+        return len(self.canonical)
+
+
+class ChunkDeduplicator:
+    """Persisted SimHash signature index with alias records for duplicate chunks"""
+
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, path: str = DEDUP_INDEX_PATH, max_distance: int = DEDUP_MAX_DISTANCE,
+                 min_tokens: int = DEDUP_MIN_TOKENS, shingle_size: int = DEDUP_SHINGLE_SIZE):
+        self.path = path
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self.shingle_size = shingle_size
+        self.bands = max_distance + 1
+        width = 64 // self.bands
+        self._bands = [(band * width, width if band < self.bands - 1 else 64 - band * width)
+                       for band in range(self.bands)]
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                id TEXT PRIMARY KEY,
+                simhash INTEGER NOT NULL,
+                source TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_bands_key ON bands(band, value);
+            CREATE INDEX IF NOT EXISTS idx_bands_id ON bands(id);
+            CREATE TABLE IF NOT EXISTS aliases (
+                id TEXT PRIMARY KEY,
+                canonical_id TEXT NOT NULL,
+                distance INTEGER NOT NULL,
+                source TEXT,
+                title TEXT,
+                section TEXT,
+                position INTEGER,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_aliases_canonical ON aliases(canonical_id);
+        """)
+        self._conn.commit()
+
+    def band_values(self, signature: int) -> List[int]:
+        return [(signature >> shift) & ((1 << width) - 1) for shift, width in self._bands]
+
+    def signature(self, text: str) -> Optional[int]:
+        """SimHash of a chunk text, or None if it is too short to deduplicate"""
+        tokens = re.findall(r'\w+', text.lower())
+        return simhash(tokens, self.shingle_size) if len(tokens) >= self.min_tokens else None
+
+    def _lookup(self, keys: Dict[int, set]) -> Dict[tuple, List[tuple]]:
+        """Indexed (id, signature) pairs for every (band, value) key"""
+        table = {}
+        with self._lock:
+            for band, values in keys.items():
+                values = list(values)
+                for i in range(0, len(values), self.LOOKUP_BATCH_SIZE):
+                    batch = values[i:i + self.LOOKUP_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    for value, vector_id, signature in self._conn.execute(
+                        "SELECT b.value, s.id, s.simhash FROM bands b JOIN signatures s ON s.id = b.id "
+                        f"WHERE b.band = ? AND b.value IN ({placeholders})", [band] + batch
+                    ):
+                        table.setdefault((band, value), []).append((vector_id, signature & ((1 << 64) - 1)))
+        return table
+
+    def plan(self, texts: List[str], vector_ids: List[str]) -> DedupPlan:
+        """
+        Find near-duplicates among a batch of chunk texts
+
+        A chunk is a duplicate if an indexed chunk, or an earlier chunk of this
+        batch that is kept, is within max_distance bits. Re-upserting a chunk
+        under its own ID never counts as a duplicate of itself.
+        """
+        signatures = [self.signature(text) for text in texts]
+
+        keys = {}
+        for signature in signatures:
+            if signature is not None:
+                for band, value in enumerate(self.band_values(signature)):
+                    keys.setdefault(band, set()).add(value)
+        table = self._lookup(keys)
+
+        keep = np.ones(len(texts), dtype=bool)
+        canonical, distances = {}, {}
+        for i, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            values = self.band_values(signature)
+            best = None
+            for band, value in enumerate(values):
+                for vector_id, other in table.get((band, value), ()):
+                    if vector_id == vector_ids[i]:
+                        continue
+                    distance = hamming(signature, other)
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (vector_id, distance)
+            if best is not None:
+                keep[i] = False
+                canonical[i], distances[i] = best
+            else:
+                for band, value in enumerate(values):
+                    table.setdefault((band, value), []).append((vector_ids[i], signature))
+        return DedupPlan(keep, signatures, canonical, distances)
+
+    def record(self, plan: DedupPlan, vector_ids: List[str], metadata: List[Dict[str, Any]]) -> None:
+        """Persist signatures of kept chunks and alias rows for duplicates (after a successful upsert)"""
+        now = time.time()
+        kept = [i for i in np.flatnonzero(plan.keep) if plan.signatures[i] is not None]
+        with self._lock:
+            kept_ids = [vector_ids[i] for i in kept]
+            for start in range(0, len(kept_ids), self.LOOKUP_BATCH_SIZE):
+                batch = kept_ids[start:start + self.LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM bands WHERE id IN ({placeholders})", batch)
+                self._conn.execute(f"DELETE FROM aliases WHERE id IN ({placeholders})", batch)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO signatures (id, simhash, source, created_at) VALUES (?, ?, ?, ?)",
+                [(vector_ids[i], _signed(plan.signatures[i]), metadata[i].get('source'), now) for i in kept]
+            )
+            self._conn.executemany(
+                "INSERT INTO bands (band, value, id) VALUES (?, ?, ?)",
+                [(band, value, vector_ids[i]) for i in kept
+                 for band, value in enumerate(self.band_values(plan.signatures[i]))]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO aliases (id, canonical_id, distance, source, title, section, position, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(vector_ids[i], canonical_id, plan.distances[i], metadata[i].get('source'), metadata[i].get('title'),
+                  metadata[i].get('section'), metadata[i].get('position'), now)
+                 for i, canonical_id in plan.canonical.items()]
+            )
+            self._conn.commit()
+
+    def aliases_for(self, canonical_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Alias records (source, title, section, position) grouped by canonical vector ID"""
+        aliases = {}
+        with self._lock:
+            for i in range(0, len(canonical_ids), self.LOOKUP_BATCH_SIZE):
+                batch = canonical_ids[i:i + self.LOOKUP_BATCH_SIZE]
+                for row in self._conn.execute(
+                    "SELECT canonical_id, id, source, title, section, position FROM aliases "
+                    f"WHERE canonical_id IN ({','.join('?' * len(batch))})", batch
+                ):
+                    aliases.setdefault(row[0], []).append(
+                        {'id': row[1], 'source': row[2], 'title': row[3], 'section': row[4], 'position': row[5]}
+                    )
+        return aliases
+
+    def forget(self, vector_ids: List[str]) -> int:
+        """
+        Drop signatures and alias rows for deleted vectors
+
+        Aliases of a deleted canonical chunk are dropped with it, since their
+        text was never indexed; the number of such orphaned aliases is returned
+        (re-ingest their documents to index that text again).
+        """
+        orphaned = 0
+        with self._lock:
+            for i in range(0, len(vector_ids), self.LOOKUP_BATCH_SIZE):
+                batch = vector_ids[i:i + self.LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM signatures WHERE id IN ({placeholders})", batch)
+                self._conn.execute(f"DELETE FROM bands WHERE id IN ({placeholders})", batch)
+                self._conn.execute(f"DELETE FROM aliases WHERE id IN ({placeholders})", batch)
+                orphaned += self._conn.execute(
+                    f"DELETE FROM aliases WHERE canonical_id IN ({placeholders})", batch
+                ).rowcount
+            self._conn.commit()
+        return orphaned
+
+    def clear(self) -> None:
+        """Remove all signatures and aliases"""
+        with self._lock:
+            self._conn.executescript("DELETE FROM signatures; DELETE FROM bands; DELETE FROM aliases;")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Number of indexed signatures and of chunks stored as aliases"""
+        with self._lock:
+            return {
+                'signatures': self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0],
+                'aliases': self._conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,309 @@
+"""
+Reduced-dimension index vectors with full-vector rescoring
+
+Usage:
+    python dim_reduction.py migrate --method pca --dimension 256
+    python dim_reduction.py migrate --method truncate --dimension 256 --target my-index-256
+    python dim_reduction.py info
+
+With EMBEDDING_REDUCTION set, the vector index holds projected vectors
+(EMBEDDING_REDUCED_DIM wide) and the full embeddings are kept in the chunk
+store. A query searches the reduced index for top_k * EMBEDDING_RESCORE_FACTOR
+candidates and reorders that shortlist by full-vector cosine similarity.
+
+Projections:
+    pca       fitted on the corpus embeddings, persisted at PCA_PROJECTION_PATH
+    truncate  keeps the leading dimensions (only for Matryoshka-trained models)
+
+`migrate` copies an existing full-width index into a new reduced index
+(a new local directory or Pinecone index) without touching the original,
+then prints the settings that switch the app over.
+"""
+import argparse
+import os
+import sys
+from typing import List, Dict, Any, Optional
+import numpy as np
+from config import (
+    EMBEDDING_REDUCTION,
+    EMBEDDING_REDUCED_DIM,
+    PCA_PROJECTION_PATH,
+    PCA_FIT_SAMPLES,
+    LOCAL_INDEX_PATH,
+    PINECONE_INDEX_NAME,
+    PINECONE_ENVIRONMENT
+)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class Projection:
+    """Maps full-width embeddings to the reduced index dimension"""
+
+    method = 'none'
+
+    def __init__(self, full_dimension: int, dimension: int):
+        if not 0 < dimension <= full_dimension:
+            raise ValueError(f"Reduced dimension must be between 1 and {full_dimension}, got {dimension}")
+        self.full_dimension = full_dimension
+        self.dimension = dimension
+
+    def _apply(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def project(self, vectors) -> np.ndarray:
+        """Project one vector or a matrix of row vectors; results are L2-normalized float32"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return _normalize(self._apply(vectors)).astype(np.float32)
+
+    def describe(self) -> Dict[str, Any]:
+        return {'method': self.method, 'dimension': self.dimension, 'full_dimension': self.full_dimension}
+
+
+class TruncationProjection(Projection):
+    """Matryoshka-style truncation to the leading dimensions"""
+
+    method = 'truncate'
+
+    def _apply(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors[..., :self.dimension]
+
+
+class PCAProjection(Projection):
+    """Principal-component projection fitted on corpus embeddings"""
+
+    method = 'pca'
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance: float = 0.0):
+        super().__init__(components.shape[1], components.shape[0])
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        self.explained_variance = explained_variance
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, dimension: int) -> 'PCAProjection':
+        """Fit on a sample of embeddings (rows); needs at least `dimension` of them"""
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float64))
+        if len(embeddings) < dimension:
+            raise ValueError(f"PCA to {dimension} dimensions needs at least {dimension} embeddings, "
+                             f"got {len(embeddings)}")
+        mean = embeddings.mean(axis=0)
+        _, singular_values, vt = np.linalg.svd(embeddings - mean, full_matrices=False)
+        variance = singular_values ** 2
+        explained = float(variance[:dimension].sum() / variance.sum()) if variance.sum() > 0 else 1.0
+        return cls(mean, vt[:dimension], explained)
+
+    def _apply(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors - self.mean) @ self.components.T
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, mean=self.mean, components=self.components,
+                     explained_variance=np.float64(self.explained_variance))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PCAProjection':
+        with np.load(path) as data:
+            return cls(data['mean'], data['components'], float(data['explained_variance']))
+
+    def describe(self) -> Dict[str, Any]:
+        info = super().describe()
+        info['explained_variance'] = round(self.explained_variance, 4)
+        return info
+
+
+def create_projection(full_dimension: int, method: str = EMBEDDING_REDUCTION,
+                      dimension: int = EMBEDDING_REDUCED_DIM,
+                      path: str = PCA_PROJECTION_PATH) -> Optional[Projection]:
+    """Projection configured for the index, or None for full-width vectors"""
+    method = (method or 'none').lower()
+    if method == 'none':
+        return None
+    if method == 'truncate':
+        return TruncationProjection(full_dimension, dimension)
+    if method == 'pca':
+        if not os.path.exists(path):
+            raise ValueError(
+                f"EMBEDDING_REDUCTION=pca needs a fitted projection at '{path}'. "
+                f"Ingest documents at full width, then run `python dim_reduction.py migrate`."
+            )
+        projection = PCAProjection.load(path)
+        if projection.full_dimension != full_dimension or projection.dimension != dimension:
+            raise ValueError(
+                f"PCA projection at '{path}' maps {projection.full_dimension} -> {projection.dimension} dimensions, "
+                f"but the model has {full_dimension} and EMBEDDING_REDUCED_DIM is {dimension}"
+            )
+        return projection
+    raise ValueError(f"Unknown EMBEDDING_REDUCTION '{method}'. Use 'none', 'pca' or 'truncate'.")
+
+
+def rescore(docs: List[Dict[str, Any]], query_embedding, embeddings: Dict[str, np.ndarray],
+            top_k: int) -> List[Dict[str, Any]]:
+    """
+    Reorder a reduced-index shortlist by full-vector cosine similarity
+
+    Docs whose full embedding is missing keep their reduced-index score.
+    Each doc keeps the reduced score under 'reduced_score'.
+    """
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    ids = [doc['id'] for doc in docs if doc['id'] in embeddings]
+    full_scores = {}
+    if ids:
+        scores = _normalize(np.stack([embeddings[i] for i in ids])) @ query
+        full_scores = dict(zip(ids, scores.tolist()))
+    for doc in docs:
+        doc['reduced_score'] = doc['score']
+        doc['score'] = full_scores.get(doc['id'], doc['score'])
+    docs.sort(key=lambda doc: doc['score'], reverse=True)
+    return docs[:top_k]
+
+
+# ----------------------------------------------------------------------
+# Migration
+# ----------------------------------------------------------------------
+
+def _open_target(vector_store, target: str, dimension: int):
+    if vector_store.backend == 'local':
+        from local_index import LocalIndex
+        if LocalIndex.exists(target):
+            raise ValueError(f"Target local index '{target}' already exists; remove it or pick another --target")
+        return LocalIndex(dimension, target)
+
+    from pinecone import ServerlessSpec
+    if target == vector_store.index_name:
+        raise ValueError("The target Pinecone index must differ from the source index")
+    existing = {index['name'] for index in vector_store.pc.list_indexes()}
+    if target not in existing:
+        print(f"Creating Pinecone index '{target}' ({dimension} dimensions, cosine)")
+        vector_store.pc.create_index(name=target, dimension=dimension, metric='cosine',
+                                     spec=ServerlessSpec(cloud='aws', region=PINECONE_ENVIRONMENT))
+    return vector_store.pc.Index(target)
+
+
+def migrate(vector_store, method: str, dimension: int, target: str,
+            projection_path: str = PCA_PROJECTION_PATH, batch_size: int = 100,
+            fit_samples: int = PCA_FIT_SAMPLES) -> Dict[str, Any]:
+    """
+    Copy a full-width index into a new reduced index
+
+    Pass 1 fetches every vector listed in the chunk store from the source index
+    and saves its full embedding in the chunk store (skipping IDs that already
+    have one, so an interrupted run resumes). The PCA projection, if any, is
+    fitted on up to `fit_samples` of them. Pass 2 projects the stored
+    embeddings and upserts them with their metadata into the target index.
+    """
+    store = vector_store.chunk_store
+    full_dimension = vector_store.full_dimension
+    ids = store.list_ids()
+    metadata = {}
+    rng = np.random.default_rng(0)
+    sample, seen = [], 0
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        response = vector_store.index.fetch(ids=batch)['vectors']
+        stored = store.get_embeddings(batch)
+        fetched_ids, fetched = [], []
+        for vector_id in batch:
+            if vector_id not in response:
+                continue
+            vector = response[vector_id]
+            metadata[vector_id] = dict(vector.get('metadata') or {})
+            if vector_id in stored:
+                values = stored[vector_id]
+            else:
+                values = np.asarray(vector['values'], dtype=np.float32)
+                if len(values) != full_dimension:
+                    raise ValueError(f"Source index holds {len(values)}-dim vectors; migrate from a full-width index")
+                fetched_ids.append(vector_id)
+                fetched.append(values)
+            # Reservoir sample for fitting
+            seen += 1
+            if len(sample) < fit_samples:
+                sample.append(values)
+            else:
+                slot = int(rng.integers(seen))
+                if slot < fit_samples:
+                    sample[slot] = values
+        if fetched:
+            store.put_embeddings(fetched_ids, np.stack(fetched))
+        print(f"Fetched {min(start + batch_size, len(ids))}/{len(ids)} vectors", file=sys.stderr)
+
+    if method == 'pca':
+        projection = PCAProjection.fit(np.stack(sample), dimension)
+        projection.save(projection_path)
+        print(f"PCA projection saved to {projection_path} "
+              f"({projection.explained_variance:.1%} of variance kept)", file=sys.stderr)
+    else:
+        projection = TruncationProjection(full_dimension, dimension)
+
+    target_index = _open_target(vector_store, target, dimension)
+    migrated = [vector_id for vector_id in ids if vector_id in metadata]
+    for start in range(0, len(migrated), batch_size):
+        batch = migrated[start:start + batch_size]
+        stored = store.get_embeddings(batch)
+        vectors = projection.project(np.stack([stored[vector_id] for vector_id in batch]))
+        target_index.upsert(vectors=[
+            {'id': vector_id, 'values': vectors[i].tolist(), 'metadata': metadata[vector_id]}
+            for i, vector_id in enumerate(batch)
+        ])
+        print(f"Upserted {start + len(batch)}/{len(migrated)} reduced vectors", file=sys.stderr)
+
+    return {
+        'migrated': len(migrated),
+        'skipped': len(ids) - len(migrated),
+        'target': target,
+        **projection.describe()
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Reduced-dimension index tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("migrate", help="Copy the current full-width index into a reduced index")
+    run.add_argument("--method", choices=["pca", "truncate"], default="pca")
+    run.add_argument("--dimension", type=int, default=EMBEDDING_REDUCED_DIM)
+    run.add_argument("--target", help="Target local index directory or Pinecone index name")
+    run.add_argument("--projection-path", default=PCA_PROJECTION_PATH)
+    sub.add_parser("info", help="Show the configured reduction")
+    args = parser.parse_args(argv)
+
+    from vector_store import VectorStore
+    if args.command == "info":
+        vector_store = VectorStore()
+        print(vector_store.get_index_stats(refresh=True))
+        return 0
+
+    # The source is always read at full width
+    vector_store = VectorStore(reduction='none')
+    if args.target:
+        target = args.target
+    elif vector_store.backend == 'local':
+        target = f"{LOCAL_INDEX_PATH}-{args.method}{args.dimension}"
+    else:
+        target = f"{PINECONE_INDEX_NAME}-{args.method}{args.dimension}"
+    result = migrate(vector_store, args.method, args.dimension, target, args.projection_path)
+
+    print(f"Migrated {result['migrated']} vectors to '{target}' ({result['skipped']} IDs missing from the source index)")
+    print("Switch over with:")
+    print(f"  EMBEDDING_REDUCTION={args.method}")
+    print(f"  EMBEDDING_REDUCED_DIM={args.dimension}")
+    if vector_store.backend == 'local':
+        print(f"  LOCAL_INDEX_PATH={target}")
+    else:
+        print(f"  PINECONE_INDEX_NAME={target}")
+    if args.method == 'pca' and args.projection_path != PCA_PROJECTION_PATH:
+        print(f"  PCA_PROJECTION_PATH={args.projection_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
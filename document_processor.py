@@ -1,44 +1,159 @@
 """
 Document processing utilities for chunking and text extraction
 """
+import bisect
+import codecs
+import io
+import itertools
+import mmap
+import os
 import re
+import shutil
+import tempfile
+from contextlib import contextmanager
 import PyPDF2
-from typing import List, Dict, Any
-from io import BytesIO
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from typing import List, Dict, Any, Iterator, Tuple
+from chunk_batch import ChunkBatch, StringTable
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_UNIT, CHUNK_OVERLAP_TOKENS, UPLOAD_SPOOL_THRESHOLD, UPLOAD_SPOOL_DIR,
+    UPLOAD_READ_CHUNK
+)
+from memory_monitor import RSSMonitor, MemoryProfile, MemoryBudget
+from text_normalizer import TextNormalizer, OffsetMap, normalize
+
+# Leading raw text kept for title detection when the document is streamed
+TITLE_HEAD_LINES = 5
+TITLE_HEAD_CHARS = 64 * 1024
+
+# Peak bytes held per upload byte while extracting and chunking (decoded and
+# normalized text, offset map and chunk columns); used by the memory budget
+EXTRACT_BYTES_PER_UPLOAD_BYTE = 4
+
+
+class NamedUpload:
+    """Binary file object (e.g. a spooled temporary file) that reports the original upload name"""
+
+    def __init__(self, file, name: str):
+        self._file = file
+        self.name = name
+
+    def read(self, *args) -> bytes:
+        return self._file.read(*args)
+
+    def seek(self, *args) -> int:
+        return self._file.seek(*args)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def spool_dir() -> str:
+    """Directory for upload spool files (kept off /tmp, which is often RAM-backed)"""
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    return UPLOAD_SPOOL_DIR
 
 
 class DocumentProcessor:
     """Handles document processing, text extraction, and chunking"""
     
-    def __init__(self):
-        pass
+    def __init__(self, unit: str = CHUNK_UNIT):
+        if unit not in ('chars', 'tokens'):
+            raise ValueError(f"Unknown chunk unit '{unit}' (use 'chars' or 'tokens')")
+        self.unit = unit
     
-    def extract_text_from_pdf(self, pdf_file) -> str:
-        """Extract text from uploaded PDF file"""
+    @property
+    def token_counter(self):
+        """The embedding model's tokenizer, loaded on first use in token mode"""
+        from tokenization import get_token_counter
+        return get_token_counter()
+    
+    @contextmanager
+    def _open_for_parsing(self, upload):
+        """
+        Seekable view of an upload that avoids a second in-memory copy
+
+        File-backed uploads are memory-mapped, in-memory buffers are used as
+        they are, and anything else is spooled: kept in memory up to
+        UPLOAD_SPOOL_THRESHOLD bytes, otherwise written to disk and mapped.
+        """
+        try:
+            fileno = upload.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fileno = None
+
+        if fileno is None and isinstance(upload, io.BytesIO):
+            yield upload
+            return
+
+        spool = None
+        if fileno is None:
+            spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, dir=spool_dir())
+            shutil.copyfileobj(upload, spool, UPLOAD_READ_CHUNK)
+            if spool.tell() <= UPLOAD_SPOOL_THRESHOLD:
+                spool.seek(0)
+                try:
+                    yield spool
+                finally:
+                    spool.close()
+                return
+            fileno = spool.fileno()
+
         try:
-            pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_file.read()))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            if os.fstat(fileno).st_size == 0:
+                yield io.BytesIO()
+                return
+            mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def iter_text_from_pdf(self, pdf_file) -> Iterator[str]:
+        """Yield the text of an uploaded PDF page by page"""
+        try:
+            with self._open_for_parsing(pdf_file) as stream:
+                pdf_reader = PyPDF2.PdfReader(stream)
+                for page in pdf_reader.pages:
+                    yield page.extract_text() + "\n"
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
     
-    def extract_text_from_txt(self, txt_file) -> str:
-        """Extract text from uploaded text file"""
+    def extract_text_from_pdf(self, pdf_file) -> str:
+        """Extract text from uploaded PDF file"""
+        return "".join(self.iter_text_from_pdf(pdf_file))
+    
+    def iter_text_from_txt(self, txt_file) -> Iterator[str]:
+        """Yield an uploaded text file in blocks, decoding UTF-8 incrementally"""
         try:
-            return txt_file.read().decode('utf-8')
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            while True:
+                block = txt_file.read(UPLOAD_READ_CHUNK)
+                if not block:
+                    break
+                yield decoder.decode(block)
+            yield decoder.decode(b'', final=True)
         except Exception as e:
             raise Exception(f"Error reading text file: {str(e)}")
     
-    def clean_text(self, text: str) -> str:
-        """Clean and normalize text"""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        # Remove special characters but keep punctuation
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '', text)
-        return text.strip()
+    def extract_text_from_txt(self, txt_file) -> str:
+        """Extract text from uploaded text file"""
+        return "".join(self.iter_text_from_txt(txt_file))
+    
+    def clean_text(self, text: str, offsets: OffsetMap = None) -> str:
+        """
+        Clean and normalize text: collapse whitespace and drop special characters
+        but keep punctuation, in a single pass (see text_normalizer)
+        """
+        return normalize(text, offsets)
     
     def extract_document_title(self, text: str, source_name: str) -> str:
         """Extract or derive document title from text or filename"""
@@ -95,107 +210,199 @@ class DocumentProcessor:
         
         return sections
     
-    def chunk_text(self, text: str, source_name: str = "unknown", title: str = None) -> List[Dict[str, Any]]:
+    def chunk_text(self, text: str, source_name: str = "unknown", title: str = None) -> ChunkBatch:
         """
         Split text into overlapping chunks with enhanced metadata
+        
+        Returns a ChunkBatch whose chunks are slices of the cleaned text;
+        iterating or indexing it yields the legacy {'text', 'metadata'} dicts.
+        Chunk positions are offsets into the original (uncleaned) text.
         """
-        clean_text = self.clean_text(text)
+        offsets = OffsetMap()
+        clean_text = self.clean_text(text, offsets)
         
         # Extract title if not provided
         if title is None:
             title = self.extract_document_title(clean_text, source_name)
         
+        return self.chunk_clean_text(clean_text, offsets, source_name, title)
+    
+    def chunk_clean_text(self, clean_text: str, offset_map: OffsetMap, source_name: str, title: str) -> ChunkBatch:
+        """Chunk text that was already normalized, mapping positions back through `offset_map`"""
         # Detect sections in the document
         sections_data = self.detect_sections(clean_text)
         
-        # Create a mapping of text positions to sections
-        position_to_section = {}
+        # Sorted section start positions for bisect lookups
+        section_starts = []
+        section_names = []
         current_pos = 0
         for section_info in sections_data:
-            position_to_section[current_pos] = section_info['section']
+            section_starts.append(current_pos)
+            section_names.append(section_info['section'])
             current_pos += len(section_info['text']) + 1
         
-        # Simple sentence-aware chunking
-        sentences = re.split(r'(?<=[.!?])\s+', clean_text)
+        sources, titles, sections = StringTable([source_name]), StringTable([title]), StringTable()
+        offsets, lengths, positions, section_ids = [], [], [], []
         
-        chunks = []
-        current_chunk = ""
-        chunk_index = 0
-        chunk_start_position = 0
+        def emit(start: int, end: int) -> None:
+            section = self._find_section_for_position(start, section_starts, section_names)
+            # Strip like str.strip() without copying the chunk
+            while start < end and clean_text[start].isspace():
+                start += 1
+            while end > start and clean_text[end - 1].isspace():
+                end -= 1
+            if end > start:
+                offsets.append(start)
+                lengths.append(end - start)
+                positions.append(offset_map(start))
+                section_ids.append(sections.code(section))
         
-        for sentence in sentences:
+        spans = self._token_spans(clean_text) if self.unit == 'tokens' else self._char_spans(clean_text)
+        for chunk_start, chunk_end in spans:
+            emit(chunk_start, chunk_end)
+        
+        return ChunkBatch(
+            clean_text, offsets, lengths, positions, range(len(offsets)),
+            [0] * len(offsets), [0] * len(offsets), section_ids, sources, titles, sections
+        )
+    
+    @staticmethod
+    def _sentence_boundaries(clean_text: str) -> Iterator[Tuple[int, int]]:
+        """(end, next start) of every sentence, ending with the end of the text"""
+        return itertools.chain(
+            (m.span() for m in re.finditer(r'(?<=[.!?])\s+', clean_text)),
+            [(len(clean_text), len(clean_text))]
+        )
+    
+    def _char_spans(self, clean_text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Simple sentence-aware chunking over sentence boundaries, sized in characters
+        
+        The current chunk is always clean_text[start:end], so no sentence strings are built.
+        """
+        chunk_start = 0
+        chunk_end = 0
+        sentence_start = 0
+        for sentence_end, next_start in self._sentence_boundaries(clean_text):
             # If adding this sentence would exceed chunk size, save current chunk
-            if len(current_chunk) + len(sentence) > CHUNK_SIZE and current_chunk:
-                # Find the section for this chunk based on its position
-                chunk_section = self._find_section_for_position(chunk_start_position, position_to_section)
-                
-                chunks.append({
-                    'text': current_chunk.strip(),
-                    'metadata': {
-                        'source': source_name,
-                        'title': title,
-                        'section': chunk_section,
-                        'position': chunk_start_position,
-                        'chunk_index': chunk_index,
-                        'chunk_size': len(current_chunk.strip())
-                    }
-                })
+            if chunk_end - chunk_start + sentence_end - sentence_start > CHUNK_SIZE and chunk_end > chunk_start:
+                yield chunk_start, chunk_end
                 
                 # Start new chunk with overlap
-                overlap_text = current_chunk[-CHUNK_OVERLAP:] if len(current_chunk) > CHUNK_OVERLAP else current_chunk
-                chunk_start_position += len(current_chunk) - len(overlap_text)
-                current_chunk = overlap_text + " " + sentence
-                chunk_index += 1
-            else:
-                if not current_chunk:
-                    chunk_start_position = len(clean_text) - len(' '.join(sentences[sentences.index(sentence):]))
-                current_chunk += " " + sentence if current_chunk else sentence
+                chunk_start = max(chunk_start, chunk_end - CHUNK_OVERLAP)
+            chunk_end = sentence_end
+            sentence_start = next_start
         
         # Add the last chunk if it has content
-        if current_chunk.strip():
-            chunk_section = self._find_section_for_position(chunk_start_position, position_to_section)
-            chunks.append({
-                'text': current_chunk.strip(),
-                'metadata': {
-                    'source': source_name,
-                    'title': title,
-                    'section': chunk_section,
-                    'position': chunk_start_position,
-                    'chunk_index': chunk_index,
-                    'chunk_size': len(current_chunk.strip())
-                }
-            })
-        
-        return chunks
+        yield chunk_start, chunk_end
     
-    def _find_section_for_position(self, position: int, position_to_section: Dict[int, str]) -> str:
-        """Find the appropriate section for a given text position"""
-        # Find the closest section position that's less than or equal to our position
-        best_section = "Unknown"
-        best_pos = -1
+    def _token_spans(self, clean_text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Sentence-aware chunking sized in embedding-model tokens
+        
+        The text is tokenized once; a span's size is the number of tokens starting
+        inside it. Chunks fill up to the model's input length so nothing is
+        truncated, and a sentence longer than that is split at token boundaries.
+        """
+        counter = self.token_counter
+        limit = counter.chunk_tokens
+        overlap = max(0, min(CHUNK_OVERLAP_TOKENS, limit - 1))
+        token_offsets = counter.offsets(clean_text)
+        token_starts = [start for start, _ in token_offsets]
+        token_ends = [end for _, end in token_offsets]
         
-        for pos, section in position_to_section.items():
-            if pos <= position and pos > best_pos:
-                best_pos = pos
-                best_section = section
+        def token_at(position: int) -> int:
+            return bisect.bisect_left(token_starts, position)
         
-        return best_section
+        chunk_start = 0
+        chunk_end = 0
+        for sentence_end, _ in self._sentence_boundaries(clean_text):
+            # If adding this sentence would exceed the token budget, save current chunk
+            if token_at(sentence_end) - token_at(chunk_start) > limit and chunk_end > chunk_start:
+                yield chunk_start, chunk_end
+                
+                # Start new chunk with the last CHUNK_OVERLAP_TOKENS tokens
+                first, last = token_at(chunk_start), token_at(chunk_end)
+                if last - overlap > first:
+                    chunk_start = token_starts[last - overlap]
+            chunk_end = sentence_end
+            
+            # A sentence that alone exceeds the budget is cut into token windows
+            first = token_at(chunk_start)
+            while token_at(chunk_end) - first > limit:
+                yield chunk_start, token_ends[first + limit - 1]
+                first += limit - overlap
+                chunk_start = token_starts[first]
+        
+        # Add the last chunk if it has content
+        yield chunk_start, chunk_end
     
-    def process_uploaded_file(self, uploaded_file) -> List[Dict[str, Any]]:
-        """Process uploaded file and return chunks with enhanced metadata"""
-        file_name = uploaded_file.name
+    def _find_section_for_position(self, position: int, section_starts: List[int], section_names: List[str]) -> str:
+        """Find the section whose start is the closest at or before the given text position"""
+        i = bisect.bisect_right(section_starts, position) - 1
+        return section_names[i] if i >= 0 else "Unknown"
+    
+    def _upload_size(self, upload) -> int:
+        """Size of an upload in bytes without reading it (0 if unknown)"""
+        size = getattr(upload, 'size', None)
+        if size is not None:
+            return int(size)
+        try:
+            position = upload.tell()
+            size = upload.seek(0, os.SEEK_END)
+            upload.seek(position)
+            return int(size)
+        except (AttributeError, OSError, ValueError):
+            return 0
+    
+    def process_uploaded_file(self, uploaded_file, profile: MemoryProfile = None,
+                              budget: MemoryBudget = None) -> ChunkBatch:
+        """
+        Process uploaded file and return chunks with enhanced metadata
         
-        if file_name.lower().endswith('.pdf'):
-            text = self.extract_text_from_pdf(uploaded_file)
-        elif file_name.lower().endswith('.txt'):
-            text = self.extract_text_from_txt(uploaded_file)
-        else:
-            raise ValueError("Unsupported file type. Please upload PDF or TXT files.")
+        With a MemoryProfile, the 'extract' and 'chunk' stages are recorded in it
+        (otherwise one is created and printed when INGEST_MEMORY_PROFILE is on).
+        Files whose estimated working set does not fit the memory budget are
+        rejected with MemoryBudgetExceeded before anything is read.
+        """
+        file_name = uploaded_file.name
+        budget = budget or MemoryBudget()
+        budget.check(f"Processing {file_name}", self._upload_size(uploaded_file) * EXTRACT_BYTES_PER_UPLOAD_BYTE)
         
-        if not text.strip():
-            raise ValueError("No text content found in the uploaded file.")
+        own_profile = profile is None
+        if own_profile:
+            profile = MemoryProfile(file_name)
         
-        # Extract title from document content
-        title = self.extract_document_title(text, file_name)
+        with RSSMonitor(file_name) as memory, profile:
+            if file_name.lower().endswith('.pdf'):
+                pieces = self.iter_text_from_pdf(uploaded_file)
+            elif file_name.lower().endswith('.txt'):
+                pieces = self.iter_text_from_txt(uploaded_file)
+            else:
+                raise ValueError("Unsupported file type. Please upload PDF or TXT files.")
+            
+            # Normalize while extracting so the raw text is never held in full
+            normalizer = TextNormalizer()
+            head = ""
+            for piece in pieces:
+                if len(head) < TITLE_HEAD_CHARS and head.count('\n') < TITLE_HEAD_LINES:
+                    head += piece[:TITLE_HEAD_CHARS]
+                normalizer.feed(piece)
+            text = normalizer.finish()
+            profile.stage('extract')
+            
+            if not text:
+                raise ValueError("No text content found in the uploaded file.")
+            
+            # Extract title from document content
+            title = self.extract_document_title(head, file_name)
+            
+            chunks = self.chunk_clean_text(text, normalizer.offsets, file_name, title)
+            profile.stage('chunk')
         
-        return self.chunk_text(text, source_name=file_name, title=title)
+        report = memory.report()
+        print(f"Processed {file_name}: {len(text)} chars, {len(chunks)} chunks, "
+              f"peak RSS {report['rss_peak_mb']} MB (+{report['rss_peak_delta_mb']} MB)")
+        if own_profile:
+            profile.print_report()
+        return chunks
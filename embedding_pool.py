@@ -0,0 +1,202 @@
+"""
+Multi-process embedding pool for large ingests
+
+Usage:
+    python embedding_pool.py benchmark --max-workers 8 --chunks 4000
+    python embedding_pool.py benchmark --stand-ins          # hashing embedder, no model download
+
+Each worker process loads its own copy of the embedding model and gets an
+equal share of the machine's cores for torch. A batch is split into shards
+that are encoded in parallel; workers write their rows straight into one
+shared-memory float32 matrix, so embeddings are never pickled back to the
+parent (only the input texts travel over the pipe).
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_POOL_WORKERS, EMBEDDING_POOL_SHARD_SIZE
+
+# Model name that makes workers use the stand-in hashing embedder
+STAND_IN_MODEL = "stand-in:hashing"
+
+_model = None
+
+
+def _load_model(model_name: str):
+    if model_name == STAND_IN_MODEL:
+        from stand_ins import HashingEmbedder
+        return HashingEmbedder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _model = _load_model(model_name)
+
+
+def _worker_dimension() -> int:
+    return _model.get_sentence_embedding_dimension()
+
+
+def _encode_shard(shm_name: str, shape: tuple, start: int, texts: List[str], batch_size: int) -> int:
+    # Spawned workers share the parent's resource tracker, so attaching here does
+    # not take ownership; the parent unlinks the segment
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[start:start + len(texts)] = _model.encode(texts, batch_size=batch_size)
+        del out
+    finally:
+        shm.close()
+    return len(texts)
+
+
+class EmbeddingPool:
+    """Shards encode() calls across worker processes with shared-memory output"""
+
+    def __init__(self, workers: int = EMBEDDING_POOL_WORKERS, dimension: Optional[int] = None,
+                 model_name: str = EMBEDDING_MODEL_NAME, shard_size: int = EMBEDDING_POOL_SHARD_SIZE):
+        self.workers = max(1, workers)
+        self.model_name = model_name
+        self.shard_size = shard_size
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # spawn, not fork: forked torch state is unsafe and the parent may hold a loaded model
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(model_name, threads)
+        )
+        self._dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-pool")
+        self._dimension = dimension
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = self._executor.submit(_worker_dimension).result()
+        return self._dimension
+
+    def warm_up(self) -> None:
+        """Start every worker and load its model now instead of on the first encode"""
+        futures = [self._executor.submit(_worker_dimension) for _ in range(self.workers)]
+        self._dimension = futures[0].result()
+        for future in futures[1:]:
+            future.result()
+
+    def _shards(self, count: int) -> List[tuple]:
+        shards = max(self.workers, math.ceil(count / self.shard_size))
+        size = math.ceil(count / shards)
+        return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 64, **kwargs) -> np.ndarray:
+        """Embed texts like SentenceTransformer.encode, returning a float32 matrix"""
+        if isinstance(sentences, str):
+            return self.encode([sentences], batch_size)[0]
+        count = len(sentences)
+        dimension = self.get_sentence_embedding_dimension()
+        if count == 0:
+            return np.zeros((0, dimension), dtype=np.float32)
+
+        shape = (count, dimension)
+        shm = shared_memory.SharedMemory(create=True, size=count * dimension * 4)
+        try:
+            futures = [
+                self._executor.submit(_encode_shard, shm.name, shape, start, list(sentences[start:stop]), batch_size)
+                for start, stop in self._shards(count)
+            ]
+            for future in futures:
+                future.result()
+            return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def encode_async(self, sentences: List[str], batch_size: int = 64) -> Future:
+        """Start encode() in the background (e.g. the next ingest batch while this one upserts)"""
+        return self._dispatcher.submit(self.encode, sentences, batch_size)
+
+    def close(self) -> None:
+        self._dispatcher.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> 'EmbeddingPool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ----------------------------------------------------------------------
+# Scaling benchmark
+# ----------------------------------------------------------------------
+
+def _sample_texts(count: int) -> List[str]:
+    words = ("router interface vpn tunnel firewall policy address wizard configure security "
+             "access list routing table network device port protocol user session").split()
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(words, size=120)) for _ in range(count)]
+
+
+def benchmark(model_name: str, max_workers: int, chunks: int, batch_size: int = 64) -> List[Dict[str, Any]]:
+    """Chunks/second in-process and with 1..max_workers pool workers (model load excluded)"""
+    texts = _sample_texts(chunks)
+    rows = []
+
+    model = _load_model(model_name)
+    model.encode(texts[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    model.encode(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    rows.append({'workers': 0, 'seconds': elapsed, 'chunks_per_second': chunks / elapsed})
+    print(f"in-process : {chunks / elapsed:8.1f} chunks/s", file=sys.stderr)
+    del model
+
+    for workers in range(1, max_workers + 1):
+        with EmbeddingPool(workers, model_name=model_name) as pool:
+            pool.warm_up()
+            pool.encode(texts[:batch_size * workers], batch_size)
+            start = time.perf_counter()
+            pool.encode(texts, batch_size)
+            elapsed = time.perf_counter() - start
+        row = {'workers': workers, 'seconds': elapsed, 'chunks_per_second': chunks / elapsed,
+               'speedup': rows[0]['seconds'] / elapsed}
+        rows.append(row)
+        print(f"{workers:2d} workers : {row['chunks_per_second']:8.1f} chunks/s ({row['speedup']:.2f}x)",
+              file=sys.stderr)
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Multi-process embedding pool tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="Measure encode throughput from 1 to N workers")
+    bench.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    bench.add_argument("--chunks", type=int, default=2000)
+    bench.add_argument("--batch-size", type=int, default=64)
+    bench.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    bench.add_argument("--stand-ins", action="store_true", help="Use the hashing stand-in embedder")
+    bench.add_argument("-o", "--output", help="Write results as JSON")
+    args = parser.parse_args(argv)
+
+    model_name = STAND_IN_MODEL if args.stand_ins else args.model
+    rows = benchmark(model_name, args.max_workers, args.chunks, args.batch_size)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'model': model_name, 'cpus': os.cpu_count(), 'results': rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+Confidence-based fast path: skip reranking and optionally answer extractively
+
+Usage:
+    python fast_path.py golden.jsonl -o fast_path_report.json
+
+When the top dense match is decisive (high score and a clear margin over the
+runner-up), reranking adds latency without changing the context set. Above a
+stricter threshold the top chunk usually contains the answer verbatim, so a
+cited extractive span can replace the LLM call.
+
+The CLI evaluates the policy offline. Each golden-set line is a JSON object
+with "query", a reference "answer" and optionally the expected "sources".
+Every query is run through the full path and the fast path once, then every
+threshold pair in the grid is scored from those runs: how many queries it
+would fast-path, the latency saved and the quality lost (context hit rate
+and answer token F1 against the reference).
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter
+from typing import List, Dict, Any, Optional
+from config import (
+    FAST_PATH_SKIP_RERANK_SCORE,
+    FAST_PATH_SKIP_RERANK_MARGIN,
+    FAST_PATH_EXTRACTIVE,
+    FAST_PATH_EXTRACTIVE_SCORE,
+    FAST_PATH_EXTRACTIVE_MARGIN,
+    TOP_K_RERANK
+)
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'what', 'when', 'where', 'which',
+    'who', 'why', 'with', 'you'
+}
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in re.findall(r'\w+', text.lower()) if t not in STOPWORDS]
+
+
+def token_f1(prediction: str, reference: str) -> float:
+    """Bag-of-words F1 between two answers (citation markers ignored)"""
+    predicted = Counter(_terms(re.sub(r'\[\d+\]', ' ', prediction)))
+    expected = Counter(_terms(reference))
+    common = sum((predicted & expected).values())
+    if common == 0:
+        return 0.0
+    precision = common / sum(predicted.values())
+    recall = common / sum(expected.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+class FastPathPolicy:
+    """Decides from retrieval confidence whether to skip rerank and/or the LLM"""
+
+    def __init__(self, skip_rerank_score: float = FAST_PATH_SKIP_RERANK_SCORE,
+                 skip_rerank_margin: float = FAST_PATH_SKIP_RERANK_MARGIN,
+                 extractive: bool = FAST_PATH_EXTRACTIVE,
+                 extractive_score: float = FAST_PATH_EXTRACTIVE_SCORE,
+                 extractive_margin: float = FAST_PATH_EXTRACTIVE_MARGIN,
+                 max_span_chars: int = 400):
+        self.skip_rerank_score = skip_rerank_score
+        self.skip_rerank_margin = skip_rerank_margin
+        self.extractive = extractive
+        self.extractive_score = extractive_score
+        self.extractive_margin = extractive_margin
+        self.max_span_chars = max_span_chars
+
+    @staticmethod
+    def confidence(docs: List[Dict[str, Any]]) -> Dict[str, float]:
+        """Top dense score and its margin over the runner-up"""
+        top = docs[0].get('score', 0.0) if docs else 0.0
+        second = docs[1].get('score', 0.0) if len(docs) > 1 else 0.0
+        return {'top_score': top, 'margin': top - second}
+
+    def decide(self, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fast-path decision for candidates sorted by dense score"""
+        decision = self.confidence(docs)
+        decision['skip_rerank'] = bool(docs) and \
+            decision['top_score'] >= self.skip_rerank_score and decision['margin'] >= self.skip_rerank_margin
+        decision['extractive'] = self.extractive and decision['skip_rerank'] and \
+            decision['top_score'] >= self.extractive_score and decision['margin'] >= self.extractive_margin
+        return decision
+
+    def extract_span(self, query: str, text: str) -> str:
+        """
+        Sentence with the best query-term overlap, extended by following sentences
+        that also mention query terms (up to max_span_chars)
+        """
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+|\n+', text) if s.strip()]
+        if not sentences:
+            return text[:self.max_span_chars].strip()
+        terms = set(_terms(query))
+        overlaps = [len(terms & set(_terms(sentence))) for sentence in sentences]
+        best = max(range(len(sentences)), key=lambda i: (overlaps[i], -i))
+        span = sentences[best]
+        for sentence, overlap in zip(sentences[best + 1:], overlaps[best + 1:]):
+            if not overlap or sentence in span or len(span) + 1 + len(sentence) > self.max_span_chars:
+                break
+            span += " " + sentence
+        return span[:self.max_span_chars].strip()
+
+    def extractive_answer(self, query: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer dict in LLMService format, quoting the top chunk with citation [1]"""
+        text = (doc.get('text') or '').strip()
+        answer = f"{self.extract_span(query, text)} [1]"
+        preview = text[:200] + "..." if len(text) > 200 else text
+        return {
+            'answer': answer,
+            'citations': [{
+                'citation_num': 1,
+                'source': doc.get('source', 'Unknown'),
+                'title': doc.get('title', ''),
+                'section': doc.get('section', ''),
+                'position': doc.get('position', 0),
+                'text_preview': preview,
+                'score': doc.get('score', 0)
+            }],
+            'sources': [{'citation_num': 1, 'source': doc.get('source', 'Unknown'), 'chunks_used': 1}],
+            'tokens_used': 0,
+            'model_used': 'extractive'
+        }
+
+
+# ----------------------------------------------------------------------
+# Offline evaluation
+# ----------------------------------------------------------------------
+
+def load_golden_set(path: str) -> List[Dict[str, Any]]:
+    """Read golden queries ({"query", "answer", optional "sources"}) from JSONL"""
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get('query') or 'answer' not in item:
+                raise ValueError(f"Line {line_number} of {path} needs 'query' and 'answer'")
+            items.append(item)
+    return items
+
+
+def _context_hit(docs: List[Dict[str, Any]], expected_sources: Optional[List[str]]) -> Optional[bool]:
+    if not expected_sources:
+        return None
+    return any(doc.get('source') in expected_sources for doc in docs)
+
+
+def run_golden_query(pipeline, policy: FastPathPolicy, item: Dict[str, Any],
+                     top_k_rerank: int = TOP_K_RERANK) -> Dict[str, Any]:
+    """Run one golden query down both paths and record timings and quality"""
+    query = item['query']
+    retrieved = pipeline.retrieve(query, pipeline.retrieval_depth(None))
+    candidates, _ = pipeline.select_candidates(retrieved, None, top_k_rerank)
+    candidates, _ = pipeline.diversify(candidates, top_k_rerank)
+    candidates = pipeline.load_texts(candidates)
+    record = {'query': query, **policy.confidence(candidates)}
+    if not candidates:
+        record['empty'] = True
+        return record
+
+    start = time.perf_counter()
+    reranked = pipeline.rerank(query, candidates, top_k_rerank)
+    record['rerank_seconds'] = time.perf_counter() - start
+    start = time.perf_counter()
+    full = pipeline.generate(query, reranked)
+    record['generation_seconds'] = time.perf_counter() - start
+
+    dense = candidates[:top_k_rerank]
+    start = time.perf_counter()
+    fast = policy.extractive_answer(query, dense[0])
+    record['extractive_seconds'] = time.perf_counter() - start
+
+    expected = item.get('sources')
+    record.update({
+        'full_hit': _context_hit(reranked, expected),
+        'skip_hit': _context_hit(dense, expected),
+        'full_f1': token_f1(full['answer'], item['answer']),
+        'extractive_f1': token_f1(fast['answer'], item['answer'])
+    })
+    return record
+
+
+def score_thresholds(records: List[Dict[str, Any]], score: float, margin: float,
+                     extractive: bool) -> Dict[str, Any]:
+    """Coverage, latency saved and quality cost of one threshold pair over recorded runs"""
+    runs = [r for r in records if not r.get('empty')]
+    taken = [r for r in runs if r['top_score'] >= score and r['margin'] >= margin]
+    saved = 0.0
+    f1_loss = 0.0
+    hit_loss = 0
+    for r in taken:
+        saved += r['rerank_seconds']
+        if r['full_hit'] is not None:
+            hit_loss += int(r['full_hit']) - int(r['skip_hit'])
+        if extractive:
+            saved += r['generation_seconds'] - r['extractive_seconds']
+            f1_loss += r['full_f1'] - r['extractive_f1']
+    n = len(runs) or 1
+    return {
+        'score': score,
+        'margin': margin,
+        'coverage': len(taken) / n,
+        'latency_saved_per_query': saved / n,
+        'hit_rate_loss': hit_loss / n,
+        'f1_loss': f1_loss / n
+    }
+
+
+def sweep(records: List[Dict[str, Any]], scores: List[float], margins: List[float],
+          extractive: bool, max_quality_loss: float) -> Dict[str, Any]:
+    """Score every threshold pair and pick the widest coverage within the quality budget"""
+    grid = [score_thresholds(records, s, m, extractive) for s in scores for m in margins]
+    loss_key = 'f1_loss' if extractive else 'hit_rate_loss'
+    acceptable = [row for row in grid if row[loss_key] <= max_quality_loss and row['coverage'] > 0]
+    best = max(acceptable, key=lambda row: (row['latency_saved_per_query'], row['score'])) if acceptable else None
+    return {'grid': grid, 'recommended': best}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Evaluate fast-path thresholds against a golden set")
+    parser.add_argument("golden", help="JSONL with query, answer and optional sources per line")
+    parser.add_argument("-o", "--output", help="Write the full report as JSON")
+    parser.add_argument("--max-quality-loss", type=float, default=0.02,
+                        help="Largest acceptable average quality drop for the recommendation")
+    parser.add_argument("--stand-ins", action="store_true", help="Use local stand-in backends")
+    args = parser.parse_args(argv)
+
+    if args.stand_ins:
+        from stand_ins import create_stand_in_pipeline
+        pipeline = create_stand_in_pipeline()
+    else:
+        from rag_pipeline import create_pipeline
+        pipeline = create_pipeline()
+
+    policy = FastPathPolicy()
+    records = []
+    for number, item in enumerate(load_golden_set(args.golden), 1):
+        records.append(run_golden_query(pipeline, policy, item))
+        print(f"[{number}] top={records[-1]['top_score']:.3f} margin={records[-1]['margin']:.3f} {item['query'][:60]}",
+              file=sys.stderr)
+
+    # Observed top scores are the only thresholds at which coverage changes
+    scores = sorted({round(r['top_score'], 3) for r in records if not r.get('empty')})
+    margins = [0.0, 0.02, 0.05, 0.08, 0.12, 0.2]
+    report = {
+        'queries': len(records),
+        'skip_rerank': sweep(records, scores, margins, False, args.max_quality_loss),
+        'extractive': sweep(records, scores, margins, True, args.max_quality_loss),
+        'records': records
+    }
+
+    for name in ('skip_rerank', 'extractive'):
+        best = report[name]['recommended']
+        if best is None:
+            print(f"{name}: no thresholds within the quality budget")
+        else:
+            print(f"{name}: score>={best['score']} margin>={best['margin']} covers {best['coverage']:.0%} of queries, "
+                  f"saves {best['latency_saved_per_query'] * 1000:.0f} ms/query, "
+                  f"hit-rate loss {best['hit_rate_loss']:.3f}, F1 loss {best['f1_loss']:.3f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""
+Compact index snapshots for fast warm starts and moves between environments
+
+Usage:
+    python index_snapshot.py export .rag_data/snapshots/prod [--dtype float16]
+    python index_snapshot.py verify .rag_data/snapshots/prod
+    python index_snapshot.py import .rag_data/snapshots/prod [--replace]
+
+A snapshot is a directory of flat files, each covered by a SHA-256 checksum
+in manifest.json:
+
+    vectors.npy            index vectors (float32 or float16), one row per ID
+    ids.txt                vector IDs, one per line, in row order
+    metadata.json/.npz     columnar metadata: distinct values per field plus
+                           int32 codes per row (-1 where a row lacks the field)
+    texts.bin/.offsets.npy chunk texts as one UTF-8 blob plus row offsets
+    embeddings.npy         full-width float32 embeddings (reduced indexes only)
+    projection.npz         PCA mean and components (EMBEDDING_REDUCTION=pca only)
+
+Import memory-maps the vector matrix. The local backend streams it into a
+new base file that it then maps (see LocalIndex.bulk_load); Pinecone gets
+batched upserts from a thread pool. Restoring a snapshot never re-runs
+extraction, chunking or embedding. PCA-reduced vectors only match queries
+projected with the same mean and components: `import` installs the
+snapshot's projection at PCA_PROJECTION_PATH when none exists there and
+refuses a snapshot whose projection differs from the installed one.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+import numpy as np
+from config import SNAPSHOT_DIR, SNAPSHOT_DTYPE, SNAPSHOT_IMPORT_WORKERS, SNAPSHOT_BATCH_SIZE, PCA_PROJECTION_PATH
+from dedup import DedupPlan
+from dim_reduction import PCAProjection
+
+FORMAT_VERSION = 1
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    manifest_path = os.path.join(path, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        raise ValueError(f"No snapshot manifest at '{manifest_path}'")
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')} (expected {FORMAT_VERSION})")
+    return manifest
+
+
+def verify_snapshot(path: str, manifest: Optional[Dict[str, Any]] = None,
+                    workers: int = SNAPSHOT_IMPORT_WORKERS) -> None:
+    """Check every file's size and checksum (files are hashed in parallel); raises on mismatch"""
+    manifest = manifest or read_manifest(path)
+    files = manifest['files']
+    for name, expected in files.items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise ValueError(f"Snapshot file '{name}' is missing")
+        if os.path.getsize(file_path) != expected['bytes']:
+            raise ValueError(f"Snapshot file '{name}' is {os.path.getsize(file_path)} bytes, expected {expected['bytes']}")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        digests = dict(zip(files, pool.map(lambda name: _sha256(os.path.join(path, name)), files)))
+    for name, digest in digests.items():
+        if digest != files[name]['sha256']:
+            raise ValueError(f"Checksum mismatch for snapshot file '{name}'")
+
+
+# ----------------------------------------------------------------------
+# Columnar metadata
+# ----------------------------------------------------------------------
+
+def _encode_metadata(metadata: List[Dict[str, Any]]) -> tuple:
+    """Dictionary-encode metadata dicts into {field: values} and {field: codes}"""
+    fields = sorted({field for record in metadata for field in record})
+    values, codes = {}, {}
+    for field in fields:
+        lookup, distinct = {}, []
+        column = np.full(len(metadata), -1, dtype=np.int32)
+        for row, record in enumerate(metadata):
+            if field not in record:
+                continue
+            key = json.dumps(record[field], sort_keys=True)
+            code = lookup.get(key)
+            if code is None:
+                code = lookup[key] = len(distinct)
+                distinct.append(record[field])
+            column[row] = code
+        values[field], codes[field] = distinct, column
+    return values, codes
+
+
+def _decode_metadata(values: Dict[str, List[Any]], codes: Dict[str, np.ndarray], count: int) -> List[Dict[str, Any]]:
+    metadata = [{} for _ in range(count)]
+    for field, distinct in values.items():
+        column = codes[field]
+        for row in np.flatnonzero(column >= 0):
+            metadata[row][field] = distinct[column[row]]
+    return metadata
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+
+def _read_index(vector_store, batch_size: int, workers: int) -> tuple:
+    """IDs, vectors and metadata of every indexed chunk"""
+    if vector_store.backend == 'local':
+        return vector_store.index.live_rows()
+
+    # Pinecone has no scan; the chunk store lists every indexed ID
+    ids = vector_store.chunk_store.list_ids()
+    batches = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        responses = list(pool.map(lambda batch: vector_store.index.fetch(ids=batch)['vectors'], batches))
+    found, vectors, metadata = [], [], []
+    for batch, response in zip(batches, responses):
+        for vector_id in batch:
+            if vector_id in response:
+                found.append(vector_id)
+                vectors.append(np.asarray(response[vector_id]['values'], dtype=np.float32))
+                metadata.append(dict(response[vector_id].get('metadata') or {}))
+    matrix = np.stack(vectors) if vectors else np.zeros((0, vector_store.index_dimension), dtype=np.float32)
+    return found, matrix, metadata
+
+
+def export_snapshot(vector_store, path: str, dtype: str = SNAPSHOT_DTYPE, include_texts: bool = True,
+                    batch_size: int = SNAPSHOT_BATCH_SIZE, workers: int = SNAPSHOT_IMPORT_WORKERS) -> Dict[str, Any]:
+    """Write the current index (and chunk texts) to a snapshot directory"""
+    if dtype not in ('float32', 'float16'):
+        raise ValueError(f"Unsupported snapshot dtype '{dtype}'. Use 'float32' or 'float16'.")
+    if os.path.exists(path):
+        raise ValueError(f"Snapshot '{path}' already exists; remove it or pick another path")
+    start_time = time.time()
+    ids, vectors, metadata = _read_index(vector_store, batch_size, workers)
+    if any('\n' in vector_id for vector_id in ids):
+        raise ValueError("Vector IDs containing newlines cannot be written to a snapshot")
+
+    # Write into a temporary directory and rename, so a snapshot is either complete or absent
+    staging = f"{path}.partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    np.save(os.path.join(staging, 'vectors.npy'), np.asarray(vectors, dtype=dtype))
+    with open(os.path.join(staging, 'ids.txt'), 'w', encoding='utf-8') as f:
+        f.write("\n".join(ids))
+    values, codes = _encode_metadata(metadata)
+    with open(os.path.join(staging, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(values, f)
+    np.savez(os.path.join(staging, 'metadata.npz'), **codes)
+
+    texts_found = embeddings_found = 0
+    if include_texts:
+        store = vector_store.chunk_store
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        with open(os.path.join(staging, 'texts.bin'), 'wb') as f:
+            for start in range(0, len(ids), store.LOOKUP_BATCH_SIZE):
+                batch = ids[start:start + store.LOOKUP_BATCH_SIZE]
+                texts = store.get_texts(batch)
+                texts_found += len(texts)
+                for i, vector_id in enumerate(batch):
+                    data = texts.get(vector_id, '').encode('utf-8')
+                    f.write(data)
+                    offsets[start + i + 1] = offsets[start + i] + len(data)
+        np.save(os.path.join(staging, 'texts.offsets.npy'), offsets)
+
+        # Reduced indexes rescore with full embeddings, which live only in the chunk store
+        if vector_store.projection is not None:
+            embeddings = np.zeros((len(ids), vector_store.full_dimension), dtype=np.float32)
+            for start in range(0, len(ids), store.LOOKUP_BATCH_SIZE):
+                batch = ids[start:start + store.LOOKUP_BATCH_SIZE]
+                stored = store.get_embeddings(batch)
+                embeddings_found += len(stored)
+                for i, vector_id in enumerate(batch):
+                    if vector_id in stored:
+                        embeddings[start + i] = stored[vector_id]
+            if embeddings_found:
+                np.save(os.path.join(staging, 'embeddings.npy'), embeddings)
+
+    if isinstance(vector_store.projection, PCAProjection):
+        vector_store.projection.save(os.path.join(staging, 'projection.npz'))
+
+    files = {}
+    for name in sorted(os.listdir(staging)):
+        file_path = os.path.join(staging, name)
+        files[name] = {'bytes': os.path.getsize(file_path), 'sha256': _sha256(file_path)}
+    manifest = {
+        'format': FORMAT_VERSION,
+        'created_at': time.time(),
+        'count': len(ids),
+        'dimension': int(vectors.shape[1]) if len(ids) else vector_store.index_dimension,
+        'dtype': dtype,
+        'full_dimension': vector_store.full_dimension,
+        'reduction': vector_store.projection.describe() if vector_store.projection is not None else None,
+        'source': {'backend': vector_store.backend, 'index': vector_store.index_name},
+        'texts': include_texts,
+        'embeddings': embeddings_found > 0,
+        'files': files
+    }
+    with open(os.path.join(staging, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging, path)
+
+    return {
+        'path': path,
+        'vectors': len(ids),
+        'texts': texts_found,
+        'embeddings': embeddings_found,
+        'bytes': sum(entry['bytes'] for entry in files.values()),
+        'seconds': time.time() - start_time
+    }
+
+
+# ----------------------------------------------------------------------
+# Import
+# ----------------------------------------------------------------------
+
+def import_snapshot(vector_store, path: str, verify: bool = True, replace: bool = False,
+                    batch_size: int = SNAPSHOT_BATCH_SIZE, workers: int = SNAPSHOT_IMPORT_WORKERS) -> Dict[str, Any]:
+    """
+    Restore a snapshot into the configured index
+
+    The index must be empty unless `replace` is set, which clears it (and the
+    chunk store and dedup index) first. Vector width and reduction method must
+    match the current configuration.
+    """
+    start_time = time.time()
+    manifest = read_manifest(path)
+    if verify:
+        verify_snapshot(path, manifest, workers)
+
+    if manifest['dimension'] != vector_store.index_dimension:
+        raise ValueError(f"Snapshot holds {manifest['dimension']}-dim vectors but the index expects "
+                         f"{vector_store.index_dimension}; check EMBEDDING_REDUCTION / EMBEDDING_REDUCED_DIM")
+    current = vector_store.projection.describe()['method'] if vector_store.projection is not None else None
+    snapshot = (manifest['reduction'] or {}).get('method')
+    if current != snapshot:
+        raise ValueError(f"Snapshot reduction is '{snapshot or 'none'}' but EMBEDDING_REDUCTION is '{current or 'none'}'")
+    if snapshot == 'pca':
+        _check_projection(vector_store.projection, path, manifest)
+
+    existing = vector_store.get_index_stats(refresh=True).get('total_vectors', 0)
+    if existing and not replace:
+        raise ValueError(f"Index already holds {existing} vectors; pass replace=True (--replace) to overwrite it")
+    if existing and not vector_store.clear_index():
+        raise Exception("Error clearing the index before import")
+
+    count = manifest['count']
+    with open(os.path.join(path, 'ids.txt'), encoding='utf-8') as f:
+        ids = f.read().split("\n") if count else []
+    vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+    with open(os.path.join(path, 'metadata.json'), encoding='utf-8') as f:
+        values = json.load(f)
+    with np.load(os.path.join(path, 'metadata.npz')) as codes:
+        metadata = _decode_metadata(values, {field: codes[field] for field in values}, count)
+
+    if vector_store.backend == 'local':
+        vector_store.index.bulk_load(ids, vectors, metadata)
+    else:
+        def upsert(start: int) -> int:
+            stop = min(start + batch_size, count)
+            block = np.asarray(vectors[start:stop], dtype=np.float32)
+            vector_store.index.upsert(vectors=[
+                {'id': ids[i], 'values': block[i - start].tolist(), 'metadata': metadata[i]}
+                for i in range(start, stop)
+            ])
+            return stop - start
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            upserted = 0
+            for done in pool.map(upsert, range(0, count, batch_size)):
+                upserted += done
+                print(f"Upserted {upserted}/{count} vectors", file=sys.stderr)
+
+    texts_restored = 0
+    if manifest['texts']:
+        texts_restored = _restore_texts(vector_store, path, manifest, ids, metadata)
+
+    return {
+        'vectors': count,
+        'texts': texts_restored,
+        'backend': vector_store.backend,
+        'seconds': time.time() - start_time
+    }
+
+
+def _check_projection(projection: PCAProjection, path: str, manifest: Dict[str, Any]) -> None:
+    """Refuse PCA vectors projected differently from the queries this environment will run"""
+    if 'projection.npz' not in manifest['files']:
+        raise ValueError("Snapshot of a PCA-reduced index has no projection.npz (exported before it was "
+                         "included); re-export it from the source environment")
+    exported = PCAProjection.load(os.path.join(path, 'projection.npz'))
+    if not (np.array_equal(exported.mean, projection.mean) and np.array_equal(exported.components, projection.components)):
+        raise ValueError(f"Snapshot was projected with a different PCA fit than '{PCA_PROJECTION_PATH}'; "
+                         f"remove that file to install the snapshot's projection on import")
+
+
+def install_projection(path: str, projection_path: str = PCA_PROJECTION_PATH) -> bool:
+    """
+    Copy a snapshot's PCA projection to projection_path if none is installed
+
+    Must run before the VectorStore is built, which loads the projection.
+    Returns whether a projection was installed.
+    """
+    manifest = read_manifest(path)
+    if (manifest['reduction'] or {}).get('method') != 'pca' or 'projection.npz' not in manifest['files'] \
+            or os.path.exists(projection_path):
+        return False
+    source = os.path.join(path, 'projection.npz')
+    if _sha256(source) != manifest['files']['projection.npz']['sha256']:
+        raise ValueError("Checksum mismatch for snapshot file 'projection.npz'")
+    PCAProjection.load(source).save(projection_path)
+    return True
+
+
+def _restore_texts(vector_store, path: str, manifest: Dict[str, Any], ids: List[str],
+                   metadata: List[Dict[str, Any]]) -> int:
+    """Refill the chunk store (and dedup signatures) from the snapshot's text columns"""
+    offsets = np.load(os.path.join(path, 'texts.offsets.npy'))
+    embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r') if manifest['embeddings'] else None
+    store, deduplicator = vector_store.chunk_store, vector_store.deduplicator
+    restored = 0
+    with open(os.path.join(path, 'texts.bin'), 'rb') as f:
+        blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b''
+    for start in range(0, len(ids), store.LOOKUP_BATCH_SIZE):
+        stop = min(start + store.LOOKUP_BATCH_SIZE, len(ids))
+        records, texts, kept = [], [], []
+        for i in range(start, stop):
+            text = blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+            if not text:
+                continue
+            record = {
+                'id': ids[i],
+                'text': text,
+                'source': metadata[i].get('source', 'unknown'),
+                'title': metadata[i].get('title', ''),
+                'section': metadata[i].get('section', '')
+            }
+            if embeddings is not None and embeddings[i].any():
+                record['embedding'] = np.asarray(embeddings[i], dtype=np.float32).tobytes()
+            records.append(record)
+            texts.append(text)
+            kept.append(i)
+        restored += store.put_many(records) if records else 0
+        if deduplicator is not None and kept:
+            plan = DedupPlan(np.ones(len(kept), dtype=bool), [deduplicator.signature(t) for t in texts], {}, {})
+            deduplicator.record(plan, [ids[i] for i in kept], [metadata[i] for i in kept])
+    if isinstance(blob, mmap.mmap):
+        blob.close()
+    return restored
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Index snapshot export/import")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Write the current index to a snapshot directory")
+    export.add_argument("path", nargs="?", help=f"Snapshot directory (default: under {SNAPSHOT_DIR})")
+    export.add_argument("--dtype", choices=["float32", "float16"], default=SNAPSHOT_DTYPE)
+    export.add_argument("--no-texts", action="store_true", help="Leave chunk texts out of the snapshot")
+    restore = sub.add_parser("import", help="Load a snapshot into the configured index")
+    restore.add_argument("path")
+    restore.add_argument("--replace", action="store_true", help="Clear a non-empty index first")
+    restore.add_argument("--no-verify", action="store_true", help="Skip checksum verification")
+    verify = sub.add_parser("verify", help="Check a snapshot's checksums")
+    verify.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "verify":
+        verify_snapshot(args.path)
+        manifest = read_manifest(args.path)
+        print(f"Snapshot OK: {manifest['count']} vectors, {manifest['dimension']} dimensions ({manifest['dtype']})")
+        return 0
+
+    from vector_store import VectorStore
+    if args.command == "import" and install_projection(args.path):
+        print(f"Installed the snapshot's PCA projection at '{PCA_PROJECTION_PATH}'")
+    vector_store = VectorStore()
+    if args.command == "export":
+        path = args.path or os.path.join(SNAPSHOT_DIR, time.strftime("%Y%m%d-%H%M%S"))
+        result = export_snapshot(vector_store, path, args.dtype, include_texts=not args.no_texts)
+        print(f"Exported {result['vectors']} vectors ({result['texts']} texts) to '{path}': "
+              f"{result['bytes'] / 1024 / 1024:.1f} MB in {result['seconds']:.1f}s")
+    else:
+        result = import_snapshot(vector_store, args.path, verify=not args.no_verify, replace=args.replace)
+        print(f"Imported {result['vectors']} vectors ({result['texts']} texts) into the {result['backend']} "
+              f"index in {result['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Cached index statistics with optimistic local updates
+
+describe_index_stats is a network round trip, and the dashboard asks for
+stats on every Streamlit rerun. IndexStatsCache serves the last fetched
+stats immediately, adjusts the vector count locally on upserts, deletes and
+clears, and refreshes from the index on a background thread once the
+cached copy is older than INDEX_STATS_TTL. Each refresh replaces the local
+adjustments with the index's own count.
+"""
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+from config import INDEX_STATS_TTL
+
+
+class IndexStatsCache:
+    """TTL cache over a stats fetch function, refreshed asynchronously"""
+
+    def __init__(self, fetch: Callable[[], Dict[str, Any]], ttl: float = INDEX_STATS_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self._stats: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self._delta = 0          # vectors added (or removed) locally since the last fetch
+        self._cleared = False    # clear_index ran since the last fetch
+        self._refreshing = False
+        self._generation = 0     # bumped by clear(), so a refresh started before it is discarded
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        with self._lock:
+            generation = self._generation
+        try:
+            stats = self.fetch()
+            error = None
+        except Exception as e:
+            stats, error = None, str(e)
+        with self._lock:
+            self._refreshing = False
+            self._last_error = error
+            if stats is not None and generation == self._generation:
+                self._stats = stats
+                self._fetched_at = time.time()
+                self._delta = 0
+                self._cleared = False
+
+    def refresh(self) -> Dict[str, Any]:
+        """Fetch from the index now (blocking) and return the result"""
+        with self._lock:
+            self._refreshing = True
+        self._refresh()
+        return self.get(refresh_if_stale=False)
+
+    def get(self, refresh_if_stale: bool = True) -> Dict[str, Any]:
+        """Latest stats with local adjustments; never blocks except for the very first fetch"""
+        with self._lock:
+            first = self._stats is None and not self._refreshing
+            stale = time.time() - self._fetched_at > self.ttl
+            start_refresh = refresh_if_stale and stale and not self._refreshing and not first
+            if start_refresh or first:
+                self._refreshing = True
+        if first:
+            self._refresh()
+        elif start_refresh:
+            threading.Thread(target=self._refresh, name="index-stats-refresh", daemon=True).start()
+
+        with self._lock:
+            if self._stats is None:
+                return {'error': self._last_error or "Index statistics not loaded yet"}
+            stats = dict(self._stats)
+            if self._cleared:
+                stats['total_vectors'] = 0
+                if 'aliased_chunks' in stats:
+                    stats['aliased_chunks'] = 0
+            stats['total_vectors'] = max(0, stats.get('total_vectors', 0) + self._delta)
+            stats['stats_age'] = round(time.time() - self._fetched_at, 1)
+            stats['stats_pending'] = self._delta != 0 or self._cleared
+            if self._last_error:
+                stats['stats_error'] = self._last_error
+            return stats
+
+    def note_upsert(self, count: int) -> None:
+        """Vectors written locally (re-upserted IDs are over-counted until the next refresh)"""
+        with self._lock:
+            self._delta += count
+
+    def note_delete(self, count: int) -> None:
+        with self._lock:
+            self._delta -= count
+
+    def note_clear(self) -> None:
+        with self._lock:
+            self._cleared = True
+            self._delta = 0
+            self._generation += 1
+
+    def invalidate(self) -> None:
+        """Make the next get() start a background refresh"""
+        with self._lock:
+            self._fetched_at = 0.0
@@ -0,0 +1,394 @@
+"""
+Durable background ingestion: SQLite job queue plus worker processes
+
+Usage:
+    python ingest_jobs.py worker [--processes N]   # run ingestion workers
+    python ingest_jobs.py list                     # show recent jobs
+
+Uploads are spooled to disk and recorded as jobs. Workers claim jobs, run
+extract → chunk → embed → upsert, and checkpoint after every committed batch
+of INGEST_BATCH_SIZE chunks. Vector IDs are derived from the job ID and chunk
+index, so a job resumed after a crash re-upserts at most one batch and never
+duplicates vectors.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from chunk_batch import ChunkBatch
+from profiling import profiled
+from config import (
+    INGEST_QUEUE_PATH,
+    INGEST_UPLOAD_DIR,
+    INGEST_BATCH_SIZE,
+    INGEST_POLL_INTERVAL,
+    INGEST_STALE_SECONDS,
+    EMBEDDING_POOL_WORKERS
+)
+
+
+JOB_COLUMNS = (
+    'id', 'source_name', 'kind', 'payload_path', 'status', 'total_chunks', 'total_batches',
+    'committed_batches', 'upserted_count', 'error', 'worker', 'heartbeat_at', 'created_at', 'updated_at'
+)
+
+
+class SpooledUpload:
+    """Read-only view of a spooled upload that reports the original file name"""
+
+    def __init__(self, path: str, name: str):
+        self._file = open(path, 'rb')
+        self.name = name
+
+    def read(self, *args) -> bytes:
+        return self._file.read(*args)
+
+    def seek(self, *args) -> int:
+        return self._file.seek(*args)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class IngestJobQueue:
+    """SQLite-backed queue of ingestion jobs with per-batch checkpoints"""
+
+    def __init__(self, path: str = INGEST_QUEUE_PATH, upload_dir: str = INGEST_UPLOAD_DIR):
+        self.path = path
+        self.upload_dir = upload_dir
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.makedirs(upload_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                source_name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                total_chunks INTEGER,
+                total_batches INTEGER,
+                committed_batches INTEGER NOT NULL DEFAULT 0,
+                upserted_count INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                worker TEXT,
+                heartbeat_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _row_to_job(self, row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        if job['total_batches']:
+            job['progress'] = job['committed_batches'] / job['total_batches']
+        else:
+            job['progress'] = 1.0 if job['status'] == 'completed' else 0.0
+        return job
+
+    # ------------------------------------------------------------------
+    # Producers
+    # ------------------------------------------------------------------
+
+    def _insert(self, job_id: str, source_name: str, kind: str, payload_path: str) -> Dict[str, Any]:
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, source_name, kind, payload_path, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (job_id, source_name, kind, payload_path, now, now)
+        )
+        return self.get_job(job_id)
+
+    def enqueue_file(self, uploaded_file) -> Dict[str, Any]:
+        """Spool an uploaded file (needs .name and .read()) to disk and queue it"""
+        job_id = uuid.uuid4().hex[:16]
+        extension = os.path.splitext(uploaded_file.name)[1].lower()
+        payload_path = os.path.join(self.upload_dir, f"{job_id}{extension}")
+        with open(payload_path, 'wb') as f:
+            shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
+        return self._insert(job_id, uploaded_file.name, 'file', payload_path)
+
+    def enqueue_text(self, text: str, source_name: str) -> Dict[str, Any]:
+        """Spool pasted text to disk and queue it"""
+        job_id = uuid.uuid4().hex[:16]
+        payload_path = os.path.join(self.upload_dir, f"{job_id}.txt")
+        with open(payload_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return self._insert(job_id, source_name, 'text', payload_path)
+
+    # ------------------------------------------------------------------
+    # Consumers
+    # ------------------------------------------------------------------
+
+    def claim_next(self, worker: str, stale_after: float = INGEST_STALE_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Atomically claim the oldest queued job, or a running job whose worker stopped heartbeating
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now - stale_after,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, heartbeat_at = ?, updated_at = ?, error = NULL "
+                    "WHERE id = ?",
+                    (worker, now, now, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get_job(row[0])
+
+    def set_plan(self, job_id: str, total_chunks: int, total_batches: int) -> None:
+        """Record how many chunks and batches the job will produce"""
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET total_chunks = ?, total_batches = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+            (total_chunks, total_batches, now, now, job_id)
+        )
+
+    def checkpoint(self, job_id: str, committed_batches: int, upserted_count: int) -> None:
+        """Record that batches [0, committed_batches) are durably in the index"""
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET committed_batches = ?, upserted_count = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+            (committed_batches, upserted_count, now, now, job_id)
+        )
+
+    def heartbeat(self, job_id: str) -> None:
+        """Mark the job as still owned by a live worker"""
+        self._execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def complete(self, job_id: str) -> None:
+        now = time.time()
+        self._execute("UPDATE jobs SET status = 'completed', updated_at = ? WHERE id = ?", (now, job_id))
+
+    def fail(self, job_id: str, error: str) -> None:
+        now = time.time()
+        self._execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?", (error, now, job_id))
+
+    def retry(self, job_id: str) -> None:
+        """Re-queue a failed job; it resumes from its last committed batch"""
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = 'queued', error = NULL, updated_at = ? WHERE id = ? AND status = 'failed'",
+            (now, job_id)
+        )
+
+    def discard(self, job_id: str, vector_store=None) -> None:
+        """Drop a failed or queued job, deleting any vectors it already committed"""
+        job = self.get_job(job_id)
+        if job is None or job['status'] == 'running':
+            return
+        if vector_store is not None and job['total_chunks']:
+            vector_store.delete_documents(job_vector_ids(job_id, job['total_chunks']))
+        if os.path.exists(job['payload_path']):
+            os.remove(job['payload_path'])
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    # ------------------------------------------------------------------
+    # Inspection
+    # ------------------------------------------------------------------
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent jobs first"""
+        rows = self._execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def has_active_jobs(self) -> bool:
+        row = self._execute("SELECT 1 FROM jobs WHERE status IN ('queued', 'running') LIMIT 1").fetchone()
+        return row is not None
+
+
+def job_vector_ids(job_id: str, end: int, start: int = 0) -> List[str]:
+    """Deterministic vector IDs for chunks [start, end) of a job"""
+    return [f"{job_id}_{i}" for i in range(start, end)]
+
+
+class IngestWorker:
+    """Claims jobs from the queue and runs them batch by batch"""
+
+    def __init__(self, queue: IngestJobQueue, vector_store, doc_processor=None,
+                 batch_size: int = INGEST_BATCH_SIZE, poll_interval: float = INGEST_POLL_INTERVAL):
+        from document_processor import DocumentProcessor
+        self.queue = queue
+        self.vector_store = vector_store
+        self.doc_processor = doc_processor or DocumentProcessor()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.name = f"{os.uname().nodename}:{os.getpid()}"
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_forever(self, parent_pid: Optional[int] = None) -> None:
+        """Process jobs until stopped (or until the parent process exits, if given)"""
+        while not self._stop.is_set():
+            if parent_pid and os.getppid() != parent_pid:
+                break
+            if not self.run_once():
+                self._stop.wait(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """Claim and process one job; returns False if the queue was empty"""
+        job = self.queue.claim_next(self.name)
+        if job is None:
+            return False
+
+        # Keep heartbeating while long extraction or embedding steps run
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(INGEST_STALE_SECONDS / 4):
+                self.queue.heartbeat(job['id'])
+
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            with profiled('ingest', job['source_name']):
+                self._process(job)
+            self.queue.complete(job['id'])
+            if os.path.exists(job['payload_path']):
+                os.remove(job['payload_path'])
+        except Exception as e:
+            self.queue.fail(job['id'], str(e))
+        finally:
+            done.set()
+        return True
+
+    def _load_chunks(self, job: Dict[str, Any]) -> ChunkBatch:
+        if job['kind'] == 'text':
+            with open(job['payload_path'], encoding='utf-8') as f:
+                text = f.read()
+            title = self.doc_processor.extract_document_title(text, job['source_name'])
+            return self.doc_processor.chunk_text(text, job['source_name'], title)
+
+        upload = SpooledUpload(job['payload_path'], job['source_name'])
+        try:
+            return self.doc_processor.process_uploaded_file(upload)
+        finally:
+            upload.close()
+
+    def _process(self, job: Dict[str, Any]) -> None:
+        # Extraction and chunking are deterministic, so a resumed job sees the same batches
+        chunks = self._load_chunks(job)
+        total_batches = (len(chunks) + self.batch_size - 1) // self.batch_size
+        self.queue.set_plan(job['id'], len(chunks), total_batches)
+
+        upserted = job['upserted_count'] if job['committed_batches'] else 0
+
+        def batch_at(batch_index: int) -> ChunkBatch:
+            start = batch_index * self.batch_size
+            return chunks.slice(start, min(start + self.batch_size, len(chunks)))
+
+        # With an embedding pool, encode the next batch in the worker processes while
+        # this one is upserted (dedup still runs at upsert time; aliased chunks are
+        # then embedded but never stored)
+        prefetch = ThreadPoolExecutor(max_workers=1) if EMBEDDING_POOL_WORKERS > 1 else None
+        pending = None
+        try:
+            for batch_index in range(job['committed_batches'], total_batches):
+                batch = pending.result() if pending is not None else batch_at(batch_index)
+                pending = None
+                if prefetch is not None and batch_index + 1 < total_batches:
+                    pending = prefetch.submit(self.vector_store.encode_chunks, batch_at(batch_index + 1))
+                start = batch_index * self.batch_size
+                result = self.vector_store.upsert_documents(
+                    batch, vector_ids=job_vector_ids(job['id'], start + len(batch), start)
+                )
+                if not result['success']:
+                    raise Exception(f"Batch {batch_index + 1}/{total_batches} failed: {result['error']}")
+                upserted += result['upserted_count']
+                self.queue.checkpoint(job['id'], batch_index + 1, upserted)
+        finally:
+            if prefetch is not None:
+                prefetch.shutdown(wait=True)
+
+
+def _worker_main(parent_pid: Optional[int] = None) -> None:
+    from vector_store import VectorStore
+    worker = IngestWorker(IngestJobQueue(), VectorStore())
+    print(f"Ingest worker {worker.name} started")
+    worker.run_forever(parent_pid)
+
+
+def start_worker_process(parent_pid: Optional[int] = None) -> subprocess.Popen:
+    """Launch a detached worker process (exits when parent_pid exits, if given)"""
+    command = [sys.executable, os.path.abspath(__file__), 'worker']
+    if parent_pid:
+        command += ['--parent-pid', str(parent_pid)]
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Background ingestion job queue")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker_parser = subparsers.add_parser('worker', help="Run ingestion worker processes")
+    worker_parser.add_argument("--processes", type=int, default=1)
+    worker_parser.add_argument("--parent-pid", type=int, default=None, help="Exit when this process exits")
+    list_parser = subparsers.add_parser('list', help="Show recent jobs")
+    list_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for job in IngestJobQueue().list_jobs(args.limit):
+            print(f"{job['id']}  {job['status']:<9}  {job['committed_batches']}/{job['total_batches'] or '?'} batches  "
+                  f"{job['source_name']}" + (f"  error: {job['error']}" if job['error'] else ""))
+        return 0
+
+    if args.processes <= 1:
+        _worker_main(args.parent_pid)
+        return 0
+
+    # Each process loads its own embedding model; spawn avoids forking torch state
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_worker_main, args=(args.parent_pid,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Scheduler for Groq calls: per-model request/token budgets, fair queuing and model routing
+
+Every generation asks the scheduler for a grant before calling Groq. Waiting
+calls are queued per session and granted round-robin across sessions, so one
+busy session (or a batch job) cannot starve the others. A grant is only
+issued when the chosen model's request and token buckets can cover the
+call's estimated tokens; the reservation is settled against the returned
+usage.total_tokens afterwards. Calls are routed to the fast model when the
+queue is deep, the packed context is small, or the primary model is out of
+budget or rate limited. A session (e.g. a batch job) can additionally be
+capped with its own budget, which only delays that session's calls.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, Tuple
+from config import (
+    LLM_MODEL,
+    LLM_FAST_MODEL,
+    GROQ_REQUESTS_PER_MINUTE,
+    GROQ_TOKENS_PER_MINUTE,
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_TIMEOUT,
+    LLM_ROUTE_QUEUE_DEPTH,
+    LLM_ROUTE_SMALL_CONTEXT_TOKENS
+)
+from rate_limiter import TokenBucket
+from tracing import tracer
+
+
+class LLMGrant:
+    """Permission to make one LLM call with a specific model"""
+
+    def __init__(self, session_id: str, model: str, route_reason: str, estimate: int, queue_wait: float):
+        self.session_id = session_id
+        self.model = model
+        self.route_reason = route_reason
+        self.estimate = estimate
+        self.queue_wait = queue_wait
+
+
+class _Ticket:
+    def __init__(self, session_id: str, estimate: int, context_tokens: int):
+        self.session_id = session_id
+        self.estimate = estimate
+        self.context_tokens = context_tokens
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    """Fair, budget-aware admission of LLM calls with primary/fast model routing"""
+
+    def __init__(self, primary_model: str = LLM_MODEL, fast_model: str = LLM_FAST_MODEL,
+                 requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = GROQ_TOKENS_PER_MINUTE,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 route_queue_depth: int = LLM_ROUTE_QUEUE_DEPTH,
+                 small_context_tokens: int = LLM_ROUTE_SMALL_CONTEXT_TOKENS):
+        self.primary_model = primary_model
+        self.fast_model = fast_model or primary_model
+        self.max_concurrency = max_concurrency
+        self.route_queue_depth = route_queue_depth
+        self.small_context_tokens = small_context_tokens
+        self._cond = threading.Condition()
+        self._sessions = OrderedDict()  # session_id -> deque of waiting tickets, in round-robin order
+        self._waiting = 0
+        self._running = 0
+        self._blocked_until = {}
+        self._session_budgets = {}  # session_id -> (requests, tokens) caps on top of the model budgets
+        self.set_budget(requests_per_minute, tokens_per_minute)
+        self.counters = {
+            'granted': {}, 'routed': {}, 'rate_limited': 0, 'timeouts': 0,
+            'tokens_reserved': 0, 'tokens_used': 0, 'max_queue_depth': 0
+        }
+
+    def set_budget(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        """(Re)create per-model budgets; Groq limits each model separately"""
+        with self._cond:
+            self._budgets = {
+                model: (TokenBucket(requests_per_minute), TokenBucket(tokens_per_minute))
+                for model in {self.primary_model, self.fast_model}
+            }
+            self._cond.notify_all()
+
+    def set_session_budget(self, session_id: str, requests_per_minute: int, tokens_per_minute: int) -> None:
+        """Cap one session's calls below the shared model budgets (other sessions are unaffected)"""
+        with self._cond:
+            self._session_budgets[session_id] = (TokenBucket(requests_per_minute), TokenBucket(tokens_per_minute))
+            self._cond.notify_all()
+
+    def clear_session_budget(self, session_id: str) -> None:
+        """Remove a session's cap; its calls are then limited by the model budgets only"""
+        with self._cond:
+            self._session_budgets.pop(session_id, None)
+            self._cond.notify_all()
+
+    def _session_wait(self, ticket: _Ticket) -> float:
+        budget = self._session_budgets.get(ticket.session_id)
+        if budget is None:
+            return 0.0
+        requests, tokens = budget
+        return max(requests.wait_time(1), tokens.wait_time(ticket.estimate))
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    def _budget_wait(self, model: str, estimate: int) -> float:
+        requests, tokens = self._budgets[model]
+        blocked = max(0.0, self._blocked_until.get(model, 0.0) - time.monotonic())
+        return max(blocked, requests.wait_time(1), tokens.wait_time(estimate))
+
+    def route(self, estimate: int, context_tokens: int, queue_depth: int) -> Tuple[str, str]:
+        """Pick the model for a call and the reason for the choice"""
+        if self.fast_model == self.primary_model:
+            return self.primary_model, 'primary'
+        if queue_depth >= self.route_queue_depth:
+            return self.fast_model, 'queue_depth'
+        if context_tokens <= self.small_context_tokens:
+            return self.fast_model, 'small_context'
+        if self._budget_wait(self.primary_model, estimate) > 0 and self._budget_wait(self.fast_model, estimate) == 0:
+            return self.fast_model, 'primary_budget'
+        return self.primary_model, 'primary'
+
+    # ------------------------------------------------------------------
+    # Admission
+    # ------------------------------------------------------------------
+
+    def _head(self) -> Optional[_Ticket]:
+        # A session over its own cap is skipped so it does not hold up the others
+        for queue in self._sessions.values():
+            if queue and self._session_wait(queue[0]) == 0:
+                return queue[0]
+        return None
+
+    def _dequeue(self, ticket: _Ticket) -> None:
+        queue = self._sessions[ticket.session_id]
+        queue.remove(ticket)
+        self._waiting -= 1
+        if queue:
+            self._sessions.move_to_end(ticket.session_id)  # round-robin: other sessions go next
+        else:
+            del self._sessions[ticket.session_id]
+
+    def acquire(self, session_id: str, estimate: int, context_tokens: int = 0,
+                timeout: Optional[float] = LLM_QUEUE_TIMEOUT) -> LLMGrant:
+        """
+        Wait for this session's turn and for budget, then reserve it
+
+        Args:
+            session_id: Caller identity used for fair ordering
+            estimate: Upper bound on tokens the call will consume
+            context_tokens: Estimated prompt tokens (small contexts can use the fast model)
+            timeout: Seconds to wait before giving up
+
+        Raises:
+            TimeoutError: if no grant was possible within `timeout`
+        """
+        ticket = _Ticket(session_id or 'default', estimate, context_tokens)
+        deadline = None if timeout is None else ticket.enqueued + timeout
+        with self._cond:
+            self._sessions.setdefault(ticket.session_id, deque()).append(ticket)
+            self._waiting += 1
+            self.counters['max_queue_depth'] = max(self.counters['max_queue_depth'], self._waiting)
+            while True:
+                delay = None
+                if self._head() is ticket and self._running < self.max_concurrency:
+                    model, reason = self.route(estimate, context_tokens, self._waiting - 1)
+                    delay = self._budget_wait(model, estimate)
+                    if delay == 0:
+                        requests, tokens = self._budgets[model]
+                        requests.acquire(1, timeout=0)
+                        tokens.acquire(estimate, timeout=0)
+                        if ticket.session_id in self._session_budgets:
+                            session_requests, session_tokens = self._session_budgets[ticket.session_id]
+                            session_requests.acquire(1, timeout=0)
+                            session_tokens.acquire(estimate, timeout=0)
+                        self._dequeue(ticket)
+                        self._running += 1
+                        waited = time.monotonic() - ticket.enqueued
+                        self.counters['granted'][model] = self.counters['granted'].get(model, 0) + 1
+                        self.counters['routed'][reason] = self.counters['routed'].get(reason, 0) + 1
+                        self.counters['tokens_reserved'] += estimate
+                        self._cond.notify_all()
+                        tracer.observe("llm.queue_wait", waited)
+                        return LLMGrant(ticket.session_id, model, reason, estimate, waited)
+                elif self._sessions[ticket.session_id][0] is ticket:
+                    session_wait = self._session_wait(ticket)
+                    delay = session_wait if session_wait > 0 else None
+
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._dequeue(ticket)
+                        self.counters['timeouts'] += 1
+                        self._cond.notify_all()
+                        raise TimeoutError(
+                            f"LLM queue: no capacity within {timeout:.1f}s ({self._waiting} calls waiting)"
+                        )
+                    delay = remaining if delay is None else min(delay, remaining)
+                self._cond.wait(delay)
+
+    def release(self, grant: LLMGrant, tokens_used: Optional[int] = None,
+                retry_after: Optional[float] = None) -> None:
+        """
+        Finish a call: settle the token reservation and free the slot
+
+        Args:
+            grant: Grant returned by acquire()
+            tokens_used: usage.total_tokens reported by Groq (None refunds the whole estimate)
+            retry_after: Set when Groq rate-limited the call; blocks that model for this many seconds
+        """
+        with self._cond:
+            self._running -= 1
+            used = tokens_used or 0
+            self._budgets[grant.model][1].adjust(grant.estimate - used)
+            if grant.session_id in self._session_budgets:
+                self._session_budgets[grant.session_id][1].adjust(grant.estimate - used)
+            self.counters['tokens_used'] += used
+            if retry_after is not None:
+                self.counters['rate_limited'] += 1
+                self._blocked_until[grant.model] = time.monotonic() + retry_after
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, per-session backlog, routing counts and budget levels"""
+        with self._cond:
+            return {
+                'queue_depth': self._waiting,
+                'running': self._running,
+                'sessions_waiting': {session: len(queue) for session, queue in self._sessions.items()},
+                'budgets': {
+                    model: {'requests_available': requests.available, 'tokens_available': tokens.available}
+                    for model, (requests, tokens) in self._budgets.items()
+                },
+                'session_budgets': {
+                    session: {'requests_available': requests.available, 'tokens_available': tokens.available}
+                    for session, (requests, tokens) in self._session_budgets.items()
+                },
+                'counters': {key: (dict(value) if isinstance(value, dict) else value)
+                             for key, value in self.counters.items()},
+                'queue_wait': tracer.snapshot().get('llm.queue_wait', {})
+            }
+
+    def export_prometheus(self) -> str:
+        """Scheduler gauges and counters in the Prometheus text format"""
+        state = self.metrics()
+        lines = [
+            "# TYPE rag_llm_queue_depth gauge",
+            f"rag_llm_queue_depth {state['queue_depth']}",
+            "# TYPE rag_llm_running gauge",
+            f"rag_llm_running {state['running']}",
+            "# TYPE rag_llm_requests_total counter"
+        ]
+        for model, count in state['counters']['granted'].items():
+            lines.append(f'rag_llm_requests_total{{model="{model}"}} {count}')
+        lines.append("# TYPE rag_llm_routed_total counter")
+        for reason, count in state['counters']['routed'].items():
+            lines.append(f'rag_llm_routed_total{{reason="{reason}"}} {count}')
+        lines += [
+            "# TYPE rag_llm_rate_limited_total counter",
+            f"rag_llm_rate_limited_total {state['counters']['rate_limited']}",
+            "# TYPE rag_llm_queue_timeouts_total counter",
+            f"rag_llm_queue_timeouts_total {state['counters']['timeouts']}",
+            "# TYPE rag_llm_tokens_used_total counter",
+            f"rag_llm_tokens_used_total {state['counters']['tokens_used']}"
+        ]
+        return "\n".join(lines) + "\n"
@@ -2,15 +2,23 @@
 LLM service using Groq for generating answers with citations
 """
 import re
-from groq import Groq
-from typing import List, Dict, Any, Tuple
-from config import GROQ_API_KEY, LLM_MODEL, MAX_TOKENS, TEMPERATURE
+from groq import Groq, RateLimitError
+from typing import List, Dict, Any, Tuple, Optional
+from config import GROQ_API_KEY, MAX_TOKENS, TEMPERATURE, LLM_MAX_RETRIES
+from llm_scheduler import LLMScheduler
+from resilience import resilience, ServiceUnavailable, DeadlineExceeded
+from tracing import tracer
+
+
+class LLMUnavailable(ServiceUnavailable):
+    """No answer could be generated in time: the scheduler queue timed out or Groq kept rate limiting"""
 
 
 class LLMService:
     """Handles LLM operations for generating answers with citations"""
     
-    def __init__(self):
+    def __init__(self, scheduler: LLMScheduler = None):
+        self.scheduler = scheduler or LLMScheduler()
         if not GROQ_API_KEY:
             raise ValueError("GROQ_API_KEY not found in environment variables")
         
@@ -26,16 +34,22 @@ class LLMService:
             else:
                 raise e
     
-    def generate_answer_with_citations(self, query: str, context_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def generate_answer_with_citations(self, query: str, context_docs: List[Dict[str, Any]],
+                                       session_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Generate an answer with inline citations using retrieved documents
         
         Args:
             query: User's question
             context_docs: List of relevant documents with text and metadata
+            session_id: Caller identity for fair queuing in the LLM scheduler
         
         Returns:
             Dict with answer, citations, and metadata
+
+        Raises:
+            LLMUnavailable: if the scheduler grants no slot in time or rate
+                limiting outlasts LLM_MAX_RETRIES (callers fall back)
         """
         if not context_docs:
             return {
@@ -46,34 +60,23 @@ class LLMService:
             }
         
         try:
-            # Prepare context with citation markers
-            context_text, citation_map = self._prepare_context_with_citations(context_docs)
-            
-            # Create the prompt
-            prompt = self._create_rag_prompt(query, context_text)
-            
-            # Generate answer
-            response = self.client.chat.completions.create(
-                model=LLM_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful AI assistant that answers questions based on provided context. Always include citations in your answers using [1], [2], etc. format when referencing specific information from the context."
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                max_tokens=MAX_TOKENS,
-                temperature=TEMPERATURE
-            )
+            with tracer.span("llm.prompt_build", context_docs=len(context_docs)) as span:
+                # Prepare context with citation markers
+                context_text, citation_map = self._prepare_context_with_citations(context_docs)
+                
+                # Create the prompt
+                prompt = self._create_rag_prompt(query, context_text)
+                span.set_attribute('prompt_chars', len(prompt))
             
+            # Generate answer once the scheduler grants a slot and budget
+            response, grant = self._call_llm(prompt, self.estimate_tokens(query, context_docs), session_id)
             answer = response.choices[0].message.content
             tokens_used = response.usage.total_tokens if response.usage else 0
             
             # Extract and validate citations
-            citations = self._extract_citations(answer, citation_map)
+            with tracer.span("llm.citation_extraction") as span:
+                citations = self._extract_citations(answer, citation_map)
+                span.set_attribute('citations', len(citations))
             
             # Prepare source information
             sources = self._prepare_sources(context_docs)
@@ -83,17 +86,88 @@ class LLMService:
                 'citations': citations,
                 'sources': sources,
                 'tokens_used': tokens_used,
-                'model_used': LLM_MODEL
+                'model_used': grant.model,
+                'queue_wait': grant.queue_wait
             }
             
+        except ServiceUnavailable:
+            raise
+        except TimeoutError as e:
+            raise LLMUnavailable('llm', str(e)) from e
+        except RateLimitError as e:
+            raise LLMUnavailable('llm', f"Still rate limited after {LLM_MAX_RETRIES} retries: {str(e)}") from e
         except Exception as e:
             return {
                 'answer': f"Error generating answer: {str(e)}",
                 'citations': [],
                 'sources': [],
-                'tokens_used': 0
+                'tokens_used': 0,
+                'error': str(e)
             }
     
+    def _call_llm(self, prompt: str, estimate: int, session_id: Optional[str]):
+        """Call Groq through the scheduler, retrying after rate-limit responses"""
+        queue_wait = 0.0
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            grant = self.scheduler.acquire(session_id, estimate, estimate - MAX_TOKENS)
+            queue_wait += grant.queue_wait
+            with tracer.span("llm.call", model=grant.model, route=grant.route_reason, max_tokens=MAX_TOKENS,
+                             queue_wait=grant.queue_wait, attempt=attempt) as span:
+                try:
+                    # A 429 means we are over quota, not that Groq is down: retried below, never trips the breaker
+                    response = resilience.call(
+                        'llm', self.client.chat.completions.create, passthrough=(RateLimitError,),
+                        model=grant.model,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": "You are a helpful AI assistant that answers questions based on provided context. Always include citations in your answers using [1], [2], etc. format when referencing specific information from the context."
+                            },
+                            {
+                                "role": "user", 
+                                "content": prompt
+                            }
+                        ],
+                        max_tokens=MAX_TOKENS,
+                        temperature=TEMPERATURE
+                    )
+                except RateLimitError as e:
+                    retry_after = e.response.headers.get('retry-after') if e.response is not None else None
+                    self.scheduler.release(grant, 0, retry_after=float(retry_after or 2 ** attempt))
+                    if attempt == LLM_MAX_RETRIES:
+                        raise
+                    continue
+                except DeadlineExceeded:
+                    # The abandoned call may still complete, so keep its whole estimate reserved
+                    self.scheduler.release(grant, grant.estimate)
+                    raise
+                except Exception:
+                    self.scheduler.release(grant, 0)
+                    raise
+                
+                usage = response.usage
+                self.scheduler.release(grant, usage.total_tokens if usage else None)
+                if usage:
+                    span.set_attributes(
+                        prompt_tokens=usage.prompt_tokens,
+                        completion_tokens=usage.completion_tokens,
+                        total_tokens=usage.total_tokens
+                    )
+            grant.queue_wait = queue_wait
+            return response, grant
+    
+    def estimate_tokens(self, query: str, context_docs: List[Dict[str, Any]]) -> int:
+        """
+        Rough upper bound on the tokens a generation call will consume
+        
+        Uses ~4 characters per token for the prompt plus the full completion
+        budget, so rate limiters can reserve capacity before the call and
+        reconcile against the returned usage afterwards.
+        """
+        prompt_chars = len(query) + sum(len(doc.get('text') or '') for doc in context_docs)
+        prompt_overhead = 150  # system message, instructions and citation markers
+        return prompt_chars // 4 + prompt_overhead + 8 * len(context_docs) + MAX_TOKENS
+    
     def _prepare_context_with_citations(self, docs: List[Dict[str, Any]]) -> Tuple[str, Dict[int, Dict]]:
         """Prepare context text with citation numbers and return citation map"""
         context_parts = []
@@ -0,0 +1,320 @@
+"""
+Concurrent multi-session load test for the query and ingest paths
+
+Usage:
+    python load_test.py --stand-ins --ramp 1,2,4,8,16 --duration 20
+    python load_test.py --url http://127.0.0.1:8600 --ramp 1,4,16 -o load.json
+    python load_test.py --stand-ins --streamlit --ramp 1,2,4   # drive app.py headlessly
+
+Each simulated session loops for the step duration: it asks a question
+(optionally scoped to its own session ID for fair LLM queuing) and, with
+probability --ingest-ratio, ingests a small document instead. Concurrency
+is ramped through the given levels; each level reports throughput, error
+and rejection rates, p50/p95/p99 latency per pipeline stage (from the
+returned span trees) and the peak RSS of this process. The ramp stops at
+the first level that breaks the p95 or error-rate SLO unless --full-ramp
+is given.
+
+Targets:
+    --stand-ins             in-process QueryService on local stand-ins with simulated latency
+    --url URL               a running query_service.py over HTTP
+    --streamlit             app.py through Streamlit's AppTest client, as a thin
+                            client of --url (or of an in-process stand-in server)
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from typing import List, Dict, Any, Optional, Callable
+from memory_monitor import RSSMonitor
+from tracing import LatencyHistogram
+from warmup import SAMPLE_QUESTIONS
+
+TOPICS = [
+    ("artificial intelligence", "the simulation of human reasoning by machines"),
+    ("narrow AI", "systems trained for one task such as image recognition"),
+    ("general AI", "a hypothetical system with human-level reasoning across tasks"),
+    ("supervised learning", "training on labelled examples to predict outputs"),
+    ("unsupervised learning", "finding structure in unlabelled data such as clusters"),
+    ("AI in healthcare", "diagnosis support, medical imaging and drug discovery"),
+    ("AI implementation challenges", "data quality, bias, cost and regulation"),
+    ("reinforcement learning", "learning by trial and error from rewards")
+]
+
+EXTRA_QUESTIONS = [
+    "What is reinforcement learning?",
+    "How does narrow AI differ from general AI?",
+    "Why does data quality matter for AI?",
+    "What is unsupervised learning used for?"
+]
+
+
+def synthetic_document(index: int, rng: random.Random, paragraphs: int = 6) -> str:
+    """A small document about the sample-question topics"""
+    parts = []
+    for p in range(paragraphs):
+        topic, definition = rng.choice(TOPICS)
+        parts.append(
+            f"Section {p + 1}. {topic.capitalize()} is {definition}. Document {index} discusses {topic} "
+            f"with example {rng.randint(1, 10000)}, covering practical deployment, evaluation and common pitfalls."
+        )
+    return "\n\n".join(parts)
+
+
+class LevelRecorder:
+    """Thread-safe counters and per-stage latency histograms for one concurrency level"""
+
+    def __init__(self):
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.completed = 0
+        self.errors: Dict[str, int] = {}
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram(window_size=1_000_000)
+            histogram.observe(seconds)
+
+    def observe_trace(self, span: Dict[str, Any]) -> None:
+        """Record every span of a returned trace tree under its name"""
+        self.observe(span['name'], span['duration'])
+        for child in span.get('children', []):
+            self.observe_trace(child)
+
+    def success(self) -> None:
+        with self._lock:
+            self.completed += 1
+
+    def failure(self, error: Exception) -> None:
+        from query_service import ServiceOverloaded
+        with self._lock:
+            if isinstance(error, ServiceOverloaded):
+                self.rejected += 1
+            else:
+                key = type(error).__name__
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+
+class AppSession:
+    """One Streamlit session of app.py driven through AppTest (same query/ingest_text interface)
+
+    AppTest installs a process-wide Streamlit runtime for each script run, so
+    runs are serialized here; concurrent sessions still overlap in the query
+    service behind the app.
+    """
+
+    _run_lock = threading.Lock()
+
+    QUERY_LABEL = "What would you like to know?"
+    ASK_LABEL = "🔍 Ask AI"
+    BACK_LABEL = "⬅️ Back to Dashboard"
+
+    def __init__(self, service, timeout: float = 120):
+        from streamlit.testing.v1 import AppTest
+        self.service = service
+        self.app = AppTest.from_file("app.py", default_timeout=timeout)
+        self._run(self.app)
+
+    def _run(self, element) -> None:
+        with self._run_lock:
+            element.run()
+
+    def query(self, question: str, session_id: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        # A previous answer leaves the results page up; go back to the dashboard first
+        back = [button for button in self.app.button if button.label == self.BACK_LABEL]
+        if back:
+            self._run(back[0].click())
+        boxes = [box for box in self.app.text_input if box.label == self.QUERY_LABEL]
+        if not boxes:
+            raise Exception("Query box not rendered (is the index empty?)")
+        self._run(boxes[0].input(question))
+        buttons = [button for button in self.app.button if button.label == self.ASK_LABEL]
+        if not buttons or buttons[0].disabled:
+            raise Exception("Ask button not available")
+        self._run(buttons[0].click())
+        if self.app.exception:
+            raise Exception(self.app.exception[0].message)
+        return {}
+
+    def ingest_text(self, text: str, source_name: str, title: str = None) -> Dict[str, Any]:
+        # Uploads go through the sidebar's job queue; load the service directly like the worker does
+        return self.service.ingest_text(text, source_name, title)
+
+
+class Session:
+    """A simulated user issuing queries and occasional ingests"""
+
+    def __init__(self, client, session_id: str, rng: random.Random, ingest_ratio: float, think_time: float,
+                 questions: List[str]):
+        self.client = client
+        self.session_id = session_id
+        self.rng = rng
+        self.ingest_ratio = ingest_ratio
+        self.think_time = think_time
+        self.questions = questions
+        self.ingested = 0
+
+    def act(self, recorder: LevelRecorder) -> None:
+        start = time.perf_counter()
+        ingest = self.rng.random() < self.ingest_ratio
+        try:
+            if ingest:
+                self.ingested += 1
+                self.client.ingest_text(synthetic_document(self.ingested, self.rng),
+                                        f"load-{self.session_id}-{self.ingested}.txt")
+                recorder.observe('client.ingest', time.perf_counter() - start)
+            else:
+                result = self.client.query(self.rng.choice(self.questions), session_id=self.session_id)
+                recorder.observe('client.query', time.perf_counter() - start)
+                if result.get('trace'):
+                    recorder.observe_trace(result['trace'])
+            recorder.success()
+        except Exception as e:
+            recorder.failure(e)
+        if self.think_time:
+            time.sleep(self.rng.expovariate(1 / self.think_time))
+
+
+def run_level(make_client: Callable[[int], Any], concurrency: int, duration: float, ingest_ratio: float,
+              think_time: float, seed: int = 0) -> Dict[str, Any]:
+    """Run `concurrency` sessions for `duration` seconds and summarize"""
+    recorder = LevelRecorder()
+    questions = SAMPLE_QUESTIONS + EXTRA_QUESTIONS
+    sessions = [
+        Session(make_client(i), f"s{concurrency}-{i}", random.Random(seed * 1000 + i), ingest_ratio, think_time,
+                questions)
+        for i in range(concurrency)
+    ]
+    deadline = time.perf_counter() + duration
+
+    def loop(session: Session) -> None:
+        while time.perf_counter() < deadline:
+            session.act(recorder)
+
+    with RSSMonitor(f"load x{concurrency}", interval=0.05) as memory:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=loop, args=(session,), daemon=True) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    errors = sum(recorder.errors.values())
+    attempts = recorder.completed + errors + recorder.rejected
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'completed': recorder.completed,
+        'throughput': round(recorder.completed / elapsed, 2),
+        'errors': dict(recorder.errors),
+        'error_rate': round(errors / attempts, 4) if attempts else 0.0,
+        'rejected': recorder.rejected,
+        'rejection_rate': round(recorder.rejected / attempts, 4) if attempts else 0.0,
+        'stages': {name: hist.summary() for name, hist in sorted(recorder.stages.items())},
+        'memory': memory.report()
+    }
+
+
+def ramp(make_client: Callable[[int], Any], levels: List[int], duration: float, ingest_ratio: float = 0.05,
+         think_time: float = 0.0, slo_p95: float = 5.0, max_error_rate: float = 0.01,
+         full_ramp: bool = False) -> Dict[str, Any]:
+    """Run each concurrency level in turn; report the highest level within the SLO"""
+    results, within = [], None
+    for seed, concurrency in enumerate(levels):
+        result = run_level(make_client, concurrency, duration, ingest_ratio, think_time, seed)
+        p95 = result['stages'].get('client.query', {}).get('p95', 0.0)
+        result['within_slo'] = p95 <= slo_p95 and result['error_rate'] + result['rejection_rate'] <= max_error_rate
+        results.append(result)
+        print(f"x{concurrency:<4} {result['throughput']:7.2f} req/s  p50 "
+              f"{result['stages'].get('client.query', {}).get('p50', 0.0):6.3f}s  p95 {p95:6.3f}s  "
+              f"errors {result['error_rate']:.1%}  rejected {result['rejection_rate']:.1%}  "
+              f"peak RSS {result['memory']['rss_peak_mb']:.0f} MB" + ("" if result['within_slo'] else "  [SLO breached]"),
+              file=sys.stderr)
+        if result['within_slo']:
+            within = concurrency
+        elif not full_ramp:
+            break
+    return {'slo': {'p95': slo_p95, 'max_error_rate': max_error_rate},
+            'max_concurrency_within_slo': within, 'levels': results}
+
+
+def _stand_in_service(args):
+    """In-process QueryService on stand-ins, seeded with a synthetic corpus"""
+    from llm_scheduler import LLMScheduler
+    from query_service import QueryService
+    from stand_ins import create_stand_in_pipeline
+    pipeline = create_stand_in_pipeline(args.encode_latency, args.index_latency, args.rerank_latency,
+                                        args.llm_latency)
+    pipeline.llm_service.scheduler = LLMScheduler(requests_per_minute=args.groq_rpm, tokens_per_minute=args.groq_tpm)
+    service = QueryService(pipeline)
+    rng = random.Random(0)
+    for i in range(args.corpus):
+        service.ingest_text(synthetic_document(i, rng), f"corpus-{i}.txt")
+    return service
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Ramp concurrent sessions against the RAG service")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--stand-ins", action="store_true", help="In-process service on local stand-ins")
+    target.add_argument("--url", help="Base URL of a running query_service.py")
+    parser.add_argument("--streamlit", action="store_true", help="Drive app.py through Streamlit's AppTest")
+    parser.add_argument("--ramp", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per level")
+    parser.add_argument("--ingest-ratio", type=float, default=0.05, help="Share of actions that ingest a document")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a session's actions (s)")
+    parser.add_argument("--slo-p95", type=float, default=5.0, help="Query p95 latency objective (s)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--full-ramp", action="store_true", help="Keep ramping after the SLO is breached")
+    stand_ins = parser.add_argument_group("stand-in latencies (seconds per call) and corpus")
+    stand_ins.add_argument("--encode-latency", type=float, default=0.02)
+    stand_ins.add_argument("--index-latency", type=float, default=0.05)
+    stand_ins.add_argument("--rerank-latency", type=float, default=0.15)
+    stand_ins.add_argument("--llm-latency", type=float, default=0.8)
+    stand_ins.add_argument("--corpus", type=int, default=50, help="Synthetic documents ingested before the ramp")
+    stand_ins.add_argument("--groq-rpm", type=int, default=100000, help="LLM scheduler request budget")
+    stand_ins.add_argument("--groq-tpm", type=int, default=100000000, help="LLM scheduler token budget")
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.ramp.split(",") if level.strip()]
+
+    if args.stand_ins:
+        service = _stand_in_service(args)
+    else:
+        from query_service import QueryServiceClient
+        service = QueryServiceClient(args.url)
+
+    if args.streamlit:
+        import config
+        url = args.url
+        if url is None:
+            # Serve the stand-in service over HTTP so app.py can use it as a thin client
+            from query_service import QueryServer
+            server = QueryServer(service, '127.0.0.1', 0, workers=max(levels), max_queue=max(levels) * 4)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+        # app.py reads QUERY_SERVICE_URL from config on every script run
+        config.QUERY_SERVICE_URL = url
+        make_client = lambda i: AppSession(service)
+    else:
+        make_client = lambda i: service
+
+    report = ramp(make_client, levels, args.duration, args.ingest_ratio, args.think_time,
+                  args.slo_p95, args.max_error_rate, args.full_ramp)
+    report['target'] = 'streamlit' if args.streamlit else ('stand-ins' if args.stand_ins else args.url)
+    print(f"Highest concurrency within SLO: {report['max_concurrency_within_slo']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
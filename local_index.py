@@ -0,0 +1,545 @@
+"""
+Local in-process vector index with the same interface as a Pinecone index
+
+On disk an index directory holds a compacted base (records.json plus
+vectors-<generation>.npy, live rows only) and delta-<generation>.log, to
+which every upsert and delete is appended as one framed record. A batch
+therefore costs I/O proportional to its own size; once the log outgrows the
+base, flush() folds it into a new base generation and drops deleted rows.
+A torn record at the end of the log (a crash mid-append) is ignored.
+The base matrix is memory-mapped copy-on-write at load, so a restored or
+restarted index is not read into RAM up front and processes sharing the
+directory share its page cache; the first batch that needs more rows than
+the base holds moves the matrix into memory.
+
+Several processes (the app, the query service, ingest workers) may open the
+same directory. Writers hold an exclusive flock on the directory and first
+catch up with the files; every read checks whether records.json was replaced
+(reload) or the log grew (replay the new frames), so writes from other
+processes become visible without a restart and are never overwritten.
+"""
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one writing process per index
+    fcntl = None
+
+# The delta log is folded into the base once it is larger than the base and at least this big
+MIN_COMPACT_BYTES = 1024 * 1024
+# Frame header: JSON header length and vector payload length
+FRAME_HEADER = struct.Struct('<II')
+# Rows normalized per step when bulk_load streams a new base to disk
+BULK_BLOCK_ROWS = 65536
+
+
+class LocalIndex:
+    """
+    NumPy-backed stand-in for a Pinecone index
+
+    Vectors are kept L2-normalized in one matrix so a query is a single
+    matrix-vector product (cosine similarity). Equality fields such as
+    source, title and section keep a per-value row bitmap that is maintained
+    on every upsert/delete, so metadata filters select candidate rows before
+    any vector is scored.
+    """
+
+    BITMAP_FIELDS = ('source', 'title', 'section')
+
+    def __init__(self, dimension: int, path: Optional[str] = None):
+        self.dimension = dimension
+        self.path = path
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._base_bytes = 0
+        self._delta_offset = 0
+        self._records_stamp = None
+        self._lock_depth = 0
+        self._reset()
+        if self.exists(path):
+            with self._file_lock(shared=True):
+                self._load()
+
+    @staticmethod
+    def exists(path: Optional[str]) -> bool:
+        """Whether `path` holds a saved local index"""
+        return bool(path) and os.path.exists(os.path.join(path, 'records.json'))
+
+    def _reset(self, capacity: int = 1024, vectors: Optional[np.ndarray] = None) -> None:
+        self._vectors = np.zeros((capacity, self.dimension), dtype=np.float32) if vectors is None else vectors
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._metadata: List[Optional[Dict[str, Any]]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._bitmaps: Dict[str, Dict[Any, np.ndarray]] = {field: {} for field in self.BITMAP_FIELDS}
+
+    @property
+    def _capacity(self) -> int:
+        return self._vectors.shape[0]
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        extra = capacity - self._capacity
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self.dimension), dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+        for values in self._bitmaps.values():
+            for value, bitmap in values.items():
+                values[value] = np.concatenate([bitmap, np.zeros(extra, dtype=bool)])
+
+    def _bitmap(self, field: str, value: Any) -> np.ndarray:
+        values = self._bitmaps[field]
+        if value not in values:
+            values[value] = np.zeros(self._capacity, dtype=bool)
+        return values[value]
+
+    def _index_row(self, row: int, metadata: Dict[str, Any], flag: bool) -> None:
+        for field in self.BITMAP_FIELDS:
+            if field in metadata:
+                self._bitmap(field, metadata[field])[row] = flag
+
+    # ------------------------------------------------------------------
+    # Pinecone-compatible operations
+    # ------------------------------------------------------------------
+
+    def upsert(self, vectors: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        """Insert or overwrite vectors given as {'id', 'values', 'metadata'} dicts"""
+        if not vectors:
+            return {'upserted_count': 0}
+        ids = [vector['id'] for vector in vectors]
+        metadata = [dict(vector.get('metadata') or {}) for vector in vectors]
+        matrix = self._normalize_rows(
+            np.asarray([vector['values'] for vector in vectors], dtype=np.float32).reshape(len(vectors), -1)
+        )
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._apply_upsert(ids, matrix, metadata)
+            self._append({'op': 'upsert', 'ids': ids, 'metadata': metadata}, matrix)
+        return {'upserted_count': len(vectors)}
+
+    def _apply_upsert(self, ids: List[str], matrix: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        """Write already-normalized rows into the in-memory index"""
+        self._grow(len(self._ids) + len(ids))
+        for vector_id, values, record in zip(ids, matrix, metadata):
+            row = self._id_to_row.get(vector_id)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(vector_id)
+                self._metadata.append(None)
+                self._id_to_row[vector_id] = row
+            elif self._alive[row]:
+                self._index_row(row, self._metadata[row], False)
+
+            self._vectors[row] = values
+            self._metadata[row] = record
+            self._alive[row] = True
+            self._index_row(row, record, True)
+
+    def query(self, vector: List[float], top_k: int = 10, include_metadata: bool = True,
+              include_values: bool = False, filter: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Return the top_k most similar live vectors that match the metadata filter"""
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._filter_mask(filter))
+            if rows.size == 0 or top_k <= 0:
+                return {'matches': []}
+
+            query = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                query = query / norm
+
+            scores = self._vectors[rows] @ query
+            k = min(top_k, rows.size)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+
+            matches = []
+            for i in best:
+                row = rows[i]
+                match = {'id': self._ids[row], 'score': float(scores[i])}
+                if include_metadata:
+                    match['metadata'] = dict(self._metadata[row])
+                if include_values:
+                    match['values'] = self._vectors[row].tolist()
+                matches.append(match)
+            return {'matches': matches}
+
+    def fetch(self, ids: List[str], **kwargs) -> Dict[str, Any]:
+        """Fetch stored vectors and metadata by ID"""
+        with self._lock:
+            self._refresh()
+            vectors = {}
+            for vector_id in ids:
+                row = self._id_to_row.get(vector_id)
+                if row is not None and self._alive[row]:
+                    vectors[vector_id] = {
+                        'id': vector_id,
+                        'values': self._vectors[row].tolist(),
+                        'metadata': dict(self._metadata[row])
+                    }
+            return {'vectors': vectors}
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False,
+               filter: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Delete vectors by ID, by metadata filter, or all of them"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            if delete_all:
+                self._reset()
+                self.flush(force=True)
+                return {}
+            rows = [self._id_to_row[i] for i in (ids or []) if i in self._id_to_row]
+            if filter:
+                rows.extend(np.flatnonzero(self._filter_mask(filter)).tolist())
+            deleted = [self._ids[row] for row in sorted(set(rows)) if self._alive[row]]
+            if deleted:
+                self._apply_delete(deleted)
+                self._append({'op': 'delete', 'ids': deleted})
+        return {}
+
+    def _apply_delete(self, ids: List[str]) -> None:
+        for vector_id in ids:
+            row = self._id_to_row.get(vector_id)
+            if row is not None and self._alive[row]:
+                self._index_row(row, self._metadata[row], False)
+                self._alive[row] = False
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        """Index statistics in the same shape as Pinecone's describe_index_stats"""
+        with self._lock:
+            self._refresh()
+            return {
+                'total_vector_count': int(self._alive.sum()),
+                'dimension': self.dimension,
+                'index_fullness': 0.0
+            }
+
+    def last_modified(self) -> Optional[float]:
+        """Time of the last write persisted to the index directory (None for an in-memory index)"""
+        if not self.exists(self.path):
+            return None
+        times = []
+        for name in ('records.json', os.path.basename(self._delta_path())):
+            try:
+                times.append(os.path.getmtime(self._file(name)))
+            except OSError:
+                pass
+        return max(times) if times else None
+
+    def list_values(self, field: str) -> List[Any]:
+        """Distinct live values of a bitmap-indexed metadata field"""
+        with self._lock:
+            self._refresh()
+            return sorted(value for value, bitmap in self._bitmaps.get(field, {}).items() if bitmap.any())
+
+    # ------------------------------------------------------------------
+    # Bulk export/import (index snapshots)
+    # ------------------------------------------------------------------
+
+    def live_rows(self) -> tuple:
+        """IDs, vector matrix and metadata of all live rows, in row order"""
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._alive)
+            return ([self._ids[row] for row in rows], self._vectors[rows],
+                    [dict(self._metadata[row]) for row in rows])
+
+    def bulk_load(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> int:
+        """
+        Replace the whole index with the given rows in one pass
+
+        `vectors` may be a memory map (e.g. a snapshot): a persistent index
+        normalizes it block by block straight into a new base file and maps
+        that, so the matrix is never held in memory as a whole.
+        """
+        if vectors.shape != (len(ids), self.dimension):
+            raise ValueError(f"Expected a {len(ids)}x{self.dimension} matrix, got {vectors.shape}")
+        ids, metadata, count = list(ids), [dict(m) for m in metadata], len(ids)
+        with self._lock, self._file_lock():
+            if not self.path:
+                self._rebuild(ids, vectors, metadata)
+                self._normalize_rows(self._vectors[:count])
+                return count
+            self._refresh()
+            generation = self._generation + 1
+            os.makedirs(self.path, exist_ok=True)
+            base_path = self._file(f"vectors-{generation}.npy")
+            base = np.lib.format.open_memmap(base_path, mode='w+', dtype=np.float32, shape=(count, self.dimension))
+            for start in range(0, count, BULK_BLOCK_ROWS):
+                block = np.array(vectors[start:start + BULK_BLOCK_ROWS], dtype=np.float32)
+                base[start:start + len(block)] = self._normalize_rows(block)
+            base.flush()
+            del base
+            self._commit_base(generation, ids, metadata)
+            self._rebuild(ids, np.load(base_path, mmap_mode='c'), metadata)
+        return count
+
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def _rebuild(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        """Replace the in-memory index with the given live rows (a mapped base is used in place)"""
+        count = len(ids)
+        if isinstance(vectors, np.memmap) and vectors.flags.writeable and count:
+            self._reset(vectors=vectors)
+        else:
+            self._reset(max(1024, count))
+            self._vectors[:count] = vectors
+        self._alive[:count] = True
+        self._ids = ids
+        self._metadata = metadata
+        self._id_to_row = {vector_id: row for row, vector_id in enumerate(ids)}
+        for row, record in enumerate(metadata):
+            self._index_row(row, record, True)
+
+    # ------------------------------------------------------------------
+    # Metadata filtering (subset of Pinecone's filter language)
+    # ------------------------------------------------------------------
+
+    def _filter_mask(self, filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = self._alive.copy()
+        if not filter:
+            return mask
+        return mask & self._evaluate(filter, mask)
+
+    def _evaluate(self, filter: Dict[str, Any], candidates: np.ndarray) -> np.ndarray:
+        mask = candidates.copy()
+        # Bitmap-backed fields first so scanned predicates only see pre-filtered rows
+        for key, condition in sorted(filter.items(), key=lambda item: item[0] not in self._bitmaps):
+            if key == '$and':
+                for clause in condition:
+                    mask &= self._evaluate(clause, mask)
+            elif key == '$or':
+                any_mask = np.zeros_like(mask)
+                for clause in condition:
+                    any_mask |= self._evaluate(clause, mask)
+                mask &= any_mask
+            else:
+                if not isinstance(condition, dict):
+                    condition = {'$eq': condition}
+                for op, operand in condition.items():
+                    mask &= self._field_mask(key, op, operand, mask)
+        return mask
+
+    def _field_mask(self, field: str, op: str, operand: Any, candidates: np.ndarray) -> np.ndarray:
+        # Equality-style predicates on indexed fields come straight from the bitmaps
+        if field in self._bitmaps and op in ('$eq', '$ne', '$in', '$nin'):
+            values = operand if op in ('$in', '$nin') else [operand]
+            hit = np.zeros(self._capacity, dtype=bool)
+            for value in values:
+                bitmap = self._bitmaps[field].get(value)
+                if bitmap is not None:
+                    hit |= bitmap
+            return ~hit if op in ('$ne', '$nin') else hit
+
+        # Everything else is evaluated only on rows that survived earlier predicates
+        result = np.zeros(self._capacity, dtype=bool)
+        for row in np.flatnonzero(candidates):
+            value = self._metadata[row].get(field)
+            result[row] = self._compare(value, op, operand)
+        return result
+
+    @staticmethod
+    def _compare(value: Any, op: str, operand: Any) -> bool:
+        if op == '$eq':
+            return value == operand
+        if op == '$ne':
+            return value != operand
+        if op == '$in':
+            return value in operand
+        if op == '$nin':
+            return value not in operand
+        if op == '$exists':
+            return (value is not None) == bool(operand)
+        if value is None:
+            return False
+        if op == '$gt':
+            return value > operand
+        if op == '$gte':
+            return value >= operand
+        if op == '$lt':
+            return value < operand
+        if op == '$lte':
+            return value <= operand
+        raise ValueError(f"Unsupported filter operator: {op}")
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _delta_path(self, generation: int = None) -> str:
+        return self._file(f"delta-{self._generation if generation is None else generation}.log")
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        """Advisory flock on the index directory, held across a whole write (re-entrant per instance)"""
+        if not self.path or fcntl is None or self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        if not shared:
+            os.makedirs(self.path, exist_ok=True)
+        elif not os.path.isdir(self.path):
+            yield
+            return
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._lock_depth += 1
+            yield
+        finally:
+            self._lock_depth = max(0, self._lock_depth - 1)
+            os.close(fd)  # closing the descriptor releases the lock
+
+    def _stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._file('records.json'))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        """Catch up with writes made through other LocalIndex instances or processes"""
+        if not self.path:
+            return
+        stamp = self._stamp()
+        if stamp is None or stamp == self._records_stamp:
+            try:
+                size = os.path.getsize(self._delta_path())
+            except OSError:
+                return
+            if size <= self._delta_offset:
+                return
+            try:
+                with open(self._delta_path(), 'rb') as f:
+                    f.seek(self._delta_offset)
+                    data = f.read(size - self._delta_offset)
+                self._delta_offset += self._replay(data)
+                return
+            except OSError:
+                pass  # compacted away meanwhile: reload the new base
+        with self._file_lock(shared=True):
+            self._load()
+
+    def _append(self, header: Dict[str, Any], matrix: Optional[np.ndarray] = None) -> None:
+        """Append one operation to the delta log, compacting when the log outgrows the base"""
+        if not self.path:
+            return
+        if not self.exists(self.path):
+            self.flush(force=True)
+            return
+        payload = json.dumps(header).encode('utf-8')
+        body = np.ascontiguousarray(matrix, dtype=np.float32).tobytes() if matrix is not None else b''
+        # One write per frame, so a crash leaves at most one torn frame at the end
+        with open(self._delta_path(), 'ab') as f:
+            f.write(FRAME_HEADER.pack(len(payload), len(body)) + payload + body)
+            self._delta_offset = f.tell()
+        if self._delta_offset > max(MIN_COMPACT_BYTES, self._base_bytes):
+            self.flush()
+
+    def _replay(self, data: bytes) -> int:
+        """Apply complete frames from a delta log; returns the bytes consumed"""
+        position = 0
+        while position + FRAME_HEADER.size <= len(data):
+            header_size, body_size = FRAME_HEADER.unpack_from(data, position)
+            start = position + FRAME_HEADER.size
+            end = start + header_size + body_size
+            if end > len(data):
+                break
+            header = json.loads(data[start:start + header_size].decode('utf-8'))
+            if header['op'] == 'upsert':
+                matrix = np.frombuffer(data, dtype=np.float32, count=body_size // 4, offset=start + header_size)
+                self._apply_upsert(header['ids'], matrix.reshape(-1, self.dimension), header['metadata'])
+            elif header['op'] == 'delete':
+                self._apply_delete(header['ids'])
+            position = end
+        return position
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Fold the delta log into a new base of live rows only
+
+        Called automatically once the log outgrows the base; call it directly
+        after large ingests or deletes to reclaim space and memory now.
+        """
+        with self._lock, self._file_lock():
+            if not self.path:
+                return
+            self._refresh()
+            has_dead_rows = not self._alive[:len(self._ids)].all()
+            if not force and self._delta_offset == 0 and not has_dead_rows and self.exists(self.path):
+                return
+            rows = np.flatnonzero(self._alive)
+            ids = [self._ids[row] for row in rows]
+            metadata = [self._metadata[row] for row in rows]
+            vectors = self._vectors[rows]
+            if has_dead_rows:
+                self._rebuild(ids, vectors, metadata)
+
+            os.makedirs(self.path, exist_ok=True)
+            generation = self._generation + 1
+            np.save(self._file(f"vectors-{generation}.npy"), vectors)
+            self._commit_base(generation, ids, metadata)
+
+    def _commit_base(self, generation: int, ids: List[str], metadata: List[Dict[str, Any]]) -> None:
+        """Switch to an already written vectors-<generation>.npy with an empty log; drop the old files"""
+        previous = self._generation
+        open(self._delta_path(generation), 'wb').close()
+        with open(self._file('records.tmp.json'), 'w') as f:
+            json.dump({'dimension': self.dimension, 'generation': generation, 'ids': ids, 'metadata': metadata}, f)
+        # records.json names the generation, so replacing it switches base and log at once
+        os.replace(self._file('records.tmp.json'), self._file('records.json'))
+        self._generation = generation
+        self._base_bytes = len(ids) * self.dimension * 4
+        self._delta_offset = 0
+        self._records_stamp = self._stamp()
+        for stale in (f"vectors-{previous}.npy", f"delta-{previous}.log", "vectors.npy"):
+            try:
+                os.remove(self._file(stale))
+            except OSError:
+                pass
+
+    def _load(self) -> None:
+        try:
+            stamp = self._stamp()
+            with open(self._file('records.json')) as f:
+                records = json.load(f)
+            generation = records.get('generation')
+            # Indexes saved before the delta log have a single vectors.npy and no log
+            vectors = np.load(self._file('vectors.npy' if generation is None else f"vectors-{generation}.npy"),
+                              mmap_mode='c')
+            delta = b''
+            if generation is not None and os.path.exists(self._delta_path(generation)):
+                with open(self._delta_path(generation), 'rb') as f:
+                    delta = f.read()
+        except (OSError, ValueError) as e:
+            raise Exception(f"Error loading local index from '{self.path}': {str(e)}")
+
+        if records.get('dimension', self.dimension) != self.dimension:
+            raise ValueError(
+                f"Local index at '{self.path}' has dimension {records['dimension']}, expected {self.dimension}"
+            )
+        self._rebuild(list(records['ids']), vectors, list(records['metadata']))
+        self._generation = generation or 0
+        self._base_bytes = vectors.nbytes
+        self._delta_offset = self._replay(delta)
+        self._records_stamp = stamp
@@ -0,0 +1,209 @@
+"""
+Resident-set-size accounting for memory-heavy operations such as uploads
+
+RSS is process-wide, so concurrent operations share the numbers; the peak is
+sampled by a background thread while the monitored block runs.
+
+MemoryProfile adds opt-in tracemalloc snapshots at ingest stage boundaries
+(top allocating lines per stage), and MemoryBudget keeps ingestion under a
+configured RSS ceiling by shrinking batches or rejecting the work up front.
+"""
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from typing import List, Dict, Any, Optional
+from config import INGEST_MEMORY_PROFILE, INGEST_MEMORY_TOP_N, INGEST_MEMORY_BUDGET_MB, INGEST_MEMORY_MIN_BATCH
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss() -> int:
+    """Current resident set size in bytes (falls back to the lifetime peak off Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """Lifetime peak resident set size of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class RSSMonitor:
+    """Context manager recording RSS at entry, exit and the sampled peak in between"""
+
+    def __init__(self, label: str = "", interval: float = 0.01):
+        self.label = label
+        self.interval = interval
+        self.start = self.end = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self) -> 'RSSMonitor':
+        self.start = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.end = current_rss()
+        self.peak = max(self.peak, self.end)
+
+    def report(self) -> Dict[str, Any]:
+        """Start/peak/end RSS and the peak growth over the start, in MB"""
+        mb = 1024 * 1024
+        return {
+            'rss_start_mb': round(self.start / mb, 1),
+            'rss_peak_mb': round(self.peak / mb, 1),
+            'rss_end_mb': round(self.end / mb, 1),
+            'rss_peak_delta_mb': round((self.peak - self.start) / mb, 1)
+        }
+
+
+class MemoryBudgetExceeded(Exception):
+    """Ingestion would push the process past INGEST_MEMORY_BUDGET_MB"""
+
+
+class MemoryProfile:
+    """
+    Per-stage memory report for one ingest (tracemalloc + RSS), a no-op unless enabled
+
+    Call stage(name) after each step; the report lists, per stage, the traced
+    allocations still alive, the traced peak since the previous boundary, RSS
+    and the top allocating source lines of that stage.
+    """
+
+    def __init__(self, label: str = "", enabled: bool = INGEST_MEMORY_PROFILE, top_n: int = INGEST_MEMORY_TOP_N):
+        self.label = label
+        self.enabled = enabled
+        self.top_n = top_n
+        self.stages: List[Dict[str, Any]] = []
+        self._snapshot = None
+        self._started_tracing = False
+        self._stage_start = 0.0
+        self._depth = 0  # re-entrant, so a caller can keep profiling across nested steps
+
+    def __enter__(self) -> 'MemoryProfile':
+        self._depth += 1
+        if self.enabled and self._depth == 1:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+            self._stage_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._depth -= 1
+        if self._depth:
+            return
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._snapshot = None
+
+    def stage(self, name: str) -> None:
+        """Record the stage that just finished"""
+        if not self.enabled or self._snapshot is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ))
+        mb = 1024 * 1024
+        top = [
+            {
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_mb': round(stat.size_diff / mb, 2),
+                'count': stat.count_diff
+            }
+            for stat in snapshot.compare_to(self._snapshot, 'lineno')[:self.top_n]
+            if stat.size_diff > 0
+        ]
+        self.stages.append({
+            'stage': name,
+            'seconds': round(time.perf_counter() - self._stage_start, 3),
+            'traced_mb': round(current / mb, 1),
+            'traced_peak_mb': round(peak / mb, 1),
+            'rss_mb': round(current_rss() / mb, 1),
+            'top': top
+        })
+        self._snapshot = snapshot
+        tracemalloc.reset_peak()
+        self._stage_start = time.perf_counter()
+
+    def report(self) -> Dict[str, Any]:
+        """Stages in order with the overall traced peak and the stage that reached it"""
+        if not self.stages:
+            return {}
+        worst = max(self.stages, key=lambda stage: stage['traced_peak_mb'])
+        return {
+            'label': self.label,
+            'stages': self.stages,
+            'traced_peak_mb': worst['traced_peak_mb'],
+            'peak_stage': worst['stage']
+        }
+
+    def print_report(self) -> None:
+        report = self.report()
+        if not report:
+            return
+        print(f"Memory profile for {self.label} (traced peak {report['traced_peak_mb']} MB in {report['peak_stage']}):")
+        for stage in self.stages:
+            print(f"  {stage['stage']:<10} {stage['seconds']:>7.3f}s  live {stage['traced_mb']:>7.1f} MB  "
+                  f"peak {stage['traced_peak_mb']:>7.1f} MB  RSS {stage['rss_mb']:>7.1f} MB")
+            for entry in stage['top'][:3]:
+                print(f"      +{entry['size_mb']:.2f} MB  {entry['location']}")
+
+
+class MemoryBudget:
+    """RSS ceiling for ingestion; 0 MB means unlimited"""
+
+    def __init__(self, limit_mb: float = INGEST_MEMORY_BUDGET_MB, min_batch: int = INGEST_MEMORY_MIN_BATCH):
+        self.limit = int(limit_mb * 1024 * 1024)
+        self.min_batch = max(1, min_batch)
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def headroom(self) -> Optional[int]:
+        """Bytes left under the ceiling, or None when unlimited"""
+        if not self.enabled:
+            return None
+        return self.limit - current_rss()
+
+    def check(self, label: str, needed: int = 0) -> None:
+        """Raise MemoryBudgetExceeded if `needed` more bytes would not fit"""
+        headroom = self.headroom()
+        if headroom is not None and needed > headroom:
+            mb = 1024 * 1024
+            raise MemoryBudgetExceeded(
+                f"{label} needs about {needed / mb:.1f} MB but only {max(headroom, 0) / mb:.1f} MB of the "
+                f"{self.limit / mb:.0f} MB ingest memory budget is free (INGEST_MEMORY_BUDGET_MB)"
+            )
+
+    def batch_size(self, label: str, count: int, bytes_per_item: int) -> int:
+        """
+        Largest batch of up to `count` items whose working set fits the headroom
+
+        Raises MemoryBudgetExceeded when not even INGEST_MEMORY_MIN_BATCH items fit.
+        """
+        headroom = self.headroom()
+        if headroom is None or count * bytes_per_item <= headroom:
+            return count
+        self.check(label, min(count, self.min_batch) * bytes_per_item)
+        return max(self.min_batch, headroom // max(bytes_per_item, 1))
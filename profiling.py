@@ -0,0 +1,220 @@
+"""
+On-demand CPU profiling of individual queries and ingests
+
+Usage:
+    python profiling.py list                      # recent profiles
+    python profiling.py show <request-id>         # top functions by cumulative time
+    flamegraph.pl .rag_data/profiles/<request-id>.collapsed > flame.svg
+
+Each profiled request runs under cProfile and is saved under PROFILE_DIR as
+<request-id>.pstats (for pstats/snakeviz) and <request-id>.collapsed, one
+"frame;frame;frame microseconds" line per stack, which flamegraph.pl and
+speedscope read directly. cProfile only sees the calling thread, and one
+request is profiled at a time; overlapping requests run unprofiled.
+"""
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+from config import PROFILING_ENABLED, PROFILE_DIR, PROFILE_KEEP
+
+# Call-graph paths below this many microseconds are dropped from the collapsed stacks
+MIN_STACK_MICROSECONDS = 1
+MAX_STACK_DEPTH = 200
+
+
+def _frame_name(func) -> str:
+    filename, line, name = func
+    if filename == '~':
+        return name.replace(';', ':')  # built-ins, e.g. <built-in method time.sleep>
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ':')
+
+
+def collapsed_stacks(stats: pstats.Stats) -> List[str]:
+    """
+    Flamegraph "collapsed" lines from a cProfile call graph
+
+    cProfile keeps caller -> callee edges rather than full stacks, so each
+    function's time is split across its call paths in proportion to the
+    cumulative time of every edge along the path.
+    """
+    entries = stats.stats
+    children: Dict[Any, Dict[Any, float]] = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, {})[func] = edge[3]
+
+    lines: Dict[str, float] = {}
+
+    def walk(func, weight: float, path: List[str], seen: set) -> None:
+        _, _, own, cumulative, _ = entries[func]
+        path = path + [_frame_name(func)]
+        ratio = weight / cumulative if cumulative > 0 else 0.0
+        own_time = own * ratio
+        if own_time * 1e6 >= MIN_STACK_MICROSECONDS:
+            key = ";".join(path)
+            lines[key] = lines.get(key, 0.0) + own_time
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_time in children.get(func, {}).items():
+            child_weight = edge_time * ratio
+            if child in seen or child not in entries or child_weight * 1e6 < MIN_STACK_MICROSECONDS:
+                continue
+            walk(child, child_weight, path, seen | {child})
+
+    roots = [func for func, (_, _, _, _, callers) in entries.items() if not callers]
+    for root in roots:
+        walk(root, entries[root][3], [], {root})
+    return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(lines.items())
+            if round(seconds * 1e6) > 0]
+
+
+class ProfileStore:
+    """Directory of saved profiles (pstats, collapsed stacks and a small JSON summary per request)"""
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path(self, request_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{request_id}.{suffix}")
+
+    def save(self, request_id: str, profiler: cProfile.Profile, info: Dict[str, Any]) -> Dict[str, Any]:
+        """Write the profile files for one request and prune the oldest beyond PROFILE_KEEP"""
+        os.makedirs(self.directory, exist_ok=True)
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(self.path(request_id, 'pstats'))
+        stacks = collapsed_stacks(stats)
+        with open(self.path(request_id, 'collapsed'), 'w', encoding='utf-8') as f:
+            f.write("\n".join(stacks) + ("\n" if stacks else ""))
+        info = dict(info, request_id=request_id, functions=len(stats.stats), stacks=len(stacks),
+                    top=self.top_functions(stats, limit=10))
+        with open(self.path(request_id, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(info, f, indent=2)
+        self._prune()
+        return info
+
+    @staticmethod
+    def top_functions(stats: pstats.Stats, limit: int = 20, sort: str = 'cumulative') -> List[Dict[str, Any]]:
+        """Heaviest functions as dicts (calls, own and cumulative seconds)"""
+        key = 3 if sort == 'cumulative' else 2
+        ranked = sorted(stats.stats.items(), key=lambda item: item[1][key], reverse=True)[:limit]
+        return [
+            {'function': _frame_name(func), 'calls': calls, 'own': round(own, 4), 'cumulative': round(cumulative, 4)}
+            for func, (_, calls, own, cumulative, _) in ranked
+        ]
+
+    def _prune(self) -> None:
+        with self._lock:
+            for entry in self.list()[self.keep:]:
+                for suffix in ('json', 'pstats', 'collapsed'):
+                    try:
+                        os.remove(self.path(entry['request_id'], suffix))
+                    except OSError:
+                        pass
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Saved profile summaries, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        entries.sort(key=lambda entry: entry.get('started_at', 0), reverse=True)
+        return entries[:limit] if limit else entries
+
+    def load(self, request_id: str) -> pstats.Stats:
+        return pstats.Stats(self.path(request_id, 'pstats'), stream=io.StringIO())
+
+    def read(self, request_id: str, suffix: str) -> bytes:
+        with open(self.path(request_id, suffix), 'rb') as f:
+            return f.read()
+
+
+profiles = ProfileStore()
+
+# cProfile hooks the calling thread only and nested profilers displace each other,
+# so one request at a time is profiled
+_active = threading.Lock()
+
+
+@contextmanager
+def profiled(kind: str, label: str = "", enabled: Optional[bool] = None, store: ProfileStore = None):
+    """
+    Profile the block if `enabled` (default PROFILING_ENABLED); yields the request ID or None
+
+    The saved summary is available from store.list() once the block exits.
+    """
+    if not (PROFILING_ENABLED if enabled is None else enabled) or not _active.acquire(blocking=False):
+        yield None
+        return
+    store = store or profiles
+    request_id = f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    profiler = cProfile.Profile()
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        profiler.enable()
+        yield request_id
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - start
+        _active.release()
+        try:
+            info = store.save(request_id, profiler, {
+                'kind': kind, 'label': label[:200], 'started_at': started_at,
+                'seconds': round(seconds, 3), 'error': error
+            })
+            print(f"Profiled {kind} '{info['label'][:60]}' in {seconds:.2f}s -> {store.path(request_id, 'pstats')}")
+        except Exception as e:
+            print(f"Error saving profile {request_id}: {str(e)}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Saved per-request CPU profiles")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    list_parser = subparsers.add_parser('list', help="Show recent profiles")
+    list_parser.add_argument("--limit", type=int, default=20)
+    show_parser = subparsers.add_parser('show', help="Print the heaviest functions of one profile")
+    show_parser.add_argument("request_id")
+    show_parser.add_argument("--sort", choices=['cumulative', 'tottime'], default='cumulative')
+    show_parser.add_argument("--limit", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for entry in profiles.list(args.limit):
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['started_at']))
+            print(f"{entry['request_id']}  {started}  {entry['seconds']:>7.3f}s  {entry['label'][:60]}"
+                  + (f"  error: {entry['error']}" if entry.get('error') else ""))
+        return 0
+
+    if not os.path.exists(profiles.path(args.request_id, 'pstats')):
+        print(f"No profile '{args.request_id}' in {profiles.directory}", file=sys.stderr)
+        return 1
+    stats = pstats.Stats(profiles.path(args.request_id, 'pstats'), stream=sys.stdout)
+    stats.sort_stats(args.sort).print_stats(args.limit)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
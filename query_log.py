@@ -0,0 +1,195 @@
+"""
+Append-only, compressed log of answered queries for workload replay
+
+Each answered (or failed) query becomes one JSON record: the question, its
+parameters, the configuration that served it, retrieved and context chunk
+IDs with scores, per-stage timings from the trace and tokens used. Records
+are buffered and appended as gzip members to one segment per UTC day under
+QUERY_LOG_DIR (queries-YYYYMMDD.jsonl.gz). A file of concatenated members is
+still a valid gzip stream, so `zcat` and gzip.open read it whole, and a
+crash loses at most the unflushed buffer. Segments older than
+QUERY_LOG_KEEP_DAYS are deleted whenever a writer starts a new day. replay_queries.py reads these
+logs and writes its runs in the same format.
+"""
+import atexit
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Iterator
+from config import (
+    QUERY_LOG_DIR, QUERY_LOG_FLUSH_RECORDS, QUERY_LOG_FLUSH_SECONDS, QUERY_LOG_KEEP_DAYS, VECTOR_BACKEND, EMBEDDING_REDUCTION,
+    EMBEDDING_MODEL_NAME, LLM_MODEL, ADAPTIVE_DEPTH_ENABLED, MMR_ENABLED, FAST_PATH_ENABLED, CHUNK_UNIT
+)
+
+
+def stage_timings(trace: Dict[str, Any]) -> Dict[str, float]:
+    """Seconds per span name in a trace tree (repeated spans are summed)"""
+    timings: Dict[str, float] = {}
+
+    def walk(span: Dict[str, Any]) -> None:
+        timings[span['name']] = round(timings.get(span['name'], 0.0) + span['duration'], 6)
+        for child in span.get('children', []):
+            walk(child)
+
+    walk(trace)
+    return timings
+
+
+def describe_configuration(pipeline) -> Dict[str, Any]:
+    """The settings that decide what a query returns, so replays can be compared like for like"""
+    vector_store = pipeline.vector_store
+    return {
+        'backend': getattr(vector_store, 'backend', VECTOR_BACKEND),
+        'embedding_model': EMBEDDING_MODEL_NAME,
+        'chunk_unit': CHUNK_UNIT,
+        'reduction': EMBEDDING_REDUCTION if getattr(vector_store, 'projection', None) is not None else 'none',
+        'reranker': type(pipeline.reranker).__name__,
+        'llm_model': LLM_MODEL,
+        'adaptive_depth': ADAPTIVE_DEPTH_ENABLED and pipeline.candidate_selector is not None,
+        'mmr': MMR_ENABLED and pipeline.diversifier is not None,
+        'fast_path': FAST_PATH_ENABLED and pipeline.fast_path is not None
+    }
+
+
+def build_record(query: str, params: Dict[str, Any], configuration: Dict[str, Any],
+                 response: Optional[Dict[str, Any]] = None, error: Optional[Dict[str, str]] = None,
+                 started_at: float = None, latency: float = None, session_id: Optional[str] = None,
+                 replay_of: Optional[str] = None) -> Dict[str, Any]:
+    """One log record from a pipeline response (or the error that replaced it)"""
+    record = {
+        'id': uuid.uuid4().hex,
+        'ts': round(started_at if started_at is not None else time.time(), 3),
+        'session_id': session_id,
+        'query': query,
+        'params': params,
+        'config': configuration,
+        'latency': round(latency, 6) if latency is not None else None,
+        'error': error
+    }
+    if replay_of:
+        record['replay_of'] = replay_of
+    if response is not None:
+        result = response.get('result') or {}
+        record.update({
+            'retrieved_ids': response.get('retrieved_ids', []),
+            'retrieved_scores': response.get('retrieved_scores', []),
+            'context_ids': [doc.get('id') for doc in response.get('docs', [])],
+            'rerank_scores': [round(doc['rerank_score'], 4) for doc in response.get('docs', [])
+                              if 'rerank_score' in doc],
+            'stages': stage_timings(response['trace']) if response.get('trace') else {},
+            'tokens_used': result.get('tokens_used', 0),
+            'model': result.get('model_used'),
+            'fast_path': (response.get('trace') or {}).get('attributes', {}).get('fast_path')
+        })
+    return record
+
+
+class QueryLog:
+    """Buffered writer of daily gzip JSONL segments (thread-safe; safe to share between processes)"""
+
+    def __init__(self, directory: str = QUERY_LOG_DIR, flush_records: int = QUERY_LOG_FLUSH_RECORDS,
+                 flush_seconds: float = QUERY_LOG_FLUSH_SECONDS, keep_days: int = QUERY_LOG_KEEP_DAYS):
+        self.directory = directory
+        self.flush_records = max(1, flush_records)
+        self.flush_seconds = flush_seconds
+        self.keep_days = keep_days
+        self._pruned_day = None
+        self.written = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def segment_path(self, ts: float) -> str:
+        return os.path.join(self.directory, f"queries-{time.strftime('%Y%m%d', time.gmtime(ts))}.jsonl.gz")
+
+    def append(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._buffer.append(record)
+            due = len(self._buffer) >= self.flush_records or time.time() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Append buffered records as one gzip member per segment"""
+        with self._lock:
+            records, self._buffer = self._buffer, []
+            self._last_flush = time.time()
+            if not records:
+                return
+            segments: Dict[str, List[str]] = {}
+            for record in records:
+                segments.setdefault(self.segment_path(record['ts']), []).append(
+                    json.dumps(record, separators=(',', ':'), default=str)
+                )
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                for path, lines in segments.items():
+                    member = gzip.compress(("\n".join(lines) + "\n").encode('utf-8'))
+                    # One write per member, so concurrent appenders never interleave inside a member
+                    with open(path, 'ab') as f:
+                        f.write(member)
+                self.written += len(records)
+            except OSError as e:
+                print(f"Error writing query log: {str(e)}")
+            today = time.strftime('%Y%m%d', time.gmtime())
+            if today != self._pruned_day:
+                self._pruned_day = today
+                self.prune()
+
+    def prune(self, now: float = None) -> List[str]:
+        """Delete segments older than keep_days (by the UTC day in their name); returns the removed paths"""
+        if self.keep_days <= 0:
+            return []
+        cutoff = time.strftime('%Y%m%d', time.gmtime((now or time.time()) - self.keep_days * 86400))
+        removed = []
+        for path in self.segments():
+            if os.path.basename(path)[len('queries-'):len('queries-') + 8] < cutoff:
+                try:
+                    os.remove(path)
+                    removed.append(path)
+                except OSError:
+                    pass
+        return removed
+
+    def segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "queries-*.jsonl.gz")))
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self.segments()
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            'directory': self.directory,
+            'segments': len(segments),
+            'bytes': sum(os.path.getsize(path) for path in segments),
+            'written': self.written,
+            'buffered': buffered
+        }
+
+
+def read_log(paths: List[str], since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Records from log files or directories (all segments inside), oldest first"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))))
+        else:
+            files.append(path)
+    records = []
+    for path in files:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if (since is None or record['ts'] >= since) and (until is None or record['ts'] < until):
+                    records.append(record)
+    records.sort(key=lambda record: record['ts'])
+    return iter(records)
@@ -0,0 +1,615 @@
+"""
+Headless HTTP query service for the RAG pipeline
+
+Usage:
+    python query_service.py                  # real backends from config
+    python query_service.py --stand-ins      # local stand-in backends, no API keys needed
+
+Endpoints:
+    POST /query    {"query": ..., "top_k_retrieval": 20, "top_k_rerank": 5, "filters": {...}}
+    POST /ingest   {"text": ..., "source_name": ...}  or raw file bytes with ?filename=doc.pdf
+    POST /jobs     same payloads as /ingest, queued for background workers (202 + job)
+    GET  /jobs     recent background ingestion jobs (?limit=20)
+    POST /jobs/<id>/retry    requeue a failed job
+    POST /jobs/<id>/discard  drop a job and its vectors (needs the admin token, like /clear)
+    POST /clear    delete the whole index (needs QUERY_SERVICE_ADMIN_TOKEN as a bearer token)
+    GET  /stats    index statistics, worker pool state and latency percentiles
+    GET  /metrics  latency histograms in Prometheus text format
+    GET  /healthz  liveness check
+    GET  /readyz   readiness: 503 until background warm-up has finished
+"""
+import argparse
+import hmac
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import List, Dict, Any, Optional, Callable
+from urllib.parse import urlparse, parse_qs
+import requests
+from config import (
+    QUERY_SERVICE_HOST,
+    QUERY_SERVICE_PORT,
+    QUERY_SERVICE_WORKERS,
+    QUERY_SERVICE_MAX_QUEUE,
+    QUERY_SERVICE_TIMEOUT,
+    QUERY_SERVICE_ADMIN_TOKEN,
+    UPLOAD_SPOOL_THRESHOLD,
+    UPLOAD_READ_CHUNK,
+    WARMUP_ENABLED,
+    QUERY_LOG_ENABLED
+)
+from document_processor import DocumentProcessor, NamedUpload, spool_dir
+from memory_monitor import RSSMonitor, MemoryProfile, MemoryBudgetExceeded
+from ingest_jobs import IngestJobQueue
+from query_log import QueryLog, build_record, describe_configuration
+from rag_pipeline import RAGPipeline, PipelineError
+from resilience import resilience
+from tracing import tracer
+from warmup import Warmup
+
+
+class NamedBytesIO(BytesIO):
+    """In-memory upload with a file name, matching what DocumentProcessor expects"""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+class QueryService:
+    """In-process query/ingest/stats API shared by the HTTP server and the Streamlit app"""
+
+    def __init__(self, pipeline: RAGPipeline, doc_processor: DocumentProcessor = None,
+                 ingest_queue: IngestJobQueue = None, query_log: QueryLog = None):
+        self.pipeline = pipeline
+        self.doc_processor = doc_processor or DocumentProcessor()
+        self.ingest_queue = ingest_queue or IngestJobQueue()
+        self.query_log = query_log
+        self.configuration = describe_configuration(pipeline)
+        self.warmup = None
+
+    @classmethod
+    def from_config(cls) -> 'QueryService':
+        """Build the service from configured backends"""
+        from rag_pipeline import create_pipeline
+        return cls(create_pipeline(), query_log=QueryLog() if QUERY_LOG_ENABLED else None)
+
+    @property
+    def vector_store(self):
+        return self.pipeline.vector_store
+
+    def start_warmup(self) -> Warmup:
+        """Warm models and connections in the background (idempotent)"""
+        if self.warmup is None:
+            self.warmup = Warmup(self.pipeline).start()
+        return self.warmup
+
+    def readiness(self) -> Dict[str, Any]:
+        """Warm-up status; a service that never started warm-up counts as ready"""
+        if self.warmup is None:
+            return {'ready': True, 'started': False, 'seconds': 0.0, 'steps': {}}
+        return self.warmup.status()
+
+    def query(self, query: str, top_k_retrieval: int = None, top_k_rerank: int = None,
+              filters: Optional[Dict[str, Any]] = None,
+              on_stage: Optional[Callable[[str], None]] = None,
+              session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Answer a question (see RAGPipeline.answer); raises PipelineError on failure"""
+        if self.query_log is None:
+            return self.pipeline.answer(query, top_k_retrieval, top_k_rerank, filters,
+                                        on_stage=on_stage, session_id=session_id)
+        params = {'top_k_retrieval': top_k_retrieval, 'top_k_rerank': top_k_rerank, 'filters': filters}
+        started_at, start = time.time(), time.perf_counter()
+        try:
+            response = self.pipeline.answer(query, top_k_retrieval, top_k_rerank, filters,
+                                            on_stage=on_stage, session_id=session_id)
+        except PipelineError as e:
+            self.query_log.append(build_record(
+                query, params, self.configuration, error={'stage': e.stage, 'message': str(e)},
+                started_at=started_at, latency=time.perf_counter() - start, session_id=session_id
+            ))
+            raise
+        self.query_log.append(build_record(query, params, self.configuration, response, started_at=started_at,
+                                           latency=time.perf_counter() - start, session_id=session_id))
+        return response
+
+    def ingest_text(self, text: str, source_name: str, title: str = None) -> Dict[str, Any]:
+        """Chunk, embed and index pasted text"""
+        if title is None:
+            title = self.doc_processor.extract_document_title(text, source_name)
+        chunks = self.doc_processor.chunk_text(text, source_name, title)
+        result = self.vector_store.upsert_documents(chunks)
+        result['title'] = title
+        return result
+
+    def ingest_file(self, uploaded_file) -> Dict[str, Any]:
+        """Extract, chunk, embed and index an uploaded PDF/TXT file (needs .name and .read())"""
+        with RSSMonitor(uploaded_file.name) as memory, MemoryProfile(uploaded_file.name) as profile:
+            chunks = self.doc_processor.process_uploaded_file(uploaded_file, profile, self.vector_store.memory_budget)
+            result = self.vector_store.upsert_documents(chunks, profile=profile)
+        result['memory'] = memory.report()
+        if profile.enabled:
+            result['memory_profile'] = profile.report()
+            profile.print_report()
+        return result
+
+    def submit_file(self, uploaded_file) -> Dict[str, Any]:
+        """Queue an uploaded file for background ingestion and return the job"""
+        return self.ingest_queue.enqueue_file(uploaded_file)
+
+    def submit_text(self, text: str, source_name: str) -> Dict[str, Any]:
+        """Queue pasted text for background ingestion and return the job"""
+        return self.ingest_queue.enqueue_text(text, source_name)
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Recent ingestion jobs, newest first"""
+        return self.ingest_queue.list_jobs(limit)
+
+    def retry_job(self, job_id: str) -> Dict[str, Any]:
+        self.ingest_queue.retry(job_id)
+        return self.ingest_queue.get_job(job_id) or {}
+
+    def discard_job(self, job_id: str) -> Dict[str, Any]:
+        self.ingest_queue.discard(job_id, self.vector_store)
+        return {'discarded': job_id}
+
+    def stats(self) -> Dict[str, Any]:
+        """Index statistics, service availability, latency percentiles and candidate selection totals"""
+        selector = self.pipeline.candidate_selector
+        diversifier = self.pipeline.diversifier
+        scheduler = getattr(self.pipeline.llm_service, 'scheduler', None)
+        return {
+            'index': self.vector_store.get_index_stats(),
+            'inventory': self.vector_store.source_inventory(),
+            'services': {
+                'vector_backend': self.vector_store.backend,
+                'reranker': 'cohere' if hasattr(self.pipeline.reranker, 'co') else 'fallback',
+                'llm': self.pipeline.llm_service is not None
+            },
+            'latency': tracer.snapshot(),
+            'candidate_selection': selector.stats() if selector is not None else None,
+            'diversity': diversifier.stats() if diversifier is not None else None,
+            'llm_scheduler': scheduler.metrics() if scheduler is not None else None,
+            'warmup': self.readiness(),
+            'query_cache': self.vector_store.query_cache.stats(),
+            'query_log': self.query_log.stats() if self.query_log is not None else None,
+            'resilience': dict(resilience.stats(), index_replica_age=self.vector_store.replica_age())
+        }
+
+    def metrics(self) -> str:
+        """Latency histograms and LLM scheduler state in Prometheus text format"""
+        scheduler = getattr(self.pipeline.llm_service, 'scheduler', None)
+        return tracer.export_prometheus() + (scheduler.export_prometheus() if scheduler is not None else "")
+
+    def list_sources(self) -> List[str]:
+        return self.vector_store.list_sources()
+
+    def clear_index(self) -> bool:
+        return self.vector_store.clear_index()
+
+
+class ServiceOverloaded(Exception):
+    """Raised when the worker pool queue is full or the service is draining"""
+
+
+class WorkerPool:
+    """
+    Fixed-size worker pool with a bounded wait queue
+
+    At most `workers` requests run at once and at most `max_queue` more wait;
+    anything beyond that is rejected immediately so callers can back off
+    instead of piling up behind a saturated pipeline.
+    """
+
+    def __init__(self, workers: int = QUERY_SERVICE_WORKERS, max_queue: int = QUERY_SERVICE_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rag-worker')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._rejected = 0
+        self.accepting = True
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Schedule fn or raise ServiceOverloaded if there is no room"""
+        if not self.accepting:
+            raise ServiceOverloaded("Service is shutting down")
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ServiceOverloaded("Request queue is full")
+        with self._lock:
+            self._pending += 1
+
+        def run():
+            with self._lock:
+                self._pending -= 1
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._slots.release()
+
+        return self._executor.submit(run)
+
+    def state(self) -> Dict[str, int]:
+        """Current queue depth, running count and rejections"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queued': self._pending,
+                'running': self._running,
+                'rejected': self._rejected
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work and optionally wait for queued and running requests to finish"""
+        self.accepting = False
+        self._executor.shutdown(wait=wait)
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """Routes HTTP requests onto the shared worker pool"""
+
+    server_version = "RAGQueryService/1.0"
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _read_upload(self, filename: str):
+        """Upload body in memory up to UPLOAD_SPOOL_THRESHOLD bytes, streamed to a spool file beyond that"""
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= UPLOAD_SPOOL_THRESHOLD:
+            return NamedBytesIO(self.rfile.read(length) if length else b'', filename)
+        spool = tempfile.TemporaryFile(dir=spool_dir())
+        remaining = length
+        while remaining:
+            block = self.rfile.read(min(UPLOAD_READ_CHUNK, remaining))
+            if not block:
+                break
+            spool.write(block)
+            remaining -= len(block)
+        spool.seek(0)
+        return NamedUpload(spool, filename)
+
+    def _authorize_admin(self) -> bool:
+        """Check the admin bearer token, answering 403/401 if the request may not proceed"""
+        token = self.server.admin_token
+        if not token:
+            self._send_json(403, {'error': "Endpoint disabled; set QUERY_SERVICE_ADMIN_TOKEN to enable it"})
+            return False
+        supplied = self.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {token}".encode('utf-8')):
+            self._send_json(401, {'error': "Missing or invalid admin token"}, {'WWW-Authenticate': 'Bearer'})
+            return False
+        return True
+
+    def _run(self, fn: Callable, *args, **kwargs) -> None:
+        try:
+            future = self.server.pool.submit(fn, *args, **kwargs)
+        except ServiceOverloaded as e:
+            self._send_json(503, {'error': str(e), **self.server.pool.state()}, {'Retry-After': '1'})
+            return
+        try:
+            self._send_json(200, future.result(timeout=self.server.request_timeout))
+        except FutureTimeoutError:
+            self._send_json(504, {'error': f"Request timed out after {self.server.request_timeout:.0f}s"})
+        except PipelineError as e:
+            self._send_json(502, {'error': str(e), 'stage': e.stage})
+        except MemoryBudgetExceeded as e:
+            self._send_json(413, {'error': str(e)})
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == '/healthz':
+            self._send_json(200, {'status': 'ok' if self.server.pool.accepting else 'draining'})
+        elif path == '/readyz':
+            readiness = self.server.service.readiness()
+            ready = readiness['ready'] and self.server.pool.accepting
+            self._send_json(200 if ready else 503, readiness)
+        elif path == '/stats':
+            stats = self.server.service.stats()
+            stats['pool'] = self.server.pool.state()
+            self._send_json(200, stats)
+        elif path == '/jobs':
+            try:
+                limit = int(parse_qs(urlparse(self.path).query).get('limit', ['20'])[0])
+                if limit < 1:
+                    raise ValueError
+            except ValueError:
+                self._send_json(400, {'error': "?limit= must be a positive integer"})
+                return
+            self._send_json(200, {'jobs': self.server.service.list_jobs(limit)})
+        elif path == '/sources':
+            self._send_json(200, {'sources': self.server.service.list_sources()})
+        elif path == '/metrics':
+            body = self.server.service.metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {'error': f"Unknown endpoint {path}"})
+
+    def do_POST(self) -> None:
+        parsed = urlparse(self.path)
+        service = self.server.service
+
+        if parsed.path in ('/ingest', '/jobs') and \
+                self.headers.get('Content-Type', '').startswith('application/octet-stream'):
+            filename = parse_qs(parsed.query).get('filename', [''])[0]
+            if not filename:
+                self._send_json(400, {'error': "Missing ?filename= for file upload"})
+                return
+            upload = self._read_upload(filename)
+            if parsed.path == '/jobs':
+                try:
+                    self._send_json(202, service.submit_file(upload))
+                finally:
+                    upload.close()
+            else:
+                # Closed by the worker, which may outlive this handler on timeout
+                def ingest():
+                    try:
+                        return service.ingest_file(upload)
+                    finally:
+                        upload.close()
+                self._run(ingest)
+            return
+
+        body = self._read_body()
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': "Request body must be JSON"})
+            return
+        if not isinstance(payload, dict):
+            self._send_json(400, {'error': "Request body must be a JSON object"})
+            return
+
+        if parsed.path == '/query':
+            if not payload.get('query'):
+                self._send_json(400, {'error': "Missing 'query'"})
+                return
+            self._run(service.query, payload['query'], payload.get('top_k_retrieval'),
+                      payload.get('top_k_rerank'), payload.get('filters'),
+                      session_id=payload.get('session_id') or self.client_address[0])
+        elif parsed.path == '/ingest':
+            if not payload.get('text'):
+                self._send_json(400, {'error': "Missing 'text'"})
+                return
+            self._run(service.ingest_text, payload['text'], payload.get('source_name', 'Pasted Text'),
+                      payload.get('title'))
+        elif parsed.path == '/jobs':
+            if not payload.get('text'):
+                self._send_json(400, {'error': "Missing 'text'"})
+                return
+            self._send_json(202, service.submit_text(payload['text'], payload.get('source_name', 'Pasted Text')))
+        elif parsed.path.startswith('/jobs/') and parsed.path.endswith('/retry'):
+            self._send_json(200, service.retry_job(parsed.path.split('/')[2]))
+        elif parsed.path.startswith('/jobs/') and parsed.path.endswith('/discard'):
+            # Discarding deletes the job's vectors, so it is as privileged as /clear
+            if self._authorize_admin():
+                self._run(service.discard_job, parsed.path.split('/')[2])
+        elif parsed.path == '/clear':
+            if self._authorize_admin():
+                self._run(service.clear_index)
+        else:
+            self._send_json(404, {'error': f"Unknown endpoint {parsed.path}"})
+
+
+class QueryServer(ThreadingHTTPServer):
+    """HTTP server that owns the query service and its worker pool"""
+
+    daemon_threads = False  # let server_close() wait for responses still being written
+    request_queue_size = 128  # listen backlog; admission control happens in the worker pool
+
+    def __init__(self, service: QueryService, host: str = QUERY_SERVICE_HOST, port: int = QUERY_SERVICE_PORT,
+                 workers: int = QUERY_SERVICE_WORKERS, max_queue: int = QUERY_SERVICE_MAX_QUEUE,
+                 request_timeout: float = QUERY_SERVICE_TIMEOUT, verbose: bool = False,
+                 admin_token: Optional[str] = QUERY_SERVICE_ADMIN_TOKEN):
+        super().__init__((host, port), QueryRequestHandler)
+        self.service = service
+        self.pool = WorkerPool(workers, max_queue)
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+        self.admin_token = admin_token
+
+    def graceful_shutdown(self) -> None:
+        """Reject new work, let queued and running requests finish, then stop serving"""
+        self.pool.accepting = False
+        self.pool.shutdown(wait=True)
+        self.shutdown()
+
+
+def serve(service: QueryService, host: str = QUERY_SERVICE_HOST, port: int = QUERY_SERVICE_PORT,
+          workers: int = QUERY_SERVICE_WORKERS, max_queue: int = QUERY_SERVICE_MAX_QUEUE,
+          request_timeout: float = QUERY_SERVICE_TIMEOUT, verbose: bool = False) -> None:
+    """Run the HTTP service until SIGINT/SIGTERM, then drain in-flight requests"""
+    server = QueryServer(service, host, port, workers, max_queue, request_timeout, verbose)
+
+    def handle_signal(signum, frame):
+        print(f"Received signal {signum}, draining {server.pool.state()['running']} running requests...")
+        # shutdown() blocks until serve_forever returns, so run it off the serving thread
+        threading.Thread(target=server.graceful_shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    print(f"RAG query service listening on http://{host}:{server.server_address[1]} "
+          f"({workers} workers, queue {max_queue})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        tracer.save()
+        print("RAG query service stopped")
+
+
+class QueryServiceClient:
+    """HTTP client with the same interface as QueryService, used by the Streamlit app"""
+
+    def __init__(self, base_url: str, timeout: float = QUERY_SERVICE_TIMEOUT,
+                 admin_token: Optional[str] = QUERY_SERVICE_ADMIN_TOKEN):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.admin_token = admin_token
+        self.session = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise Exception(f"Query service unreachable at {self.base_url}: {str(e)}")
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {'error': response.text}
+        if response.status_code == 502 and 'stage' in payload:
+            raise PipelineError(payload['stage'], payload['error'])
+        if response.status_code == 503:
+            raise ServiceOverloaded(payload.get('error', "Query service is busy"))
+        if response.status_code >= 400:
+            raise Exception(payload.get('error', f"Query service returned HTTP {response.status_code}"))
+        return payload
+
+    def query(self, query: str, top_k_retrieval: int = None, top_k_rerank: int = None,
+              filters: Optional[Dict[str, Any]] = None,
+              on_stage: Optional[Callable[[str], None]] = None,
+              session_id: Optional[str] = None) -> Dict[str, Any]:
+        if on_stage:
+            on_stage('retrieval')
+        return self._request('POST', '/query', json={
+            'query': query,
+            'top_k_retrieval': top_k_retrieval,
+            'top_k_rerank': top_k_rerank,
+            'filters': filters,
+            'session_id': session_id
+        })
+
+    def ingest_text(self, text: str, source_name: str, title: str = None) -> Dict[str, Any]:
+        return self._request('POST', '/ingest', json={'text': text, 'source_name': source_name, 'title': title})
+
+    def ingest_file(self, uploaded_file) -> Dict[str, Any]:
+        # Passing the file object lets requests stream it instead of building a bytes copy
+        return self._request('POST', '/ingest', params={'filename': uploaded_file.name},
+                             data=uploaded_file, headers={'Content-Type': 'application/octet-stream'})
+
+    def submit_file(self, uploaded_file) -> Dict[str, Any]:
+        return self._request('POST', '/jobs', params={'filename': uploaded_file.name},
+                             data=uploaded_file, headers={'Content-Type': 'application/octet-stream'})
+
+    def submit_text(self, text: str, source_name: str) -> Dict[str, Any]:
+        return self._request('POST', '/jobs', json={'text': text, 'source_name': source_name})
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self._request('GET', '/jobs', params={'limit': limit})['jobs']
+
+    def retry_job(self, job_id: str) -> Dict[str, Any]:
+        return self._request('POST', f'/jobs/{job_id}/retry')
+
+    def discard_job(self, job_id: str) -> Dict[str, Any]:
+        return self._request('POST', f'/jobs/{job_id}/discard', headers=self._admin_headers())
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request('GET', '/stats')
+
+    def readiness(self) -> Dict[str, Any]:
+        # /readyz answers 503 with the warm-up status while not ready, so read the body either way
+        try:
+            return self.session.get(f"{self.base_url}/readyz", timeout=self.timeout).json()
+        except (requests.RequestException, ValueError) as e:
+            raise Exception(f"Query service unreachable at {self.base_url}: {str(e)}")
+
+    def metrics(self) -> str:
+        try:
+            response = self.session.get(f"{self.base_url}/metrics", timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise Exception(f"Query service unreachable at {self.base_url}: {str(e)}")
+        return response.text
+
+    def list_sources(self) -> List[str]:
+        return self._request('GET', '/sources')['sources']
+
+    def clear_index(self) -> bool:
+        return bool(self._request('POST', '/clear', headers=self._admin_headers()))
+
+    def _admin_headers(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {self.admin_token}"} if self.admin_token else {}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Run the RAG pipeline as an HTTP service")
+    parser.add_argument("--host", default=QUERY_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=QUERY_SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=QUERY_SERVICE_WORKERS)
+    parser.add_argument("--max-queue", type=int, default=QUERY_SERVICE_MAX_QUEUE)
+    parser.add_argument("--timeout", type=float, default=QUERY_SERVICE_TIMEOUT, help="Per-request timeout (seconds)")
+    parser.add_argument("--stand-ins", action="store_true", help="Use local stand-in backends (no API keys)")
+    parser.add_argument("--stand-in-latency", type=float, default=0.0,
+                        help="Simulated latency per stand-in call (seconds)")
+    parser.add_argument("--ingest-workers", type=int, default=1,
+                        help="Background ingestion worker processes to launch (0 to run them separately)")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip background warm-up at start")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    if args.stand_ins:
+        from ingest_jobs import IngestWorker
+        from stand_ins import create_stand_in_pipeline
+        latency = args.stand_in_latency
+        # Stand-in indexes live in memory, so ingestion runs on an in-process worker thread
+        spool = tempfile.mkdtemp(prefix='rag-stand-in-')
+        service = QueryService(create_stand_in_pipeline(latency, latency, latency, latency),
+                               ingest_queue=IngestJobQueue(os.path.join(spool, 'jobs.sqlite3'), spool))
+        worker = IngestWorker(service.ingest_queue, service.vector_store, service.doc_processor)
+        threading.Thread(target=worker.run_forever, daemon=True).start()
+    else:
+        from ingest_jobs import start_worker_process
+        service = QueryService.from_config()
+        for _ in range(args.ingest_workers):
+            start_worker_process(parent_pid=os.getpid())
+
+    if WARMUP_ENABLED and not args.no_warmup:
+        service.start_warmup()
+    serve(service, args.host, args.port, args.workers, args.max_queue, args.timeout, args.verbose)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
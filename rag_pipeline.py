@@ -0,0 +1,241 @@
+"""
+Query pipeline (retrieve → rerank → generate) independent of the Streamlit UI
+"""
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Callable, Tuple, ContextManager
+from config import TOP_K_RETRIEVAL, TOP_K_RERANK, ADAPTIVE_DEPTH_ENABLED, MMR_ENABLED, FAST_PATH_ENABLED
+from resilience import resilience, ServiceUnavailable
+from tracing import tracer
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline stage fails; `stage` names the failing step"""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+class RAGPipeline:
+    """Runs a question through retrieval, reranking and answer generation"""
+
+    def __init__(self, vector_store, reranker, llm_service, candidate_selector=None, diversifier=None,
+                 fast_path=None):
+        self.vector_store = vector_store
+        self.reranker = reranker
+        self.llm_service = llm_service
+        self.candidate_selector = candidate_selector
+        self.diversifier = diversifier
+        self.fast_path = fast_path
+
+    def retrieval_depth(self, top_k: int = None) -> int:
+        """Candidates to fetch: the requested top_k, widened to the selector's upper bound"""
+        if top_k is None:
+            top_k = TOP_K_RETRIEVAL
+        if self.candidate_selector is not None:
+            return max(top_k, self.candidate_selector.max_candidates)
+        return top_k
+
+    def select_candidates(self, docs: List[Dict[str, Any]], top_k_retrieval: int = None,
+                          top_k_rerank: int = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Step 1b: trim or keep retrieved candidates before reranking (still without texts)"""
+        if self.candidate_selector is None:
+            return docs, None
+        with tracer.span("candidate_selection", retrieved=len(docs)) as span:
+            candidates, selection = self.candidate_selector.select(
+                docs, top_k_retrieval or TOP_K_RETRIEVAL, top_k_rerank or TOP_K_RERANK
+            )
+            span.set_attributes(selected=selection['selected'], rule=selection['rule'])
+        return candidates, selection
+
+    def diversify(self, docs: List[Dict[str, Any]],
+                  top_k_rerank: int = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Step 1c: drop redundant near-duplicate candidates by MMR (no-op without a diversifier)"""
+        if self.diversifier is None:
+            return docs, None
+        top_k_rerank = top_k_rerank or TOP_K_RERANK
+        with tracer.span("diversity", candidates=len(docs)) as span:
+            selected, report = self.diversifier.select(docs, top_k_rerank, top_k_rerank)
+            span.set_attribute('selected', len(selected))
+        # Embeddings were only needed here; keep them out of rerank payloads and responses
+        for doc in docs:
+            doc.pop('values', None)
+        return selected, report
+
+    def load_texts(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Step 1d: load chunk texts for the final candidates only (retrieval returns ids and scores)"""
+        return self.vector_store.fetch_texts(docs)
+
+    def retrieve(self, query: str, top_k: int = None, filters: Optional[Dict[str, Any]] = None,
+                 query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Step 1: dense retrieval of candidate chunks (without texts; see load_texts)"""
+        if top_k is None:
+            top_k = TOP_K_RETRIEVAL
+        with tracer.span("retrieval", top_k=top_k, filtered=bool(filters)) as span:
+            try:
+                docs = self.vector_store.query_similar_documents(
+                    query, top_k, filters, query_embedding=query_embedding, include_text=False,
+                    include_values=self.diversifier is not None
+                )
+            except Exception as e:
+                raise PipelineError('retrieval', f"Error during retrieval: {str(e)}")
+            span.set_attribute('retrieved', len(docs))
+        return docs
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_k: int = None) -> List[Dict[str, Any]]:
+        """Step 2: rerank candidates down to the context set"""
+        if top_k is None:
+            top_k = TOP_K_RERANK
+
+        def score_order():
+            from reranker import FallbackReranker
+            return FallbackReranker().rerank_documents(query, docs, top_k)
+
+        with tracer.span("rerank", candidates=len(docs), top_k=top_k):
+            try:
+                return resilience.call('rerank', self.reranker.rerank_documents, query, docs, top_k,
+                                       strict=True, fallback=score_order)
+            except Exception as e:
+                raise PipelineError('rerank', f"Error during reranking: {str(e)}")
+
+    def generate(self, query: str, docs: List[Dict[str, Any]], session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Step 3: generate a cited answer from the context set"""
+        with tracer.span("generation", context_docs=len(docs)) as span:
+            try:
+                result = self.llm_service.generate_answer_with_citations(query, docs, session_id)
+            except ServiceUnavailable as e:
+                # Groq is down, too slow or out of quota: quote the best chunk rather than fail the query
+                from fast_path import FastPathPolicy
+                span.set_attribute('degraded', str(e))
+                result = (self.fast_path or FastPathPolicy()).extractive_answer(query, docs[0])
+                result['degraded'] = True
+                result['degraded_reason'] = str(e)
+            except Exception as e:
+                raise PipelineError('generation', f"Error generating answer: {str(e)}")
+            span.set_attributes(tokens_used=result.get('tokens_used', 0), model=result.get('model_used'))
+        return result
+
+    def answer(self, query: str, top_k_retrieval: int = None, top_k_rerank: int = None,
+               filters: Optional[Dict[str, Any]] = None, query_embedding: Optional[List[float]] = None,
+               on_stage: Optional[Callable[[str], None]] = None, session_id: Optional[str] = None,
+               stage_limits: Optional[Dict[str, ContextManager]] = None) -> Dict[str, Any]:
+        """
+        Answer one question end to end
+
+        Args:
+            query: User's question
+            top_k_retrieval: Candidates to retrieve
+            top_k_rerank: Documents kept after reranking
+            filters: Optional metadata filter for scoped retrieval
+            query_embedding: Precomputed query vector (skips encoding)
+            on_stage: Optional callback invoked with 'retrieval', 'rerank' and
+                'generation' as each stage starts (used for progress display)
+            session_id: Caller identity for fair LLM queuing across sessions
+            stage_limits: Optional context managers (e.g. semaphores) held around
+                the 'rerank' and 'generation' calls; waiting for them is not
+                counted in the stage timings (used by batch runs)
+
+        Returns:
+            Dict with 'result' (LLM answer dict), 'docs' (context documents),
+            'retrieved' and 'candidates' (counts before and after candidate
+            selection), 'retrieved_ids' and 'retrieved_scores',
+            'candidate_selection' and 'diversity' reports, the 'fast_path'
+            decision, 'timing_info' and 'trace'
+
+        Raises:
+            PipelineError: if a stage fails
+        """
+        notify = on_stage or (lambda stage: None)
+        limits = stage_limits or {}
+        timing_info = {}
+
+        with tracer.span("query", top_k_retrieval=top_k_retrieval, top_k_rerank=top_k_rerank) as trace:
+            notify('retrieval')
+            retrieved_docs = self.retrieve(query, self.retrieval_depth(top_k_retrieval), filters, query_embedding)
+            timing_info['retrieval'] = trace.children[-1].duration
+
+            candidates, selection = self.select_candidates(retrieved_docs, top_k_retrieval, top_k_rerank)
+            candidates, diversity = self.diversify(candidates, top_k_rerank)
+            candidates = self.load_texts(candidates)
+            fast_path = self.fast_path.decide(candidates) if self.fast_path is not None and candidates else None
+            if not candidates:
+                result = self.llm_service.handle_no_answer_case(query)
+                reranked_docs = []
+            else:
+                if fast_path and fast_path['skip_rerank']:
+                    # Decisive dense match: the dense order is the context order
+                    reranked_docs = candidates[:top_k_rerank or TOP_K_RERANK]
+                    trace.set_attribute('fast_path', 'extractive' if fast_path['extractive'] else 'skip_rerank')
+                else:
+                    notify('rerank')
+                    with limits.get('rerank') or nullcontext():
+                        reranked_docs = self.rerank(query, candidates, top_k_rerank)
+                    timing_info['reranking'] = trace.children[-1].duration
+                    if selection is not None:
+                        self.candidate_selector.record(selection, timing_info['reranking'], len(candidates))
+
+                notify('generation')
+                if fast_path and fast_path['extractive']:
+                    with tracer.span("generation.extractive"):
+                        result = self.fast_path.extractive_answer(query, reranked_docs[0])
+                else:
+                    with limits.get('generation') or nullcontext():
+                        result = self.generate(query, reranked_docs, session_id)
+                timing_info['llm_generation'] = trace.children[-1].duration
+        timing_info['total'] = trace.duration
+
+        return {
+            'query': query,
+            'result': result,
+            'docs': reranked_docs,
+            'retrieved': len(retrieved_docs),
+            'retrieved_ids': [doc['id'] for doc in retrieved_docs],
+            'retrieved_scores': [round(doc.get('score', 0.0), 4) for doc in retrieved_docs],
+            'candidates': len(candidates),
+            'candidate_selection': selection,
+            'diversity': diversity,
+            'fast_path': fast_path,
+            'timing_info': timing_info,
+            'trace': trace.to_dict()
+        }
+
+
+def create_pipeline() -> RAGPipeline:
+    """Build a pipeline from configured services, falling back to the local reranker if Cohere is unavailable"""
+    from vector_store import VectorStore
+    from reranker import RerankerService, FallbackReranker
+    from llm_service import LLMService
+
+    vector_store = VectorStore()
+    try:
+        reranker = RerankerService()
+    except Exception as e:
+        print(f"Cohere Reranker not available: {str(e)}. Using fallback reranker.")
+        reranker = FallbackReranker()
+    llm_service = LLMService()
+    return RAGPipeline(vector_store, reranker, llm_service,
+                       create_candidate_selector(), create_diversifier(), create_fast_path())
+
+
+def create_candidate_selector():
+    """Adaptive depth selector if enabled in config, otherwise None (fixed-k retrieval)"""
+    if not ADAPTIVE_DEPTH_ENABLED:
+        return None
+    from candidate_selection import AdaptiveDepthSelector
+    return AdaptiveDepthSelector()
+
+
+def create_diversifier():
+    """MMR selector if enabled in config, otherwise None"""
+    if not MMR_ENABLED:
+        return None
+    from candidate_selection import MMRSelector
+    return MMRSelector()
+
+
+def create_fast_path():
+    """Fast-path policy if enabled in config, otherwise None"""
+    if not FAST_PATH_ENABLED:
+        return None
+    from fast_path import FastPathPolicy
+    return FastPathPolicy()
@@ -0,0 +1,81 @@
+"""
+Token-bucket rate limiting for calls to external APIs
+"""
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`
+
+    Callers reserve an estimated amount up front with acquire() and settle the
+    difference with adjust() once the real cost is known (e.g. the
+    usage.total_tokens returned by the LLM). The level may go negative after an
+    under-estimate, which simply delays the next caller.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        """Tokens currently available (may be negative)"""
+        with self._cond:
+            self._refill()
+            return self._level
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens would be available"""
+        with self._cond:
+            self._refill()
+            amount = min(amount, self.capacity)
+            return max(0.0, (amount - self._level) / self.rate_per_second)
+
+    def acquire(self, amount: float = 1, timeout: Optional[float] = None) -> float:
+        """
+        Block until `amount` tokens are available and take them
+
+        Requests larger than the bucket capacity are clamped to the capacity so
+        they can still proceed once the bucket is full.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            TimeoutError: if the tokens are not available within `timeout` seconds
+        """
+        start = time.monotonic()
+        needed = min(amount, self.capacity)
+        with self._cond:
+            while True:
+                self._refill()
+                if self._level >= needed:
+                    self._level -= amount
+                    return time.monotonic() - start
+                delay = (needed - self._level) / self.rate_per_second
+                if timeout is not None:
+                    remaining = timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        raise TimeoutError(f"Rate limit: {amount:.0f} tokens not available within {timeout:.1f}s")
+                    delay = min(delay, remaining)
+                self._cond.wait(delay)
+
+    def adjust(self, delta: float) -> None:
+        """Return (positive) or charge (negative) tokens after the real cost is known"""
+        with self._cond:
+            self._refill()
+            self._level = min(self.capacity, self._level + delta)
+            self._cond.notify_all()
@@ -0,0 +1,273 @@
+"""
+Replay logged query workloads and diff runs
+
+Usage:
+    python replay_queries.py run .rag_data/query_log -o baseline.jsonl.gz
+    python replay_queries.py run .rag_data/query_log --env EMBEDDING_REDUCTION=pca --speed 4 -o pca.jsonl.gz
+    python replay_queries.py run queries-20261019.jsonl.gz --url http://127.0.0.1:8600 --speed 0 --concurrency 8
+    python replay_queries.py diff baseline.jsonl.gz pca.jsonl.gz -o diff.json
+
+`run` re-executes every logged query with its original parameters and
+session, at the original arrival rate times --speed (0 = as fast as
+--concurrency allows). By default the queries go to an in-process service
+built from the configuration; --env overrides apply before it is built.
+--url targets a running query_service.py and --stand-ins uses local
+stand-ins. Each replayed query is written in the query log format, tagged
+with the ID of the record it replays.
+
+`diff` pairs the records of two logs or runs by the query they came from.
+It compares end-to-end and per-stage latency percentiles, errors, tokens
+and the retrieved and context chunk sets.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+# Stages compared by `diff`, in pipeline order (others are included when present in both runs)
+DIFF_STAGES = ['retrieval', 'candidate_selection', 'diversity', 'rerank', 'generation', 'query']
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _build_target(args) -> Tuple[Any, Dict[str, Any]]:
+    """The service to replay against and a description of its configuration"""
+    if args.url:
+        from query_service import QueryServiceClient
+        return QueryServiceClient(args.url), {'target': args.url}
+    from query_service import QueryService
+    from query_log import describe_configuration
+    if args.stand_ins:
+        import random
+        from llm_scheduler import LLMScheduler
+        from load_test import synthetic_document
+        from stand_ins import create_stand_in_pipeline
+        pipeline = create_stand_in_pipeline()
+        pipeline.llm_service.scheduler = LLMScheduler(requests_per_minute=100000, tokens_per_minute=100000000)
+        service = QueryService(pipeline)
+        # Same corpus and chunk IDs on every run, so stand-in runs can be diffed
+        rng = random.Random(0)
+        for i in range(args.corpus):
+            chunks = service.doc_processor.chunk_text(synthetic_document(i, rng), f"corpus-{i}.txt")
+            service.vector_store.upsert_documents(chunks, [f"corpus-{i}-{j}" for j in range(len(chunks))])
+    else:
+        service = QueryService.from_config()
+        service.query_log = None  # replays go to the run file, not the production log
+    return service, dict(describe_configuration(service.pipeline), target='stand-ins' if args.stand_ins else 'local')
+
+
+class ReplayRun:
+    """Schedules logged queries at their (scaled) original offsets and records the outcomes"""
+
+    def __init__(self, service, configuration: Dict[str, Any], speed: float, concurrency: int, output: str):
+        self.service = service
+        self.configuration = configuration
+        self.speed = speed
+        self.concurrency = concurrency
+        self.output = output
+        self.completed = self.failed = 0
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _replay_one(self, original: Dict[str, Any], due: float) -> None:
+        from query_log import build_record
+        params = original.get('params') or {}
+        lag = max(0.0, time.perf_counter() - due)
+        started_at, start = time.time(), time.perf_counter()
+        response, error = None, None
+        try:
+            response = self.service.query(original['query'], params.get('top_k_retrieval'),
+                                          params.get('top_k_rerank'), params.get('filters'),
+                                          session_id=original.get('session_id'))
+        except Exception as e:
+            error = {'stage': getattr(e, 'stage', 'client'), 'message': str(e)}
+        record = build_record(original['query'], params, self.configuration, response, error,
+                              started_at=started_at, latency=time.perf_counter() - start,
+                              session_id=original.get('session_id'), replay_of=original.get('replay_of') or original['id'])
+        record['lag'] = round(lag, 6)
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(',', ':'), default=str) + "\n")
+            self.max_lag = max(self.max_lag, lag)
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def run(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not records:
+            return {'replayed': 0}
+        first_ts = records[0]['ts']
+        start = time.perf_counter()
+        with gzip.open(self.output, 'wt', encoding='utf-8') as self._file, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for record in records:
+                due = start + ((record['ts'] - first_ts) / self.speed if self.speed > 0 else 0.0)
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._replay_one, record, due)
+        elapsed = time.perf_counter() - start
+        return {
+            'replayed': len(records),
+            'completed': self.completed,
+            'failed': self.failed,
+            'seconds': round(elapsed, 2),
+            'original_seconds': round(records[-1]['ts'] - first_ts, 2),
+            'max_lag': round(self.max_lag, 3),
+            'output': self.output
+        }
+
+
+def _jaccard(a: List[str], b: List[str]) -> float:
+    a, b = set(a or []), set(b or [])
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _latency_summary(values: List[float]) -> Dict[str, float]:
+    from tracing import LatencyHistogram
+    histogram = LatencyHistogram(window_size=max(1, len(values)), samples=values)
+    return histogram.summary()
+
+
+def diff_runs(a_records: List[Dict[str, Any]], b_records: List[Dict[str, Any]], worst: int = 10) -> Dict[str, Any]:
+    """Latency and result-set differences between two runs over the same logged queries"""
+    def key(record):
+        return record.get('replay_of') or record['id']
+
+    b_by_key = {key(record): record for record in b_records}
+    pairs = [(a, b_by_key[key(a)]) for a in a_records if key(a) in b_by_key]
+    ok_pairs = [(a, b) for a, b in pairs if not a.get('error') and not b.get('error')]
+
+    latency = {
+        'a': _latency_summary([a['latency'] for a, _ in ok_pairs]),
+        'b': _latency_summary([b['latency'] for _, b in ok_pairs])
+    }
+    stages = {}
+    shared = set.intersection(*[set(r.get('stages', {})) for pair in ok_pairs for r in pair]) if ok_pairs else set()
+    for stage in [s for s in DIFF_STAGES if s in shared] + sorted(shared - set(DIFF_STAGES)):
+        a_summary = _latency_summary([a['stages'][stage] for a, _ in ok_pairs])
+        b_summary = _latency_summary([b['stages'][stage] for _, b in ok_pairs])
+        stages[stage] = {'a_p50': a_summary['p50'], 'b_p50': b_summary['p50'],
+                         'a_p95': a_summary['p95'], 'b_p95': b_summary['p95']}
+
+    compared = []
+    for a, b in ok_pairs:
+        a_context, b_context = a.get('context_ids', []), b.get('context_ids', [])
+        compared.append({
+            'query': a['query'],
+            'retrieved_jaccard': round(_jaccard(a.get('retrieved_ids'), b.get('retrieved_ids')), 4),
+            'context_jaccard': round(_jaccard(a_context, b_context), 4),
+            'top1_same': bool(a_context) and bool(b_context) and a_context[0] == b_context[0],
+            'latency_delta': round(b['latency'] - a['latency'], 4)
+        })
+    count = len(compared) or 1
+    config_a = a_records[0].get('config', {}) if a_records else {}
+    config_b = b_records[0].get('config', {}) if b_records else {}
+    return {
+        'matched': len(pairs),
+        'unmatched': len(a_records) - len(pairs),
+        'errors': {'a': sum(1 for a, _ in pairs if a.get('error')), 'b': sum(1 for _, b in pairs if b.get('error'))},
+        'config_changes': {name: [config_a.get(name), config_b.get(name)]
+                           for name in sorted(set(config_a) | set(config_b))
+                           if config_a.get(name) != config_b.get(name)},
+        'latency': latency,
+        'stages': stages,
+        'tokens': {'a': sum(a.get('tokens_used') or 0 for a, _ in ok_pairs),
+                   'b': sum(b.get('tokens_used') or 0 for _, b in ok_pairs)},
+        'results': {
+            'retrieved_jaccard': round(sum(c['retrieved_jaccard'] for c in compared) / count, 4),
+            'context_jaccard': round(sum(c['context_jaccard'] for c in compared) / count, 4),
+            'top1_agreement': round(sum(c['top1_same'] for c in compared) / count, 4),
+            'context_changed': sum(1 for c in compared if c['context_jaccard'] < 1.0)
+        },
+        'most_changed': sorted(compared, key=lambda c: (c['context_jaccard'], -abs(c['latency_delta'])))[:worst]
+    }
+
+
+def print_diff(report: Dict[str, Any]) -> None:
+    print(f"Matched {report['matched']} queries ({report['unmatched']} unmatched); "
+          f"errors A {report['errors']['a']} / B {report['errors']['b']}")
+    for name, (a, b) in report['config_changes'].items():
+        print(f"  config {name}: {a} -> {b}")
+    a, b = report['latency']['a'], report['latency']['b']
+    if a.get('count'):
+        print(f"{'end-to-end':<26} p50 {a['p50']:.3f}s -> {b['p50']:.3f}s   p95 {a['p95']:.3f}s -> {b['p95']:.3f}s   "
+              f"p99 {a['p99']:.3f}s -> {b['p99']:.3f}s")
+    for stage, values in report['stages'].items():
+        print(f"{stage:<26} p50 {values['a_p50']:.3f}s -> {values['b_p50']:.3f}s   "
+              f"p95 {values['a_p95']:.3f}s -> {values['b_p95']:.3f}s")
+    results = report['results']
+    print(f"Retrieved-set Jaccard {results['retrieved_jaccard']:.3f}, context-set Jaccard {results['context_jaccard']:.3f}, "
+          f"top-1 agreement {results['top1_agreement']:.1%}, {results['context_changed']} queries with a changed context")
+    print(f"Tokens {report['tokens']['a']} -> {report['tokens']['b']}")
+    for entry in report['most_changed']:
+        if entry['context_jaccard'] < 1.0:
+            print(f"  {entry['context_jaccard']:.2f}  {entry['latency_delta']:+.3f}s  {entry['query'][:70]}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Replay logged queries and compare runs")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Re-execute a logged workload")
+    run_parser.add_argument("logs", nargs='+', help="Query log files or directories")
+    target = run_parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Base URL of a running query_service.py")
+    target.add_argument("--stand-ins", action="store_true", help="In-process service on local stand-ins")
+    run_parser.add_argument("--corpus", type=int, default=50, help="Synthetic documents for --stand-ins")
+    run_parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                            help="Configuration override for the in-process service (repeatable)")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="Arrival-rate multiplier; 0 = no pacing")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="Queries in flight at most")
+    run_parser.add_argument("--since", help="Only records at or after this time (ISO or epoch)")
+    run_parser.add_argument("--until", help="Only records before this time (ISO or epoch)")
+    run_parser.add_argument("--limit", type=int, default=None)
+    run_parser.add_argument("-o", "--output", default=f"replay-{time.strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+    diff_parser = subparsers.add_parser('diff', help="Compare two logs or replay runs")
+    diff_parser.add_argument("a")
+    diff_parser.add_argument("b")
+    diff_parser.add_argument("--worst", type=int, default=10, help="Most-changed queries to list")
+    diff_parser.add_argument("-o", "--output", help="Write the diff as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        # Overrides must be in the environment before config is first imported
+        for assignment in args.env:
+            name, _, value = assignment.partition('=')
+            os.environ[name.strip()] = value
+        from query_log import read_log
+        records = list(read_log(args.logs, _parse_time(args.since), _parse_time(args.until)))[:args.limit]
+        service, configuration = _build_target(args)
+        print(f"Replaying {len(records)} queries at {'max' if args.speed <= 0 else f'{args.speed}x'} speed "
+              f"against {configuration.get('target')}")
+        summary = ReplayRun(service, configuration, args.speed, args.concurrency, args.output).run(records)
+        print(json.dumps(summary, indent=2))
+        return 0 if not summary.get('failed') else 1
+
+    from query_log import read_log
+    report = diff_runs(list(read_log([args.a])), list(read_log([args.b])), args.worst)
+    print_diff(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
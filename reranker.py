@@ -4,6 +4,7 @@ Reranking service using Cohere Rerank API
 import cohere
 from typing import List, Dict, Any
 from config import COHERE_API_KEY, TOP_K_RERANK
+from tracing import tracer
 
 
 class RerankerService:
@@ -15,7 +16,8 @@ class RerankerService:
         
         self.co = cohere.Client(COHERE_API_KEY)
     
-    def rerank_documents(self, query: str, documents: List[Dict[str, Any]], top_k: int = None) -> List[Dict[str, Any]]:
+    def rerank_documents(self, query: str, documents: List[Dict[str, Any]], top_k: int = None,
+                         strict: bool = False) -> List[Dict[str, Any]]:
         """
         Rerank documents using Cohere Rerank API
         
@@ -23,6 +25,8 @@ class RerankerService:
             query: The search query
             documents: List of documents with 'text' field
             top_k: Number of top documents to return
+            strict: Raise API errors instead of returning the original order
+                (the pipeline sets this so failures reach its circuit breaker)
         
         Returns:
             List of reranked documents with updated scores
@@ -38,13 +42,14 @@ class RerankerService:
             doc_texts = [doc['text'] for doc in documents]
             
             # Call Cohere Rerank API
-            rerank_response = self.co.rerank(
-                model="rerank-english-v3.0",
-                query=query,
-                documents=doc_texts,
-                top_n=min(top_k, len(documents)),
-                return_documents=True
-            )
+            with tracer.span("rerank.cohere", candidates=len(doc_texts), top_n=min(top_k, len(documents))):
+                rerank_response = self.co.rerank(
+                    model="rerank-english-v3.0",
+                    query=query,
+                    documents=doc_texts,
+                    top_n=min(top_k, len(documents)),
+                    return_documents=True
+                )
             
             # Reconstruct documents with new ranking
             reranked_docs = []
@@ -58,6 +63,8 @@ class RerankerService:
             return reranked_docs
             
         except Exception as e:
+            if strict:
+                raise
             # Fallback: return original documents if reranking fails
             print(f"Reranking failed: {str(e)}. Returning original order.")
             return documents[:top_k] if top_k else documents
@@ -66,9 +73,10 @@ class RerankerService:
 class FallbackReranker:
     """Simple fallback reranker that just returns top documents by similarity score"""
     
-    def rerank_documents(self, query: str, documents: List[Dict[str, Any]], top_k: int = None) -> List[Dict[str, Any]]:
+    def rerank_documents(self, query: str, documents: List[Dict[str, Any]], top_k: int = None,
+                         strict: bool = False) -> List[Dict[str, Any]]:
         """
-        Simple fallback reranking by similarity score
+        Simple fallback reranking by similarity score (never fails, so `strict` has no effect)
         """
         if top_k is None:
             top_k = TOP_K_RERANK
@@ -0,0 +1,424 @@
+"""
+Deadlines, circuit breakers and hedged requests for remote calls
+
+Usage:
+    python resilience.py drill                       # fault scenarios against local stand-ins
+    python resilience.py drill --queries 60 --compare # also run each scenario without the layer
+
+Each remote dependency (the vector index, the Cohere reranker and the Groq
+LLM) is called through a ServicePolicy:
+
+- a deadline, after which the caller stops waiting and the call counts as a
+  failure (the abandoned request finishes on its worker thread);
+- a circuit breaker that opens after BREAKER_FAILURE_THRESHOLD consecutive
+  failures and sends calls straight to the fallback until a probe succeeds
+  BREAKER_RESET_SECONDS later;
+- optional hedging: a call still running after the service's recent
+  HEDGE_PERCENTILE latency is duplicated and the first result wins.
+
+Fallbacks are chosen by the caller: the local score-order reranker, a local
+replica of the index, or an extractive answer instead of the LLM.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from config import (
+    RESILIENCE_ENABLED, INDEX_DEADLINE, RERANK_DEADLINE, LLM_DEADLINE, BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS, HEDGE_ENABLED, HEDGE_SERVICES, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES,
+    RESILIENCE_MAX_THREADS
+)
+from tracing import tracer, LatencyHistogram
+
+
+class ServiceUnavailable(Exception):
+    """A guarded call was refused by an open circuit or missed its deadline"""
+
+    def __init__(self, service: str, message: str):
+        super().__init__(message)
+        self.service = service
+
+
+class CircuitOpen(ServiceUnavailable):
+    """The service's circuit breaker is open"""
+
+
+class DeadlineExceeded(ServiceUnavailable):
+    """The call did not finish within the service deadline"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_SECONDS,
+                 name: Optional[str] = None):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _log_transition(self, before: str, after: str, reason: Optional[str] = None) -> None:
+        # Only state changes are logged; calls refused or failed in between are counted in stats()
+        if before != after:
+            detail = f" after {self.failures} consecutive failures ({reason})" if after == self.OPEN else ""
+            print(f"{self.name or 'service'} circuit {before} -> {after}{detail}")
+
+    def allow(self) -> bool:
+        """Whether a call may go to the service now"""
+        with self._lock:
+            before = self.state
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            allowed = self.state == self.HALF_OPEN and not self._probe_in_flight
+            if allowed:
+                self._probe_in_flight = True
+            after = self.state
+        self._log_transition(before, after)
+        return allowed
+
+    def record_success(self) -> None:
+        with self._lock:
+            before = self.state
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+        self._log_transition(before, self.CLOSED)
+
+    def release(self) -> None:
+        """End a call that says nothing about the service's health (frees a half-open probe)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self, reason: Optional[str] = None) -> None:
+        with self._lock:
+            before = self.state
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+            after = self.state
+        self._log_transition(before, after, reason)
+
+
+# Guarded calls run here so the caller can stop waiting at the deadline
+_executor = ThreadPoolExecutor(max_workers=RESILIENCE_MAX_THREADS, thread_name_prefix="resilience")
+
+
+class ServicePolicy:
+    """Deadline, circuit breaker and optional hedging for one remote service"""
+
+    def __init__(self, name: str, deadline: Optional[float], breaker: CircuitBreaker, hedge: bool = False,
+                 hedge_percentile: float = HEDGE_PERCENTILE, hedge_min_samples: int = HEDGE_MIN_SAMPLES):
+        self.name = name
+        self.deadline = deadline if deadline and deadline > 0 else None
+        self.breaker = breaker
+        if breaker.name is None:
+            breaker.name = name
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyHistogram()
+        self.counts = {'calls': 0, 'failures': 0, 'deadline_misses': 0, 'rejected': 0, 'fallbacks': 0,
+                       'hedged': 0, 'hedge_wins': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before sending a duplicate, or None while hedging is off or uncalibrated"""
+        if not self.hedge or len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def _execute(self, fn: Callable, args, kwargs) -> Any:
+        """Run fn on the pool, hedging and enforcing the deadline"""
+        parent = tracer.current_span()
+
+        def attempt(number: int):
+            with tracer.attach(parent):
+                if number:
+                    with tracer.span(f"{self.name}.hedge"):
+                        return fn(*args, **kwargs)
+                return fn(*args, **kwargs)
+
+        start = time.perf_counter()
+        deadline_at = start + self.deadline if self.deadline is not None else None
+        futures = [_executor.submit(attempt, 0)]
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is not None and (deadline_at is None or start + hedge_delay < deadline_at):
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                futures.append(_executor.submit(attempt, 1))
+                self._count('hedged')
+
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = deadline_at - time.perf_counter() if deadline_at is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1 and future is futures[1]:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+            if not done:
+                break
+        if pending:
+            self._count('deadline_misses')
+            raise DeadlineExceeded(self.name, f"{self.name} did not respond within {self.deadline:.1f}s")
+        raise error
+
+    def call(self, fn: Callable, *args, fallback: Optional[Callable[[], Any]] = None,
+             passthrough: Tuple[type, ...] = (), **kwargs) -> Any:
+        """
+        Call fn(*args, **kwargs) under the policy
+
+        On an open circuit, a missed deadline or an error, returns fallback()
+        if given, otherwise raises (ServiceUnavailable or the call's own error).
+        Errors of a `passthrough` type (e.g. rate limits: the service answered,
+        the caller is over quota) are re-raised without counting as failures.
+        """
+        span = tracer.current_span()
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('rejected')
+            return self._fall_back(fallback, CircuitOpen(self.name, f"{self.name} circuit is open"), span)
+
+        start = time.perf_counter()
+        try:
+            if self.deadline is None and not self.hedge:
+                result = fn(*args, **kwargs)
+            else:
+                result = self._execute(fn, args, kwargs)
+        except passthrough:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self._count('failures')
+            self.breaker.record_failure(str(e))
+            return self._fall_back(fallback, e, span)
+        self.breaker.record_success()
+        with self._lock:
+            self.latency.observe(time.perf_counter() - start)
+        return result
+
+    def _fall_back(self, fallback: Optional[Callable[[], Any]], error: Exception, span) -> Any:
+        # Recorded on the caller's span rather than printed: this runs on every degraded call
+        if span is not None:
+            span.set_attributes(degraded=self.name, breaker=self.breaker.state, fallback_reason=str(error))
+        if fallback is None:
+            raise error
+        self._count('fallbacks')
+        return fallback()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            summary = self.latency.summary()
+            counts = dict(self.counts)
+        return {
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'times_opened': self.breaker.times_opened,
+            'deadline': self.deadline,
+            'hedging': self.hedge,
+            'hedge_delay': self.hedge_delay(),
+            'p50': summary['p50'],
+            'p95': summary['p95'],
+            **counts
+        }
+
+
+class ResilienceRegistry:
+    """Named service policies built from config; disabled, calls run inline and only fall back on errors"""
+
+    DEADLINES = {'index': INDEX_DEADLINE, 'rerank': RERANK_DEADLINE, 'llm': LLM_DEADLINE}
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, enabled: bool = RESILIENCE_ENABLED, deadlines: Dict[str, float] = None,
+                  failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_SECONDS,
+                  hedge: bool = HEDGE_ENABLED, hedge_services: str = HEDGE_SERVICES,
+                  hedge_percentile: float = HEDGE_PERCENTILE, hedge_min_samples: int = HEDGE_MIN_SAMPLES) -> None:
+        """(Re)build every policy, e.g. to apply drill settings; resets breakers and statistics"""
+        self.enabled = enabled
+        self.deadlines = dict(self.DEADLINES, **(deadlines or {}))
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # LLM calls spend tokens from the scheduler's budget, so they are never duplicated
+        self.hedge_services = {name.strip() for name in hedge_services.split(',') if name.strip()} - {'llm'} \
+            if hedge else set()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.policies: Dict[str, ServicePolicy] = {}
+        self._lock = threading.Lock()
+
+    def policy(self, name: str) -> ServicePolicy:
+        with self._lock:
+            policy = self.policies.get(name)
+            if policy is None:
+                policy = self.policies[name] = ServicePolicy(
+                    name, self.deadlines.get(name), CircuitBreaker(self.failure_threshold, self.reset_timeout, name),
+                    name in self.hedge_services, self.hedge_percentile, self.hedge_min_samples
+                )
+            return policy
+
+    def call(self, name: str, fn: Callable, *args, fallback: Optional[Callable[[], Any]] = None,
+             passthrough: Tuple[type, ...] = (), **kwargs) -> Any:
+        """Call fn under the named service's policy (see ServicePolicy.call)"""
+        if not self.enabled:
+            try:
+                return fn(*args, **kwargs)
+            except passthrough:
+                raise
+            except Exception as e:
+                if fallback is None:
+                    raise
+                span = tracer.current_span()
+                if span is not None:
+                    span.set_attributes(degraded=name, fallback_reason=str(e))
+                return fallback()
+        return self.policy(name).call(fn, *args, fallback=fallback, passthrough=passthrough, **kwargs)
+
+    def is_open(self, name: str) -> bool:
+        return self.enabled and name in self.policies and self.policies[name].breaker.state == CircuitBreaker.OPEN
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            policies = dict(self.policies)
+        return {'enabled': self.enabled, 'services': {name: policy.stats() for name, policy in policies.items()}}
+
+
+resilience = ResilienceRegistry()
+
+
+# ----------------------------------------------------------------------
+# Fault drill against local stand-ins
+# ----------------------------------------------------------------------
+
+# name -> faults per stand-in component (see stand_ins.SimulatedLatency)
+DRILL_SCENARIOS = {
+    'healthy': {},
+    'rerank_outage': {'rerank': {'error_rate': 1.0}},
+    'rerank_tail': {'rerank': {'stall_rate': 0.1, 'stall_seconds': 2.0}},
+    'index_tail': {'index': {'stall_rate': 0.1, 'stall_seconds': 2.0}},
+    'llm_outage': {'llm': {'error_rate': 1.0}},
+    'llm_stall': {'llm': {'stall_rate': 0.2, 'stall_seconds': 5.0}}
+}
+
+
+def run_drill(scenario: str, queries: int, enabled: bool, latencies: Dict[str, float],
+              deadlines: Dict[str, float], reset_timeout: float) -> Dict[str, Any]:
+    """Answer `queries` questions on a stand-in pipeline with the scenario's faults injected"""
+    import random
+    from llm_scheduler import LLMScheduler
+    from load_test import synthetic_document, EXTRA_QUESTIONS
+    from query_service import QueryService
+    from stand_ins import create_stand_in_pipeline, stand_in_faults
+    from warmup import SAMPLE_QUESTIONS
+
+    resilience.configure(enabled=enabled, deadlines=deadlines, reset_timeout=reset_timeout, hedge=True,
+                         hedge_services='index,rerank', hedge_min_samples=10)
+    pipeline = create_stand_in_pipeline(latencies['encode'], latencies['index'], latencies['rerank'], latencies['llm'])
+    pipeline.llm_service.scheduler = LLMScheduler(requests_per_minute=100000, tokens_per_minute=100000000)
+    service = QueryService(pipeline)
+    rng = random.Random(0)
+    for i in range(20):
+        service.ingest_text(synthetic_document(i, rng), f"corpus-{i}.txt")
+
+    faults = stand_in_faults(pipeline)
+    for component, settings in DRILL_SCENARIOS[scenario].items():
+        for key, value in settings.items():
+            setattr(faults[component], key, value)
+
+    histogram = LatencyHistogram(window_size=queries)
+    errors = degraded = 0
+    questions = SAMPLE_QUESTIONS + EXTRA_QUESTIONS
+    for i in range(queries):
+        start = time.perf_counter()
+        try:
+            response = pipeline.answer(questions[i % len(questions)], session_id="drill")
+            if response['result'].get('degraded') or response['result'].get('error'):
+                degraded += 1
+        except Exception:
+            errors += 1
+        histogram.observe(time.perf_counter() - start)
+    summary = histogram.summary()
+    return {
+        'scenario': scenario,
+        'resilience': enabled,
+        'p50': round(summary['p50'], 3),
+        'p95': round(summary['p95'], 3),
+        'max': round(summary['max'], 3),
+        'errors': errors,
+        'degraded': degraded,
+        'services': resilience.stats()['services']
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Resilience layer tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    drill = subparsers.add_parser('drill', help="Run fault scenarios against local stand-ins")
+    drill.add_argument("--scenarios", default=",".join(DRILL_SCENARIOS), help="Comma-separated scenario names")
+    drill.add_argument("--queries", type=int, default=40, help="Queries per scenario")
+    drill.add_argument("--compare", action="store_true", help="Also run every scenario with the layer disabled")
+    drill.add_argument("--index-latency", type=float, default=0.03)
+    drill.add_argument("--rerank-latency", type=float, default=0.08)
+    drill.add_argument("--llm-latency", type=float, default=0.2)
+    drill.add_argument("--deadline-factor", type=float, default=5.0,
+                       help="Deadline per service as a multiple of its simulated latency")
+    drill.add_argument("--reset-seconds", type=float, default=1.0, help="Breaker open time before a probe")
+    drill.add_argument("-o", "--output", help="Write results as JSON")
+    args = parser.parse_args(argv)
+
+    latencies = {'encode': 0.005, 'index': args.index_latency, 'rerank': args.rerank_latency, 'llm': args.llm_latency}
+    deadlines = {name: latencies[name] * args.deadline_factor for name in ('index', 'rerank', 'llm')}
+    results = []
+    for scenario in [name.strip() for name in args.scenarios.split(',') if name.strip()]:
+        if scenario not in DRILL_SCENARIOS:
+            print(f"Unknown scenario '{scenario}' (choose from {', '.join(DRILL_SCENARIOS)})", file=sys.stderr)
+            return 2
+        for enabled in ([True, False] if args.compare else [True]):
+            result = run_drill(scenario, args.queries, enabled, latencies, deadlines, args.reset_seconds)
+            results.append(result)
+            services = result['services']
+            detail = "  ".join(
+                f"{name}: {stats['state']} fallbacks {stats['fallbacks']} hedged {stats['hedged']}/{stats['hedge_wins']} won"
+                for name, stats in services.items() if stats['failures'] or stats['hedged'] or stats['fallbacks']
+            )
+            print(f"{scenario:<14} {'on ' if enabled else 'off'}  p50 {result['p50']:.3f}s  p95 {result['p95']:.3f}s  "
+                  f"max {result['max']:.3f}s  errors {result['errors']}  degraded {result['degraded']}  {detail}")
+    resilience.configure()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    # Run the imported module's main so the drill configures the registry the pipeline uses
+    from resilience import main as module_main
+    sys.exit(module_main())
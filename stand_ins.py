@@ -0,0 +1,213 @@
+"""
+Local stand-ins for the embedding model, Pinecone, Cohere and Groq
+
+These let the pipeline, the HTTP service and the tooling run without API keys
+or model downloads, with configurable artificial latency.
+"""
+import hashlib
+import random
+import re
+import time
+import numpy as np
+from types import SimpleNamespace
+from typing import List, Dict, Any, Union
+from chunk_store import ChunkStore
+from config import TOP_K_RERANK, DEDUP_ENABLED
+from dedup import ChunkDeduplicator
+from local_index import LocalIndex
+from llm_scheduler import LLMScheduler
+from llm_service import LLMService
+from reranker import FallbackReranker
+from vector_store import VectorStore
+from warmup import QueryEmbeddingCache
+from index_stats import IndexStatsCache
+from memory_monitor import MemoryBudget
+
+
+class InjectedFault(ConnectionError):
+    """Failure raised by a stand-in to imitate an unreachable remote service"""
+
+
+class SimulatedLatency:
+    """Sleeps for `mean` seconds ± `jitter` to imitate a remote call, optionally failing or stalling"""
+
+    def __init__(self, mean: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_seconds: float = 0.0):
+        self.mean = mean
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+
+    def wait(self) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            raise InjectedFault("Simulated service failure")
+        delay = self.mean + random.uniform(-self.jitter, self.jitter) if self.jitter else self.mean
+        if self.stall_rate and random.random() < self.stall_rate:
+            delay += self.stall_seconds
+        if delay > 0:
+            time.sleep(delay)
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder with the SentenceTransformer encode() interface"""
+
+    def __init__(self, dimension: int = 384, latency: SimulatedLatency = None):
+        self.dimension = dimension
+        self.latency = latency or SimulatedLatency()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r'\w+', text.lower()):
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        self.latency.wait()
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        if not sentences:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.vstack([self._embed(sentence) for sentence in sentences])
+
+
+class StandInIndex(LocalIndex):
+    """In-memory LocalIndex that adds simulated network latency to every call"""
+
+    def __init__(self, dimension: int, latency: SimulatedLatency = None):
+        super().__init__(dimension)
+        self.latency = latency or SimulatedLatency()
+
+    def upsert(self, *args, **kwargs):
+        self.latency.wait()
+        return super().upsert(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        self.latency.wait()
+        return super().query(*args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        self.latency.wait()
+        return super().fetch(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.latency.wait()
+        return super().delete(*args, **kwargs)
+
+    def describe_index_stats(self, *args, **kwargs):
+        self.latency.wait()
+        return super().describe_index_stats(*args, **kwargs)
+
+
+class StandInVectorStore(VectorStore):
+    """VectorStore backed by the hashing embedder, an in-memory index and chunk store"""
+
+    def __init__(self, dimension: int = 384, encode_latency: float = 0.0, index_latency: float = 0.0,
+                 chunk_store_path: str = ":memory:"):
+        self.backend = 'local'
+        self.pc = None
+        self.index_name = 'stand-in'
+        self.embedding_model = HashingEmbedder(dimension, SimulatedLatency(encode_latency))
+        self.embedding_pool = None
+        self.query_cache = QueryEmbeddingCache()
+        self.index_stats = IndexStatsCache(self._fetch_index_stats)
+        self.full_dimension = dimension
+        self.projection = None
+        self.chunk_store = ChunkStore(chunk_store_path)
+        self.deduplicator = ChunkDeduplicator(":memory:") if DEDUP_ENABLED else None
+        self.memory_budget = MemoryBudget()
+        self.fallback_index = None
+        self.index = StandInIndex(dimension, SimulatedLatency(index_latency))
+
+
+class StandInReranker(FallbackReranker):
+    """Lexical-overlap reranker with simulated API latency"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = SimulatedLatency(latency)
+
+    def rerank_documents(self, query: str, documents: List[Dict[str, Any]], top_k: int = None,
+                         strict: bool = False) -> List[Dict[str, Any]]:
+        try:
+            self.latency.wait()
+        except InjectedFault:
+            # Same contract as RerankerService: original order unless the caller wants the error
+            if strict:
+                raise
+            return documents[:top_k] if top_k else documents
+        terms = set(re.findall(r'\w+', query.lower()))
+        scored = []
+        for index, doc in enumerate(documents):
+            words = set(re.findall(r'\w+', (doc.get('text') or '').lower()))
+            overlap = len(terms & words) / len(terms) if terms else 0.0
+            reranked = doc.copy()
+            reranked['rerank_score'] = 0.5 * overlap + 0.5 * doc.get('score', 0)
+            reranked['original_rank'] = index
+            scored.append(reranked)
+        scored.sort(key=lambda d: d['rerank_score'], reverse=True)
+        return scored[:top_k if top_k is not None else TOP_K_RERANK]
+
+
+class _StandInCompletions:
+    """Imitates groq.Client().chat.completions by quoting the first sentence of each context chunk"""
+
+    def __init__(self, latency: SimulatedLatency):
+        self.latency = latency
+
+    def create(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 0, **kwargs):
+        self.latency.wait()
+        prompt = messages[-1]['content']
+        sentences = []
+        for number, text in re.findall(r'^\[(\d+)\] (.+)$', prompt, flags=re.MULTILINE)[:2]:
+            first_sentence = re.split(r'(?<=[.!?])\s+', text.strip())[0]
+            sentences.append(f"{first_sentence} [{number}]")
+        answer = " ".join(sentences) or "The context does not contain enough information to answer."
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(answer) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+
+class StandInLLMService(LLMService):
+    """LLMService whose Groq client is replaced by a local extractive responder"""
+
+    def __init__(self, latency: float = 0.0):
+        completions = _StandInCompletions(SimulatedLatency(latency))
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        self.scheduler = LLMScheduler()
+
+
+def create_stand_in_pipeline(encode_latency: float = 0.0, index_latency: float = 0.0,
+                             rerank_latency: float = 0.0, llm_latency: float = 0.0):
+    """Build a RAGPipeline wired entirely to local stand-ins"""
+    from rag_pipeline import RAGPipeline, create_candidate_selector, create_diversifier, create_fast_path
+    return RAGPipeline(
+        StandInVectorStore(encode_latency=encode_latency, index_latency=index_latency),
+        StandInReranker(rerank_latency),
+        StandInLLMService(llm_latency),
+        create_candidate_selector(),
+        create_diversifier(),
+        create_fast_path()
+    )
+
+
+def stand_in_faults(pipeline) -> Dict[str, SimulatedLatency]:
+    """The latency (and fault) settings of a stand-in pipeline's remote services, by service name"""
+    return {
+        'encode': pipeline.vector_store.embedding_model.latency,
+        'index': pipeline.vector_store.index.latency,
+        'rerank': pipeline.reranker.latency,
+        'llm': pipeline.llm_service.client.chat.completions.latency
+    }
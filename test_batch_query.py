@@ -0,0 +1,73 @@
+"""
+Tests for batch question answering with the stand-in pipeline
+"""
+import json
+from batch_query import BatchQueryRunner, load_queries
+
+
+def write_queries(path, queries):
+    path.write_text("".join(json.dumps(item) + "\n" for item in queries))
+    return load_queries(str(path))
+
+
+def test_batch_answers_match_the_interactive_pipeline(tmp_path, seeded_pipeline):
+    pipeline = seeded_pipeline
+    queries = write_queries(tmp_path / "queries.jsonl", [
+        {'query': "how does chunking affect latency?", 'top_k_rerank': 2},
+        {'id': 'cache', 'query': "why cache embeddings?"}
+    ])
+    output = tmp_path / "results.jsonl"
+
+    summary = BatchQueryRunner(pipeline, retrieval_workers=2).run(queries, str(output))
+
+    assert summary['ok'] == 2 and summary['error'] == 0
+    records = {record['id']: record for record in map(json.loads, output.read_text().splitlines())}
+    expected = pipeline.answer("how does chunking affect latency?", top_k_rerank=2)
+    assert records['1']['reranked_ids'] == [doc['id'] for doc in expected['docs']]
+    assert records['1']['answer'] == expected['result']['answer']
+    assert {'encode', 'retrieval', 'total'} <= set(records['cache']['timings'])
+
+
+def test_resumed_batch_skips_answered_queries(tmp_path, seeded_pipeline):
+    pipeline = seeded_pipeline
+    queries = write_queries(tmp_path / "queries.jsonl", [{'query': "what do rerankers do?"}])
+    output = str(tmp_path / "results.jsonl")
+    runner = BatchQueryRunner(pipeline)
+    runner.run(queries, output)
+    assert runner.run(queries, output)['skipped'] == 1
+
+
+def test_batch_budget_caps_only_the_batch_session(tmp_path, seeded_pipeline):
+    scheduler = seeded_pipeline.llm_service.scheduler
+    budgets = dict(scheduler._budgets)
+    capped = []
+    acquire = scheduler.acquire
+
+    def spy(session_id, *args, **kwargs):
+        capped.append(session_id in scheduler.metrics()['session_budgets'])
+        return acquire(session_id, *args, **kwargs)
+
+    scheduler.acquire = spy
+    queries = write_queries(tmp_path / "queries.jsonl", [{'query': "what do rerankers do?"}])
+    runner = BatchQueryRunner(seeded_pipeline, requests_per_minute=5, tokens_per_minute=50000)
+    assert runner.run(queries, str(tmp_path / "results.jsonl"))['ok'] == 1
+    assert capped == [True]
+    # The shared model budgets are untouched and the cap is gone once the batch ends
+    assert scheduler._budgets == budgets
+    assert scheduler.metrics()['session_budgets'] == {}
+
+
+def test_degraded_answers_are_recorded_and_retried(tmp_path, seeded_pipeline, monkeypatch):
+    def queue_timeout(*args, **kwargs):
+        raise TimeoutError("LLM queue: no capacity within 60.0s (1 calls waiting)")
+
+    queries = write_queries(tmp_path / "queries.jsonl", [{'query': "what do rerankers do?"}])
+    output = tmp_path / "results.jsonl"
+    with monkeypatch.context() as patch:
+        patch.setattr(seeded_pipeline.llm_service.scheduler, 'acquire', queue_timeout)
+        summary = BatchQueryRunner(seeded_pipeline).run(queries, str(output))
+    assert (summary['ok'], summary['degraded'], summary['error']) == (0, 1, 0)
+    [record] = map(json.loads, output.read_text().splitlines())
+    assert record['status'] == 'degraded' and "no capacity" in record['error']
+
+    assert BatchQueryRunner(seeded_pipeline).run(queries, str(output))['ok'] == 1
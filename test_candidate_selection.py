@@ -0,0 +1,97 @@
+"""
+Tests for adaptive candidate depth and MMR diversity selection
+"""
+import numpy as np
+from candidate_selection import AdaptiveDepthSelector, MMRSelector
+
+
+def scored(scores):
+    return [{'id': f"d{i}", 'score': score} for i, score in enumerate(scores)]
+
+
+def test_gap_after_the_leaders_shrinks_the_rerank_set():
+    selector = AdaptiveDepthSelector(min_candidates=2, max_candidates=10)
+    docs, selection = selector.select(scored([0.9, 0.88, 0.86, 0.3, 0.29, 0.28, 0.27]), baseline_k=7)
+    assert [doc['id'] for doc in docs] == ['d0', 'd1', 'd2']
+    assert selection['rule'] == 'gap'
+
+
+def test_rerank_top_k_is_a_lower_bound():
+    selector = AdaptiveDepthSelector(min_candidates=2, max_candidates=10)
+    docs, _ = selector.select(scored([0.9, 0.88, 0.3, 0.29, 0.28, 0.27]), baseline_k=6, min_k=4)
+    assert len(docs) == 4
+
+
+def test_mmr_drops_near_duplicates_and_stays_quiet(capsys):
+    base = np.eye(4)
+    docs = [
+        {'id': 'a', 'score': 0.9, 'text': "x" * 10, 'values': base[0].tolist()},
+        {'id': 'a-copy', 'score': 0.89, 'text': "x" * 10, 'values': (base[0] + 0.01 * base[1]).tolist()},
+        {'id': 'b', 'score': 0.8, 'text': "y" * 10, 'values': base[1].tolist()},
+        {'id': 'c', 'score': 0.7, 'text': "z" * 10, 'values': base[2].tolist()}
+    ]
+    kept, report = MMRSelector(lambda_mult=0.5, max_candidates=3).select(docs, context_size=2)
+    assert [doc['id'] for doc in kept] == ['a', 'b', 'c']
+    assert report['near_duplicates_dropped'] == 1
+    assert report['redundant_context_chars_avoided'] == 10
+    # Before texts are loaded the index's chunk_size metadata is counted instead
+    unloaded = [dict(doc, text=None, chunk_size=25) for doc in docs]
+    assert MMRSelector(lambda_mult=0.5, max_candidates=3).select(unloaded, context_size=2)[1]['rerank_chars_in'] == 100
+    assert capsys.readouterr().out == ""
+
+
+def test_default_pipeline_retrieves_exactly_the_requested_top_k(seeded_pipeline):
+    assert seeded_pipeline.candidate_selector is None and seeded_pipeline.diversifier is None
+    response = seeded_pipeline.answer("what is tracing?", top_k_retrieval=7, top_k_rerank=3)
+    assert response['retrieved'] == response['candidates'] == 7
+
+
+def naive_mmr(relevance, similarity, k, lambda_mult):
+    chosen = []
+    while len(chosen) < min(k, len(relevance)):
+        def marginal(i):
+            if not chosen:
+                return relevance[i]
+            return lambda_mult * relevance[i] - (1 - lambda_mult) * max(similarity[i][j] for j in chosen)
+        chosen.append(max((i for i in range(len(relevance)) if i not in chosen), key=marginal))
+    return chosen
+
+
+def test_vectorized_mmr_matches_the_textbook_greedy_loop():
+    rng = np.random.default_rng(0)
+    for trial in range(50):
+        vectors = rng.normal(size=(15, 6))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarity = vectors @ vectors.T
+        relevance = rng.uniform(0, 1, size=15)
+        lambda_mult = trial / 49
+        assert MMRSelector(lambda_mult=lambda_mult).order(relevance, similarity, 6) == \
+            naive_mmr(relevance, similarity, 6, lambda_mult)
+
+
+def test_mmr_with_lambda_one_keeps_the_dense_top_k():
+    rng = np.random.default_rng(1)
+    docs = [{'id': f"d{i}", 'score': 1 - i / 10, 'values': rng.normal(size=4).tolist()} for i in range(8)]
+    kept, report = MMRSelector(lambda_mult=1.0, max_candidates=5).select(docs, context_size=3)
+    assert [doc['id'] for doc in kept] == [f"d{i}" for i in range(5)]
+    assert report['redundant_context_chars_avoided'] == 0
+    # Without embeddings there is nothing to diversify on
+    unembedded = [dict(doc, values=None) for doc in docs]
+    assert MMRSelector(max_candidates=5).select(unembedded, context_size=3) == (unembedded, None)
+
+
+def test_pipeline_diversifies_with_index_vectors(seeded_pipeline):
+    seeded_pipeline.diversifier = MMRSelector(lambda_mult=0.5, max_candidates=4)
+    chunk_store = seeded_pipeline.vector_store.chunk_store
+    fetched = {}
+    get_texts = chunk_store.get_texts
+    chunk_store.get_texts = lambda ids: fetched.update(get_texts(ids)) or get_texts(ids)
+
+    response = seeded_pipeline.answer("what is tracing?", top_k_retrieval=10, top_k_rerank=3)
+    assert response['retrieved'] == 10
+    assert response['candidates'] == response['diversity']['candidates_out'] == 4
+    assert seeded_pipeline.diversifier.stats()['queries'] == 1
+    # Only the diversified candidates' texts are loaded, and the char counts match them
+    assert len(fetched) == 4 and {doc['id'] for doc in response['docs']} <= set(fetched)
+    assert response['diversity']['rerank_chars_out'] == sum(map(len, fetched.values()))
+    assert response['diversity']['rerank_chars_in'] > response['diversity']['rerank_chars_out']
@@ -0,0 +1,61 @@
+"""
+Tests for the columnar chunk batch and its list-of-dicts compatibility view
+"""
+import numpy as np
+import pytest
+from chunk_batch import ChunkBatch, StringTable
+from document_processor import DocumentProcessor
+
+
+def legacy_chunks():
+    return [
+        {'text': f"chunk number {i}", 'metadata': {
+            'source': "a.txt" if i < 3 else "b.txt", 'title': "Title", 'section': f"S{i % 2}",
+            'position': i * 100, 'chunk_index': i, 'chunk_size': len(f"chunk number {i}")
+        }}
+        for i in range(5)
+    ]
+
+
+def test_from_dicts_round_trips_the_legacy_format():
+    chunks = legacy_chunks()
+    batch = ChunkBatch.from_dicts(chunks)
+    assert batch.to_dicts() == chunks
+    assert batch[-1] == chunks[-1]
+    assert (len(batch.sources), len(batch.titles), len(batch.sections)) == (2, 1, 2)
+
+
+def test_slices_and_takes_share_the_buffer_and_carry_embeddings():
+    batch = ChunkBatch.from_dicts(legacy_chunks())
+    batch.embeddings = np.arange(10, dtype=np.float32).reshape(5, 2)
+
+    window = batch[1:3]
+    assert window.buffer is batch.buffer and window.sources is batch.sources
+    assert window.texts() == ["chunk number 1", "chunk number 2"]
+    assert window.embeddings.tolist() == [[2, 3], [4, 5]]
+
+    picked = batch.take([4, 0])
+    assert [item['metadata']['chunk_index'] for item in picked] == [4, 0]
+    assert picked.embeddings.tolist() == [[8, 9], [0, 1]]
+    with pytest.raises(ValueError):
+        batch[::2]
+
+
+def test_string_table_interns_values():
+    table = StringTable(["a", "b", "a"])
+    assert len(table) == 2
+    assert table.code("b") == 1 and table.code("c") == 2
+    assert table[2] == "c"
+
+
+def test_document_chunks_are_slices_of_the_cleaned_text():
+    text = "Heading\n\n" + " ".join(f"Sentence {i} talks about topic {i % 7}." for i in range(200))
+    batch = DocumentProcessor(unit='chars').chunk_text(text, "doc.txt", "Doc")
+    assert len(batch) > 2
+    assert sum(len(item['text']) for item in batch) > len(batch.buffer)  # overlaps are not copied
+    for i, item in enumerate(batch):
+        assert item['text'] == batch.buffer[batch.offsets[i]:batch.offsets[i] + batch.lengths[i]]
+        assert item['text'] == item['text'].strip()
+        assert item['metadata']['chunk_index'] == i
+        assert item['metadata']['chunk_size'] == len(item['text'])
+    assert batch.nbytes() >= len(batch.buffer)
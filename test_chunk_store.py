@@ -0,0 +1,80 @@
+"""
+Tests for the SQLite chunk text store
+"""
+import pytest
+from chunk_store import ChunkStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks.sqlite3"))
+    yield store
+    store.close()
+
+
+def records(count: int, source: str = "a.txt", start: int = 0, text: str = "chunk {i}"):
+    return [{'id': f"{source}-{i}", 'source': source, 'text': text.format(i=i)} for i in range(start, start + count)]
+
+
+def test_lookups_span_more_ids_than_one_statement_allows(store, monkeypatch):
+    monkeypatch.setattr(ChunkStore, 'LOOKUP_BATCH_SIZE', 7)
+    store.put_many(records(20))
+    ids = [f"a.txt-{i}" for i in range(20)] + ["missing"]
+
+    texts = store.get_texts(ids)
+    assert len(texts) == 20
+    assert texts["a.txt-13"] == "chunk 13"
+    store.delete_many(ids[:15])
+    assert store.list_ids() == ids[15:20]
+
+
+def test_put_many_replaces_existing_ids(store):
+    store.put_many(records(3))
+    store.put_many([{'id': "a.txt-1", 'source': "a.txt", 'text': "rewritten"}])
+    assert store.count() == 3
+    assert store.get_texts(["a.txt-1"]) == {"a.txt-1": "rewritten"}
+
+
+def inventory_by_source(store):
+    return {row['source']: (row['chunks'], row['bytes']) for row in store.inventory()}
+
+
+def test_inventory_follows_inserts_replaces_and_deletes(store):
+    store.put_many(records(3, text="é{i}"))
+    store.put_many(records(2, source="b.txt"))
+    assert inventory_by_source(store) == {"a.txt": (3, 9), "b.txt": (2, 14)}
+
+    # A replace moves the row's bytes, and a source change moves the row itself
+    store.put_many([{'id': "a.txt-0", 'source': "a.txt", 'text': "longer text"},
+                    {'id': "a.txt-1", 'source': "b.txt", 'text': "moved"}])
+    assert inventory_by_source(store) == {"a.txt": (2, 14), "b.txt": (3, 19)}
+
+    store.delete_many(["a.txt-0", "a.txt-2"])
+    assert inventory_by_source(store) == {"b.txt": (3, 19)}
+    store.clear()
+    assert store.inventory() == []
+
+
+def test_inventory_matches_a_full_scan(store):
+    for source in ("a.txt", "b.txt", "c.txt"):
+        store.put_many(records(5, source=source, text="text number {i}"))
+    store.delete_many(["b.txt-1", "c.txt-4"])
+    for row in store.inventory():
+        texts = [text for source, text in store.iter_texts() if source == row['source']]
+        assert row['chunks'] == len(texts) == store.count(row['source'])
+        assert row['bytes'] == sum(len(text.encode()) for text in texts)
+        assert row['first_ingested'] <= row['last_ingested']
+
+
+def test_inventory_is_backfilled_for_stores_that_predate_it(tmp_path):
+    path = str(tmp_path / "chunks.sqlite3")
+    store = ChunkStore(path)
+    store.put_many(records(4))
+    store._conn.executescript(
+        "DROP TRIGGER chunks_inventory_insert; DROP TRIGGER chunks_inventory_delete; DROP TABLE source_inventory;"
+    )
+    store.close()
+
+    reopened = ChunkStore(path)
+    assert inventory_by_source(reopened) == {"a.txt": (4, 28)}
+    reopened.close()
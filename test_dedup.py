@@ -0,0 +1,97 @@
+"""
+Tests for SimHash near-duplicate detection and its banded signature index
+"""
+import random
+import pytest
+from dedup import ChunkDeduplicator
+
+TEXT = "the quarterly report covers revenue growth across all regions and the outlook for next year"
+
+
+@pytest.fixture
+def dedup(tmp_path):
+    dedup = ChunkDeduplicator(str(tmp_path / "signatures.sqlite3"), max_distance=3, min_tokens=4)
+    yield dedup
+    dedup.close()
+
+
+def flip_bits(signature: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        signature ^= 1 << bit
+    return signature
+
+
+def with_hex_signatures(dedup):
+    """Use the text itself as the signature so distances are exact"""
+    dedup.signature = lambda text: int(text, 16)
+    return dedup
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 6, 10])
+def test_bands_cover_every_bit_once(tmp_path, max_distance):
+    dedup = ChunkDeduplicator(str(tmp_path / "s.sqlite3"), max_distance=max_distance)
+    assert len(dedup.band_values(0)) == max_distance + 1
+    assert sum(width for _, width in dedup._bands) == 64
+    assert dedup.band_values((1 << 64) - 1) == [(1 << width) - 1 for _, width in dedup._bands]
+    dedup.close()
+
+
+def test_signatures_within_the_distance_share_a_band(dedup):
+    rng = random.Random(0)
+    for _ in range(500):
+        signature = rng.getrandbits(64)
+        near = flip_bits(signature, rng.randint(0, dedup.max_distance), rng)
+        shared = [a == b for a, b in zip(dedup.band_values(signature), dedup.band_values(near))]
+        assert any(shared)
+
+
+def test_plan_aliases_indexed_and_in_batch_near_duplicates(dedup):
+    with_hex_signatures(dedup)
+    rng = random.Random(1)
+    base = rng.getrandbits(64)
+    indexed = dedup.plan([f"{base:x}"], ["a"])
+    dedup.record(indexed, ["a"], [{'source': "a.txt"}])
+
+    batch = [f"{flip_bits(base, 3, rng):x}", f"{flip_bits(base, 4, rng):x}", f"{rng.getrandbits(64):x}"]
+    batch.append(f"{flip_bits(int(batch[2], 16), 1, rng):x}")
+    plan = dedup.plan(batch, ["b", "c", "d", "e"])
+    assert plan.keep.tolist() == [False, True, True, False]
+    assert plan.canonical == {0: "a", 3: "d"}
+    assert plan.distances == {0: 3, 3: 1}
+
+
+def test_reupserting_a_chunk_is_not_a_duplicate_of_itself(dedup):
+    plan = dedup.plan([TEXT], ["a"])
+    dedup.record(plan, ["a"], [{'source': "a.txt"}])
+    assert dedup.plan([TEXT], ["a"]).keep.tolist() == [True]
+    assert dedup.plan([TEXT], ["b"]).canonical == {0: "a"}
+
+
+def test_short_chunks_are_never_deduplicated(dedup):
+    plan = dedup.plan(["too short", "too short"], ["a", "b"])
+    assert plan.signatures == [None, None]
+    assert plan.keep.tolist() == [True, True]
+
+
+def test_aliases_are_recorded_and_forgotten_with_their_canonical(dedup):
+    ids = ["a", "b", "c"]
+    metadata = [{'source': f"{name}.txt", 'title': name.upper(), 'position': 0} for name in ids]
+    plan = dedup.plan([TEXT, TEXT.upper(), TEXT + "!"], ids)
+    dedup.record(plan, ids, metadata)
+
+    assert dedup.stats() == {'signatures': 1, 'aliases': 2}
+    assert sorted(alias['source'] for alias in dedup.aliases_for(["a"])["a"]) == ["b.txt", "c.txt"]
+    assert dedup.forget(["a"]) == 2
+    assert dedup.stats() == {'signatures': 0, 'aliases': 0}
+
+
+
+def test_deleting_one_document_keeps_an_identical_one_by_default():
+    from stand_ins import StandInVectorStore
+    store = StandInVectorStore(dimension=16)
+    assert store.deduplicator is None
+    for source in ("a.txt", "b.txt"):
+        store.upsert_documents([{'text': TEXT, 'metadata': {'source': source}}], [source])
+    store.delete_documents(["a.txt"])
+    [match] = store.query_similar_documents(TEXT, top_k=5, filters={'source': "b.txt"})
+    assert (match['id'], match['text']) == ("b.txt", TEXT)
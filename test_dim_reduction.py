@@ -0,0 +1,75 @@
+"""
+Tests for reduced-dimension projections and full-vector rescoring
+"""
+import numpy as np
+import pytest
+from document_processor import DocumentProcessor
+from dim_reduction import PCAProjection, TruncationProjection, create_projection, rescore
+from local_index import LocalIndex
+from stand_ins import StandInVectorStore
+
+
+def low_rank_embeddings(count: int = 200, full: int = 32, rank: int = 6, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(count, rank)) @ rng.normal(size=(rank, full))).astype(np.float32)
+
+
+def test_pca_keeps_the_geometry_of_low_rank_embeddings():
+    embeddings = low_rank_embeddings()
+    projection = PCAProjection.fit(embeddings[:150], 8)
+    assert projection.explained_variance > 0.999
+
+    query, corpus = embeddings[150], embeddings[151:]
+    full = corpus @ query / np.linalg.norm(corpus, axis=1) / np.linalg.norm(query)
+    reduced = projection.project(corpus) @ projection.project(query)
+    assert np.argmax(reduced) == np.argmax(full)
+    assert np.allclose(np.linalg.norm(projection.project(corpus), axis=1), 1.0, atol=1e-5)
+
+
+def test_pca_save_and_load(tmp_path):
+    projection = PCAProjection.fit(low_rank_embeddings(), 8)
+    path = str(tmp_path / "pca.npz")
+    projection.save(path)
+    loaded = create_projection(32, 'pca', 8, path)
+    assert np.array_equal(loaded.components, projection.components)
+    assert loaded.describe()['explained_variance'] == round(projection.explained_variance, 4)
+    with pytest.raises(ValueError, match="maps 32 -> 8"):
+        create_projection(32, 'pca', 16, path)
+
+
+def test_create_projection_validates_its_settings(tmp_path):
+    assert create_projection(32, 'none') is None
+    assert isinstance(create_projection(32, 'truncate', 8), TruncationProjection)
+    with pytest.raises(ValueError, match="migrate"):
+        create_projection(32, 'pca', 8, str(tmp_path / "missing.npz"))
+    with pytest.raises(ValueError):
+        create_projection(32, 'truncate', 64)
+    with pytest.raises(ValueError, match="Unknown"):
+        create_projection(32, 'random')
+    with pytest.raises(ValueError, match="at least 8"):
+        PCAProjection.fit(low_rank_embeddings(count=4), 8)
+
+
+def test_rescore_orders_by_full_vectors_and_keeps_reduced_scores():
+    docs = [{'id': 'a', 'score': 0.9}, {'id': 'b', 'score': 0.8}, {'id': 'c', 'score': 0.7}]
+    embeddings = {'a': np.array([0.0, 1.0], dtype=np.float32), 'b': np.array([2.0, 0.0], dtype=np.float32)}
+    result = rescore(docs, [1.0, 0.0], embeddings, top_k=2)
+    assert [doc['id'] for doc in result] == ['b', 'c']
+    assert result[0]['score'] == pytest.approx(1.0)
+    assert result[0]['reduced_score'] == 0.8
+    assert result[1]['score'] == result[1]['reduced_score'] == 0.7
+
+
+def test_reduced_store_rescores_its_shortlist():
+    store = StandInVectorStore(dimension=32)
+    store.projection = TruncationProjection(32, 8)
+    store.index = LocalIndex(8)
+    texts = [f"Topic {i} covers {word} in detail." for i, word in enumerate(["caching", "indexing", "ranking"])]
+    chunks = DocumentProcessor().chunk_text(" ".join(texts), "a.txt", "A")
+    store.upsert_documents(chunks, ["a0"])
+
+    assert store.index.describe_index_stats()['dimension'] == 8
+    assert len(store.chunk_store.get_embeddings(["a0"])["a0"]) == 32
+    [match] = store.query_similar_documents("caching in detail", top_k=1)
+    assert match['id'] == "a0"
+    assert 'reduced_score' in match
@@ -0,0 +1,76 @@
+"""
+Tests for upload parsing: in-memory, spooled and memory-mapped views and incremental decoding
+"""
+import io
+import mmap
+import tempfile
+import document_processor
+from document_processor import DocumentProcessor
+
+TEXT = "Résumé Guide\n\nThe café opens at nine. Naïve questions are welcome! " * 40
+
+
+class Upload(io.BytesIO):
+    """In-memory upload with a file name, like Streamlit's UploadedFile"""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+class Stream:
+    """Non-seekable upload that can only be read"""
+
+    def __init__(self, data: bytes, name: str = "stream.txt"):
+        self._data = io.BytesIO(data)
+        self.name = name
+
+    def read(self, *args) -> bytes:
+        return self._data.read(*args)
+
+
+def test_in_memory_uploads_are_parsed_in_place():
+    upload = Upload(b"data", "a.pdf")
+    with DocumentProcessor()._open_for_parsing(upload) as stream:
+        assert stream is upload
+
+
+def test_small_streams_are_spooled_in_memory_and_large_ones_mapped(monkeypatch, tmp_path):
+    monkeypatch.setattr(document_processor, 'UPLOAD_SPOOL_THRESHOLD', 64)
+    monkeypatch.setattr(document_processor, 'spool_dir', lambda: str(tmp_path))
+    processor = DocumentProcessor()
+
+    with processor._open_for_parsing(Stream(b"x" * 64)) as stream:
+        assert isinstance(stream, tempfile.SpooledTemporaryFile) and not stream._rolled
+        assert stream.read() == b"x" * 64
+    with processor._open_for_parsing(Stream(b"y" * 1000)) as stream:
+        assert isinstance(stream, mmap.mmap)
+        assert stream[:] == b"y" * 1000
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_file_uploads_are_memory_mapped(tmp_path):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(b"%PDF-1.4 body")
+    with open(path, 'rb') as f, DocumentProcessor()._open_for_parsing(f) as stream:
+        assert isinstance(stream, mmap.mmap)
+        assert stream[:4] == b"%PDF"
+    empty = tmp_path / "empty.pdf"
+    empty.write_bytes(b"")
+    with open(empty, 'rb') as f, DocumentProcessor()._open_for_parsing(f) as stream:
+        assert stream.read() == b""
+
+
+def test_text_blocks_split_inside_multibyte_characters_decode_intact(monkeypatch):
+    monkeypatch.setattr(document_processor, 'UPLOAD_READ_CHUNK', 3)
+    processor = DocumentProcessor()
+    assert processor.extract_text_from_txt(Upload(TEXT.encode('utf-8'), "guide.txt")) == TEXT
+
+
+def test_uploaded_text_chunks_like_the_same_text_in_memory(monkeypatch):
+    monkeypatch.setattr(document_processor, 'UPLOAD_READ_CHUNK', 7)
+    processor = DocumentProcessor(unit='chars')
+    uploaded = processor.process_uploaded_file(Upload(TEXT.encode('utf-8'), "guide.txt"))
+    # The title comes from the raw head of the upload (chunk_text derives it from the cleaned text)
+    assert uploaded[0]['metadata']['title'] == "Résumé Guide"
+    assert uploaded.to_dicts() == processor.chunk_text(TEXT, "guide.txt", "Résumé Guide").to_dicts()
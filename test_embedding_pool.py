@@ -0,0 +1,39 @@
+"""
+Tests for the multi-process embedding pool, using the stand-in hashing embedder in the workers
+"""
+import numpy as np
+import pytest
+from embedding_pool import STAND_IN_MODEL, EmbeddingPool
+from stand_ins import HashingEmbedder
+
+TEXTS = [f"chunk {i} about topic {i % 5} and detail {i * 7}" for i in range(23)]
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with EmbeddingPool(workers=2, model_name=STAND_IN_MODEL, shard_size=4) as pool:
+        yield pool
+
+
+def test_shards_cover_every_row_once():
+    pool = EmbeddingPool.__new__(EmbeddingPool)
+    pool.workers, pool.shard_size = 2, 4
+    for count in (1, 2, 7, 23, 64):
+        shards = pool._shards(count)
+        assert shards[0][0] == 0 and shards[-1][1] == count
+        assert all(stop == start for (_, stop), (start, _) in zip(shards, shards[1:]))
+        assert len(shards) >= min(count, 2)
+
+
+def test_pool_output_matches_in_process_encoding(pool):
+    expected = HashingEmbedder().encode(TEXTS)
+    result = pool.encode(TEXTS, batch_size=3)
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected)
+    assert np.allclose(pool.encode(TEXTS[5]), expected[5])
+    assert pool.encode([]).shape == (0, pool.get_sentence_embedding_dimension())
+
+
+def test_async_encoding_returns_the_same_matrix(pool):
+    future = pool.encode_async(TEXTS[:9])
+    assert np.allclose(future.result(timeout=60), pool.encode(TEXTS[:9]))
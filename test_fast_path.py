@@ -0,0 +1,66 @@
+"""
+Tests for confidence-based rerank skipping, extractive answers and threshold sweeps
+"""
+from fast_path import FastPathPolicy, sweep, token_f1
+
+
+def docs(*scores):
+    return [{'id': f"d{i}", 'score': score, 'text': f"text {i}"} for i, score in enumerate(scores)]
+
+
+def test_decide_needs_both_score_and_margin():
+    policy = FastPathPolicy(skip_rerank_score=0.7, skip_rerank_margin=0.1,
+                            extractive=True, extractive_score=0.9, extractive_margin=0.2)
+    assert not policy.decide(docs(0.8, 0.75))['skip_rerank']
+    assert not policy.decide(docs(0.6, 0.1))['skip_rerank']
+    decision = policy.decide(docs(0.8, 0.6))
+    assert decision['skip_rerank'] and not decision['extractive']
+    assert policy.decide(docs(0.95, 0.5))['extractive']
+    assert policy.decide(docs(0.95))['margin'] == 0.95
+    assert not policy.decide([])['skip_rerank']
+
+
+def test_extractive_mode_is_off_unless_enabled():
+    policy = FastPathPolicy(skip_rerank_score=0.0, skip_rerank_margin=0.0, extractive=False,
+                            extractive_score=0.0, extractive_margin=0.0)
+    assert not policy.decide(docs(0.99, 0.1))['extractive']
+
+
+def test_extract_span_quotes_the_best_matching_sentences():
+    policy = FastPathPolicy(max_span_chars=80)
+    text = ("The office opens at nine. Weekend parking is in the north lot. "
+            "The lot fills early on weekend mornings. The cafeteria closes early.")
+    assert policy.extract_span("where is the weekend parking lot", text) == \
+        "Weekend parking is in the north lot. The lot fills early on weekend mornings."
+    answer = policy.extractive_answer("cafeteria", {'text': text, 'source': "faq.txt", 'score': 0.9})
+    assert answer['answer'] == "The cafeteria closes early. [1]"
+    assert answer['citations'][0]['source'] == "faq.txt"
+    assert answer['model_used'] == 'extractive'
+
+
+def test_token_f1_ignores_citation_markers_and_stopwords():
+    assert token_f1("Parking is free [1].", "parking free") == 1.0
+    assert token_f1("nothing relevant", "parking free") == 0.0
+
+
+def test_pipeline_skips_rerank_on_a_decisive_match(seeded_pipeline):
+    seeded_pipeline.fast_path = FastPathPolicy(skip_rerank_score=-1.0, skip_rerank_margin=-1.0)
+    seeded_pipeline.reranker.rerank_documents = None
+    response = seeded_pipeline.answer("What does document 3 describe?", 10, 3)
+    assert response['fast_path']['skip_rerank']
+    assert 'reranking' not in response['timing_info']
+    assert len(response['docs']) == 3
+
+
+def test_sweep_recommends_the_biggest_saving_within_the_quality_budget():
+    records = [
+        {'top_score': 0.9, 'margin': 0.3, 'rerank_seconds': 0.2, 'full_hit': True, 'skip_hit': True},
+        {'top_score': 0.8, 'margin': 0.1, 'rerank_seconds': 0.2, 'full_hit': True, 'skip_hit': False},
+        {'top_score': 0.5, 'margin': 0.0, 'rerank_seconds': 0.2, 'full_hit': None, 'skip_hit': None},
+        {'empty': True}
+    ]
+    result = sweep(records, scores=[0.0, 0.7, 0.85], margins=[0.0, 0.2], extractive=False, max_quality_loss=0.0)
+    assert len(result['grid']) == 6
+    # Equal savings go to the stricter score threshold
+    assert (result['recommended']['score'], result['recommended']['margin']) == (0.85, 0.0)
+    assert result['recommended']['coverage'] == 1 / 3
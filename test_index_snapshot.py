@@ -0,0 +1,66 @@
+"""
+Tests for index snapshot export and import
+"""
+import numpy as np
+import pytest
+from dim_reduction import PCAProjection
+from document_processor import DocumentProcessor
+from index_snapshot import export_snapshot, import_snapshot, install_projection
+from local_index import LocalIndex
+from stand_ins import StandInVectorStore
+
+
+def test_round_trip_restores_vectors_metadata_and_texts_into_a_mapped_index(tmp_path, seeded_pipeline):
+    source = seeded_pipeline.vector_store
+    export_snapshot(source, str(tmp_path / "snapshot"), dtype='float16')
+
+    target = StandInVectorStore()
+    target.index = LocalIndex(target.index_dimension, str(tmp_path / "index"))
+    result = import_snapshot(target, str(tmp_path / "snapshot"))
+
+    ids, vectors, metadata = source.index.live_rows()
+    assert result['vectors'] == result['texts'] == len(ids)
+    assert isinstance(target.index._vectors, np.memmap)
+    restored = target.index.fetch(ids[:3])['vectors']
+    for i, vector_id in enumerate(ids[:3]):
+        assert restored[vector_id]['metadata'] == metadata[i]
+        assert np.allclose(restored[vector_id]['values'], vectors[i], atol=1e-3)
+    assert target.chunk_store.get_texts(ids[:3]) == source.chunk_store.get_texts(ids[:3])
+
+    question = "What is reinforcement learning?"
+    assert [doc['id'] for doc in target.query_similar_documents(question, 5)] == \
+           [doc['id'] for doc in source.query_similar_documents(question, 5)]
+
+
+def test_import_into_a_non_empty_index_needs_replace(tmp_path, seeded_pipeline):
+    export_snapshot(seeded_pipeline.vector_store, str(tmp_path / "snapshot"))
+    with pytest.raises(ValueError, match="replace"):
+        import_snapshot(seeded_pipeline.vector_store, str(tmp_path / "snapshot"))
+
+
+def pca_store(projection: PCAProjection) -> StandInVectorStore:
+    store = StandInVectorStore(dimension=16)
+    store.projection = projection
+    store.index = LocalIndex(projection.dimension)
+    return store
+
+
+def test_pca_projection_travels_with_the_snapshot(tmp_path):
+    rng = np.random.default_rng(0)
+    projection = PCAProjection.fit(rng.normal(size=(64, 16)), 8)
+    source = pca_store(projection)
+    text = "Rerankers reorder candidates. Embeddings map text to vectors. Caches avoid repeated work."
+    source.upsert_documents(DocumentProcessor().chunk_text(text, "a.txt", "A"), ["a0"])
+    snapshot = str(tmp_path / "snapshot")
+    export_snapshot(source, snapshot)
+
+    installed_path = str(tmp_path / "pca.npz")
+    assert install_projection(snapshot, installed_path)
+    assert not install_projection(snapshot, installed_path)
+    installed = PCAProjection.load(installed_path)
+    assert np.array_equal(installed.components, projection.components)
+    assert import_snapshot(pca_store(installed), snapshot)['vectors'] == 1
+
+    refitted = PCAProjection.fit(rng.normal(size=(64, 16)), 8)
+    with pytest.raises(ValueError, match="different PCA fit"):
+        import_snapshot(pca_store(refitted), snapshot)
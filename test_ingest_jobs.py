@@ -0,0 +1,89 @@
+"""
+Tests for the durable ingestion queue: checkpoints, retries and stale-job takeover
+"""
+import random
+import pytest
+from ingest_jobs import IngestJobQueue, IngestWorker, job_vector_ids
+from load_test import synthetic_document
+from stand_ins import StandInVectorStore
+
+BATCH_SIZE = 3
+
+
+class FlakyVectorStore(StandInVectorStore):
+    """Stand-in store that records upserted IDs and fails one chosen upsert call"""
+
+    def __init__(self, fail_on_call: int = 0):
+        super().__init__(dimension=32)
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+        self.upserted_ids = []
+
+    def upsert_documents(self, chunks, vector_ids=None, **kwargs):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            return {'success': False, 'error': "index unavailable"}
+        self.upserted_ids.extend(vector_ids)
+        return super().upsert_documents(chunks, vector_ids=vector_ids, **kwargs)
+
+    def vector_count(self) -> int:
+        return self.index.describe_index_stats()['total_vector_count']
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return IngestJobQueue(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "uploads"))
+
+
+@pytest.fixture
+def job(queue):
+    return queue.enqueue_text(synthetic_document(0, random.Random(3), paragraphs=60), "report.txt")
+
+
+def test_failed_job_resumes_from_its_last_checkpoint(queue, job):
+    store = FlakyVectorStore(fail_on_call=3)
+    worker = IngestWorker(queue, store, batch_size=BATCH_SIZE)
+
+    assert worker.run_once()
+    failed = queue.get_job(job['id'])
+    assert failed['status'] == 'failed'
+    assert "Batch 3/" in failed['error']
+    assert failed['committed_batches'] == 2
+    assert failed['total_batches'] > 3
+    assert store.upserted_ids == job_vector_ids(job['id'], 2 * BATCH_SIZE)
+
+    queue.retry(job['id'])
+    store.upserted_ids.clear()
+    assert worker.run_once()
+    completed = queue.get_job(job['id'])
+    assert completed['status'] == 'completed'
+    assert completed['progress'] == 1.0
+    # Only the uncommitted batches are sent again, under the same deterministic IDs
+    assert store.upserted_ids == job_vector_ids(job['id'], completed['total_chunks'], 2 * BATCH_SIZE)
+    assert completed['upserted_count'] == store.vector_count() == completed['total_chunks']
+    assert not worker.run_once()
+
+
+def test_a_stale_running_job_is_taken_over_at_its_checkpoint(queue, job):
+    claimed = queue.claim_next("crashed-worker")
+    queue.set_plan(claimed['id'], 9, 3)
+    queue.checkpoint(claimed['id'], 1, BATCH_SIZE)
+    assert queue.claim_next("other-worker") is None
+
+    taken = queue.claim_next("other-worker", stale_after=-1)
+    assert (taken['id'], taken['worker'], taken['committed_batches']) == (job['id'], "other-worker", 1)
+
+    store = FlakyVectorStore()
+    IngestWorker(queue, store, batch_size=BATCH_SIZE)._process(taken)
+    assert store.upserted_ids[0] == f"{job['id']}_{BATCH_SIZE}"
+
+
+def test_discarding_a_failed_job_deletes_its_committed_vectors(queue, job):
+    store = FlakyVectorStore(fail_on_call=2)
+    IngestWorker(queue, store, batch_size=BATCH_SIZE).run_once()
+    assert store.vector_count() == BATCH_SIZE
+
+    queue.discard(job['id'], store)
+    assert queue.get_job(job['id']) is None
+    assert store.vector_count() == 0
+    assert not queue.has_active_jobs()
@@ -0,0 +1,96 @@
+"""
+Tests for LLM call admission: routing, fair queuing across sessions and token budgets
+"""
+import threading
+import time
+import pytest
+from llm_scheduler import LLMScheduler
+
+
+def scheduler(**kwargs) -> LLMScheduler:
+    options = dict(primary_model='primary', fast_model='fast', requests_per_minute=600, tokens_per_minute=60000,
+                   max_concurrency=1, route_queue_depth=3, small_context_tokens=100)
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_routing_reasons():
+    llm = scheduler()
+    assert llm.route(500, context_tokens=1000, queue_depth=0) == ('primary', 'primary')
+    assert llm.route(500, context_tokens=1000, queue_depth=3) == ('fast', 'queue_depth')
+    assert llm.route(500, context_tokens=50, queue_depth=0) == ('fast', 'small_context')
+    llm.release(llm.acquire('s', 500, context_tokens=1000), retry_after=60)
+    assert llm.route(500, context_tokens=1000, queue_depth=0) == ('fast', 'primary_budget')
+    assert scheduler(fast_model='primary').route(500, 50, 10) == ('primary', 'primary')
+
+
+def test_waiting_sessions_are_granted_round_robin():
+    llm = scheduler()
+    held = llm.acquire('busy', 10, context_tokens=1000)
+    order, threads = [], []
+
+    def call(session: str) -> None:
+        grant = llm.acquire(session, 10, context_tokens=1000, timeout=10)
+        order.append(session)
+        llm.release(grant, tokens_used=10)
+
+    # One session queues three calls before another session queues one
+    for number, session in enumerate(['batch', 'batch', 'batch', 'user']):
+        threads.append(threading.Thread(target=call, args=(session,)))
+        threads[-1].start()
+        wait_for(lambda: llm.metrics()['queue_depth'] == number + 1)
+    assert llm.metrics()['sessions_waiting'] == {'batch': 3, 'user': 1}
+
+    llm.release(held, tokens_used=10)
+    for thread in threads:
+        thread.join(10)
+    assert order == ['batch', 'user', 'batch', 'batch']
+    assert llm.metrics()['counters']['max_queue_depth'] == 4
+
+
+def test_token_reservations_are_settled_against_usage():
+    llm = scheduler(tokens_per_minute=1000)
+    tokens = llm._budgets['primary'][1]
+    grant = llm.acquire('s', 400, context_tokens=1000)
+    assert tokens.available == pytest.approx(600, abs=5)
+    llm.release(grant, tokens_used=150)
+    assert tokens.available == pytest.approx(850, abs=5)
+    assert llm.metrics()['counters']['tokens_used'] == 150
+
+
+def test_acquire_times_out_when_the_budget_is_spent():
+    llm = scheduler(fast_model='primary', tokens_per_minute=60, max_concurrency=2)
+    llm.release(llm.acquire('s', 60, context_tokens=1000), tokens_used=60)
+    with pytest.raises(TimeoutError):
+        llm.acquire('s', 60, context_tokens=1000, timeout=0.05)
+    state = llm.metrics()
+    assert state['counters']['timeouts'] == 1
+    assert state['queue_depth'] == 0
+    assert state['sessions_waiting'] == {}
+
+
+def test_a_capped_session_waits_without_blocking_other_sessions():
+    llm = scheduler(fast_model='primary', max_concurrency=2)
+    llm.set_session_budget('batch', requests_per_minute=1, tokens_per_minute=60000)
+    llm.release(llm.acquire('batch', 100), tokens_used=100)
+    assert llm.metrics()['session_budgets']['batch']['requests_available'] < 1
+
+    granted = []
+    waiter = threading.Thread(target=lambda: granted.append(llm.acquire('batch', 100, timeout=5)))
+    waiter.start()
+    wait_for(lambda: llm.metrics()['queue_depth'] == 1)
+    # The batch call is over its own cap; an interactive call behind it is granted at once
+    llm.release(llm.acquire('user', 100, timeout=0.5), tokens_used=100)
+    assert not granted
+
+    llm.clear_session_budget('batch')
+    waiter.join(5)
+    assert granted and granted[0].session_id == 'batch'
+    assert llm.metrics()['session_budgets'] == {}
@@ -0,0 +1,70 @@
+"""
+Tests for the load-test harness with scripted clients
+"""
+import threading
+import time
+from load_test import ramp, run_level
+from query_service import ServiceOverloaded
+
+
+class ScriptedClient:
+    """Client whose query latency grows with the number of concurrent callers"""
+
+    active = 0
+    lock = threading.Lock()
+
+    def __init__(self, base: float = 0.002, per_caller: float = 0.0, overload_above: int = 0):
+        self.base = base
+        self.per_caller = per_caller
+        self.overload_above = overload_above
+        self.ingested = []
+
+    def query(self, question, session_id=None):
+        with ScriptedClient.lock:
+            ScriptedClient.active += 1
+            callers = ScriptedClient.active
+        try:
+            if self.overload_above and callers > self.overload_above:
+                raise ServiceOverloaded("queue full")
+            time.sleep(self.base + self.per_caller * callers)
+            return {'trace': {'name': 'query', 'duration': 0.001, 'children': [
+                {'name': 'retrieval', 'duration': 0.0005, 'children': []}
+            ]}}
+        finally:
+            with ScriptedClient.lock:
+                ScriptedClient.active -= 1
+
+    def ingest_text(self, text, source_name, title=None):
+        self.ingested.append(source_name)
+        return {'success': True}
+
+
+def test_level_summary_counts_outcomes_and_trace_stages():
+    clients = []
+
+    def make_client(i):
+        clients.append(ScriptedClient())
+        return clients[-1]
+
+    result = run_level(make_client, concurrency=3, duration=0.3, ingest_ratio=0.2, think_time=0.0)
+    assert result['completed'] > 10
+    assert result['errors'] == {} and result['rejected'] == 0
+    assert {'client.query', 'client.ingest', 'query', 'retrieval'} <= set(result['stages'])
+    assert result['stages']['query']['count'] == result['stages']['client.query']['count']
+    assert all(name.startswith("load-s3-") for client in clients for name in client.ingested)
+
+
+def test_overload_is_a_rejection_not_an_error():
+    client = ScriptedClient(overload_above=1)
+    result = run_level(lambda i: client, concurrency=4, duration=0.3, ingest_ratio=0.0, think_time=0.0)
+    assert result['rejected'] > 0
+    assert result['errors'] == {}
+    assert 0 < result['rejection_rate'] < 1
+
+
+def test_ramp_stops_at_the_first_level_past_the_slo():
+    report = ramp(lambda i: ScriptedClient(per_caller=0.02), levels=[1, 2, 8, 16], duration=0.3,
+                  ingest_ratio=0.0, slo_p95=0.1)
+    assert report['max_concurrency_within_slo'] == 2
+    assert [level['concurrency'] for level in report['levels']] == [1, 2, 8]
+    assert not report['levels'][-1]['within_slo']
@@ -0,0 +1,141 @@
+"""
+Tests for the local vector index: filtering, persistence and compaction
+"""
+import os
+import numpy as np
+import local_index
+from local_index import LocalIndex
+
+DIMENSION = 8
+
+
+def make_vectors(count: int, start: int = 0, source: str = "a.txt"):
+    rng = np.random.default_rng(start)
+    return [
+        {'id': f"v{i}", 'values': rng.normal(size=DIMENSION).tolist(), 'metadata': {'source': source, 'chunk_index': i}}
+        for i in range(start, start + count)
+    ]
+
+
+def test_filters_use_bitmaps_and_scanned_predicates():
+    index = LocalIndex(DIMENSION)
+    index.upsert(make_vectors(5, source="a.txt"))
+    index.upsert(make_vectors(5, start=5, source="b.txt"))
+    query = make_vectors(1)[0]['values']
+
+    matches = index.query(query, top_k=10, filter={'source': 'b.txt', 'chunk_index': {'$gte': 7}})['matches']
+    assert sorted(match['id'] for match in matches) == ['v7', 'v8', 'v9']
+    assert index.list_values('source') == ['a.txt', 'b.txt']
+
+    index.delete(filter={'source': 'a.txt'})
+    assert index.list_values('source') == ['b.txt']
+    assert index.describe_index_stats()['total_vector_count'] == 5
+
+
+def test_batches_append_to_the_log_instead_of_rewriting_the_base(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalIndex(DIMENSION, path)
+    index.upsert(make_vectors(10))
+    base = os.path.join(path, "vectors-1.npy")
+    base_mtime = os.stat(base).st_mtime_ns
+
+    for batch in range(1, 5):
+        index.upsert(make_vectors(10, start=batch * 10))
+    assert os.stat(base).st_mtime_ns == base_mtime
+    assert os.path.getsize(os.path.join(path, "delta-1.log")) > 0
+
+    reloaded = LocalIndex(DIMENSION, path)
+    assert reloaded.describe_index_stats()['total_vector_count'] == 50
+    assert reloaded.fetch(['v42'])['vectors']['v42']['metadata']['chunk_index'] == 42
+
+
+def test_deletes_and_overwrites_replay_after_restart(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalIndex(DIMENSION, path)
+    index.upsert(make_vectors(6))
+    index.delete(ids=['v1', 'v2'])
+    index.upsert([{'id': 'v3', 'values': [1.0] + [0.0] * (DIMENSION - 1), 'metadata': {'source': 'c.txt'}}])
+
+    reloaded = LocalIndex(DIMENSION, path)
+    assert reloaded.describe_index_stats()['total_vector_count'] == 4
+    assert reloaded.fetch(['v1', 'v2'])['vectors'] == {}
+    assert reloaded.list_values('source') == ['a.txt', 'c.txt']
+    assert reloaded.query([1.0] + [0.0] * (DIMENSION - 1), top_k=1)['matches'][0]['id'] == 'v3'
+
+
+def test_flush_compacts_dead_rows_on_disk_and_in_memory(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalIndex(DIMENSION, path)
+    index.upsert(make_vectors(20))
+    index.delete(ids=[f"v{i}" for i in range(15)])
+    index.flush()
+
+    assert len(index._ids) == 5
+    assert sorted(os.listdir(path)) == ['delta-2.log', 'records.json', 'vectors-2.npy']
+    assert os.path.getsize(os.path.join(path, 'delta-2.log')) == 0
+    assert np.load(os.path.join(path, 'vectors-2.npy')).shape == (5, DIMENSION)
+    assert LocalIndex(DIMENSION, path).describe_index_stats()['total_vector_count'] == 5
+
+
+def test_log_is_compacted_once_it_outgrows_the_base(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_index, 'MIN_COMPACT_BYTES', 0)
+    path = str(tmp_path / "index")
+    index = LocalIndex(DIMENSION, path)
+    for batch in range(6):
+        index.upsert(make_vectors(10, start=batch * 10))
+    assert index._generation > 1
+    assert LocalIndex(DIMENSION, path).describe_index_stats()['total_vector_count'] == 60
+
+
+def test_torn_frame_at_the_end_of_the_log_is_ignored(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalIndex(DIMENSION, path)
+    index.upsert(make_vectors(3))
+    index.upsert(make_vectors(3, start=3))
+    log = os.path.join(path, "delta-1.log")
+    with open(log, 'r+b') as f:
+        f.truncate(os.path.getsize(log) - 5)
+    assert LocalIndex(DIMENSION, path).describe_index_stats()['total_vector_count'] == 3
+
+
+def test_indexes_saved_before_the_delta_log_still_load(tmp_path):
+    import json
+    path = tmp_path / "index"
+    path.mkdir()
+    vectors = np.eye(3, DIMENSION, dtype=np.float32)
+    np.save(path / "vectors.npy", vectors)
+    (path / "records.json").write_text(json.dumps({
+        'dimension': DIMENSION, 'ids': ['x', 'y', 'z'], 'metadata': [{'source': 's'}] * 3
+    }))
+    index = LocalIndex(DIMENSION, str(path))
+    assert index.query(vectors[1].tolist(), top_k=1)['matches'][0]['id'] == 'y'
+    index.upsert(make_vectors(1))
+    index.flush()
+    assert not (path / "vectors.npy").exists()
+    assert LocalIndex(DIMENSION, str(path)).describe_index_stats()['total_vector_count'] == 4
+
+
+def test_writes_from_another_instance_are_visible_without_reopening(tmp_path):
+    path = str(tmp_path / "index")
+    app, worker = LocalIndex(DIMENSION, path), LocalIndex(DIMENSION, path)
+    app.upsert(make_vectors(3))
+    worker.upsert(make_vectors(3, start=3, source="b.txt"))
+
+    assert app.describe_index_stats()['total_vector_count'] == 6
+    assert app.list_values('source') == ['a.txt', 'b.txt']
+    app.delete(ids=['v4'])
+    assert worker.fetch(['v3', 'v4'])['vectors'].keys() == {'v3'}
+
+
+def test_compaction_by_one_instance_does_not_drop_the_others_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_index, 'MIN_COMPACT_BYTES', 0)
+    path = str(tmp_path / "index")
+    first, second = LocalIndex(DIMENSION, path), LocalIndex(DIMENSION, path)
+    for batch in range(6):
+        (first if batch % 2 else second).upsert(make_vectors(5, start=batch * 5))
+    first.flush()
+    second.upsert(make_vectors(1, start=100))
+
+    assert first._generation > 1
+    for index in (first, second, LocalIndex(DIMENSION, path)):
+        assert index.describe_index_stats()['total_vector_count'] == 31
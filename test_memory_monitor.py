@@ -0,0 +1,76 @@
+"""
+Tests for the ingest memory budget and per-stage memory profiles
+"""
+import io
+import random
+import pytest
+import memory_monitor
+from document_processor import DocumentProcessor
+from load_test import synthetic_document
+from memory_monitor import MemoryBudget, MemoryBudgetExceeded, MemoryProfile
+from stand_ins import StandInVectorStore
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Pin the reported RSS at 100 MB"""
+    monkeypatch.setattr(memory_monitor, 'current_rss', lambda: 100 * MB)
+
+
+def test_unlimited_budget_never_interferes():
+    budget = MemoryBudget(limit_mb=0)
+    assert budget.headroom() is None
+    budget.check("anything", 10 ** 12)
+    assert budget.batch_size("anything", 1000, 10 ** 9) == 1000
+
+
+def test_check_rejects_work_that_does_not_fit(rss):
+    budget = MemoryBudget(limit_mb=110)
+    assert budget.headroom() == 10 * MB
+    budget.check("small", 9 * MB)
+    with pytest.raises(MemoryBudgetExceeded, match="needs about 11.0 MB but only 10.0 MB"):
+        budget.check("large", 11 * MB)
+
+
+def test_batch_size_shrinks_to_the_headroom(rss):
+    budget = MemoryBudget(limit_mb=110, min_batch=4)
+    assert budget.batch_size("fits", 10, MB) == 10
+    assert budget.batch_size("split", 100, MB) == 10
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.batch_size("too big", 100, 3 * MB)
+
+
+def test_oversized_uploads_are_rejected_before_they_are_read(rss):
+    upload = io.BytesIO(b"x" * (4 * MB))
+    upload.name = "big.txt"
+    with pytest.raises(MemoryBudgetExceeded):
+        DocumentProcessor().process_uploaded_file(upload, budget=MemoryBudget(limit_mb=110))
+    assert upload.tell() == 0
+
+
+def test_upserts_are_split_to_fit_the_budget(rss, capsys):
+    store = StandInVectorStore(dimension=16)
+    store.memory_budget = MemoryBudget(limit_mb=100 + 1 / 16, min_batch=2)
+    chunks = DocumentProcessor().chunk_text(synthetic_document(0, random.Random(1), paragraphs=60), "a.txt")
+    per_chunk = store._upsert_bytes_per_chunk(chunks)
+    assert len(chunks) * per_chunk > store.memory_budget.headroom()
+
+    result = store.upsert_documents(chunks, [f"a{i}" for i in range(len(chunks))])
+    assert result['success']
+    assert "in slices of" in capsys.readouterr().out
+    assert store.index.describe_index_stats()['total_vector_count'] == len(chunks)
+
+
+def test_profile_records_each_stage():
+    with MemoryProfile("ingest", enabled=True) as profile:
+        blob = [bytes(1024) for _ in range(1024)]
+        profile.stage('allocate')
+        del blob
+        profile.stage('release')
+    report = profile.report()
+    assert [stage['stage'] for stage in report['stages']] == ['allocate', 'release']
+    assert report['stages'][0]['traced_peak_mb'] >= 1.0
+    assert report['stages'][0]['traced_mb'] - report['stages'][1]['traced_mb'] >= 0.9
+    assert MemoryProfile("off", enabled=False).report() == {}
@@ -0,0 +1,64 @@
+"""
+Tests for per-request CPU profiles and their collapsed flamegraph stacks
+"""
+import os
+import pytest
+from profiling import ProfileStore, profiled
+
+
+def busy_leaf(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+def busy_parent() -> int:
+    return busy_leaf(200000) + busy_leaf(100000)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProfileStore(str(tmp_path / "profiles"), keep=2)
+
+
+def test_disabled_profiling_saves_nothing(store):
+    with profiled('query', "q", enabled=False, store=store) as request_id:
+        busy_leaf(10)
+    assert request_id is None
+    assert store.list() == []
+
+
+def test_profile_files_and_collapsed_stacks(store):
+    with profiled('query', "what is caching?", enabled=True, store=store) as request_id:
+        busy_parent()
+    assert sorted(os.listdir(store.directory)) == sorted(f"{request_id}.{suffix}"
+                                                         for suffix in ('collapsed', 'json', 'pstats'))
+    [info] = store.list()
+    assert (info['request_id'], info['kind'], info['label'], info['error']) == (request_id, 'query', "what is caching?", None)
+    assert any('busy_parent' in entry['function'] for entry in info['top'])
+
+    stacks = store.read(request_id, 'collapsed').decode().splitlines()
+    # Time spent in busy_leaf is attributed to the path through its caller
+    leaf_paths = [line for line in stacks if 'busy_leaf' in line]
+    assert leaf_paths and all('busy_parent' in line.split('busy_leaf')[0] for line in leaf_paths)
+    micros = sum(int(line.rsplit(' ', 1)[1]) for line in stacks)
+    assert micros <= info['seconds'] * 1e6 * 1.5
+    assert store.load(request_id).total_calls > 0
+
+
+def test_only_one_request_is_profiled_at_a_time(store):
+    with profiled('ingest', "outer", enabled=True, store=store) as outer:
+        with profiled('query', "inner", enabled=True, store=store) as inner:
+            busy_leaf(10)
+    assert outer is not None and inner is None
+    assert [entry['label'] for entry in store.list()] == ["outer"]
+
+
+def test_errors_are_recorded_and_old_profiles_pruned(store):
+    with pytest.raises(ValueError):
+        with profiled('query', "bad", enabled=True, store=store):
+            raise ValueError("boom")
+    assert store.list()[0]['error'] == "ValueError: boom"
+    for label in ("second", "third"):
+        with profiled('query', label, enabled=True, store=store):
+            busy_leaf(10)
+    assert [entry['label'] for entry in store.list()] == ["third", "second"]
+    assert len(os.listdir(store.directory)) == 6
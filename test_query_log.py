@@ -0,0 +1,40 @@
+"""
+Tests for the compressed query log
+"""
+import time
+from query_log import QueryLog, read_log
+from query_service import QueryService
+
+
+def test_answered_queries_are_logged_and_read_back(tmp_path, seeded_pipeline):
+    log = QueryLog(str(tmp_path), flush_records=100)
+    service = QueryService(seeded_pipeline, query_log=log)
+    service.query("What is reinforcement learning?", top_k_retrieval=5, top_k_rerank=2)
+    log.flush()
+
+    records = list(read_log([str(tmp_path)]))
+    assert len(records) == 1
+    assert records[0]['query'] == "What is reinforcement learning?"
+    assert records[0]['params']['top_k_rerank'] == 2
+    assert len(log.segments()) == 1
+
+
+def test_segments_older_than_the_retention_are_pruned(tmp_path):
+    now = time.time()
+    for days_ago in (0, 3, 10, 30):
+        day = time.strftime('%Y%m%d', time.gmtime(now - days_ago * 86400))
+        (tmp_path / f"queries-{day}.jsonl.gz").write_bytes(b"")
+
+    removed = QueryLog(str(tmp_path), keep_days=7).prune(now)
+    assert len(removed) == 2
+    assert len(QueryLog(str(tmp_path), keep_days=0).prune(now)) == 0
+    assert len(QueryLog(str(tmp_path)).segments()) == 2
+
+
+def test_first_flush_of_the_day_prunes(tmp_path):
+    stale = tmp_path / "queries-20000101.jsonl.gz"
+    stale.write_bytes(b"")
+    log = QueryLog(str(tmp_path), flush_records=1, keep_days=7)
+    log.append({'ts': time.time(), 'query': "hello"})
+    assert not stale.exists()
+    assert [record['query'] for record in read_log([str(tmp_path)])] == ["hello"]
@@ -0,0 +1,66 @@
+"""
+Tests for the HTTP query service on stand-in backends
+"""
+import threading
+import pytest
+import requests
+from ingest_jobs import IngestJobQueue
+from query_service import QueryServer, QueryService
+
+
+@pytest.fixture
+def server_url(tmp_path, seeded_pipeline):
+    def start(admin_token=None):
+        queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"), str(tmp_path))
+        server = QueryServer(QueryService(seeded_pipeline, ingest_queue=queue), port=0, admin_token=admin_token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_invalid_job_limit_is_a_bad_request(server_url):
+    url = server_url()
+    assert requests.get(f"{url}/jobs", params={'limit': 'abc'}).status_code == 400
+    assert requests.get(f"{url}/jobs", params={'limit': '0'}).status_code == 400
+    assert requests.get(f"{url}/jobs", params={'limit': '5'}).json() == {'jobs': []}
+
+
+def test_clear_is_disabled_without_an_admin_token(server_url, seeded_pipeline):
+    response = requests.post(f"{server_url()}/clear")
+    assert response.status_code == 403
+    assert seeded_pipeline.vector_store.index.describe_index_stats()['total_vector_count'] > 0
+
+
+def test_clear_requires_the_admin_token(server_url, seeded_pipeline):
+    url = server_url(admin_token="s3cret")
+    assert requests.post(f"{url}/clear").status_code == 401
+    assert requests.post(f"{url}/clear", headers={'Authorization': "Bearer wrong"}).status_code == 401
+    assert seeded_pipeline.vector_store.index.describe_index_stats()['total_vector_count'] > 0
+
+    assert requests.post(f"{url}/clear", headers={'Authorization': "Bearer s3cret"}).status_code == 200
+    assert seeded_pipeline.vector_store.index.describe_index_stats()['total_vector_count'] == 0
+
+
+def test_discard_requires_the_admin_token(server_url):
+    url = server_url(admin_token="s3cret")
+    job = requests.post(f"{url}/jobs", json={'text': "some text to index", 'source_name': "a.txt"}).json()
+    assert requests.post(f"{url}/jobs/{job['id']}/discard").status_code == 401
+    assert requests.post(f"{url}/jobs/{job['id']}/discard", headers={'Authorization': "Bearer wrong"}).status_code == 401
+
+    response = requests.post(f"{url}/jobs/{job['id']}/discard", headers={'Authorization': "Bearer s3cret"})
+    assert response.status_code == 200 and response.json() == {'discarded': job['id']}
+    assert requests.post(f"{server_url()}/jobs/{job['id']}/discard").status_code == 403
+
+
+@pytest.mark.parametrize("body", [b"[]", b'"x"', b"3", b"null"])
+def test_a_json_body_that_is_not_an_object_is_a_bad_request(server_url, body):
+    for path in ("/query", "/ingest", "/jobs"):
+        response = requests.post(f"{server_url()}{path}", data=body, headers={'Content-Type': "application/json"})
+        assert response.status_code == 400
+        assert response.json() == {'error': "Request body must be a JSON object"}
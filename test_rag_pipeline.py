@@ -0,0 +1,60 @@
+"""
+Tests for the query pipeline wired to local stand-ins
+"""
+import operator
+import pytest
+
+
+class FirstThree:
+    """Candidate selector that always keeps the top three candidates"""
+    max_candidates = 20
+
+    def select(self, docs, top_k_retrieval, top_k_rerank):
+        return docs[:3], {'retrieved': len(docs), 'selected': 3, 'rule': 'first-three'}
+
+    def record(self, *args):
+        pass
+
+
+def test_texts_are_only_fetched_for_selected_candidates(seeded_pipeline):
+    pipeline = seeded_pipeline
+    pipeline.candidate_selector, pipeline.diversifier, pipeline.fast_path = FirstThree(), None, None
+    chunk_store = pipeline.vector_store.chunk_store
+    requested = []
+    get_texts = chunk_store.get_texts
+    chunk_store.get_texts = lambda ids: requested.extend(ids) or get_texts(ids)
+
+    response = pipeline.answer("how do rerankers affect latency?", top_k_retrieval=10, top_k_rerank=2)
+
+    assert response['retrieved'] > 3
+    assert requested == response['retrieved_ids'][:3]
+    assert all(doc['text'] for doc in response['docs'])
+    assert response['result']['answer']
+
+
+def rate_limited(*args, **kwargs):
+    import httpx
+    from groq import RateLimitError
+    response = httpx.Response(429, headers={'retry-after': "0"}, request=httpx.Request("POST", "https://api.groq.com"))
+    raise RateLimitError("rate limit reached", response=response, body=None)
+
+
+def queue_timeout(*args, **kwargs):
+    raise TimeoutError("LLM queue: no capacity within 60.0s (3 calls waiting)")
+
+
+@pytest.mark.parametrize("failure, target", [(queue_timeout, 'scheduler.acquire'),
+                                             (rate_limited, 'client.chat.completions.create')])
+def test_an_unavailable_llm_degrades_to_an_extractive_answer(seeded_pipeline, monkeypatch, failure, target):
+    import llm_service
+    from llm_service import LLMUnavailable
+    monkeypatch.setattr(llm_service, 'LLM_MAX_RETRIES', 1)
+    owner, attribute = target.rsplit('.', 1)
+    monkeypatch.setattr(operator.attrgetter(owner)(seeded_pipeline.llm_service), attribute, failure)
+    docs = seeded_pipeline.answer("how does chunking affect latency?")['docs']
+
+    with pytest.raises(LLMUnavailable):
+        seeded_pipeline.llm_service.generate_answer_with_citations("how does chunking affect latency?", docs)
+    result = seeded_pipeline.generate("how does chunking affect latency?", docs)
+    assert result['degraded'] and 'error' not in result
+    assert result['citations'] and result['answer'] and not result['answer'].startswith("Error")
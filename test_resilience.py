@@ -0,0 +1,135 @@
+"""
+Tests for deadlines, circuit breakers and fallbacks around remote calls
+"""
+import httpx
+import pytest
+from groq import RateLimitError
+from resilience import CircuitBreaker, ServicePolicy, resilience
+from tracing import tracer
+from local_index import LocalIndex
+from stand_ins import InjectedFault, SimulatedLatency, StandInLLMService, StandInReranker, StandInVectorStore
+
+
+class Flaky:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return 'ok'
+
+
+@pytest.fixture
+def strict_resilience():
+    resilience.configure(enabled=True, failure_threshold=2, reset_timeout=3600)
+    yield resilience
+    resilience.configure()
+
+
+def test_breaker_opens_after_consecutive_failures_and_falls_back():
+    policy = ServicePolicy('rerank', None, CircuitBreaker(failure_threshold=2, reset_timeout=3600))
+    failing = Flaky(ConnectionError("down"))
+    assert [policy.call(failing, fallback=lambda: 'fallback') for _ in range(3)] == ['fallback'] * 3
+    assert failing.calls == 2
+    assert policy.stats()['state'] == CircuitBreaker.OPEN
+    assert policy.stats()['rejected'] == 1
+
+
+def test_only_breaker_state_changes_are_logged(capsys):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=3600)
+    policy = ServicePolicy('rerank', None, breaker)
+    for _ in range(6):
+        assert policy.call(Flaky(ConnectionError("down")), fallback=lambda: 'fallback') == 'fallback'
+    breaker.reset_timeout = 0
+    assert policy.call(Flaky(), fallback=lambda: 'fallback') == 'ok'
+    assert capsys.readouterr().out.splitlines() == [
+        "rerank circuit closed -> open after 2 consecutive failures (down)",
+        "rerank circuit open -> half_open",
+        "rerank circuit half_open -> closed"
+    ]
+
+
+def test_fallback_reason_is_attached_to_the_active_span(capsys):
+    policy = ServicePolicy('rerank', None, CircuitBreaker(failure_threshold=5, reset_timeout=3600))
+    with tracer.span("rerank") as span:
+        policy.call(Flaky(ConnectionError("down")), fallback=lambda: 'fallback')
+    assert (span.attributes['degraded'], span.attributes['breaker'], span.attributes['fallback_reason']) == \
+        ('rerank', CircuitBreaker.CLOSED, "down")
+
+    resilience.configure(enabled=False)
+    try:
+        with tracer.span("rerank") as span:
+            assert resilience.call('rerank', Flaky(ConnectionError("refused")), fallback=lambda: 'fallback') == 'fallback'
+    finally:
+        resilience.configure()
+    assert (span.attributes['degraded'], span.attributes['fallback_reason']) == ('rerank', "refused")
+    assert capsys.readouterr().out == ""
+
+
+def test_half_open_probe_closes_the_breaker_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    policy = ServicePolicy('index', None, breaker)
+    with pytest.raises(ConnectionError):
+        policy.call(Flaky(ConnectionError("down")))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert policy.call(Flaky()) == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_passthrough_errors_do_not_count_as_failures():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=3600)
+    policy = ServicePolicy('llm', None, breaker)
+    for _ in range(3):
+        with pytest.raises(KeyError):
+            policy.call(Flaky(KeyError("quota")), fallback=lambda: 'fallback', passthrough=(KeyError,))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert policy.stats()['failures'] == 0
+
+
+def test_groq_rate_limits_are_retried_without_opening_the_llm_circuit(strict_resilience):
+    service = StandInLLMService()
+    completions = service.client.chat.completions
+    create, responses = completions.create, []
+
+    def rate_limited(**kwargs):
+        if len(responses) < 2:
+            response = httpx.Response(429, headers={'retry-after': '0'}, request=httpx.Request('POST', 'http://groq'))
+            responses.append(response)
+            raise RateLimitError("rate limited", response=response, body=None)
+        return create(**kwargs)
+
+    completions.create = rate_limited
+    docs = [{'id': 'd1', 'text': "Rerankers reorder candidates by relevance.", 'source': 'a.txt', 'score': 0.9}]
+    for _ in range(2):
+        responses.clear()
+        result = service.generate_answer_with_citations("what do rerankers do?", docs)
+        assert "Rerankers reorder candidates" in result['answer']
+    assert strict_resilience.stats()['services']['llm']['state'] == CircuitBreaker.CLOSED
+
+
+def test_reranker_keeps_the_original_order_on_failure_unless_strict():
+    reranker = StandInReranker()
+    reranker.latency = SimulatedLatency(error_rate=1.0)
+    documents = [{'id': 'b', 'text': 'beta', 'score': 0.2}, {'id': 'a', 'text': 'alpha', 'score': 0.9}]
+    assert reranker.rerank_documents('alpha', documents, top_k=2) == documents
+    with pytest.raises(InjectedFault):
+        reranker.rerank_documents('alpha', documents, top_k=2, strict=True)
+
+
+def test_pipeline_rerank_failures_reach_the_breaker(seeded_pipeline, strict_resilience):
+    seeded_pipeline.reranker.latency = SimulatedLatency(error_rate=1.0)
+    for _ in range(3):
+        response = seeded_pipeline.answer("What does document 3 describe?", 10, 3)
+        assert len(response['docs']) == 3
+    assert strict_resilience.stats()['services']['rerank']['state'] == CircuitBreaker.OPEN
+
+
+def test_replica_age_tracks_the_last_write_to_the_fallback_index(tmp_path):
+    store = StandInVectorStore(dimension=8)
+    assert store.replica_age() is None
+    store.fallback_index = LocalIndex(8, str(tmp_path / "replica"))
+    store.fallback_index.upsert([{'id': 'a', 'values': [1.0] * 8, 'metadata': {}}])
+    assert 0 <= store.replica_age() < 60
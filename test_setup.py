@@ -51,7 +51,33 @@ def test_custom_modules() -> Dict[str, bool]:
         'document_processor': False,
         'vector_store': False,
         'reranker': False,
-        'llm_service': False
+        'llm_service': False,
+        'tracing': False,
+        'local_index': False,
+        'chunk_store': False,
+        'rag_pipeline': False,
+        'rate_limiter': False,
+        'batch_query': False,
+        'query_service': False,
+        'stand_ins': False,
+        'ingest_jobs': False,
+        'candidate_selection': False,
+        'fast_path': False,
+        'llm_scheduler': False,
+        'chunk_batch': False,
+        'memory_monitor': False,
+        'text_normalizer': False,
+        'dedup': False,
+        'dim_reduction': False,
+        'embedding_pool': False,
+        'index_snapshot': False,
+        'warmup': False,
+        'index_stats': False,
+        'load_test': False,
+        'profiling': False,
+        'query_log': False,
+        'resilience': False,
+        'tokenization': False
     }
     
     for module in module_tests.keys():
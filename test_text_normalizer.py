@@ -0,0 +1,65 @@
+"""
+Tests for the streaming normalizer against the original two-step clean_text
+"""
+import random
+import re
+import pytest
+from text_normalizer import OffsetMap, normalize, normalize_stream
+
+# Whitelisted punctuation, dropped symbols, unicode word characters and every kind of whitespace
+ALPHABET = "ab Z9_.,!?;:-()#@*/\\\"'$%€—é字  \t\n\r\x0b\x0c  "
+
+
+def clean_text(text: str) -> str:
+    """The baseline DocumentProcessor.clean_text"""
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '', text)
+    return text.strip()
+
+
+def random_texts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60)))
+
+
+def split_randomly(text: str, rng: random.Random):
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 6))))
+    return [text[start:stop] for start, stop in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("text", [
+    "", "   ", "plain text", "  a \t\n b  ", "a # b", "a #\n# b", "x # y", "$$$", "end. #",
+    "Price: $5 (approx.)!", "\n\nTitle\n\n  body  ",
+])
+def test_matches_baseline_clean_text(text):
+    assert normalize(text) == clean_text(text)
+
+
+def test_matches_baseline_on_random_text():
+    for text in random_texts(2000):
+        assert normalize(text) == clean_text(text), repr(text)
+
+
+def test_piece_boundaries_do_not_change_the_result():
+    rng = random.Random(1)
+    for text in random_texts(1000, seed=2):
+        assert normalize_stream(split_randomly(text, rng)).finish() == clean_text(text), repr(text)
+
+
+def test_offsets_point_at_the_original_characters():
+    rng = random.Random(3)
+    for text in random_texts(500, seed=4):
+        normalizer = normalize_stream(split_randomly(text, rng))
+        result = normalizer.finish()
+        for position, char in enumerate(result):
+            original = text[normalizer.offsets(position)]
+            assert original == char or (char == " " and original.isspace()), (repr(text), position)
+
+
+def test_offset_map_only_stores_anchors_where_the_shift_changes():
+    clean, messy = OffsetMap(), OffsetMap()
+    normalize("one two three four", clean)
+    normalize("a  #  b", messy)
+    assert len(clean) == 1
+    assert len(messy) == 3
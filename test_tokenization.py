@@ -0,0 +1,69 @@
+"""
+Tests for token-aware chunking and the truncation report, using the offline token estimate
+"""
+import pytest
+import document_processor
+from document_processor import DocumentProcessor
+from tokenization import TokenCounter, truncation_stats
+
+SENTENCE = "Quarterly revenue across the northern regions increased steadily. "
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    """Approximate counter for a model that embeds 32 text tokens"""
+    counter = TokenCounter.__new__(TokenCounter)
+    counter.model_name, counter.max_seq_length = 'test-model', 34
+    counter.tokenizer, counter.special_tokens = None, 2
+    monkeypatch.setattr(DocumentProcessor, 'token_counter', property(lambda self: counter))
+    monkeypatch.setattr(document_processor, 'CHUNK_OVERLAP_TOKENS', 6)
+    return counter
+
+
+def chunk(text: str):
+    return DocumentProcessor(unit='tokens').chunk_text(text, "report.txt", "Report")
+
+
+def test_estimate_offsets_agree_with_counts(counter):
+    text = "Tokenization splits internationalization into pieces, doesn't it?"
+    spans = counter.offsets(text)
+    assert counter.count([text]) == [len(spans)]
+    assert all(0 < end - start <= 6 for start, end in spans)
+    assert counter.max_tokens == counter.chunk_tokens == 32
+
+
+def test_chunks_never_exceed_the_model_input(counter):
+    batch = chunk(SENTENCE * 40)
+    counts = counter.count(batch.texts())
+    assert len(batch) > 1
+    assert max(counts) <= counter.chunk_tokens
+    # Sentence-aligned chunks fill most of the budget
+    assert min(counts[:-1]) > counter.chunk_tokens // 2
+
+
+def test_a_sentence_longer_than_the_budget_is_split_into_overlapping_windows(counter):
+    words = [f"w{i:03d}" for i in range(100)]
+    batch = chunk(" ".join(words))
+    texts = batch.texts()
+    assert max(counter.count(texts)) <= counter.chunk_tokens
+    # Every word survives and consecutive windows share CHUNK_OVERLAP_TOKENS tokens
+    assert set(" ".join(texts).split()) == set(words)
+    for previous, current in zip(texts, texts[1:]):
+        assert previous.split()[-6:] == current.split()[:6]
+
+
+def test_chunk_positions_point_into_the_original_text(counter):
+    text = "  Intro   line.\n\n" + SENTENCE * 10
+    for item in chunk(text):
+        position = item['metadata']['position']
+        assert text[position:position + 5] == item['text'][:5]
+
+
+def test_truncation_stats():
+    stats = truncation_stats([10, 40, 20, 50], max_tokens=30)
+    assert stats['truncated'] == 2
+    assert stats['tokens_dropped'] == 30
+    assert stats['dropped_pct'] == 25.0
+    assert stats['tokens_max'] == 50
+    assert stats['utilization_pct'] == round(100 * 90 / 120, 1)
+    assert truncation_stats([], 30)['chunks'] == 0
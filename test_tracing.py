@@ -0,0 +1,75 @@
+"""
+Tests for span tracing and histogram persistence
+"""
+import json
+import os
+from tracing import Tracer, tracer
+
+
+def test_finished_traces_are_persisted_by_flush_not_on_the_query_path(tmp_path):
+    store = tmp_path / "histograms.json"
+    local_tracer = Tracer(store_path=str(store), flush_seconds=3600)
+    with local_tracer.span("query"):
+        with local_tracer.span("retrieval"):
+            pass
+    assert not os.path.exists(store)
+
+    local_tracer.flush()
+    data = json.loads(store.read_text())
+    assert data['query']['count'] == 1
+    assert data['retrieval']['count'] == 1
+
+
+def test_flush_without_new_traces_does_not_write(tmp_path):
+    store = tmp_path / "histograms.json"
+    local_tracer = Tracer(store_path=str(store), flush_seconds=3600)
+    local_tracer.flush()
+    assert not os.path.exists(store)
+
+
+def test_histograms_survive_a_restart(tmp_path):
+    store = str(tmp_path / "histograms.json")
+    first = Tracer(store_path=store, flush_seconds=3600)
+    for _ in range(3):
+        with first.span("rerank"):
+            pass
+    first.flush()
+    assert Tracer(store_path=store).snapshot()['rerank']['count'] == 3
+
+
+def test_tracers_sharing_a_store_merge_instead_of_overwriting(tmp_path):
+    store = str(tmp_path / "histograms.json")
+    service, app = Tracer(store_path=store, flush_seconds=3600), Tracer(store_path=store, flush_seconds=3600)
+    for tracer_, stage, runs in ((service, "query", 2), (app, "query", 3), (app, "ingest", 1)):
+        for _ in range(runs):
+            with tracer_.span(stage):
+                pass
+    service.flush()
+    app.flush()
+    service.flush()
+    data = json.loads(open(store).read())
+    assert (data['query']['count'], len(data['query']['samples']), data['ingest']['count']) == (5, 5, 1)
+    # The writer that saved last also sees the other process's samples
+    assert app.snapshot()['query']['count'] == 5
+
+    app.reset()
+    assert json.loads(open(store).read()) == {}
+
+
+def test_the_shared_tracer_does_not_write_into_the_working_tree():
+    assert tracer.store_path == os.environ["TRACE_STORE_PATH"]
+    assert not os.path.abspath(tracer.store_path).startswith(os.path.abspath(os.path.dirname(__file__)))
+
+
+def test_retrieval_span_records_query_embedding_cache_hits():
+    from stand_ins import StandInVectorStore
+    store = StandInVectorStore()
+    attributes = []
+    for _ in range(2):
+        with tracer.span("retrieval") as span:
+            store.query_similar_documents("what is a vector index?", top_k=3)
+        attributes.append(span.attributes['embedding_cache'])
+    with tracer.span("retrieval") as span:
+        store.query_similar_documents("ignored", top_k=3, query_embedding=[0.0] * 384)
+    attributes.append(span.attributes['embedding_cache'])
+    assert attributes == ['miss', 'hit', 'precomputed']
@@ -0,0 +1,53 @@
+"""
+Tests for background warm-up and the query embedding cache
+"""
+from stand_ins import SimulatedLatency, create_stand_in_pipeline
+from warmup import QueryEmbeddingCache, Warmup
+
+QUESTIONS = ["What is caching?", "How are documents chunked?"]
+
+
+def test_cache_is_an_lru_keyed_on_normalized_whitespace():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("a  question", [1.0])
+    cache.put("b", [2.0])
+    assert cache.get(" a question ") == [1.0]
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("c") == [3.0]
+    assert cache.stats() == {'size': 2, 'hits': 2, 'misses': 1}
+
+    disabled = QueryEmbeddingCache(max_size=0)
+    disabled.put("a", [1.0])
+    assert disabled.stats()['size'] == 0
+
+
+def test_warmup_runs_every_step_and_precomputes_sample_questions():
+    pipeline = create_stand_in_pipeline()
+    warmup = Warmup(pipeline, QUESTIONS)
+    assert not warmup.ready and not warmup.status()['started']
+
+    warmup.start()
+    assert warmup.wait(30)
+    status = warmup.status()
+    assert status['ready'] and status['started']
+    assert {'encode', 'sample_questions', 'index_query', 'reranker'} <= set(status['steps'])
+    assert all(step['ok'] for step in status['steps'].values())
+    assert status['steps']['sample_questions']['cached'] == 2
+
+    cache = pipeline.vector_store.query_cache
+    hits = cache.stats()['hits']
+    pipeline.vector_store.query_similar_documents(QUESTIONS[1], top_k=1)
+    assert cache.stats()['hits'] == hits + 1
+
+
+def test_a_failing_step_is_reported_without_blocking_readiness():
+    pipeline = create_stand_in_pipeline()
+    pipeline.reranker.latency = SimulatedLatency(error_rate=1.0)
+    warmup = Warmup(pipeline, QUESTIONS)
+    warmup.run()
+    steps = warmup.status()['steps']
+    assert warmup.ready
+    assert steps['reranker']['ok'] is False
+    assert "Simulated service failure" in steps['reranker']['error']
+    assert steps['index_query']['ok']
@@ -0,0 +1,125 @@
+"""
+Single-pass text normalization with an offset map back to the original text
+
+TextNormalizer produces exactly what the old two-step clean_text did
+(collapse whitespace runs to one space, then drop characters outside the
+word/punctuation whitelist, then strip) in one scan. Input can be fed in
+arbitrary pieces, e.g. blocks from an incremental decoder, and every output
+position can be translated back to its offset in the original text.
+"""
+import bisect
+import re
+from typing import List, Iterable, Optional
+
+# Runs of characters outside the word/punctuation whitelist, except a lone
+# space (the common separator, which passes through untouched). Text between
+# two matches is copied as one slice; each match becomes one space per
+# whitespace sub-run it contains. This is the fused form of
+# re.sub(r'\s+', ' ') followed by re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '').
+IRREGULAR_PATTERN = re.compile(r'(?:[^\w.,!?;:\-() ]| (?=\s))[^\w.,!?;:\-()]*')
+ALLOWED_PATTERN = re.compile(r'[\w.,!?;:\-()]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class OffsetMap:
+    """Piecewise-linear map from normalized positions to original positions"""
+
+    def __init__(self):
+        # Anchors are only recorded where the original-minus-normalized shift changes
+        self.normalized: List[int] = []
+        self.original: List[int] = []
+
+    def add(self, normalized: int, original: int) -> None:
+        if self.normalized and original - normalized == self.original[-1] - self.normalized[-1]:
+            return
+        self.normalized.append(normalized)
+        self.original.append(original)
+
+    def shift(self, removed: int) -> None:
+        """Account for `removed` characters stripped from the front of the normalized text"""
+        if not removed:
+            return
+        i = bisect.bisect_right(self.normalized, removed) - 1
+        first = self.original[i] + removed - self.normalized[i] if i >= 0 else removed
+        self.normalized = [0] + [n - removed for n in self.normalized[i + 1:]]
+        self.original = [first] + self.original[i + 1:]
+
+    def __call__(self, position: int) -> int:
+        """Original offset of the character at a normalized position"""
+        i = bisect.bisect_right(self.normalized, position) - 1
+        if i < 0:
+            return position
+        return self.original[i] + position - self.normalized[i]
+
+    def __len__(self) -> int:
+        return len(self.normalized)
+
+
+class TextNormalizer:
+    """Streaming whitespace folding and whitelist filtering"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.offsets = OffsetMap()
+        self._length = 0     # normalized characters emitted so far
+        self._consumed = 0   # original characters fed so far
+        self._tail = ""      # end of the last piece that may join a run in the next one
+
+    def _emit(self, run: str, original: int) -> None:
+        self.offsets.add(self._length, original)
+        self._length += len(run)
+        self.parts.append(run)
+
+    def _scan(self, text: str, base: int, end: int) -> None:
+        cursor = 0
+        for match in IRREGULAR_PATTERN.finditer(text, 0, end):
+            start, stop = match.span()
+            if start > cursor:
+                self._emit(text[cursor:start], base + cursor)
+            if text[start:stop].isspace():
+                self._emit(" ", base + start)
+            else:
+                for space in WHITESPACE_PATTERN.finditer(text, start, stop):
+                    self._emit(" ", base + space.start())
+            cursor = stop
+        if end > cursor:
+            self._emit(text[cursor:end], base + cursor)
+
+    def feed(self, piece: str) -> None:
+        """Normalize the next piece of the original text"""
+        text = self._tail + piece
+        base = self._consumed - len(self._tail)
+        self._consumed += len(piece)
+        # Hold back a trailing run of non-whitelisted characters; the next piece may extend it
+        end = len(text)
+        while end and not ALLOWED_PATTERN.match(text, end - 1):
+            end -= 1
+        self._tail = text[end:]
+        self._scan(text, base, end)
+
+    def finish(self) -> str:
+        """Flush the last piece and return the stripped, normalized text"""
+        tail, self._tail = self._tail, ""
+        self._scan(tail, self._consumed - len(tail), len(tail))
+        text = "".join(self.parts)
+        stripped = text.strip()
+        self.offsets.shift(len(text) - len(text.lstrip()))
+        self.parts = [stripped]
+        return stripped
+
+
+def normalize(text: str, offsets: Optional[OffsetMap] = None) -> str:
+    """Normalize a whole string; pass an OffsetMap to receive its position mapping"""
+    normalizer = TextNormalizer()
+    if offsets is not None:
+        normalizer.offsets = offsets
+    normalizer.feed(text)
+    return normalizer.finish()
+
+
+def normalize_stream(pieces: Iterable[str]) -> TextNormalizer:
+    """Normalize text arriving in pieces; the result is in .finish() and .offsets"""
+    normalizer = TextNormalizer()
+    for piece in pieces:
+        normalizer.feed(piece)
+    return normalizer
@@ -0,0 +1,201 @@
+"""
+Embedding-model token counts for chunking and truncation reports
+
+Usage:
+    python tokenization.py stats                  # truncation report for the chunks in the current index
+    python tokenization.py stats --by-source
+    python tokenization.py compare manual.pdf     # chunk a file in character and token mode side by side
+
+The embedding model only sees its first EMBEDDING_MAX_SEQ_LENGTH tokens
+(special tokens included); anything after that is stored but never shapes the
+vector. With CHUNK_UNIT=tokens, DocumentProcessor sizes chunks in these tokens
+so every chunk fits the model exactly. The model's fast (Rust) tokenizer is
+loaded once per process; if it cannot be loaded (e.g. offline without a
+Hugging Face cache) a regex word-piece estimate is used instead.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+from config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_MAX_SEQ_LENGTH, CHUNK_TOKENS, CHUNK_STORE_PATH
+)
+
+# The estimate splits words into pieces of at most this many characters
+APPROXIMATE_PIECE_CHARS = 6
+
+
+class TokenCounter:
+    """Token offsets and counts from one model's tokenizer (without special tokens)"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, max_seq_length: int = EMBEDDING_MAX_SEQ_LENGTH):
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        self.tokenizer = None
+        self.special_tokens = 2
+        try:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+            if not self.tokenizer.is_fast:
+                raise ValueError("no fast tokenizer available")
+            self.special_tokens = self.tokenizer.num_special_tokens_to_add()
+        except Exception as e:
+            self.tokenizer = None
+            print(f"Tokenizer for {model_name} unavailable ({str(e).splitlines()[0]}); estimating token counts")
+
+    @property
+    def name(self) -> str:
+        return self.model_name if self.tokenizer is not None else 'approximate'
+
+    @property
+    def max_tokens(self) -> int:
+        """Text tokens the model embeds per input (sequence length minus special tokens)"""
+        return self.max_seq_length - self.special_tokens
+
+    @property
+    def chunk_tokens(self) -> int:
+        """Chunk size in token mode: CHUNK_TOKENS, capped at what the model embeds"""
+        return min(CHUNK_TOKENS, self.max_tokens) if CHUNK_TOKENS > 0 else self.max_tokens
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) character span of every token in `text`"""
+        if self.tokenizer is None:
+            return [span for match in re.finditer(r'\w+|[^\w\s]', text)
+                    for span in self._pieces(match.start(), match.end())]
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                  return_attention_mask=False, verbose=False)
+        return [tuple(span) for span in encoding['offset_mapping']]
+
+    @staticmethod
+    def _pieces(start: int, end: int) -> List[Tuple[int, int]]:
+        return [(i, min(i + APPROXIMATE_PIECE_CHARS, end)) for i in range(start, end, APPROXIMATE_PIECE_CHARS)]
+
+    def count(self, texts: List[str]) -> List[int]:
+        """Token count of each text (one batched tokenizer call)"""
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [sum(math.ceil(len(word) / APPROXIMATE_PIECE_CHARS) for word in re.findall(r'\w+|[^\w\s]', text))
+                    for text in texts]
+        encoding = self.tokenizer(texts, add_special_tokens=False, return_attention_mask=False, verbose=False)
+        return [len(ids) for ids in encoding['input_ids']]
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_name: str = EMBEDDING_MODEL_NAME) -> TokenCounter:
+    """Process-wide TokenCounter per model (loading a tokenizer takes seconds)"""
+    with _counters_lock:
+        if model_name not in _counters:
+            _counters[model_name] = TokenCounter(model_name)
+        return _counters[model_name]
+
+
+def _percentile(ordered: List[int], p: float) -> int:
+    if not ordered:
+        return 0
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def truncation_stats(counts: List[int], max_tokens: int) -> Dict[str, Any]:
+    """How well chunks of the given token counts fit a model that embeds `max_tokens` tokens"""
+    ordered = sorted(counts)
+    total = sum(ordered)
+    dropped = sum(count - max_tokens for count in ordered if count > max_tokens)
+    truncated = sum(1 for count in ordered if count > max_tokens)
+    return {
+        'chunks': len(ordered),
+        'max_tokens': max_tokens,
+        'tokens_p50': _percentile(ordered, 50),
+        'tokens_p95': _percentile(ordered, 95),
+        'tokens_max': ordered[-1] if ordered else 0,
+        'truncated': truncated,
+        'truncated_pct': round(100 * truncated / len(ordered), 1) if ordered else 0.0,
+        'tokens_dropped': dropped,
+        'dropped_pct': round(100 * dropped / total, 1) if total else 0.0,
+        # Share of each embedding call's capacity filled with text
+        'utilization_pct': round(100 * sum(min(count, max_tokens) for count in ordered)
+                                 / (len(ordered) * max_tokens), 1) if ordered else 0.0
+    }
+
+
+def index_truncation_stats(rows: Iterable[Tuple[str, str]], counter: TokenCounter = None,
+                           by_source: bool = False, batch_size: int = 256) -> Dict[str, Any]:
+    """Truncation report over (source, text) rows, e.g. ChunkStore.iter_texts()"""
+    counter = counter or get_token_counter()
+    counts: List[int] = []
+    per_source: Dict[str, List[int]] = {}
+    batch: List[Tuple[str, str]] = []
+
+    def flush() -> None:
+        for (source, _), count in zip(batch, counter.count([text for _, text in batch])):
+            counts.append(count)
+            if by_source:
+                per_source.setdefault(source, []).append(count)
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    report = dict(truncation_stats(counts, counter.max_tokens), tokenizer=counter.name)
+    if by_source:
+        report['sources'] = {source: truncation_stats(values, counter.max_tokens)
+                             for source, values in sorted(per_source.items())}
+    return report
+
+
+def _print_stats(label: str, stats: Dict[str, Any]) -> None:
+    print(f"{label:<40} {stats['chunks']:>6} chunks  tokens p50 {stats['tokens_p50']:>4} p95 {stats['tokens_p95']:>4} "
+          f"max {stats['tokens_max']:>5}  truncated {stats['truncated']} ({stats['truncated_pct']}%)  "
+          f"dropped {stats['dropped_pct']}%  utilization {stats['utilization_pct']}%")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Embedding token counts and truncation reports")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    stats_parser = subparsers.add_parser('stats', help="Truncation report for the indexed chunks")
+    stats_parser.add_argument("--chunk-store", default=CHUNK_STORE_PATH)
+    stats_parser.add_argument("--source", help="Only chunks from this source")
+    stats_parser.add_argument("--by-source", action="store_true", help="Also report every source")
+    stats_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    compare_parser = subparsers.add_parser('compare', help="Chunk a PDF/TXT file in character and token mode")
+    compare_parser.add_argument("file")
+    args = parser.parse_args(argv)
+
+    counter = get_token_counter()
+    if args.command == 'stats':
+        from chunk_store import ChunkStore
+        store = ChunkStore(args.chunk_store)
+        report = index_truncation_stats(store.iter_texts(args.source), counter, by_source=args.by_source)
+        store.close()
+        if args.json:
+            print(json.dumps(report, indent=2))
+            return 0
+        print(f"Tokenizer {report['tokenizer']}, {report['max_tokens']} text tokens per embedding")
+        _print_stats(args.source or "all sources", report)
+        for source, stats in report.get('sources', {}).items():
+            _print_stats(source[:40], stats)
+        return 0
+
+    from document_processor import DocumentProcessor, NamedUpload
+    print(f"Tokenizer {counter.name}, {counter.max_tokens} text tokens per embedding")
+    for unit in ('chars', 'tokens'):
+        with open(args.file, 'rb') as f:
+            chunks = DocumentProcessor(unit=unit).process_uploaded_file(NamedUpload(f, os.path.basename(args.file)))
+        _print_stats(f"CHUNK_UNIT={unit}", truncation_stats(counter.count(chunks.texts()), counter.max_tokens))
+    return 0
+
+
+if __name__ == "__main__":
+    # Run the imported module's main so DocumentProcessor shares its cached tokenizer
+    from tokenization import main as module_main
+    sys.exit(module_main())
@@ -0,0 +1,337 @@
+"""
+Structured tracing and rolling latency histograms for the RAG query path
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+from config import TRACE_STORE_PATH, TRACE_WINDOW_SIZE, TRACE_FLUSH_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, concurrent writers may lose samples
+    fcntl = None
+
+
+class Span:
+    """A single timed operation, optionally nested inside a parent span"""
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children: List['Span'] = []
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        """Elapsed seconds (up to now if the span is still open)"""
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Attach an attribute such as top_k or token counts to the span"""
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes) -> None:
+        """Attach several attributes at once"""
+        self.attributes.update(attributes)
+
+    def find(self, name: str) -> Optional['Span']:
+        """Depth-first search for a descendant span by name"""
+        if self.name == name:
+            return self
+        for child in self.children:
+            found = child.find(name)
+            if found is not None:
+                return found
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the span tree for display or export"""
+        data = {
+            'name': self.name,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'children': [child.to_dict() for child in self.children]
+        }
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class LatencyHistogram:
+    """Rolling window of latency samples with percentile summaries"""
+
+    def __init__(self, window_size: int = TRACE_WINDOW_SIZE, samples: List[float] = None):
+        self.samples = deque(samples or [], maxlen=window_size)
+        self.count = len(self.samples)
+        self.total = sum(self.samples)
+
+    def observe(self, seconds: float) -> None:
+        """Record one latency sample"""
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p: float) -> float:
+        """Nearest-rank percentile over the rolling window (p in 0-100)"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+    def summary(self) -> Dict[str, float]:
+        """p50/p95/p99 over the window plus lifetime count and sum"""
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'window': len(self.samples),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': max(self.samples) if self.samples else 0.0
+        }
+
+
+class Tracer:
+    """Collects nested spans and aggregates their durations into per-stage histograms"""
+
+    def __init__(self, store_path: Optional[str] = TRACE_STORE_PATH, window_size: int = TRACE_WINDOW_SIZE,
+                 flush_seconds: float = TRACE_FLUSH_SECONDS):
+        self.store_path = store_path
+        self.window_size = window_size
+        self.flush_seconds = flush_seconds
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        # Samples observed since the last save, merged into the shared file by save()
+        self._pending: Dict[str, LatencyHistogram] = {}
+        self.recent_traces = deque(maxlen=50)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+        self._load()
+        atexit.register(self.flush)
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_span(self) -> Optional[Span]:
+        """Innermost open span on the calling thread"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Time a block as a span nested under the current span
+
+        Usage:
+            with tracer.span("retrieval", top_k=20) as span:
+                ...
+                span.set_attribute("matches", len(results))
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(name, parent, attributes)
+        if parent is not None:
+            parent.children.append(span)
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.end = time.perf_counter()
+            stack.pop()
+            self.observe(name, span.duration)
+            if parent is None:
+                self._finish_trace(span)
+
+    @contextmanager
+    def attach(self, parent: Optional[Span]):
+        """Nest spans opened on this thread (e.g. a worker thread) under `parent` from another thread"""
+        if parent is None:
+            yield
+            return
+        stack = self._stack()
+        stack.append(parent)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration for a named stage without opening a span"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram(self.window_size)
+            histogram.observe(seconds)
+            pending = self._pending.get(name)
+            if pending is None:
+                pending = self._pending[name] = LatencyHistogram(self.window_size)
+            pending.observe(seconds)
+
+    def _finish_trace(self, root: Span) -> None:
+        with self._lock:
+            self.recent_traces.append(root.to_dict())
+            self._dirty = True
+            start_flusher = self._flusher is None and bool(self.store_path)
+            if start_flusher:
+                self._flusher = threading.Thread(target=self._flush_loop, name="trace-flush", daemon=True)
+        if start_flusher:
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        # Histograms are written off the query path; flush() at exit saves the remainder
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self) -> None:
+        """Persist histograms if any trace finished since the last save"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, False
+        if dirty:
+            self.save()
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Summaries of every stage histogram, keyed by span name"""
+        with self._lock:
+            return {name: hist.summary() for name, hist in sorted(self.histograms.items())}
+
+    def export_json(self) -> str:
+        """Export histogram summaries as JSON"""
+        return json.dumps({
+            'generated_at': time.time(),
+            'window_size': self.window_size,
+            'stages': self.snapshot()
+        }, indent=2)
+
+    def export_prometheus(self) -> str:
+        """Export histogram summaries in the Prometheus text exposition format"""
+        lines = [
+            "# HELP rag_stage_latency_seconds Latency of RAG pipeline stages over the rolling window",
+            "# TYPE rag_stage_latency_seconds summary"
+        ]
+        for name, summary in self.snapshot().items():
+            for quantile, key in (("0.5", 'p50'), ("0.95", 'p95'), ("0.99", 'p99')):
+                lines.append(f'rag_stage_latency_seconds{{stage="{name}",quantile="{quantile}"}} {summary[key]:.6f}')
+            lines.append(f'rag_stage_latency_seconds_sum{{stage="{name}"}} {summary["sum"]:.6f}')
+            lines.append(f'rag_stage_latency_seconds_count{{stage="{name}"}} {summary["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Drop all histograms and recent traces, including the persisted ones"""
+        with self._lock:
+            self.histograms = {}
+            self._pending = {}
+            self.recent_traces.clear()
+        if not self.store_path:
+            return
+        try:
+            with self._file_lock():
+                self._write({})
+        except OSError as e:
+            print(f"Error saving latency histograms: {str(e)}")
+
+    def save(self) -> None:
+        """
+        Merge samples observed since the last save into the persisted histograms
+
+        Several processes (service, app, ingest workers) share one file, so the
+        on-disk windows are re-read under a file lock and extended rather than
+        replaced; the merged result becomes this process's view as well.
+        """
+        if not self.store_path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        try:
+            with self._file_lock():
+                data = self._read()
+                for name, hist in pending.items():
+                    entry = data.setdefault(name, {'samples': [], 'count': 0, 'sum': 0.0})
+                    entry['samples'] = (list(entry.get('samples', [])) + list(hist.samples))[-self.window_size:]
+                    entry['count'] = entry.get('count', 0) + hist.count
+                    entry['sum'] = entry.get('sum', 0.0) + hist.total
+                self._write(data)
+        except (OSError, ValueError) as e:
+            print(f"Error saving latency histograms: {str(e)}")
+            with self._lock:
+                for name, hist in pending.items():
+                    # Keep the unsaved samples for the next attempt
+                    retry = self._pending.setdefault(name, LatencyHistogram(self.window_size))
+                    retry.samples.extendleft(reversed(hist.samples))
+                    retry.count += hist.count
+                    retry.total += hist.total
+            return
+        with self._lock:
+            self._apply(data)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive advisory flock on a sidecar file next to the histogram store"""
+        directory = os.path.dirname(self.store_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(f"{self.store_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # closing the descriptor releases the lock
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.store_path):
+            return {}
+        with open(self.store_path) as f:
+            return json.load(f)
+
+    def _write(self, data: Dict[str, Dict[str, Any]]) -> None:
+        tmp_path = f"{self.store_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.store_path)
+
+    def _apply(self, data: Dict[str, Dict[str, Any]]) -> None:
+        # Persisted windows plus anything observed while the file was being written
+        histograms = {}
+        for name, entry in data.items():
+            hist = LatencyHistogram(self.window_size, entry.get('samples', []))
+            hist.count = entry.get('count', hist.count)
+            hist.total = entry.get('sum', hist.total)
+            histograms[name] = hist
+        for name, pending in self._pending.items():
+            hist = histograms.setdefault(name, LatencyHistogram(self.window_size))
+            hist.samples.extend(pending.samples)
+            hist.count += pending.count
+            hist.total += pending.total
+        self.histograms = histograms
+
+    def _load(self) -> None:
+        if not self.store_path or not os.path.exists(self.store_path):
+            return
+        try:
+            self._apply(self._read())
+        except (OSError, ValueError) as e:
+            print(f"Error loading latency histograms: {str(e)}")
+
+
+# Process-wide tracer shared by all services and Streamlit sessions
+tracer = Tracer()
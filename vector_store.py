@@ -2,85 +2,257 @@
 Vector database operations using Pinecone
 """
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
 from pinecone import Pinecone, ServerlessSpec
 from sentence_transformers import SentenceTransformer
 from config import (
     PINECONE_API_KEY, 
     PINECONE_INDEX_NAME, 
     PINECONE_ENVIRONMENT,
-    TOP_K_RETRIEVAL
+    TOP_K_RETRIEVAL,
+    VECTOR_BACKEND,
+    LOCAL_INDEX_PATH,
+    CHUNK_STORE_PATH,
+    DEDUP_ENABLED,
+    EMBEDDING_REDUCTION,
+    EMBEDDING_RESCORE_FACTOR,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_POOL_WORKERS,
+    EMBEDDING_POOL_MIN_CHUNKS,
+    RESILIENCE_INDEX_FALLBACK
 )
+from chunk_batch import ChunkBatch
+from chunk_store import ChunkStore
+from dedup import ChunkDeduplicator
+from dim_reduction import create_projection, rescore
+from tracing import tracer
+from warmup import QueryEmbeddingCache
+from index_stats import IndexStatsCache
+from memory_monitor import MemoryBudget
+from resilience import resilience
+
+# Rough working set per chunk during an upsert besides its text: the float32
+# embedding, its projection and the per-batch payload lists
+UPSERT_OVERHEAD_BYTES = 4096
 
 
 class VectorStore:
     """Handles vector database operations with Pinecone"""
     
-    def __init__(self):
-        if not PINECONE_API_KEY:
+    def __init__(self, backend: str = None, reduction: str = None):
+        self.backend = backend or VECTOR_BACKEND
+        if self.backend not in ('pinecone', 'local'):
+            raise ValueError(f"Unknown vector backend '{self.backend}'. Use 'pinecone' or 'local'.")
+        if self.backend == 'pinecone' and not PINECONE_API_KEY:
             raise ValueError("PINECONE_API_KEY not found in environment variables")
         
+        # Initialize embedding model 
+        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)  # 768 dimensions for all-mpnet-base-v2
+        
+        # Worker processes for large ingest batches, started on first use
+        self.embedding_pool = None
+        
+        # Repeated and precomputed (warm-up) queries skip the encoder
+        self.query_cache = QueryEmbeddingCache()
+        
+        # describe_index_stats is cached and refreshed in the background
+        self.index_stats = IndexStatsCache(self._fetch_index_stats)
+        
+        # Optional reduced-width index vectors; full vectors then live in the chunk store for rescoring
+        self.full_dimension = self.embedding_model.get_sentence_embedding_dimension()
+        self.projection = create_projection(self.full_dimension, reduction or EMBEDDING_REDUCTION)
+        
+        # Chunk texts live locally; the index only carries small filterable metadata
+        self.chunk_store = ChunkStore(CHUNK_STORE_PATH)
+        
+        # Near-duplicate chunks are stored as aliases instead of separate vectors
+        self.deduplicator = ChunkDeduplicator() if DEDUP_ENABLED else None
+        
+        # Large upserts are split (or rejected) to stay under INGEST_MEMORY_BUDGET_MB
+        self.memory_budget = MemoryBudget()
+        
+        # Local replica queried while Pinecone's circuit is open (see resilience.py)
+        self.fallback_index = None
+        
+        if self.backend == 'local':
+            # Local NumPy index with per-field bitmaps for filtered scans
+            from local_index import LocalIndex
+            self.pc = None
+            self.index_name = LOCAL_INDEX_PATH
+            self.index = LocalIndex(self.index_dimension, LOCAL_INDEX_PATH)
+            return
+        
         # Initialize Pinecone
         self.pc = Pinecone(api_key=PINECONE_API_KEY)
         self.index_name = PINECONE_INDEX_NAME
         
-        # Initialize embedding model 
-        self.embedding_model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')  # 768 dimensions
-        
         # Connect to existing index
         try:
             self.index = self.pc.Index(self.index_name)
         except Exception as e:
             raise Exception(f"Error connecting to Pinecone index '{self.index_name}': {str(e)}")
+        
+        if RESILIENCE_INDEX_FALLBACK:
+            from local_index import LocalIndex
+            if LocalIndex.exists(LOCAL_INDEX_PATH):
+                self.fallback_index = LocalIndex(self.index_dimension, LOCAL_INDEX_PATH)
+    
+    def replica_age(self) -> Optional[float]:
+        """Seconds since the local fallback replica was last written (None without a replica)"""
+        if self.fallback_index is None:
+            return None
+        modified = self.fallback_index.last_modified()
+        return time.time() - modified if modified is not None else None
     
-    def upsert_documents(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    @property
+    def index_dimension(self) -> int:
+        """Width of the vectors stored in the index"""
+        return self.projection.dimension if self.projection is not None else self.full_dimension
+    
+    def _encoder_for(self, count: int):
+        """The embedding pool for batches large enough to shard, else the in-process model"""
+        if EMBEDDING_POOL_WORKERS <= 1 or count < EMBEDDING_POOL_MIN_CHUNKS:
+            return self.embedding_model
+        if self.embedding_pool is None:
+            from embedding_pool import EmbeddingPool
+            self.embedding_pool = EmbeddingPool(EMBEDDING_POOL_WORKERS, self.full_dimension)
+        return self.embedding_pool
+    
+    def encode_chunks(self, chunks: ChunkBatch) -> ChunkBatch:
+        """Fill chunks.embeddings if not already set (safe to call ahead of upsert_documents)"""
+        if chunks.embeddings is None and len(chunks):
+            with tracer.span("ingest.encode", chunks=len(chunks)):
+                chunks.embeddings = np.asarray(
+                    self._encoder_for(len(chunks)).encode(chunks.texts(), batch_size=64), dtype=np.float32
+                )
+        return chunks
+    
+    def _upsert_bytes_per_chunk(self, chunks: ChunkBatch) -> int:
+        """Estimated peak bytes per chunk while it is embedded and upserted"""
+        text_bytes = int(np.mean(chunks.lengths)) if len(chunks) else 0
+        vector_bytes = self.full_dimension * 4 + (self.index_dimension * 4 if self.projection is not None else 0)
+        return vector_bytes + 2 * text_bytes + UPSERT_OVERHEAD_BYTES
+    
+    def _upsert_in_slices(self, chunks: ChunkBatch, vector_ids: List[str], slice_size: int,
+                          profile=None) -> Dict[str, Any]:
+        """Upsert a batch that does not fit the memory budget as consecutive smaller ones"""
+        print(f"Memory budget: upserting {len(chunks)} chunks in slices of {slice_size}")
+        upserted_count = duplicates = 0
+        for start in range(0, len(chunks), slice_size):
+            stop = min(start + slice_size, len(chunks))
+            result = self.upsert_documents(chunks.slice(start, stop), vector_ids[start:stop], profile)
+            if not result['success']:
+                result['upserted_count'] += upserted_count
+                result['total_chunks'] = len(chunks)
+                return result
+            upserted_count += result['upserted_count']
+            duplicates += result['duplicates_aliased']
+        return {
+            'success': True,
+            'upserted_count': upserted_count,
+            'duplicates_aliased': duplicates,
+            'total_chunks': len(chunks),
+            'memory_slices': (len(chunks) + slice_size - 1) // slice_size
+        }
+    
+    def upsert_documents(self, chunks: Union[ChunkBatch, List[Dict[str, Any]]],
+                         vector_ids: Optional[List[str]] = None, profile=None) -> Dict[str, Any]:
         """
         Upsert document chunks to Pinecone with embeddings
+        
+        Args:
+            chunks: ChunkBatch from DocumentProcessor (legacy chunk dicts with
+                'text' and 'metadata' are converted)
+            vector_ids: Optional explicit IDs (one per chunk). Stable IDs make a
+                retried upsert overwrite the same vectors instead of duplicating them
+            profile: Optional MemoryProfile that records the dedup/encode/upsert stages
         """
+        if not isinstance(chunks, ChunkBatch):
+            chunks = ChunkBatch.from_dicts(chunks)
         try:
-            vectors_to_upsert = []
+            ingested_at = int(time.time())
+            if vector_ids is None:
+                vector_ids = [f"chunk_{ingested_at}_{i}" for i in range(len(chunks))]
+            total_chunks = len(chunks)
             
-            for i, chunk in enumerate(chunks):
-                vector_id = f"chunk_{int(time.time())}_{i}"
-                
-                # Generate embedding for the text
-                text = chunk['text']
-                embedding = self.embedding_model.encode(text).tolist()
-                
-                # Prepare metadata (Pinecone has limits on metadata size)
-                metadata = {
-                    'text': text[:8000],  # Limit text size for metadata
-                    'source': chunk['metadata'].get('source', 'unknown'),
-                    'title': chunk['metadata'].get('title', ''),
-                    'section': chunk['metadata'].get('section', ''),
-                    'position': chunk['metadata'].get('position', chunk['metadata'].get('chunk_index', 0)),
-                    'chunk_index': chunk['metadata'].get('chunk_index', 0),
-                    'chunk_size': chunk['metadata'].get('chunk_size', len(text))
-                }
-                
-                # Standard Pinecone format with values
-                vector_data = {
-                    'id': vector_id,
-                    'values': embedding,
-                    'metadata': metadata
-                }
-                
-                vectors_to_upsert.append(vector_data)
+            # Split batches whose embeddings and payloads would not fit the memory budget
+            if chunks.embeddings is None:
+                slice_size = self.memory_budget.batch_size(
+                    f"Upserting {len(chunks)} chunks", len(chunks), self._upsert_bytes_per_chunk(chunks)
+                )
+                if slice_size < len(chunks):
+                    return self._upsert_in_slices(chunks, list(vector_ids), slice_size, profile)
+            
+            # Drop near-duplicates before they are embedded
+            plan = None
+            all_ids = list(vector_ids)
+            if self.deduplicator is not None and len(chunks):
+                with tracer.span("ingest.dedup", chunks=len(chunks)) as span:
+                    plan = self.deduplicator.plan(chunks.texts(), all_ids)
+                    span.set_attribute('duplicates', plan.duplicates)
+                all_metadata = [chunks.metadata(i) for i in range(len(chunks))]
+                if plan.duplicates:
+                    kept = np.flatnonzero(plan.keep)
+                    chunks = chunks.take(kept)
+                    vector_ids = [all_ids[i] for i in kept]
+                    print(f"Dedup: {plan.duplicates}/{total_chunks} chunks are near-duplicates of indexed chunks, "
+                          f"stored as aliases instead of embedded")
+                if profile is not None:
+                    profile.stage('dedup')
+            
+            # Generate all embeddings with one batched encode into a float32 matrix
+            self.encode_chunks(chunks)
+            if profile is not None:
+                profile.stage('encode')
+            
+            index_vectors = chunks.embeddings
+            if self.projection is not None and len(chunks):
+                index_vectors = self.projection.project(chunks.embeddings)
             
-            # Upsert in batches
+            # Build Pinecone payloads one batch at a time from the columns
             batch_size = 100
             upserted_count = 0
             
-            for i in range(0, len(vectors_to_upsert), batch_size):
-                batch = vectors_to_upsert[i:i + batch_size]
-                response = self.index.upsert(vectors=batch)
-                upserted_count += len(batch)
+            for start in range(0, len(chunks), batch_size):
+                stop = min(start + batch_size, len(chunks))
+                vectors_to_upsert = []
+                chunk_records = []
+                for i in range(start, stop):
+                    # Text is kept in the local chunk store, not in Pinecone metadata
+                    metadata = chunks.metadata(i)
+                    metadata['ingested_at'] = ingested_at
+                    vectors_to_upsert.append({
+                        'id': vector_ids[i],
+                        'values': index_vectors[i].tolist(),
+                        'metadata': metadata
+                    })
+                    chunk_records.append({
+                        'id': vector_ids[i],
+                        'text': chunks.text(i),
+                        'source': metadata['source'],
+                        'title': metadata['title'],
+                        'section': metadata['section'],
+                        'embedding': chunks.embeddings[i].tobytes() if self.projection is not None else None
+                    })
+                
+                # Store texts first so every indexed vector can be hydrated
+                self.chunk_store.put_many(chunk_records)
+                self.index.upsert(vectors=vectors_to_upsert)
+                upserted_count += len(vectors_to_upsert)
+                self.index_stats.note_upsert(len(vectors_to_upsert))
                 time.sleep(0.1)  # Rate limiting
             
+            if plan is not None:
+                self.deduplicator.record(plan, all_ids, all_metadata)
+            if profile is not None:
+                profile.stage('upsert')
+            
             return {
                 'success': True,
                 'upserted_count': upserted_count,
-                'total_chunks': len(chunks)
+                'duplicates_aliased': plan.duplicates if plan is not None else 0,
+                'total_chunks': total_chunks
             }
             
         except Exception as e:
@@ -91,58 +263,217 @@ class VectorStore:
                 'total_chunks': len(chunks)
             }
     
-    def query_similar_documents(self, query_text: str, top_k: int = None) -> List[Dict[str, Any]]:
+    def query_similar_documents(self, query_text: str, top_k: int = None,
+                                filters: Optional[Dict[str, Any]] = None,
+                                include_text: bool = True,
+                                query_embedding: Optional[List[float]] = None,
+                                include_values: bool = False) -> List[Dict[str, Any]]:
         """
         Query Pinecone for similar documents using embeddings
+        
+        Args:
+            query_text: The search query
+            top_k: Number of candidates to return
+            filters: Optional metadata filter (see build_metadata_filter), applied
+                inside the index so only matching vectors are scored
+            include_text: Fetch chunk texts from the chunk store. Pass False and call
+                fetch_texts() later to only load texts for the candidates that are kept
+            query_embedding: Precomputed query vector (e.g. from encode_queries); skips encoding
+            include_values: Return each match's stored embedding under 'values'
+                (used for diversity selection without re-encoding)
         """
         if top_k is None:
             top_k = TOP_K_RETRIEVAL
         
         try:
             # Generate embedding for the query
-            query_embedding = self.embedding_model.encode(query_text).tolist()
+            span = tracer.current_span()
+            if query_embedding is None:
+                query_embedding = self.query_cache.get(query_text)
+                if span is not None:
+                    span.set_attribute('embedding_cache', 'hit' if query_embedding is not None else 'miss')
+            elif span is not None:
+                span.set_attribute('embedding_cache', 'precomputed')
+            if query_embedding is None:
+                with tracer.span("retrieval.encode", query_chars=len(query_text)):
+                    query_embedding = self.embedding_model.encode(query_text).tolist()
+                self.query_cache.put(query_text, query_embedding)
+            elif not isinstance(query_embedding, list):
+                query_embedding = list(map(float, query_embedding))
+            
+            # With a reduced index, search a wider shortlist and rescore it with full vectors
+            search_vector, search_k = query_embedding, top_k
+            if self.projection is not None:
+                search_vector = self.projection.project(query_embedding).tolist()
+                search_k = top_k * EMBEDDING_RESCORE_FACTOR
             
             # Query with embedding vector
-            response = self.index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
+            with tracer.span("retrieval.pinecone_query", top_k=search_k, filtered=bool(filters)) as span:
+                query_args = dict(vector=search_vector, top_k=search_k, include_metadata=True,
+                                  include_values=include_values, filter=filters or None)
+                fallback = None
+                if self.fallback_index is not None:
+                    def fallback():
+                        # The replica is only as fresh as its last import or ingest
+                        span.set_attribute('replica_age', round(self.replica_age() or 0.0))
+                        return self.fallback_index.query(**query_args)
+                response = resilience.call('index', self.index.query, fallback=fallback, **query_args)
+                span.set_attribute('matches', len(response['matches']))
             
             results = []
             for match in response['matches']:
-                results.append({
+                result = {
                     'id': match['id'],
                     'score': match['score'],
-                    'text': match['metadata'].get('text', ''),
+                    'text': match['metadata'].get('text'),  # only set for legacy vectors
                     'source': match['metadata'].get('source', 'unknown'),
                     'title': match['metadata'].get('title', ''),
                     'section': match['metadata'].get('section', ''),
                     'position': match['metadata'].get('position', 0),
-                    'chunk_index': match['metadata'].get('chunk_index', 0)
-                })
+                    'chunk_index': match['metadata'].get('chunk_index', 0),
+                    'chunk_size': match['metadata'].get('chunk_size'),
+                    'ingested_at': match['metadata'].get('ingested_at')
+                }
+                if include_values:
+                    result['values'] = list(match['values'])
+                results.append(result)
+            
+            if self.projection is not None:
+                with tracer.span("retrieval.rescore", candidates=len(results), top_k=top_k):
+                    full = self.chunk_store.get_embeddings([doc['id'] for doc in results])
+                    results = rescore(results, query_embedding, full, top_k)
+                    if include_values:
+                        # Diversity selection compares full vectors where available
+                        for doc in results:
+                            if doc['id'] in full:
+                                doc['values'] = full[doc['id']].tolist()
+            
+            if include_text:
+                self.fetch_texts(results)
             
             return results
             
         except Exception as e:
             raise Exception(f"Error querying Pinecone: {str(e)}")
     
-    def get_index_stats(self) -> Dict[str, Any]:
-        """Get statistics about the current index"""
+    def delete_documents(self, vector_ids: List[str]) -> bool:
+        """Delete specific vectors and their chunk texts"""
         try:
-            stats = self.index.describe_index_stats()
-            return {
-                'total_vectors': stats.get('total_vector_count', 0),
-                'dimension': stats.get('dimension', 0),
-                'index_fullness': stats.get('index_fullness', 0)
-            }
+            for i in range(0, len(vector_ids), 1000):
+                self.index.delete(ids=vector_ids[i:i + 1000])
+                self.index_stats.note_delete(len(vector_ids[i:i + 1000]))
+            self.chunk_store.delete_many(vector_ids)
+            if self.deduplicator is not None:
+                orphaned = self.deduplicator.forget(vector_ids)
+                if orphaned:
+                    print(f"Dedup: dropped {orphaned} aliases of deleted chunks; re-ingest their documents to restore them")
+            return True
+        except Exception as e:
+            print(f"Error deleting vectors: {str(e)}")
+            return False
+    
+    def encode_queries(self, queries: List[str], batch_size: int = 64) -> List[List[float]]:
+        """Embed many queries with one batched encode call"""
+        if not queries:
+            return []
+        with tracer.span("retrieval.batch_encode", queries=len(queries)):
+            embeddings = self.embedding_model.encode(queries, batch_size=batch_size)
+        return [embedding.tolist() for embedding in embeddings]
+    
+    def fetch_texts(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Fill in 'text' for retrieved documents with one batched chunk-store lookup
+        
+        Documents that already carry text (legacy vectors with text in metadata)
+        are left as they are.
+        """
+        missing = [doc['id'] for doc in docs if doc.get('text') is None]
+        if missing:
+            with tracer.span("retrieval.fetch_texts", ids=len(missing)) as span:
+                texts = self.chunk_store.get_texts(missing)
+                span.set_attribute('found', len(texts))
+        else:
+            texts = {}
+        
+        for doc in docs:
+            if doc.get('text') is None:
+                doc['text'] = texts.get(doc['id'], '')
+        return docs
+    
+    @staticmethod
+    def build_metadata_filter(sources: Optional[List[str]] = None, titles: Optional[List[str]] = None,
+                              sections: Optional[List[str]] = None, ingested_after: Optional[float] = None,
+                              ingested_before: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Build a Pinecone-style metadata filter for scoped retrieval
+        
+        Args:
+            sources: Only match chunks from these source names
+            titles: Only match chunks from documents with these titles
+            sections: Only match chunks from these sections
+            ingested_after: Earliest ingestion time (epoch seconds, inclusive)
+            ingested_before: Latest ingestion time (epoch seconds, inclusive)
+        
+        Returns:
+            Filter dict understood by both Pinecone and the local index, or None
+        """
+        clauses = []
+        for field, values in (('source', sources), ('title', titles), ('section', sections)):
+            if values:
+                clauses.append({field: {'$in': list(values)}})
+        
+        date_range = {}
+        if ingested_after is not None:
+            date_range['$gte'] = int(ingested_after)
+        if ingested_before is not None:
+            date_range['$lte'] = int(ingested_before)
+        if date_range:
+            clauses.append({'ingested_at': date_range})
+        
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+    
+    def list_sources(self) -> List[str]:
+        """List source names available for scoping"""
+        if hasattr(self.index, 'list_values'):
+            return self.index.list_values('source')
+        return self.chunk_store.list_sources()
+    
+    def _fetch_index_stats(self) -> Dict[str, Any]:
+        """Statistics straight from the index (a network round trip for Pinecone)"""
+        stats = self.index.describe_index_stats()
+        result = {
+            'total_vectors': stats.get('total_vector_count', 0),
+            'dimension': stats.get('dimension', 0),
+            'full_dimension': self.full_dimension,
+            'reduction': self.projection.describe() if self.projection is not None else None,
+            'index_fullness': stats.get('index_fullness', 0)
+        }
+        if self.deduplicator is not None:
+            result['aliased_chunks'] = self.deduplicator.stats()['aliases']
+        return result
+    
+    def get_index_stats(self, refresh: bool = False) -> Dict[str, Any]:
+        """Get statistics about the current index (cached; see index_stats.IndexStatsCache)"""
+        try:
+            return self.index_stats.refresh() if refresh else self.index_stats.get()
         except Exception as e:
             return {'error': str(e)}
     
+    def source_inventory(self) -> List[Dict[str, Any]]:
+        """Per-source chunk counts, text bytes, estimated vector bytes and ingest times"""
+        vector_bytes = self.index_dimension * 4
+        return [dict(entry, vector_bytes=entry['chunks'] * vector_bytes) for entry in self.chunk_store.inventory()]
+    
     def clear_index(self) -> bool:
         """Clear all vectors from the index"""
         try:
             self.index.delete(delete_all=True)
+            self.index_stats.note_clear()
+            self.chunk_store.clear()
+            if self.deduplicator is not None:
+                self.deduplicator.clear()
             return True
         except Exception as e:
             print(f"Error clearing index: {str(e)}")
@@ -0,0 +1,155 @@
+"""
+Background warm-up and readiness for the query path
+
+The first query after start-up otherwise pays one-off costs: torch kernel
+selection and tokenizer setup on the first encode, and the first TLS
+handshakes to Pinecone, Cohere and Groq. Warmup runs those steps once in a
+background thread, precomputes embeddings for the built-in sample questions,
+and reports readiness so the UI and load balancers can hold traffic until
+it is done.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from config import QUERY_EMBEDDING_CACHE_SIZE, WARMUP_RERANKER, WARMUP_LLM
+from tracing import tracer
+
+# Suggested questions shown in the app; their embeddings are precomputed at warm-up
+SAMPLE_QUESTIONS = [
+    "What is artificial intelligence?",
+    "What are the types of AI?",
+    "How is AI used in healthcare?",
+    "What is the difference between supervised and unsupervised learning?",
+    "What are the main challenges facing AI implementation?"
+]
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query text -> embedding (full width, before any projection)"""
+
+    def __init__(self, max_size: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return " ".join(query.split())
+
+    def get(self, query: str) -> Optional[List[float]]:
+        key = self._key(query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, query: str, embedding: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[self._key(query)] = embedding
+            self._entries.move_to_end(self._key(query))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class Warmup:
+    """Runs the warm-up steps once on a background thread and tracks readiness"""
+
+    def __init__(self, pipeline, questions: List[str] = None):
+        self.pipeline = pipeline
+        self.questions = SAMPLE_QUESTIONS if questions is None else questions
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.started_at = self.finished_at = None
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def start(self) -> 'Warmup':
+        if self._thread is None:
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _step(self, name: str, fn) -> None:
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"warmup.{name}"):
+                detail = fn()
+            self.steps[name] = {'ok': True, 'seconds': round(time.perf_counter() - start, 3)}
+            if detail:
+                self.steps[name].update(detail)
+        except Exception as e:
+            # A failed step (e.g. an unreachable API) must not keep the service unready
+            self.steps[name] = {'ok': False, 'seconds': round(time.perf_counter() - start, 3), 'error': str(e)}
+            print(f"Warm-up step '{name}' failed: {str(e)}")
+
+    def run(self) -> None:
+        """Run every warm-up step in order (blocking); steps that do not apply are skipped"""
+        self.started_at = self.started_at or time.time()
+        vector_store = self.pipeline.vector_store
+        reranker = self.pipeline.reranker
+        client = getattr(self.pipeline.llm_service, 'client', None)
+
+        def encode():
+            vector_store.embedding_model.encode("warm-up")
+
+        def index_query():
+            question = self.questions[0] if self.questions else "warm-up"
+            return {'matches': len(vector_store.query_similar_documents(question, top_k=1, include_text=False))}
+
+        def rerank():
+            reranker.rerank_documents("warm-up", [{'id': 'warmup', 'text': "warm-up", 'score': 0.0}], top_k=1,
+                                     strict=True)
+
+        def llm():
+            # Listing models opens the pooled TLS connection without spending tokens
+            client.models.list()
+
+        try:
+            self._step('encode', encode)
+            self._step('sample_questions', lambda: self._precompute(vector_store))
+            self._step('index_query', index_query)
+            if WARMUP_RERANKER and reranker is not None:
+                self._step('reranker', rerank)
+            if WARMUP_LLM and hasattr(getattr(client, 'models', None), 'list'):
+                self._step('llm', llm)
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+            print(f"Warm-up finished in {self.finished_at - self.started_at:.1f}s")
+
+    def _precompute(self, vector_store) -> Dict[str, Any]:
+        cache = getattr(vector_store, 'query_cache', None)
+        if cache is None or not self.questions:
+            return {'cached': 0}
+        for question, embedding in zip(self.questions, vector_store.encode_queries(self.questions)):
+            cache.put(question, embedding)
+        return {'cached': len(self.questions)}
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness, elapsed warm-up time and per-step results"""
+        end = self.finished_at or time.time()
+        return {
+            'ready': self.ready,
+            'started': self.started_at is not None,
+            'seconds': round(end - self.started_at, 3) if self.started_at else 0.0,
+            'steps': dict(self.steps)
+        }